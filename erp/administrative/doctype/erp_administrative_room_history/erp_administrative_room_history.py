@@ -0,0 +1,10 @@
+# Copyright (c) 2026, Wellspring International School and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class ERPAdministrativeRoomHistory(Document):
+    """Một phiên bản (valid_from, valid_to] của phòng / bản gán theo năm — chỉ ghi bởi room_history."""
+    pass
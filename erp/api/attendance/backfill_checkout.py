@@ -17,6 +17,7 @@ import json
 
 import frappe
 
+from erp.api.attendance import day_cache
 from erp.api.attendance.checkout_rule import parse_raw_timestamps, resolve_check_in_out
 
 # Số bản ghi xử lý giữa hai lần commit. Giữ nhỏ để không giữ transaction lâu trên production.
@@ -60,6 +61,7 @@ def backfill_check_out_times(start_date=None, end_date=None, dry_run=1, batch_si
 	scanned = 0
 	changed = 0
 	samples = []
+	changed_dates = set()
 
 	for row in rows:
 		scanned += 1
@@ -97,6 +99,7 @@ def backfill_check_out_times(start_date=None, end_date=None, dry_run=1, batch_si
 		if dry_run:
 			continue
 
+		changed_dates.add(row.date)
 		# Ghi trực tiếp field dẫn xuất: không cần chạy hook doc, và giữ nguyên `modified`
 		# để không làm nhiễu các báo cáo lọc theo thời điểm sửa.
 		frappe.db.set_value(
@@ -115,6 +118,8 @@ def backfill_check_out_times(start_date=None, end_date=None, dry_run=1, batch_si
 
 	if not dry_run:
 		frappe.db.commit()
+		# set_value bỏ qua doc hook nên cache theo ngày không được ghi xuyên — xoá hẳn
+		day_cache.invalidate_dates(changed_dates)
 
 	return {
 		"status": "success",
@@ -156,7 +156,9 @@ def process_attendance_buffer():
 						"error": str(emp_error)
 					})
 			
-			# Commit tất cả trong 1 transaction
+			# Commit tất cả trong 1 transaction. Cache điểm danh theo ngày được ghi
+			# xuyên ngay sau commit này (hook on_update gom cả lô, một pipeline) —
+			# xem erp/api/attendance/day_cache.py
 			if records_processed > 0 or records_updated > 0:
 				frappe.db.commit()
 				logger.info(f"💾 Batch committed: {records_processed} new, {records_updated} updated")
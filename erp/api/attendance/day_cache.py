@@ -0,0 +1,199 @@
+"""
+Cache điểm danh theo (ngày, mã học sinh) cho `query.get_students_day_map`.
+
+Vì sao không cache theo cả danh sách mã nữa
+-------------------------------------------
+Bản cũ cache dưới md5 của CẢ danh sách mã đã sort, và chỉ cho ngày đã qua. Hai
+phụ huynh có con trùng nhau, hay cùng một lớp hỏi theo thứ tự khác, không bao
+giờ dùng chung entry — còn "hôm nay", ngày nóng nhất, thì không cache gì.
+
+Bố cục
+------
+Mỗi ngày một hash Redis `attendance:day:<YYYY-MM-DD>`:
+
+    field = mã học sinh (lower)    value = JSON payload đúng dạng API trả ra
+                                           hoặc "" = đã tra DB, chưa có bản ghi
+
+Tra cứu là một lệnh HMGET cho cả lô; chỉ các mã MISS mới xuống DB, rồi được ghi
+ngược lại bằng HSETNX.
+
+Độ tươi của "hôm nay"
+---------------------
+Mọi lần ghi `ERP Time Attendance` qua ORM (batch processor, find_or_create...)
+đi qua doc hook `on_attendance_change`: gom các bản ghi trong giao dịch rồi SAU
+KHI COMMIT ghi đè (HSET) vào hash trong MỘT pipeline. Đường đọc DB fallback dùng
+HSETNX nên không bao giờ đè được dữ liệu ghi xuyên mới hơn — kể cả khi nó đọc DB
+ngay trước lúc batch processor commit. Đường ghi thẳng SQL (backfill) phải gọi
+`invalidate_dates`.
+"""
+
+import json
+from datetime import datetime
+
+import frappe
+
+DAY_HASH_PREFIX = "attendance:day"
+# Hash hôm nay sống qua hết ngày; ngày cũ ít ai hỏi lại nên giữ ngắn hơn.
+TODAY_TTL = 36 * 3600
+PAST_TTL = 6 * 3600
+# Marker "đã tra DB, chưa có bản ghi" — học sinh chưa quẹt thẻ vẫn được phục vụ
+# từ Redis thay vì hỏi DB ở mọi lượt.
+ABSENT = ""
+
+_PENDING_FLAG = "attendance_day_cache_pending"
+
+
+def empty_payload():
+	return {"checkInTime": None, "checkOutTime": None, "totalCheckIns": 0, "employeeName": None}
+
+
+def build_payload(check_in_time, check_out_time, total_check_ins, employee_name, date_obj):
+	"""Payload một học sinh đúng dạng `get_students_day_map` trả ra."""
+
+	def _fmt_time(time_obj):
+		if not time_obj:
+			return None
+		return datetime.combine(date_obj, time_obj.time()).isoformat()
+
+	cnt = total_check_ins or 0
+	# Doc vừa save có thể giữ chuỗi, hàng DB là datetime — quy về một kiểu trước khi so
+	ci = frappe.utils.get_datetime(check_in_time) if check_in_time else None
+	co = frappe.utils.get_datetime(check_out_time) if check_out_time else None
+	# Chỉ 1 lần quẹt → chưa có giờ ra, không nên hiển thị checkOut = checkIn
+	if cnt <= 1 and ci and co and ci == co:
+		co = None
+
+	return {
+		"checkInTime": _fmt_time(ci),
+		"checkOutTime": _fmt_time(co),
+		"totalCheckIns": cnt,
+		"employeeName": employee_name,
+	}
+
+
+def _redis_key(date_str):
+	cache = frappe.cache()
+	return cache, cache.make_key(f"{DAY_HASH_PREFIX}:{date_str}")
+
+
+def _ttl_for(date_str):
+	return TODAY_TTL if date_str >= str(frappe.utils.today()) else PAST_TTL
+
+
+def get_many(date_str, norm_codes):
+	"""HMGET cả lô. Trả (found, missing): found = {mã: payload hoặc None nếu vắng}."""
+	if not norm_codes:
+		return {}, []
+	try:
+		cache, key = _redis_key(date_str)
+		values = cache.hmget(key, norm_codes)
+	except Exception:
+		return {}, list(norm_codes)
+
+	found = {}
+	missing = []
+	for code, raw in zip(norm_codes, values):
+		if raw is None:
+			missing.append(code)
+			continue
+		if isinstance(raw, bytes):
+			raw = raw.decode("utf-8")
+		if raw == ABSENT:
+			found[code] = None
+			continue
+		try:
+			found[code] = json.loads(raw)
+		except ValueError:
+			missing.append(code)
+	return found, missing
+
+
+def _write(date_str, entries, overwrite):
+	if not entries:
+		return
+	try:
+		cache, key = _redis_key(date_str)
+		pipe = cache.pipeline(transaction=False)
+		for code, payload in entries.items():
+			value = ABSENT if payload is None else json.dumps(payload, default=str)
+			if overwrite:
+				pipe.hset(key, code, value)
+			else:
+				pipe.hsetnx(key, code, value)
+		pipe.expire(key, _ttl_for(date_str))
+		pipe.execute()
+	except Exception as e:
+		frappe.logger("attendance").warning(f"attendance day cache write failed date={date_str}: {e}")
+
+
+def fill_from_db(date_str, entries):
+	"""Ghi kết quả DB fallback — HSETNX, không đè dữ liệu ghi xuyên mới hơn."""
+	_write(date_str, entries, overwrite=False)
+
+
+def write_through(rows):
+	"""Ghi đè các bản ghi vừa commit. `rows`: iterable dict/doc có các field điểm danh."""
+	by_date = {}
+	for row in rows:
+		code = (row.get("employee_code") or "").strip().lower()
+		if not code or not row.get("date"):
+			continue
+		date_obj = frappe.utils.getdate(row.get("date"))
+		if row.get("deleted"):
+			payload = None
+		else:
+			payload = build_payload(
+				row.get("check_in_time"),
+				row.get("check_out_time"),
+				row.get("total_check_ins"),
+				row.get("employee_name"),
+				date_obj,
+			)
+		by_date.setdefault(str(date_obj), {})[code] = payload
+	for date_str, entries in by_date.items():
+		_write(date_str, entries, overwrite=True)
+
+
+def invalidate_dates(dates):
+	"""Xoá hash của các ngày — dùng sau khi ghi thẳng SQL, bỏ qua doc hook."""
+	try:
+		cache = frappe.cache()
+		keys = [cache.make_key(f"{DAY_HASH_PREFIX}:{frappe.utils.getdate(d)}") for d in set(dates) if d]
+		if keys:
+			cache.delete(*keys)
+	except Exception as e:
+		frappe.logger("attendance").warning(f"attendance day cache invalidate failed: {e}")
+
+
+def _flush_pending():
+	rows = frappe.flags.pop(_PENDING_FLAG, None) or {}
+	write_through(rows.values())
+
+
+def on_attendance_change(doc, method=None):
+	"""Doc hook ERP Time Attendance (on_update / on_trash).
+
+	Gom theo giao dịch rồi ghi MỘT pipeline sau commit: batch processor lưu hàng
+	trăm bản ghi rồi commit một lần thì cũng chỉ một lượt Redis. Rollback thì
+	không ghi gì — cache không bao giờ thấy dữ liệu chưa commit.
+	"""
+	try:
+		pending = frappe.flags.get(_PENDING_FLAG)
+		if pending is None:
+			pending = frappe.flags[_PENDING_FLAG] = {}
+			frappe.db.after_commit.add(_flush_pending)
+			frappe.db.after_rollback.add(lambda: frappe.flags.pop(_PENDING_FLAG, None))
+
+		row = {
+			"employee_code": doc.employee_code,
+			"date": doc.date,
+			"employee_name": doc.employee_name,
+			"check_in_time": doc.check_in_time,
+			"check_out_time": doc.check_out_time,
+			"total_check_ins": doc.total_check_ins,
+		}
+		if method == "on_trash":
+			row["deleted"] = True
+		pending[(doc.employee_code, str(doc.date))] = row
+	except Exception as e:
+		frappe.logger("attendance").warning(f"attendance day cache hook failed {doc.name}: {e}")
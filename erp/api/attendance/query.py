@@ -7,26 +7,27 @@ import frappe
 from frappe import _
 import json
 import time
-import hashlib
 from datetime import datetime, timedelta
 import pytz
+from erp.api.attendance import day_cache
 from erp.common.doctype.erp_time_attendance.erp_time_attendance import normalize_date_to_vn_timezone
 from erp.utils.api_response import success_response, error_response
 
 
-# TTL cache (giây) — chỉ cache cho ngày KHÔNG phải hôm nay (data ngày cũ bất biến)
-_DAY_MAP_CACHE_TTL = 300  # 5 phút
 # Ngưỡng log slow query
 _SLOW_QUERY_MS = 1000
 # Chunk size — IN-list quá lớn làm planner MySQL chọn sai plan
 _CHUNK_SIZE = 200
 
 
-def _build_cache_key(date_str: str, codes_sorted: list[str]) -> str:
-	"""Build cache key từ date + codes (đã sort + lower) — hash để tránh key dài."""
-	codes_blob = ",".join(codes_sorted)
-	digest = hashlib.md5(f"{date_str}|{codes_blob}".encode()).hexdigest()
-	return f"attendance:day_map:{date_str}:{digest}"
+def _observe_day_cache(hits: int, misses: int) -> None:
+	"""Đẩy hit/miss của cache điểm danh lên Prometheus — lỗi metric không phá API."""
+	try:
+		from erp.observability.metrics import observe_attendance_day_cache
+
+		observe_attendance_day_cache(hits, misses)
+	except Exception:
+		pass
 
 
 def _fetch_day_records(codes: list[str], date_obj) -> list[dict]:
@@ -67,12 +68,11 @@ def get_students_day_map(date=None, codes=None):
 	Tối ưu p95:
 	- Covering index `(date, employee_code, check_in_time, check_out_time, total_check_ins)`
 	- Bỏ fallback case-insensitive (collation VARCHAR mặc định đã `_ci`)
-	- Cache Redis 5 phút cho ngày KHÔNG phải hôm nay (data bất biến)
+	- Cache Redis theo từng (ngày, mã) — kể cả hôm nay, ghi xuyên từ batch processor
 	- Chunk IN-list để tránh planner MySQL chọn sai plan
 	- Slow-query log (>1s)
 	"""
 	t_start = time.perf_counter()
-	cache_hit = False
 	try:
 		# Parse params từ nhiều nguồn (backward compatible)
 		if date is None:
@@ -121,80 +121,46 @@ def get_students_day_map(date=None, codes=None):
 
 		date_obj = frappe.utils.getdate(date)
 		date_str = str(date_obj)
-		today_str = str(frappe.utils.today())
-		is_historical = date_str < today_str  # ngày cũ → cacheable
-
-		# Try cache cho ngày cũ
-		cache_key = None
-		if is_historical:
-			# Sort codes để cache key ổn định bất kể thứ tự client gửi
-			sorted_norms = sorted(original_by_norm.keys())
-			cache_key = _build_cache_key(date_str, sorted_norms)
-			try:
-				cached = frappe.cache().get_value(cache_key)
-				if cached is not None:
-					cache_hit = True
-					return success_response(
-						data=cached,
-						message="Attendance data retrieved successfully (cache)",
-						meta={
-							"date": date,
-							"codes_count": len(unique_codes),
-							"cache": "hit",
-							"elapsed_ms": int((time.perf_counter() - t_start) * 1000),
-						},
-					)
-			except Exception:
-				# Cache fail không được phá API
-				pass
-
-		# Fetch từ DB
-		records = _fetch_day_records(unique_codes, date_obj)
-
-		# Build result map — key theo form gốc client gửi
-		result = {
-			code: {"checkInTime": None, "checkOutTime": None, "totalCheckIns": 0, "employeeName": None}
-			for code in codes  # giữ nguyên codes gốc (kể cả duplicate) cho backward-compat
-		}
-		# Map từ lower-code → list các form gốc client gửi (handle duplicate)
-		original_codes_by_norm: dict[str, list[str]] = {}
-		for c in codes:
-			if isinstance(c, str) and c.strip():
-				original_codes_by_norm.setdefault(c.strip().lower(), []).append(c)
-
-		def _fmt_time(time_obj, rec_date):
-			if not time_obj:
-				return None
-			return datetime.combine(rec_date, time_obj.time()).isoformat()
 
-		for rec in records:
-			matched_keys = original_codes_by_norm.get(rec.employee_code.lower())
-			if not matched_keys:
-				continue
-
-			ci = rec.check_in_time
-			co = rec.check_out_time
-			cnt = rec.total_check_ins or 0
-
-			# Chỉ 1 lần quẹt → chưa có giờ ra, không nên hiển thị checkOut = checkIn
-			if cnt <= 1 and ci and co and ci == co:
-				co = None
-
-			payload = {
-				"checkInTime": _fmt_time(ci, date_obj),
-				"checkOutTime": _fmt_time(co, date_obj),
-				"totalCheckIns": cnt,
-				"employeeName": rec.employee_name,
-			}
-			for k in matched_keys:
-				result[k] = payload
-
-		# Cache cho ngày cũ
-		if is_historical and cache_key:
-			try:
-				frappe.cache().set_value(cache_key, result, expires_in_sec=_DAY_MAP_CACHE_TTL)
-			except Exception:
-				pass
+		# Tra cache theo TỪNG mã (hash Redis mỗi ngày, xem day_cache.py) — cả hôm
+		# nay: batch processor ghi xuyên sau mỗi commit nên cache luôn tươi.
+		norm_codes = list(original_by_norm.keys())
+		payload_by_norm, missing = day_cache.get_many(date_str, norm_codes)
+
+		records = []
+		if missing:
+			records = _fetch_day_records([original_by_norm[n] for n in missing], date_obj)
+			fetched = {}
+			for rec in records:
+				fetched[rec.employee_code.strip().lower()] = day_cache.build_payload(
+					rec.check_in_time,
+					rec.check_out_time,
+					rec.total_check_ins,
+					rec.employee_name,
+					date_obj,
+				)
+			# Mã không có bản ghi cũng ghi lại (marker vắng) để lượt sau khỏi hỏi DB
+			db_entries = {n: fetched.get(n) for n in missing}
+			day_cache.fill_from_db(date_str, db_entries)
+			payload_by_norm.update(db_entries)
+
+		_observe_day_cache(len(norm_codes) - len(missing), len(missing))
+
+		# Build result map — key theo form gốc client gửi, giữ nguyên codes gốc
+		# (kể cả duplicate) cho backward-compat
+		result = {}
+		for code in codes:
+			payload = None
+			if isinstance(code, str) and code.strip():
+				payload = payload_by_norm.get(code.strip().lower())
+			result[code] = payload or day_cache.empty_payload()
+
+		if not missing:
+			cache_state = "hit"
+		elif len(missing) < len(norm_codes):
+			cache_state = "partial"
+		else:
+			cache_state = "miss"
 
 		elapsed_ms = int((time.perf_counter() - t_start) * 1000)
 		if elapsed_ms > _SLOW_QUERY_MS:
@@ -211,7 +177,8 @@ def get_students_day_map(date=None, codes=None):
 				"date": date,
 				"codes_count": len(unique_codes),
 				"records_found": len(records),
-				"cache": "miss" if is_historical else "skip",
+				"cache": cache_state,
+				"cache_misses": len(missing),
 				"elapsed_ms": elapsed_ms,
 			},
 		)
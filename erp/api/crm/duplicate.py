@@ -8,19 +8,13 @@ from frappe.utils import now, getdate, add_years, add_months, date_diff
 from erp.utils.api_response import (
     success_response, error_response, validation_error_response
 )
-from erp.api.crm.utils import (
-    check_crm_permission, get_request_data, normalize_phone_number
-)
+from erp.api.crm import match_keys
+from erp.api.crm.utils import check_crm_permission, get_request_data
 
 
 def _normalize_person_name(name):
-    """Chuan hoa ten de so sanh: trim, gop khoang trang, lower."""
-    if not name:
-        return None
-    s = " ".join(str(name).strip().split())
-    if not s:
-        return None
-    return s.lower()
+    """Chuan hoa ten de so sanh: bo dau, gop khoang trang, lower (nhu collation utf8mb4_unicode_ci)."""
+    return match_keys.fold_name(str(name or "")) or None
 
 
 def _find_matching_leads_by_names(student_name, guardian_name, exclude_draft=False, exclude_verify=False):
@@ -34,23 +28,19 @@ def _find_matching_leads_by_names(student_name, guardian_name, exclude_draft=Fal
     if not sn or not gn:
         return []
 
-    wheres = [
-        "LOWER(TRIM(IFNULL(cl.student_name, ''))) = %s",
-        "LOWER(TRIM(IFNULL(cl.guardian_name, ''))) = %s",
+    # Tra index khoi ten (bo dau, tu dau + tu cuoi) lay ung vien, roi so ca ten
+    # tren tap ung vien - bo dau nhu phep so SQL cu (utf8mb4_unicode_ci)
+    candidates = match_keys.find_leads(
+        match_keys.NAME_BLOCK,
+        [match_keys.lead_name_block(student_name, guardian_name)],
+        exclude_draft=exclude_draft,
+        exclude_verify=exclude_verify,
+    )
+    rows = [
+        row for row in candidates
+        if _normalize_person_name(row.get("student_name")) == sn
+        and _normalize_person_name(row.get("guardian_name")) == gn
     ]
-    params = [sn, gn]
-    if exclude_draft:
-        wheres.append("cl.step != 'Draft'")
-    if exclude_verify:
-        wheres.append("cl.step != 'Verify'")
-
-    query = """
-        SELECT DISTINCT cl.name, cl.step, cl.status, cl.student_name, cl.guardian_name,
-               cl.modified, COALESCE(cl.pic_care, cl.pic_sales) AS pic, cl.campus_id
-        FROM `tabCRM Lead` cl
-        WHERE """ + " AND ".join(wheres)
-
-    rows = frappe.db.sql(query, tuple(params), as_dict=True)
     for row in rows:
         row["matched_fields"] = ["student_name", "guardian_name"]
     return rows
@@ -63,27 +53,15 @@ def _find_matching_leads(phone_numbers, student_name=None, guardian_name=None, e
     """
     matches = []
     
-    normalized_phones = [normalize_phone_number(p) for p in phone_numbers if p]
-    if not normalized_phones:
+    phone_keys = [match_keys.phone_key(p) for p in phone_numbers if p]
+    if not any(phone_keys):
         return matches
-    
-    # Tim theo SDT
-    phone_placeholders = ", ".join(["%s"] * len(normalized_phones))
-    
-    base_query = """
-        SELECT DISTINCT cl.name, cl.step, cl.status, cl.student_name, cl.guardian_name,
-               cl.modified, COALESCE(cl.pic_care, cl.pic_sales) AS pic, cl.campus_id
-        FROM `tabCRM Lead` cl
-        INNER JOIN `tabCRM Lead Phone` clp ON clp.parent = cl.name
-        WHERE clp.phone_number IN ({placeholders})
-    """.format(placeholders=phone_placeholders)
-    
-    if exclude_draft:
-        base_query += " AND cl.step != 'Draft'"
-    if exclude_verify:
-        base_query += " AND cl.step != 'Verify'"
-    
-    phone_matches = frappe.db.sql(base_query, normalized_phones, as_dict=True)
+
+    # Tim theo SDT qua index khoa (SDT chi con chu so)
+    phone_matches = match_keys.find_leads(
+        match_keys.PHONE, phone_keys,
+        exclude_draft=exclude_draft, exclude_verify=exclude_verify
+    )
     
     for match in phone_matches:
         match["matched_fields"] = ["phone_number"]
@@ -338,25 +316,17 @@ def check_draft_duplicate():
     if not phone_numbers:
         return validation_error_response("Thieu SDT", {"phone_numbers": ["Bat buoc"]})
     
-    normalized_phones = [normalize_phone_number(p) for p in phone_numbers if p]
+    phone_keys = [match_keys.phone_key(p) for p in phone_numbers if p]
     
-    if not normalized_phones:
+    if not any(phone_keys):
         return success_response({"is_duplicate": False, "matches": []})
     
-    phone_placeholders = ", ".join(["%s"] * len(normalized_phones))
-    
-    query = """
-        SELECT DISTINCT cl.name, cl.student_name, cl.guardian_name, cl.modified
-        FROM `tabCRM Lead` cl
-        INNER JOIN `tabCRM Lead Phone` clp ON clp.parent = cl.name
-        WHERE cl.step = 'Draft'
-        AND clp.phone_number IN ({placeholders})
-    """.format(placeholders=phone_placeholders)
-    
-    if exclude_lead:
-        query += f" AND cl.name != '{frappe.db.escape(exclude_lead)}'"
-    
-    matches = frappe.db.sql(query, normalized_phones, as_dict=True)
+    matches = [
+        {"name": m["name"], "student_name": m["student_name"],
+         "guardian_name": m["guardian_name"], "modified": m["modified"]}
+        for m in match_keys.find_leads(match_keys.PHONE, phone_keys)
+        if m["step"] == "Draft" and not (exclude_lead and m["name"] == exclude_lead)
+    ]
     
     return success_response({
         "is_duplicate": len(matches) > 0,
@@ -0,0 +1,314 @@
+"""
+CRM Match Key - bang khoa so trung da chuan hoa cho CRM Lead / CRM Guardian.
+
+Vi sao
+------
+Kiem tra trung truoc day so `LOWER(TRIM(IFNULL(cl.student_name, '')))` voi tham so:
+bieu thuc tren cot khong dung duoc index nao, nen moi lan luu lead / bam "kiem tra
+trung" la mot lan quet toan bang CRM Lead. Script gop gia dinh thi nap ca bang CRM
+Guardian + CRM Guardian Phone roi tu chuan hoa lai trong RAM.
+
+Bang `tabCRM Match Key` giu san cac khoa (entity_type, entity_id, key_type, match_key)
+voi index (key_type, match_key):
+
+    phone       SDT chi con chu so, sau normalize_phone_number ("84912345678")
+                Lead: bang con phone_numbers. Guardian: field phang phone_number.
+    alt_phone   Guardian: bang con CRM Guardian Phone (so phu - chi de bao cao)
+    email       email ha chu (Lead: emails + guardian_email; Guardian: emails)
+    name_block  Lead: "<ho ten HS>|<ho ten PH>", moi ten rut ve tu dau + tu cuoi
+                da bo dau (khoi chan - blocking key)
+    identity    Guardian: "+<so>|<ten bo dau>" - khoa danh tinh cua script gop nha
+
+Kiem tra trung = tra index lay ung vien, roi so sanh chinh xac tren tap ung vien
+(`duplicate.py`). Khoi ten rong hon phep so cu (bo dau, bo ten dem) nen khong lam
+mat ung vien; buoc so sanh sau giu nguyen do chinh xac cua rule.
+
+Ghi: doc hook on_update / on_trash cua CRM Lead, CRM Guardian (bang con luu cung
+parent). Ghi DB khong qua hook (import SQL) thi `refresh_recent` hang dem quet lai
+ban ghi moi sua; dung lai toan bo:
+
+    bench --site <site> execute erp.api.crm.match_keys.rebuild
+"""
+
+import frappe
+from frappe.utils import add_days, now_datetime
+
+from erp.api.crm.utils import normalize_phone_number
+
+DOCTYPE = "CRM Match Key"
+TABLE = f"tab{DOCTYPE}"
+
+LEAD = "CRM Lead"
+GUARDIAN = "CRM Guardian"
+
+PHONE = "phone"
+ALT_PHONE = "alt_phone"
+EMAIL = "email"
+NAME_BLOCK = "name_block"
+IDENTITY = "identity"
+
+MAX_KEY_LEN = 255
+REBUILD_BATCH = 2000
+REFRESH_DAYS = 2
+
+
+# ---------------------------------------------------------------------------
+# Chuan hoa (thuan - khong can site)
+# ---------------------------------------------------------------------------
+
+
+def phone_key(phone):
+    """SDT -> chi con chu so sau normalize_phone_number; '' neu khong dung duoc."""
+    e164 = normalize_phone_number(str(phone or ""))
+    digits = "".join(ch for ch in e164 if ch.isdigit())
+    return digits if len(digits) > 2 else ""
+
+
+def email_key(email):
+    value = (email or "").strip().lower()
+    return value if "@" in value else ""
+
+
+def fold_name(name):
+    """Ten bo dau / ha chu / gop khoang trang (ca \\n) - cung cach script gop nha."""
+    from erp.utils.search import strip_accents
+
+    return " ".join(strip_accents(name or "").casefold().split())
+
+
+def name_block(name):
+    """Khoi ten: tu dau + tu cuoi da bo dau ("nguyen van an" -> "nguyen an")."""
+    tokens = fold_name(name).split()
+    if not tokens:
+        return ""
+    return tokens[0] if len(tokens) == 1 else f"{tokens[0]} {tokens[-1]}"
+
+
+def lead_name_block(student_name, guardian_name):
+    sb, gb = name_block(student_name), name_block(guardian_name)
+    return f"{sb}|{gb}" if sb and gb else ""
+
+
+def identity_key(phone, name):
+    """Khoa danh tinh guardian: SDT (+84...) cong voi TEN - xem merge_families_by_guardian_phone."""
+    digits = phone_key(phone)
+    return f"+{digits}|{fold_name(name)}" if digits else ""
+
+
+def _rows(doc, table_field):
+    return doc.get(table_field) or []
+
+
+def lead_keys(doc):
+    """{(key_type, match_key)} cua mot lead (Document hoac dict co bang con)."""
+    keys = set()
+    for row in _rows(doc, "phone_numbers"):
+        keys.add((PHONE, phone_key(row.get("phone_number"))))
+    for row in _rows(doc, "emails"):
+        keys.add((EMAIL, email_key(row.get("email_address"))))
+    keys.add((EMAIL, email_key(doc.get("guardian_email"))))
+    keys.add((NAME_BLOCK, lead_name_block(doc.get("student_name"), doc.get("guardian_name"))))
+    return {(t, k[:MAX_KEY_LEN]) for t, k in keys if k}
+
+
+def guardian_keys(doc):
+    """{(key_type, match_key)} cua mot guardian. Chi SDT phang moi la danh tinh."""
+    keys = {
+        (PHONE, phone_key(doc.get("phone_number"))),
+        (IDENTITY, identity_key(doc.get("phone_number"), doc.get("guardian_name"))),
+    }
+    for row in _rows(doc, "phone_numbers"):
+        keys.add((ALT_PHONE, phone_key(row.get("phone_number"))))
+    for row in _rows(doc, "emails"):
+        keys.add((EMAIL, email_key(row.get("email_address"))))
+    return {(t, k[:MAX_KEY_LEN]) for t, k in keys if k}
+
+
+_KEY_BUILDERS = {LEAD: lead_keys, GUARDIAN: guardian_keys}
+
+
+# ---------------------------------------------------------------------------
+# Ghi
+# ---------------------------------------------------------------------------
+
+
+def _replace(entity_type, keys_by_entity):
+    """Xoa khoa cu cua cac entity roi chen lai - mot DELETE + mot INSERT nhieu dong."""
+    if not keys_by_entity:
+        return
+    frappe.db.sql(
+        f"DELETE FROM `{TABLE}` WHERE entity_type = %s AND entity_id IN %s",
+        (entity_type, tuple(keys_by_entity)),
+    )
+    values = []
+    for entity_id, keys in keys_by_entity.items():
+        for key_type, match_key in sorted(keys):
+            values.append((frappe.generate_hash(length=10), entity_type, entity_id, key_type, match_key))
+    if values:
+        now = now_datetime()
+        frappe.db.sql(
+            f"""
+            INSERT INTO `{TABLE}`
+                (name, entity_type, entity_id, key_type, match_key,
+                 creation, modified, owner, modified_by, docstatus)
+            VALUES {", ".join(["(%s, %s, %s, %s, %s, %s, %s, 'Administrator', 'Administrator', 0)"] * len(values))}
+            """,
+            tuple(v for row in values for v in row + (now, now)),
+        )
+
+
+def _on_change(doc, method):
+    if not frappe.db.table_exists(DOCTYPE):
+        return
+    if method == "on_trash":
+        frappe.db.sql(
+            f"DELETE FROM `{TABLE}` WHERE entity_type = %s AND entity_id = %s",
+            (doc.doctype, doc.name),
+        )
+        return
+    _replace(doc.doctype, {doc.name: _KEY_BUILDERS[doc.doctype](doc)})
+
+
+def on_lead_change(doc, method=None):
+    """Doc hook CRM Lead (on_update / on_trash): ghi cung giao dich voi lead."""
+    _on_change(doc, method)
+
+
+def on_guardian_change(doc, method=None):
+    """Doc hook CRM Guardian (on_update / on_trash)."""
+    _on_change(doc, method)
+
+
+# ---------------------------------------------------------------------------
+# Tra cuu
+# ---------------------------------------------------------------------------
+
+
+def find_leads(key_type, keys, exclude_draft=False, exclude_verify=False):
+    """Lead co khoa `key_type` thuoc `keys` - tra index (key_type, match_key)."""
+    keys = sorted({k for k in keys if k})
+    if not keys:
+        return []
+    wheres = ["k.entity_type = %(lead)s", "k.key_type = %(key_type)s", "k.match_key IN %(keys)s"]
+    if exclude_draft:
+        wheres.append("cl.step != 'Draft'")
+    if exclude_verify:
+        wheres.append("cl.step != 'Verify'")
+    return frappe.db.sql(
+        """
+        SELECT DISTINCT cl.name, cl.step, cl.status, cl.student_name, cl.guardian_name,
+               cl.modified, COALESCE(cl.pic_care, cl.pic_sales) AS pic, cl.campus_id
+        FROM `{table}` k
+        INNER JOIN `tabCRM Lead` cl ON cl.name = k.entity_id
+        WHERE {wheres}
+        """.format(table=TABLE, wheres=" AND ".join(wheres)),
+        {"lead": LEAD, "key_type": key_type, "keys": tuple(keys)},
+        as_dict=True,
+    )
+
+
+def holders(entity_type, key_type):
+    """{match_key: set(entity_id)} cho mot loai khoa - dung cho job quet hang loat."""
+    out = {}
+    for match_key, entity_id in frappe.db.sql(
+        f"SELECT match_key, entity_id FROM `{TABLE}` WHERE entity_type = %s AND key_type = %s",
+        (entity_type, key_type),
+    ):
+        out.setdefault(match_key, set()).add(entity_id)
+    return out
+
+
+def keys_by_entity(entity_type, key_type):
+    """{entity_id: set(match_key)} - chieu nguoc cua `holders`."""
+    out = {}
+    for match_key, ids in holders(entity_type, key_type).items():
+        for entity_id in ids:
+            out.setdefault(entity_id, set()).add(match_key)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Dung lai tu DB
+# ---------------------------------------------------------------------------
+
+
+_SOURCES = {
+    LEAD: {
+        "fields": "name, student_name, guardian_name, guardian_email",
+        "children": {"phone_numbers": ("CRM Lead Phone", "phone_number"), "emails": ("CRM Lead Email", "email_address")},
+    },
+    GUARDIAN: {
+        "fields": "name, guardian_name, phone_number",
+        "children": {"phone_numbers": ("CRM Guardian Phone", "phone_number"), "emails": ("CRM Guardian Email", "email_address")},
+    },
+}
+
+
+def _load_batch(entity_type, names):
+    src = _SOURCES[entity_type]
+    docs = {
+        r.name: r
+        for r in frappe.db.sql(
+            f"SELECT {src['fields']} FROM `tab{entity_type}` WHERE name IN %s", (tuple(names),), as_dict=True
+        )
+    }
+    for table_field, (child_dt, column) in src["children"].items():
+        for doc in docs.values():
+            doc[table_field] = []
+        for r in frappe.db.sql(
+            f"""
+            SELECT parent, {column} FROM `tab{child_dt}`
+            WHERE parenttype = %s AND parentfield = %s AND parent IN %s
+            """,
+            (entity_type, table_field, tuple(docs) or ("",)),
+            as_dict=True,
+        ):
+            if r.parent in docs:
+                docs[r.parent][table_field].append(r)
+    return docs
+
+
+def _reindex(entity_type, names):
+    done = 0
+    for start in range(0, len(names), REBUILD_BATCH):
+        chunk = names[start : start + REBUILD_BATCH]
+        docs = _load_batch(entity_type, chunk)
+        build = _KEY_BUILDERS[entity_type]
+        # Entity da bi xoa van nam trong `chunk` -> khoa cu bi xoa, khong chen lai
+        _replace(entity_type, {name: (build(docs[name]) if name in docs else set()) for name in chunk})
+        frappe.db.commit()
+        done += len(docs)
+    return done
+
+
+def rebuild(entity_types=None, since=None):
+    """Dung lai khoa cho `entity_types` (mac dinh ca hai). `since`: chi ban ghi sua tu moc nay."""
+    if not frappe.db.table_exists(DOCTYPE):
+        return {}
+    entity_types = [entity_types] if isinstance(entity_types, str) else (entity_types or list(_SOURCES))
+    summary = {}
+    for entity_type in entity_types:
+        if since:
+            names = frappe.db.sql_list(
+                f"SELECT name FROM `tab{entity_type}` WHERE modified >= %s ORDER BY name", (since,)
+            )
+        else:
+            names = frappe.db.sql_list(f"SELECT name FROM `tab{entity_type}` ORDER BY name")
+            # Khoa mo coi (entity da xoa ngoai hook)
+            frappe.db.sql(
+                f"""
+                DELETE k FROM `{TABLE}` k
+                LEFT JOIN `tab{entity_type}` e ON e.name = k.entity_id
+                WHERE k.entity_type = %s AND e.name IS NULL
+                """,
+                (entity_type,),
+            )
+            frappe.db.commit()
+        summary[entity_type] = _reindex(entity_type, names)
+    frappe.logger().info(f"crm match_keys.rebuild: {summary}")
+    return summary
+
+
+def refresh_recent():
+    """Scheduled (hang dem): lam moi khoa cua ban ghi sua trong REFRESH_DAYS ngay."""
+    return rebuild(since=add_days(now_datetime(), -REFRESH_DAYS))
@@ -1,17 +1,39 @@
 """
 Scheduler SLA CRM Issue — cap nhat sla_status + push canh bao (toi da 1 lan/ngay/issue).
+
+Khong quet bang dinh ky nua: doc hook dat han vao erp/common/deadlines.py (moc Warning,
+moc Breached, 00:00 hom sau de nhac lai), dispatcher goi process_issue_sla dung luc.
+check_crm_issue_sla van giu de chay tay.
 """
 
+from datetime import timedelta
 from typing import Optional
 
 import frappe
-from frappe.utils import getdate, now, nowdate
+from frappe.utils import get_datetime, getdate, now, now_datetime, nowdate
 
 from erp.api.crm.issue import (
     _approver_emails,
     _compute_sla_status_from_values,
     _notify_crm_issue_mobile,
+    _warning_seconds_before_deadline,
 )
+from erp.common import deadlines
+
+_SLA_FILTERS = {
+    "approval_status": "Da duyet",
+    "sla_deadline": ["is", "set"],
+    "first_response_at": ["is", "not set"],
+}
+_SLA_FIELDS = [
+    "name",
+    "sla_status",
+    "sla_deadline",
+    "sla_started_at",
+    "first_response_at",
+    "issue_code",
+    "pic",
+]
 
 
 def _enabled_emails(emails):
@@ -73,45 +95,96 @@ def _push_sla_notification(issue_name: str, issue_code: str, pic: Optional[str],
     )
 
 
+def _process_row(row):
+    """Cap nhat sla_status + push neu can cho mot issue; tra ve trang thai moi."""
+    old = (row.get("sla_status") or "").strip() or "On track"
+    new = _compute_sla_status_from_values(
+        row.get("sla_started_at"),
+        row.get("sla_deadline"),
+        row.get("first_response_at"),
+    )
+    if new != old:
+        frappe.db.set_value(
+            "CRM Issue",
+            row.name,
+            {"sla_status": new},
+            update_modified=False,
+        )
+    if new in ("Warning", "Breached") and _should_push_today(row.name):
+        _push_sla_notification(
+            row.name,
+            row.get("issue_code") or "",
+            row.get("pic"),
+            new,
+        )
+    return new
+
+
 @frappe.whitelist()
 def check_crm_issue_sla():
-    """Chay dinh ky: cap nhat sla_status (set_value, khong touch modified) + push warning/breached."""
-    rows = frappe.get_all(
-        "CRM Issue",
-        filters={
-            "approval_status": "Da duyet",
-            "sla_deadline": ["is", "set"],
-            "first_response_at": ["is", "not set"],
-        },
-        fields=[
-            "name",
-            "sla_status",
-            "sla_deadline",
-            "sla_started_at",
-            "first_response_at",
-            "issue_code",
-            "pic",
-        ],
-    )
+    """Chay tay: quet toan bo issue dang tinh SLA (lich thuong ngay do deadlines.dispatch lo)."""
+    rows = frappe.get_all("CRM Issue", filters=_SLA_FILTERS, fields=_SLA_FIELDS)
     for row in rows:
-        old = (row.get("sla_status") or "").strip() or "On track"
-        new = _compute_sla_status_from_values(
-            row.get("sla_started_at"),
-            row.get("sla_deadline"),
-            row.get("first_response_at"),
-        )
-        if new != old:
-            frappe.db.set_value(
-                "CRM Issue",
-                row.name,
-                {"sla_status": new},
-                update_modified=False,
-            )
-        if new in ("Warning", "Breached") and _should_push_today(row.name):
-            _push_sla_notification(
-                row.name,
-                row.get("issue_code") or "",
-                row.get("pic"),
-                new,
-            )
+        _process_row(row)
     frappe.db.commit()
+
+
+def next_sla_check(sla_started_at, sla_deadline, first_response_at, now_dt):
+    """Lan kiem tiep theo cua mot issue: moc Warning -> moc Breached -> 00:00 moi ngay.
+
+    None = khong con gi de theo doi (da phan hoi / chua co SLA).
+    """
+    if first_response_at or not sla_deadline or not sla_started_at:
+        return None
+    started, deadline = get_datetime(sla_started_at), get_datetime(sla_deadline)
+    total = (deadline - started).total_seconds()
+    warn_at = deadline - timedelta(seconds=_warning_seconds_before_deadline(total)) if total > 0 else deadline
+    tomorrow = deadlines.start_of_next_day(now_dt)
+    if now_dt < warn_at:
+        return warn_at
+    if now_dt < deadline:
+        return min(deadline, tomorrow)
+    return tomorrow
+
+
+def process_issue_sla(name):
+    """Handler deadlines: kiem lai issue tren DB, xu ly, tra ve han ke tiep."""
+    rows = frappe.get_all("CRM Issue", filters=dict(_SLA_FILTERS, name=name), fields=_SLA_FIELDS)
+    if not rows:
+        return None
+    row = rows[0]
+    _process_row(row)
+    return next_sla_check(
+        row.get("sla_started_at"), row.get("sla_deadline"), row.get("first_response_at"), now_datetime()
+    )
+
+
+def pending_sla_deadlines():
+    """Nguon cho deadlines.rebuild: (issue, han ke tiep) cua moi issue dang tinh SLA."""
+    now_dt = now_datetime()
+    for row in frappe.get_all("CRM Issue", filters=_SLA_FILTERS, fields=_SLA_FIELDS):
+        # Trang thai dang le da doi (vd. mat Redis luc toi moc) -> xu ly ngay
+        status = _compute_sla_status_from_values(
+            row.sla_started_at, row.sla_deadline, row.first_response_at
+        )
+        if status != ((row.sla_status or "").strip() or "On track") or (
+            status in ("Warning", "Breached") and _should_push_today(row.name)
+        ):
+            yield row.name, now_dt
+        else:
+            yield row.name, next_sla_check(row.sla_started_at, row.sla_deadline, row.first_response_at, now_dt)
+
+
+def on_issue_update(doc, method=None):
+    """Doc hook CRM Issue (on_update / on_trash): dat / doi / huy han SLA."""
+    if method == "on_trash" or (doc.get("approval_status") or "") != "Da duyet":
+        deadlines.cancel(deadlines.CRM_ISSUE_SLA, doc.name)
+        return
+    now_dt = now_datetime()
+    due = next_sla_check(doc.get("sla_started_at"), doc.get("sla_deadline"), doc.get("first_response_at"), now_dt)
+    if due and _compute_sla_status_from_values(
+        doc.get("sla_started_at"), doc.get("sla_deadline"), doc.get("first_response_at")
+    ) in ("Warning", "Breached"):
+        # Vua roi vao Warning/Breached (doi SLA, duyet lai) -> de handler quyet dinh push ngay
+        due = now_dt
+    deadlines.schedule(deadlines.CRM_ISSUE_SLA, doc.name, due)
@@ -9,6 +9,8 @@ from frappe.utils import add_to_date, cint, get_datetime, now_datetime, today
 
 from erp.api.erp_administrative.room_activity_log import log_room_activity
 from erp.api.erp_administrative.room_booking import (
+    RoomBookingConflict,
+    _conflict_response,
     _room_booking_conflicts,
     _validate_attendees,
     create_booking_for_ticket,
@@ -1699,49 +1701,59 @@ def _notify_hc_event_reminder(doc, recipient_emails, minutes_before):
         )
 
 
-def send_event_facility_reminders(minutes_before=60):
-    """Scheduler: nhắc PIC (task + công việc con) ~1 tiếng trước giờ bắt đầu sự kiện CSVC.
+EVENT_REMINDER_MINUTES = 60
+EVENT_REMINDER_RETRY_MINUTES = 5
+_EVENT_ACTIVE_STATUS = ("Open", "Assigned", "In Progress", "Waiting for Customer")
 
-    Chạy theo cron (mỗi 5 phút). Mỗi ticket chỉ gửi một lần nhờ cờ event_reminder_sent;
-    nếu chưa có PIC nào thì để nguyên cờ và thử lại ở lần quét sau (đến khi qua giờ thì rớt khỏi cửa sổ).
+
+def _event_reminder_filters(now, minutes_before):
+    return {
+        "is_event_facility": 1,
+        "event_reminder_sent": 0,
+        "status": ["in", _EVENT_ACTIVE_STATUS],
+        "event_start_time": ["between", [now, add_to_date(now, minutes=minutes_before)]],
+    }
+
+
+def _send_event_reminder(name, minutes_before):
+    """Nhắc PIC + người làm công việc con của một ticket. False nếu chưa có ai để nhắc (chưa đốt cờ)."""
+    doc = frappe.get_doc(DOCTYPE, name)
+    recipients = []
+    pic = _hc_user_email(getattr(doc, "assigned_to", None))
+    if pic:
+        recipients.append(pic)
+    sub_rows = frappe.get_all(
+        SUBTASK_DOCTYPE,
+        filters={"ticket": doc.name, "status": ["!=", "Cancelled"]},
+        fields=["assigned_to"],
+    )
+    for s in sub_rows:
+        em = _hc_user_email(s.get("assigned_to"))
+        if em:
+            recipients.append(em)
+    if not recipients:
+        return False
+    _notify_hc_event_reminder(doc, recipients, minutes_before)
+    frappe.db.set_value(DOCTYPE, doc.name, "event_reminder_sent", 1)
+    frappe.db.commit()
+    return True
+
+
+def send_event_facility_reminders(minutes_before=EVENT_REMINDER_MINUTES):
+    """Quét tay: nhắc PIC (task + công việc con) ~1 tiếng trước giờ bắt đầu sự kiện CSVC.
+
+    Lịch thường ngày do erp/common/deadlines.py lo (fire_event_facility_reminder).
+    Mỗi ticket chỉ gửi một lần nhờ cờ event_reminder_sent; nếu chưa có PIC nào thì
+    để nguyên cờ và thử lại ở lần sau (đến khi qua giờ thì rớt khỏi cửa sổ).
     """
     try:
-        minutes_before = cint(minutes_before) or 60
-        now = now_datetime()
-        threshold = add_to_date(now, minutes=minutes_before)
-        active_status = ("Open", "Assigned", "In Progress", "Waiting for Customer")
+        minutes_before = cint(minutes_before) or EVENT_REMINDER_MINUTES
         rows = frappe.get_all(
-            DOCTYPE,
-            filters={
-                "is_event_facility": 1,
-                "event_reminder_sent": 0,
-                "status": ["in", active_status],
-                "event_start_time": ["between", [now, threshold]],
-            },
-            fields=["name"],
+            DOCTYPE, filters=_event_reminder_filters(now_datetime(), minutes_before), fields=["name"]
         )
         for r in rows:
             try:
-                doc = frappe.get_doc(DOCTYPE, r.name)
-                recipients = []
-                pic = _hc_user_email(getattr(doc, "assigned_to", None))
-                if pic:
-                    recipients.append(pic)
-                sub_rows = frappe.get_all(
-                    SUBTASK_DOCTYPE,
-                    filters={"ticket": doc.name, "status": ["!=", "Cancelled"]},
-                    fields=["assigned_to"],
-                )
-                for s in sub_rows:
-                    em = _hc_user_email(s.get("assigned_to"))
-                    if em:
-                        recipients.append(em)
-                if not recipients:
-                    # Chưa có người để nhắc — chờ lần quét sau (chưa đốt cờ).
-                    continue
-                _notify_hc_event_reminder(doc, recipients, minutes_before)
-                frappe.db.set_value(DOCTYPE, doc.name, "event_reminder_sent", 1)
-                frappe.db.commit()
+                _send_event_reminder(r.name, minutes_before)
             except Exception:
                 frappe.log_error(
                     frappe.get_traceback(),
@@ -1754,6 +1766,52 @@ def send_event_facility_reminders(minutes_before=60):
         )
 
 
+def _event_reminder_due(event_start_time):
+    return add_to_date(get_datetime(event_start_time), minutes=-EVENT_REMINDER_MINUTES)
+
+
+def schedule_event_facility_reminder(doc, method=None):
+    """Doc hook (on_update / on_trash): đặt / dời / huỷ hạn nhắc sự kiện CSVC của ticket."""
+    from erp.common import deadlines
+
+    due = None
+    if (
+        method != "on_trash"
+        and cint(doc.get("is_event_facility"))
+        and not cint(doc.get("event_reminder_sent"))
+        and doc.get("status") in _EVENT_ACTIVE_STATUS
+        and doc.get("event_start_time")
+    ):
+        due = _event_reminder_due(doc.event_start_time)
+    deadlines.schedule(deadlines.EVENT_FACILITY, doc.name, due)
+
+
+def fire_event_facility_reminder(name):
+    """Handler deadlines: ticket còn trong cửa sổ thì nhắc; chưa có người nhận thì hẹn thử lại."""
+    now = now_datetime()
+    filters = dict(_event_reminder_filters(now, EVENT_REMINDER_MINUTES), name=name)
+    if not frappe.db.exists(DOCTYPE, filters):
+        return None
+    if _send_event_reminder(name, EVENT_REMINDER_MINUTES):
+        return None
+    return add_to_date(now, minutes=EVENT_REMINDER_RETRY_MINUTES)
+
+
+def pending_event_facility_reminders():
+    """Nguồn cho deadlines.rebuild: ticket sự kiện chưa nhắc, giờ bắt đầu còn ở phía trước."""
+    rows = frappe.get_all(
+        DOCTYPE,
+        filters={
+            "is_event_facility": 1,
+            "event_reminder_sent": 0,
+            "status": ["in", _EVENT_ACTIVE_STATUS],
+            "event_start_time": [">", now_datetime()],
+        },
+        fields=["name", "event_start_time"],
+    )
+    return [(r.name, _event_reminder_due(r.event_start_time)) for r in rows]
+
+
 def _notify_hc_ticket_pickup(doc):
     """Staff nhấn Nhận ticket — báo người tạo; action tách biệt ticket_picked_up (khác gán PIC)."""
     creator = (doc.creator_email or "").strip()
@@ -2546,19 +2604,17 @@ def create_ticket():
             _ticket_log_room_repair_activity(frappe.get_doc(DOCTYPE, doc.name), "repair_reported")
         except Exception:
             frappe.log_error(frappe.get_traceback(), "administrative_ticket.create_ticket.room_log")
-        frappe.db.commit()
 
         # Ticket sự kiện/CSVC: tạo thêm bản ghi ERP Room Booking để giữ chỗ phòng
-        # trên cùng lịch đặt phòng (nguồn dữ liệu chung chống trùng giờ).
+        # trên cùng lịch đặt phòng (nguồn dữ liệu chung chống trùng giờ). Cùng giao
+        # dịch với ticket: mất phòng vào tay lượt đặt song song thì huỷ cả ticket.
         if is_event_facility:
             try:
-                create_booking_for_ticket(
-                    frappe.get_doc(DOCTYPE, doc.name),
-                    attendee_rows=booking_attendee_rows,
-                )
-                frappe.db.commit()
-            except Exception:
-                frappe.log_error(frappe.get_traceback(), "administrative_ticket.create_ticket.room_booking")
+                create_booking_for_ticket(doc, attendee_rows=booking_attendee_rows)
+            except RoomBookingConflict:
+                frappe.db.rollback()
+                return _conflict_response()
+        frappe.db.commit()
 
         # Thông báo ticket HC mới (push + email + inbox web/mobile) đi qua notification-service
         # trong _hc_send_emails_on_ticket_create → _hc_notify_new_ticket_via_stream. Không còn
@@ -2803,6 +2859,9 @@ def update_ticket():
         if cint(getattr(doc, "is_event_facility", 0)):
             try:
                 sync_booking_for_ticket(frappe.get_doc(DOCTYPE, doc.name))
+            except RoomBookingConflict:
+                frappe.db.rollback()
+                return _conflict_response()
             except Exception:
                 frappe.log_error(frappe.get_traceback(), "administrative_ticket.update_ticket.room_booking")
         frappe.db.commit()
@@ -10,6 +10,7 @@ from typing import Dict, Any, List, Optional
 from erp.utils.campus_utils import get_current_campus_from_context, get_campus_id_from_user_roles
 from erp.utils.api_response import success_response, error_response, validation_error_response, not_found_response
 from erp.api.erp_administrative.room_activity_log import log_room_activity
+from erp.api.erp_administrative import room_history
 try:
     import pandas as pd
 except ImportError:
@@ -4025,16 +4026,6 @@ _ROOM_TYPE_LABELS = {
     "function_room": "Phòng chức năng",
 }
 
-# Các field chính của phòng cần tái dựng cho bản xuất theo mốc thời gian
-_ROOM_SNAPSHOT_FIELDS = (
-    "physical_code",
-    "room_number",
-    "capacity",
-    "room_type",
-    "building_id",
-    "is_active",
-)
-
 
 def _humanize_room_value(fieldname, value, _building_cache, _user_cache):
     """Chuyển giá trị thô (mã/0-1/link) sang chuỗi dễ đọc cho nhật ký thay đổi."""
@@ -4154,41 +4145,13 @@ def get_room_change_history():
         return error_response(str(e))
 
 
-def _reconstruct_room_at(ref_doctype, docname, current_values, fields, as_of_dt):
-    """Tái dựng giá trị các field tại mốc as_of bằng cách revert ngược các Version sau mốc.
-
-    Đi từ Version mới nhất -> cũ nhất (creation > as_of), với mỗi field đổi thì gán lại = giá trị cũ.
-    Sau khi xử lý hết, giá trị giữ lại chính là trạng thái tại as_of.
-    """
-    state = dict(current_values)
-    versions = frappe.get_all(
-        "Version",
-        filters={"ref_doctype": ref_doctype, "docname": docname, "creation": [">", as_of_dt]},
-        fields=["data"],
-        order_by="creation desc",
-        limit_page_length=500,
-    )
-    for v in versions:
-        try:
-            vdata = json.loads(v.get("data") or "{}")
-        except Exception:
-            continue
-        for entry in vdata.get("changed") or []:
-            if not isinstance(entry, (list, tuple)) or len(entry) < 3:
-                continue
-            fn = entry[0]
-            if fn in fields:
-                state[fn] = entry[1]  # revert về giá trị cũ
-    return state
-
-
 @frappe.whitelist(methods=["GET"], allow_guest=False)
 def export_rooms_snapshot():
     """Xuất Excel danh sách phòng theo trạng thái tại 1 mốc thời gian (point-in-time).
 
     Query: school_year_id (bắt buộc, để lấy tên theo năm), as_of (bắt buộc, mốc thời gian).
-    Tái dựng từ Frappe Version. Giới hạn: chỉ các phòng hiện còn tồn tại; nhãn tòa nhà/loại phòng
-    hiển thị theo tên hiện tại; chỉ có lịch sử từ khi bật track_changes.
+    Đọc bảng lịch sử room_history (1 truy vấn khoảng cho phòng + 1 cho bản gán theo năm),
+    nên gồm cả phòng đã xoá sau mốc. Nhãn tòa nhà/loại phòng hiển thị theo tên hiện tại.
     """
     args = getattr(frappe.request, "args", None) or {}
     school_year_id = (
@@ -4220,67 +4183,37 @@ def export_rooms_snapshot():
     building_ids = [b["name"] for b in building_rows]
     building_titles = {b["name"]: (b.get("title_vn") or b["name"]) for b in building_rows}
 
-    rooms = []
-    if building_ids:
-        rooms = frappe.get_all(
-            "ERP Administrative Room",
-            fields=[
-                "name",
-                "physical_code",
-                "room_number",
-                "capacity",
-                "room_type",
-                "building_id",
-                "is_active",
-                "creation",
-            ],
-            filters={"building_id": ["in", building_ids]},
-            order_by="room_number asc",
-        )
+    # Trạng thái tại mốc của mọi phòng (kể cả phòng đã xoá sau mốc), lọc theo tòa nhà
+    # của campus TẠI MỐC đó
+    room_states = room_history.states_at(room_history.ROOM, as_of_dt)
+    building_set = set(building_ids)
+    rooms = sorted(
+        (
+            (room_id, state)
+            for room_id, state in room_states.items()
+            if state.get("building_id") in building_set
+        ),
+        key=lambda item: str(item[1].get("room_number") or ""),
+    )
 
-    # Map phòng -> bản gán theo năm đã chọn (để lấy tên theo năm)
-    ya_by_room: Dict[str, Dict[str, Any]] = {}
+    # Tên theo năm: bản gán của năm đã chọn có hiệu lực tại mốc
+    yearly_names: Dict[str, str] = {}
     if rooms and school_year_id:
-        ya_rows = frappe.get_all(
-            "ERP Administrative Room Yearly Assignment",
-            filters={"room": ["in", [r["name"] for r in rooms]], "school_year_id": school_year_id},
-            fields=["name", "room", "display_title_vn", "creation"],
-        )
-        ya_by_room = {y["room"]: y for y in ya_rows}
+        for ya_state in room_history.states_at(
+            room_history.YEARLY, as_of_dt, school_year_id=school_year_id
+        ).values():
+            if ya_state.get("room"):
+                yearly_names[ya_state["room"]] = ya_state.get("display_title_vn") or ""
 
     header = ["Mã phòng", "Tên phòng (theo năm)", "Sức chứa", "Loại phòng", "Tòa nhà", "Hoạt động"]
     table = [header]
 
-    for room in rooms:
-        # Phòng tạo sau mốc -> chưa tồn tại tại thời điểm đó, bỏ qua
-        if room.get("creation") and get_datetime(room["creation"]) > as_of_dt:
-            continue
-
-        current = {fn: room.get(fn) for fn in _ROOM_SNAPSHOT_FIELDS}
-        state = _reconstruct_room_at(
-            "ERP Administrative Room", room["name"], current, set(_ROOM_SNAPSHOT_FIELDS), as_of_dt
-        )
+    for room_id, state in rooms:
+        yearly_name = yearly_names.get(room_id, "")
 
-        # Tên theo năm: tái dựng display_title_vn của bản gán năm đã chọn
-        yearly_name = ""
-        ya = ya_by_room.get(room["name"])
-        if ya and ya.get("creation") and get_datetime(ya["creation"]) <= as_of_dt:
-            ya_state = _reconstruct_room_at(
-                "ERP Administrative Room Yearly Assignment",
-                ya["name"],
-                {"display_title_vn": ya.get("display_title_vn")},
-                {"display_title_vn"},
-                as_of_dt,
-            )
-            yearly_name = ya_state.get("display_title_vn") or ""
-
-        ma_phong = state.get("physical_code") or state.get("room_number") or room["name"]
+        ma_phong = state.get("physical_code") or state.get("room_number") or room_id
         room_type_label = _ROOM_TYPE_LABELS.get(state.get("room_type"), state.get("room_type") or "")
-        building_label = building_titles.get(
-            state.get("building_id"),
-            frappe.db.get_value("ERP Administrative Building", state.get("building_id"), "title_vn")
-            or (state.get("building_id") or ""),
-        )
+        building_label = building_titles.get(state["building_id"], state["building_id"])
         try:
             active_label = "Hiệu lực" if int(state.get("is_active") or 0) else "Ngừng"
         except (TypeError, ValueError):
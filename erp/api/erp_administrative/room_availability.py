@@ -0,0 +1,471 @@
+# Copyright (c) 2026, Wellspring International School and contributors
+"""Tìm phòng trống nhiều phòng một lượt — chỉ mục khoảng bận theo campus / ngày.
+
+Vì sao
+------
+`get_room_bookings` / `_room_booking_conflicts` chỉ trả lời MỘT phòng; để tìm phòng
+trống FE phải gọi lần lượt từng phòng của campus (× số ngày nếu xem cả tuần), mỗi
+lượt vài truy vấn. Module này giữ sẵn các khoảng bận của cả campus theo ngày rồi trả
+lời bằng phép trừ khoảng trong bộ nhớ.
+
+Chỉ mục
+-------
+Mỗi (campus, ngày) là một hash Redis `room_availability:<campus>:<YYYY-MM-DD>`:
+field = room_id, value = [(start_phút, end_phút, kind, ref)] đã sắp xếp; field
+`__built__` đánh dấu ngày đã dựng. Ba nguồn bận:
+
+- `booking`   ERP Room Booking chưa Cancelled
+- `ticket`    ticket Hành chính CSVC sự kiện chưa Cancelled (kể cả ticket cũ chưa có booking)
+- `timetable` SIS Teacher Timetable đã sinh (giờ theo SIS Timetable Column)
+
+Ngày chưa có trong Redis được dựng lười: ba truy vấn cho MỌI ngày thiếu của campus.
+
+Làm mới
+-------
+- Doc hook booking / ticket (`on_booking_change`, `on_ticket_change`): gom (campus,
+  phòng, ngày) bị chạm — cả giá trị cũ lẫn mới — rồi sau commit tính lại ĐÚNG các ô
+  đó từ DB. Rollback thì không ghi gì.
+- Thời khoá biểu ghi bằng SQL thô (bulk sync) không qua doc hook: hash có TTL
+  `INDEX_TTL_SEC`, và `invalidate_campus` xoá cả campus khi cần làm mới ngay.
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+
+import frappe
+from frappe import _
+from frappe.utils import cint, get_datetime, getdate
+
+from erp.utils.api_response import error_response, success_response, validation_error_response
+
+BOOKING_DOCTYPE = "ERP Room Booking"
+TICKET_DOCTYPE = "ERP Administrative Ticket"
+ROOM_DOCTYPE = "ERP Administrative Room"
+CONFIG_DOCTYPE = "ERP Room Booking Config"
+
+KEY_PREFIX = "room_availability"
+BUILT_FIELD = "__built__"
+INDEX_TTL_SEC = 6 * 3600
+MAX_SEARCH_DAYS = 31
+DEFAULT_SLOT_MINUTES = 60
+
+_PENDING_FLAG = "room_availability_pending"
+_WEEKDAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def _hash_name(campus_id, day):
+    return f"{KEY_PREFIX}:{campus_id}:{day}"
+
+
+def _minutes(value):
+    """time / timedelta / datetime -> phút trong ngày."""
+    if value is None:
+        return None
+    if isinstance(value, timedelta):
+        return int(value.total_seconds() // 60)
+    return value.hour * 60 + value.minute
+
+
+def _days_between(start_day, end_day):
+    day = start_day
+    while day <= end_day:
+        yield day
+        day += timedelta(days=1)
+
+
+def _split_by_day(start_dt, end_dt):
+    """Cắt [start_dt, end_dt) thành các đoạn (ngày, start_phút, end_phút)."""
+    out = []
+    for day in _days_between(start_dt.date(), end_dt.date()):
+        lo = _minutes(start_dt) if day == start_dt.date() else 0
+        hi = _minutes(end_dt) if day == end_dt.date() else 24 * 60
+        if hi > lo:
+            out.append((day, lo, hi))
+    return out
+
+
+def merge_busy(intervals):
+    """Gộp các khoảng bận chồng lấn / nối tiếp — đầu vào [(start, end, ...)]."""
+    merged = []
+    for start, end, *_rest in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def free_slots(open_start, open_end, busy, min_minutes):
+    """Các khoảng trống trong [open_start, open_end) dài ít nhất min_minutes."""
+    slots = []
+    cursor = open_start
+    for start, end in merge_busy(busy):
+        if end <= cursor:
+            continue
+        if start >= open_end:
+            break
+        if start - cursor >= min_minutes:
+            slots.append((cursor, start))
+        cursor = max(cursor, end)
+    if open_end - cursor >= min_minutes:
+        slots.append((cursor, open_end))
+    return slots
+
+
+# ---------------------------------------------------------------------------
+# Dựng chỉ mục từ DB
+# ---------------------------------------------------------------------------
+
+
+def _load_intervals(campus_id, start_day, end_day, room_id=None):
+    """{(ngày, room_id): [(start, end, kind, ref)]} của campus trong [start_day, end_day]."""
+    range_start = datetime.combine(start_day, datetime.min.time())
+    range_end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+    params = {"campus": campus_id, "rs": range_start, "re": range_end, "ds": start_day, "de": end_day}
+    room_cond = ""
+    if room_id:
+        room_cond = "AND r.name = %(room)s"
+        params["room"] = room_id
+
+    out = {}
+
+    def _add(room, start_dt, end_dt, kind, ref):
+        start_dt, end_dt = get_datetime(start_dt), get_datetime(end_dt)
+        if not room or not start_dt or not end_dt or end_dt <= start_dt:
+            return
+        for day, lo, hi in _split_by_day(max(start_dt, range_start), min(end_dt, range_end)):
+            if start_day <= day <= end_day:
+                out.setdefault((day, room), []).append((lo, hi, kind, ref))
+
+    for row in frappe.db.sql(
+        f"""
+        SELECT b.name, b.room_id, b.start_time, b.end_time
+        FROM `tab{BOOKING_DOCTYPE}` b
+        INNER JOIN `tab{ROOM_DOCTYPE}` r ON r.name = b.room_id
+        WHERE r.campus_id = %(campus)s {room_cond}
+          AND b.status != 'Cancelled'
+          AND b.start_time < %(re)s AND b.end_time > %(rs)s
+        """,
+        params,
+        as_dict=True,
+    ):
+        _add(row.room_id, row.start_time, row.end_time, "booking", row.name)
+
+    for row in frappe.db.sql(
+        f"""
+        SELECT t.name, t.event_room_id, t.event_start_time, t.event_end_time
+        FROM `tab{TICKET_DOCTYPE}` t
+        INNER JOIN `tab{ROOM_DOCTYPE}` r ON r.name = t.event_room_id
+        WHERE r.campus_id = %(campus)s {room_cond}
+          AND t.is_event_facility = 1
+          AND t.status != 'Cancelled'
+          AND t.event_start_time < %(re)s AND t.event_end_time > %(rs)s
+        """,
+        params,
+        as_dict=True,
+    ):
+        _add(row.event_room_id, row.event_start_time, row.event_end_time, "ticket", row.name)
+
+    for row in frappe.db.sql(
+        f"""
+        SELECT DISTINCT tt.room_id, tt.date, col.start_time, col.end_time, tt.class_id
+        FROM `tabSIS Teacher Timetable` tt
+        INNER JOIN `tabSIS Timetable Column` col ON col.name = tt.timetable_column_id
+        INNER JOIN `tab{ROOM_DOCTYPE}` r ON r.name = tt.room_id
+        WHERE r.campus_id = %(campus)s {room_cond}
+          AND tt.date BETWEEN %(ds)s AND %(de)s
+          AND col.start_time IS NOT NULL AND col.end_time IS NOT NULL
+        """,
+        params,
+        as_dict=True,
+    ):
+        lo, hi = _minutes(row.start_time), _minutes(row.end_time)
+        if hi > lo:
+            out.setdefault((getdate(row.date), row.room_id), []).append(
+                (lo, hi, "timetable", row.class_id or "")
+            )
+
+    for intervals in out.values():
+        intervals.sort()
+    return out
+
+
+def _write_days(campus_id, days, loaded):
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    for day in days:
+        key = cache.make_key(_hash_name(campus_id, day))
+        pipe.delete(key)
+        mapping = {BUILT_FIELD: "1"}
+        for (d, room), intervals in loaded.items():
+            if d == day:
+                mapping[room] = json.dumps(intervals)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, INDEX_TTL_SEC)
+    pipe.execute()
+
+
+def get_campus_index(campus_id, start_day, end_day) -> dict:
+    """{ngày: {room_id: [(start, end, kind, ref)]}}; ngày thiếu thì dựng một lượt."""
+    cache = frappe.cache()
+    days = list(_days_between(start_day, end_day))
+    pipe = cache.pipeline()
+    for day in days:
+        pipe.hgetall(cache.make_key(_hash_name(campus_id, day)))
+    raw_days = pipe.execute()
+
+    index, missing = {}, []
+    for day, raw in zip(days, raw_days):
+        raw = {
+            (k.decode() if isinstance(k, bytes) else k): v for k, v in (raw or {}).items()
+        }
+        if BUILT_FIELD not in raw:
+            missing.append(day)
+            continue
+        index[day] = {
+            room: [tuple(i) for i in json.loads(v)]
+            for room, v in raw.items()
+            if room != BUILT_FIELD
+        }
+
+    if missing:
+        loaded = _load_intervals(campus_id, missing[0], missing[-1])
+        _write_days(campus_id, missing, loaded)
+        for day in missing:
+            index[day] = {room: iv for (d, room), iv in loaded.items() if d == day}
+    return index
+
+
+def invalidate_campus(campus_id):
+    """Xoá chỉ mục của campus — dùng sau khi sinh lại thời khoá biểu bằng SQL thô."""
+    try:
+        cache = frappe.cache()
+        keys = list(cache.scan_iter(match=cache.make_key(f"{KEY_PREFIX}:{campus_id}:*")))
+        if keys:
+            cache.delete(*keys)
+    except Exception as e:
+        frappe.logger().warning(f"room_availability invalidate failed {campus_id}: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Làm mới gia tăng theo doc hook
+# ---------------------------------------------------------------------------
+
+
+def _refresh_cells(cells):
+    """Tính lại các ô (campus, room, ngày) đã chạm — chỉ ngày đã có trong Redis."""
+    cache = frappe.cache()
+    by_room = {}
+    for campus_id, room_id, day in cells:
+        by_room.setdefault((campus_id, room_id), set()).add(day)
+    for (campus_id, room_id), days in by_room.items():
+        days = sorted(days)
+        keys = {day: cache.make_key(_hash_name(campus_id, day)) for day in days}
+        pipe = cache.pipeline()
+        for day in days:
+            pipe.hexists(keys[day], BUILT_FIELD)
+        built = [day for day, ok in zip(days, pipe.execute()) if ok]
+        if not built:
+            continue
+        loaded = _load_intervals(campus_id, built[0], built[-1], room_id=room_id)
+        pipe = cache.pipeline()
+        for day in built:
+            intervals = loaded.get((day, room_id))
+            if intervals:
+                pipe.hset(keys[day], room_id, json.dumps(intervals))
+            else:
+                pipe.hdel(keys[day], room_id)
+        pipe.execute()
+
+
+def _flush_pending():
+    cells = frappe.flags.pop(_PENDING_FLAG, None) or set()
+    if not cells:
+        return
+    try:
+        _refresh_cells(cells)
+    except Exception as e:
+        frappe.logger().warning(f"room_availability refresh failed: {e}")
+
+
+def _touch(room_id, start_dt, end_dt):
+    if not room_id or not start_dt or not end_dt:
+        return
+    campus_id = frappe.db.get_value(ROOM_DOCTYPE, room_id, "campus_id")
+    if not campus_id:
+        return
+    pending = frappe.flags.get(_PENDING_FLAG)
+    if pending is None:
+        pending = frappe.flags[_PENDING_FLAG] = set()
+        frappe.db.after_commit.add(_flush_pending)
+        frappe.db.after_rollback.add(lambda: frappe.flags.pop(_PENDING_FLAG, None))
+    start_dt, end_dt = get_datetime(start_dt), get_datetime(end_dt)
+    for day in _days_between(start_dt.date(), end_dt.date()):
+        pending.add((campus_id, room_id, day))
+
+
+def _touch_doc(doc, room_field, start_field, end_field):
+    try:
+        _touch(doc.get(room_field), doc.get(start_field), doc.get(end_field))
+        before = doc.get_doc_before_save() if hasattr(doc, "get_doc_before_save") else None
+        if before:
+            _touch(before.get(room_field), before.get(start_field), before.get(end_field))
+    except Exception as e:
+        frappe.logger().warning(f"room_availability hook failed {doc.doctype} {doc.name}: {e}")
+
+
+def on_booking_change(doc, method=None):
+    """Doc hook ERP Room Booking (on_update / on_trash)."""
+    _touch_doc(doc, "room_id", "start_time", "end_time")
+
+
+def on_ticket_change(doc, method=None):
+    """Doc hook ERP Administrative Ticket (on_update / on_trash) — chỉ ticket CSVC sự kiện."""
+    before = doc.get_doc_before_save() if hasattr(doc, "get_doc_before_save") else None
+    if not doc.get("is_event_facility") and not (before and before.get("is_event_facility")):
+        return
+    _touch_doc(doc, "event_room_id", "event_start_time", "event_end_time")
+
+
+# ---------------------------------------------------------------------------
+# Tìm phòng trống
+# ---------------------------------------------------------------------------
+
+
+def _candidate_rooms(campus_id, building_id=None, room_type=None, min_capacity=0):
+    """Phòng đang mở đặt (config active) của campus + giờ mở theo thứ."""
+    conditions = ["r.campus_id = %(campus)s", "cfg.is_active = 1", "IFNULL(r.is_active, 1) = 1"]
+    params = {"campus": campus_id}
+    if building_id:
+        conditions.append("r.building_id = %(building)s")
+        params["building"] = building_id
+    if room_type:
+        conditions.append("r.room_type = %(room_type)s")
+        params["room_type"] = room_type
+    if min_capacity:
+        conditions.append("IFNULL(r.capacity, 0) >= %(capacity)s")
+        params["capacity"] = min_capacity
+    rooms = frappe.db.sql(
+        f"""
+        SELECT r.name, r.title_vn, r.title_en, r.short_title, r.room_type, r.capacity,
+               r.building_id, cfg.name AS config_name
+        FROM `tab{ROOM_DOCTYPE}` r
+        INNER JOIN `tab{CONFIG_DOCTYPE}` cfg ON cfg.room_id = r.name
+        WHERE {' AND '.join(conditions)}
+        ORDER BY r.building_id, r.title_vn
+        """,
+        params,
+        as_dict=True,
+    )
+    hours = {}
+    if rooms:
+        for row in frappe.get_all(
+            "ERP Room Booking Availability",
+            filters={"parent": ["in", [r.config_name for r in rooms]], "parenttype": CONFIG_DOCTYPE},
+            fields=["parent", "day_of_week", "start_time", "end_time", "is_closed"],
+            limit_page_length=0,
+        ):
+            if row.is_closed or row.start_time is None or row.end_time is None:
+                continue
+            hours.setdefault(row.parent, {})[(row.day_of_week or "").strip()] = (
+                _minutes(row.start_time), _minutes(row.end_time),
+            )
+    return rooms, hours
+
+
+def search(campus_id, start_dt, end_dt, duration_minutes=None, building_id=None,
+           room_type=None, min_capacity=0):
+    """
+    Phòng có ít nhất một khoảng trống >= duration trong [start_dt, end_dt), đã giao với
+    giờ mở theo cấu hình. duration mặc định = cả khoảng nếu trong một ngày, còn khoảng
+    nhiều ngày (xem cả tuần) thì `DEFAULT_SLOT_MINUTES`.
+    """
+    duration = cint(duration_minutes)
+    if not duration:
+        if start_dt.date() == end_dt.date():
+            duration = int((end_dt - start_dt).total_seconds() // 60)
+        else:
+            duration = DEFAULT_SLOT_MINUTES
+    rooms, hours = _candidate_rooms(campus_id, building_id, room_type, cint(min_capacity))
+    if not rooms:
+        return []
+    segments = _split_by_day(start_dt, end_dt)
+    index = get_campus_index(campus_id, segments[0][0], segments[-1][0])
+
+    results = []
+    for room in rooms:
+        room_hours = hours.get(room.config_name) or {}
+        slots = []
+        for day, lo, hi in segments:
+            open_hours = room_hours.get(_WEEKDAY_NAMES[day.weekday()])
+            if not open_hours:
+                continue
+            open_lo, open_hi = max(lo, open_hours[0]), min(hi, open_hours[1])
+            if open_hi - open_lo < duration:
+                continue
+            busy = index.get(day, {}).get(room.name, [])
+            for s, e in free_slots(open_lo, open_hi, busy, duration):
+                slots.append({
+                    "start_time": str(datetime.combine(day, datetime.min.time()) + timedelta(minutes=s)),
+                    "end_time": str(datetime.combine(day, datetime.min.time()) + timedelta(minutes=e)),
+                })
+        if slots:
+            results.append({
+                "name": room.name,
+                "title_vn": room.title_vn or "",
+                "title_en": room.title_en or "",
+                "short_title": room.short_title or "",
+                "room_type": room.room_type or "",
+                "capacity": room.capacity,
+                "building_id": room.building_id or "",
+                "free_slots": slots,
+            })
+    return results
+
+
+@frappe.whitelist(allow_guest=False)
+def search_available_rooms(campus_id=None, start_time=None, end_time=None, duration_minutes=None,
+                           building_id=None, room_type=None, min_capacity=None):
+    """Tìm phòng trống trong một khoảng thời gian cho cả campus (lọc tòa/loại/sức chứa)."""
+    try:
+        form = frappe.local.form_dict or {}
+        campus_id = (campus_id or form.get("campus_id") or "").strip()
+        start_raw = start_time or form.get("start_time")
+        end_raw = end_time or form.get("end_time")
+        if not campus_id:
+            return validation_error_response(_("Thiếu campus_id"), {"campus_id": ["required"]})
+        if not start_raw or not end_raw:
+            return validation_error_response(
+                _("Thiếu thời gian bắt đầu / kết thúc"),
+                {"start_time": ["required"], "end_time": ["required"]},
+            )
+        try:
+            start_dt, end_dt = get_datetime(start_raw), get_datetime(end_raw)
+        except Exception:
+            return validation_error_response(
+                _("Định dạng thời gian không hợp lệ"),
+                {"start_time": ["invalid"], "end_time": ["invalid"]},
+            )
+        if end_dt <= start_dt:
+            return validation_error_response(
+                _("Thời gian kết thúc phải sau thời gian bắt đầu"), {"end_time": ["invalid"]}
+            )
+        if (end_dt.date() - start_dt.date()).days >= MAX_SEARCH_DAYS:
+            return validation_error_response(
+                _("Khoảng tìm kiếm tối đa {0} ngày").format(MAX_SEARCH_DAYS), {"end_time": ["too_long"]}
+            )
+        rooms = search(
+            campus_id,
+            start_dt,
+            end_dt,
+            duration_minutes=duration_minutes or form.get("duration_minutes"),
+            building_id=(building_id or form.get("building_id") or "").strip() or None,
+            room_type=(room_type or form.get("room_type") or "").strip() or None,
+            min_capacity=min_capacity or form.get("min_capacity"),
+        )
+        return success_response({"rooms": rooms}, "OK")
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), "room_availability.search_available_rooms")
+        return error_response(str(e))
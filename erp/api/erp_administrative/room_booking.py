@@ -66,6 +66,51 @@ def _room_booking_conflicts(room_id, start_dt, end_dt, exclude_booking_id=None,
     return frappe.get_all(BOOKING_DOCTYPE, filters=filters, fields=["name"])
 
 
+class RoomBookingConflict(frappe.ValidationError):
+    """Khung giờ đã có booking — phát hiện khi kiểm tra lại dưới khoá phòng."""
+
+
+CONFLICT_MESSAGE = "Khung giờ này đã có người đặt phòng. Vui lòng chọn thời gian khác."
+
+
+def _lock_room(room_id):
+    """Khoá dòng phòng tới hết giao dịch — hai lượt đặt cùng phòng chạy tuần tự."""
+    frappe.db.sql(
+        "SELECT name FROM `tabERP Administrative Room` WHERE name = %s FOR UPDATE", (room_id,)
+    )
+
+
+def _assert_no_conflict_locked(room_id, start_dt, end_dt, exclude_booking_id=None, exclude_ticket_id=None):
+    """
+    Khoá phòng rồi kiểm tra trùng bằng locking read (FOR UPDATE đọc bản đã commit mới
+    nhất, không phải snapshot REPEATABLE READ) — lượt đặt song song vừa commit vẫn thấy.
+    """
+    _lock_room(room_id)
+    conditions = [
+        "room_id = %(room)s",
+        "status != 'Cancelled'",
+        "start_time < %(end)s",
+        "end_time > %(start)s",
+    ]
+    params = {"room": room_id, "start": start_dt, "end": end_dt}
+    if exclude_booking_id:
+        conditions.append("name != %(exclude_booking)s")
+        params["exclude_booking"] = exclude_booking_id
+    if exclude_ticket_id:
+        conditions.append("IFNULL(source_ticket, '') != %(exclude_ticket)s")
+        params["exclude_ticket"] = exclude_ticket_id
+    hit = frappe.db.sql(
+        f"SELECT name FROM `tab{BOOKING_DOCTYPE}` WHERE {' AND '.join(conditions)} LIMIT 1 FOR UPDATE",
+        params,
+    )
+    if hit:
+        raise RoomBookingConflict(_(CONFLICT_MESSAGE))
+
+
+def _conflict_response():
+    return validation_error_response(_(CONFLICT_MESSAGE), {"end_time": ["conflict"]})
+
+
 def _resolve_booker_info(email):
     """Họ tên / avatar / phòng ban / mã NV của người đặt theo email (User.name)."""
     info = {"fullname": "", "avatar": "", "department": "", "employee_code": "", "user": None}
@@ -283,6 +328,10 @@ def _insert_booking(ctx, *, email, source, source_ticket=None, attendee_rows=Non
                 "department": att.get("department") or "",
             }
         )
+    # Kiểm tra ở caller là đường nhanh; kiểm tra quyết định nằm dưới khoá phòng
+    _assert_no_conflict_locked(
+        ctx["room_id"], ctx["start_dt"], ctx["end_dt"], exclude_ticket_id=source_ticket
+    )
     doc = frappe.get_doc(row)
     doc.insert(ignore_permissions=True)
     ensure_calendar_uid(doc)
@@ -324,10 +373,7 @@ def create_room_booking():
         if not ok_cfg:
             return err_cfg
         if _room_booking_conflicts(ctx["room_id"], ctx["start_dt"], ctx["end_dt"]):
-            return validation_error_response(
-                _("Khung giờ này đã có người đặt phòng. Vui lòng chọn thời gian khác."),
-                {"end_time": ["conflict"]},
-            )
+            return _conflict_response()
         doc = _insert_booking(
             ctx,
             email=email,
@@ -336,6 +382,9 @@ def create_room_booking():
         )
         frappe.db.commit()
         return success_response(_booking_to_dict(doc), "OK")
+    except RoomBookingConflict:
+        frappe.db.rollback()
+        return _conflict_response()
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "room_booking.create_room_booking")
         return error_response(str(e))
@@ -417,10 +466,10 @@ def update_room_booking():
         if _room_booking_conflicts(
             ctx["room_id"], ctx["start_dt"], ctx["end_dt"], exclude_booking_id=booking_id
         ):
-            return validation_error_response(
-                _("Khung giờ này đã có người đặt phòng. Vui lòng chọn thời gian khác."),
-                {"end_time": ["conflict"]},
-            )
+            return _conflict_response()
+        _assert_no_conflict_locked(
+            ctx["room_id"], ctx["start_dt"], ctx["end_dt"], exclude_booking_id=booking_id
+        )
 
         doc.title = ctx["title"]
         doc.description = ctx.get("description") or ""
@@ -438,6 +487,9 @@ def update_room_booking():
         send_booking_invites(doc, method="REQUEST")
         frappe.db.commit()
         return success_response(_booking_to_dict(doc), "OK")
+    except RoomBookingConflict:
+        frappe.db.rollback()
+        return _conflict_response()
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "room_booking.update_room_booking")
         return error_response(str(e))
@@ -589,7 +641,12 @@ def _ticket_booking_ctx(ticket):
 
 
 def create_booking_for_ticket(ticket, attendee_rows=None):
-    """Tạo ERP Room Booking gắn với ticket sự kiện/CSVC (idempotent theo source_ticket)."""
+    """
+    Tạo ERP Room Booking gắn với ticket sự kiện/CSVC (idempotent theo source_ticket).
+
+    Gọi TRONG giao dịch của ticket, trước commit: kiểm trùng dưới khoá phòng ném
+    RoomBookingConflict cho caller rollback cả ticket — không để ticket mất booking.
+    """
     try:
         ctx = _ticket_booking_ctx(ticket)
         if not ctx["room_id"] or not ctx["start_dt"] or not ctx["end_dt"]:
@@ -614,13 +671,20 @@ def create_booking_for_ticket(ticket, attendee_rows=None):
             source_ticket=ticket.name,
             attendee_rows=attendee_rows,
         )
+    except RoomBookingConflict:
+        raise
     except Exception:
         frappe.log_error(frappe.get_traceback(), "room_booking.create_booking_for_ticket")
         return None
 
 
 def sync_booking_for_ticket(ticket, attendee_rows=None):
-    """Đồng bộ booking gắn với ticket: cập nhật phòng/giờ/attendees, hoặc Cancelled khi ticket huỷ."""
+    """
+    Đồng bộ booking gắn với ticket: cập nhật phòng/giờ/attendees, hoặc Cancelled khi ticket huỷ.
+
+    Như create_booking_for_ticket: đổi phòng/giờ (hoặc mở lại booking đã huỷ) kiểm
+    trùng dưới khoá phòng, trùng thì ném RoomBookingConflict cho caller rollback.
+    """
     try:
         name = frappe.db.get_value(BOOKING_DOCTYPE, {"source_ticket": ticket.name}, "name")
         ticket_cancelled = (getattr(ticket, "status", None) or "") == "Cancelled"
@@ -639,6 +703,7 @@ def sync_booking_for_ticket(ticket, attendee_rows=None):
             return doc
 
         changed = False
+        slot_changed = doc.status == "Cancelled"
         for field, val in (
             ("title", ctx["title"]),
             ("description", ctx["description"]),
@@ -650,6 +715,8 @@ def sync_booking_for_ticket(ticket, attendee_rows=None):
             if val and getattr(doc, field) != val:
                 setattr(doc, field, val)
                 changed = True
+                if field in ("room_id", "start_time", "end_time"):
+                    slot_changed = True
 
         if attendee_rows is not None:
             _apply_attendees_to_doc(doc, attendee_rows)
@@ -665,6 +732,11 @@ def sync_booking_for_ticket(ticket, attendee_rows=None):
                 else str(err_cfg)
             ) or _("Không thể đặt phòng theo cấu hình hiện tại")
             frappe.throw(msg)
+        if slot_changed:
+            _assert_no_conflict_locked(
+                doc.room_id, doc.start_time, doc.end_time,
+                exclude_booking_id=doc.name, exclude_ticket_id=ticket.name,
+            )
         doc.status = "Booked"
         if changed:
             bump_calendar_sequence(doc)
@@ -672,6 +744,8 @@ def sync_booking_for_ticket(ticket, attendee_rows=None):
         if changed:
             send_booking_invites(doc, method="REQUEST")
         return doc
+    except RoomBookingConflict:
+        raise
     except Exception:
         frappe.log_error(frappe.get_traceback(), "room_booking.sync_booking_for_ticket")
         return None
@@ -0,0 +1,251 @@
+# Copyright (c) 2026, Wellspring International School and contributors
+"""Lịch sử theo thời gian của phòng + bản gán theo năm (ERP Administrative Room History).
+
+Vì sao không tái dựng từ Version nữa
+------------------------------------
+`export_rooms_snapshot` từng đọc tới 500 Version / phòng rồi revert ngược từng cái —
+mỗi lần xuất là hàng nghìn lượt đọc + parse JSON. Tệ hơn, `log_purge` xoá Version
+cũ hơn 90 ngày, nên xuất theo mốc cũ hơn 90 ngày sai mà không báo gì.
+
+Bảng này giữ MỘT dòng cho mỗi bộ giá trị (các field trong `TRACKED_FIELDS`) có hiệu
+lực trong [valid_from, valid_to); valid_to NULL = hiện tại. "Phòng trông thế nào lúc
+T" của cả campus là MỘT truy vấn khoảng trên index (ref_doctype, valid_from, valid_to).
+
+Ghi
+---
+- Doc hook `on_doc_update` (after_insert/on_update): bộ giá trị khác dòng đang mở thì
+  đóng dòng đó (valid_to = modified) và mở dòng mới; giống hệt thì không ghi gì —
+  lưu mà không đổi field theo dõi không sinh phiên bản.
+- `on_doc_trash`: đóng dòng đang mở; lịch sử của phòng đã xoá vẫn còn cho xuất cũ.
+- `backfill`: dựng một lần từ Version còn lại (patch), chỉ cho bản ghi chưa có dòng nào.
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import frappe
+from frappe.utils import get_datetime
+
+DOCTYPE = "ERP Administrative Room History"
+TABLE = f"tab{DOCTYPE}"
+ROOM = "ERP Administrative Room"
+YEARLY = "ERP Administrative Room Yearly Assignment"
+
+TRACKED_FIELDS = {
+    ROOM: (
+        "campus_id", "building_id", "room_number", "physical_code", "title_vn", "title_en",
+        "short_title", "capacity", "room_type", "is_active", "needs_review",
+    ),
+    YEARLY: (
+        "room", "school_year_id", "usage_type", "display_title_vn", "display_title_en",
+        "display_short_title", "class_id", "homeroom_teacher_id", "homeroom_teacher_name",
+        "vice_homeroom_teacher_id", "status", "notes",
+    ),
+}
+
+BACKFILL_CHUNK = 200
+
+
+def _normalise(value):
+    """Giá trị so sánh được sau khi qua JSON (doc giữ int/date, Version giữ chuỗi)."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return str(value)
+    if value == "":
+        return None
+    return value
+
+
+def _snapshot(ref_doctype, source) -> dict:
+    return {fn: _normalise(source.get(fn)) for fn in TRACKED_FIELDS[ref_doctype]}
+
+
+def _room_and_year(ref_doctype, docname, snapshot):
+    if ref_doctype == ROOM:
+        return docname, None
+    return snapshot.get("room"), snapshot.get("school_year_id")
+
+
+def _insert_revision(ref_doctype, docname, snapshot, valid_from, valid_to=None, changed_by=None):
+    room, school_year_id = _room_and_year(ref_doctype, docname, snapshot)
+    now = frappe.utils.now_datetime()
+    user = frappe.session.user
+    frappe.db.sql(
+        f"""
+        INSERT INTO `{TABLE}`
+            (name, ref_doctype, docname, room, school_year_id, valid_from, valid_to,
+             changed_by, snapshot, creation, modified, owner, modified_by, docstatus)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 0)
+        """,
+        (
+            frappe.generate_hash(length=12), ref_doctype, docname, room, school_year_id,
+            valid_from, valid_to, changed_by, json.dumps(snapshot, default=str),
+            now, now, user, user,
+        ),
+    )
+
+
+def _open_revision(ref_doctype, docname):
+    rows = frappe.db.sql(
+        f"""
+        SELECT name, valid_from, snapshot FROM `{TABLE}`
+        WHERE ref_doctype = %s AND docname = %s AND valid_to IS NULL
+        ORDER BY valid_from DESC
+        LIMIT 1
+        FOR UPDATE
+        """,
+        (ref_doctype, docname),
+        as_dict=True,
+    )
+    return rows[0] if rows else None
+
+
+def on_doc_update(doc, method=None):
+    """Doc hook (after_insert / on_update) cho phòng và bản gán theo năm."""
+    if doc.doctype not in TRACKED_FIELDS or not frappe.db.table_exists(DOCTYPE):
+        return
+    snapshot = _snapshot(doc.doctype, doc)
+    current = _open_revision(doc.doctype, doc.name)
+    if current is not None:
+        try:
+            stored = json.loads(current.snapshot or "{}")
+        except ValueError:
+            stored = None
+        if stored == json.loads(json.dumps(snapshot, default=str)):
+            return
+
+    ts = get_datetime(doc.modified) if doc.get("modified") else frappe.utils.now_datetime()
+    if current is None:
+        # Bản ghi chưa có lịch sử: phiên bản đầu có hiệu lực từ lúc tạo
+        valid_from = get_datetime(doc.creation) if doc.get("creation") else ts
+    else:
+        valid_from = max(ts, get_datetime(current.valid_from))
+        frappe.db.sql(
+            f"UPDATE `{TABLE}` SET valid_to = %s WHERE name = %s",
+            (valid_from, current.name),
+        )
+    _insert_revision(
+        doc.doctype, doc.name, snapshot, valid_from,
+        changed_by=doc.get("modified_by") or frappe.session.user,
+    )
+
+
+def on_doc_trash(doc, method=None):
+    """Doc hook on_trash: đóng phiên bản đang mở (phòng đã xoá vẫn có trong xuất theo mốc cũ)."""
+    if doc.doctype not in TRACKED_FIELDS or not frappe.db.table_exists(DOCTYPE):
+        return
+    frappe.db.sql(
+        f"UPDATE `{TABLE}` SET valid_to = %s WHERE ref_doctype = %s AND docname = %s AND valid_to IS NULL",
+        (frappe.utils.now_datetime(), doc.doctype, doc.name),
+    )
+
+
+def states_at(ref_doctype, as_of_dt, school_year_id=None) -> dict:
+    """
+    {docname: snapshot} của mọi bản ghi `ref_doctype` có hiệu lực tại as_of_dt —
+    một truy vấn khoảng, không vòng theo phòng.
+    """
+    conditions = ["ref_doctype = %(dt)s", "valid_from <= %(at)s", "(valid_to IS NULL OR valid_to > %(at)s)"]
+    params = {"dt": ref_doctype, "at": get_datetime(as_of_dt)}
+    if school_year_id:
+        conditions.append("school_year_id = %(sy)s")
+        params["sy"] = school_year_id
+    out = {}
+    for row in frappe.db.sql(
+        f"SELECT docname, snapshot FROM `{TABLE}` WHERE {' AND '.join(conditions)}",
+        params,
+        as_dict=True,
+    ):
+        try:
+            out[row.docname] = json.loads(row.snapshot or "{}")
+        except ValueError:
+            continue
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Dựng một lần từ Version
+# ---------------------------------------------------------------------------
+
+
+def _revisions_from_versions(ref_doctype, current, versions):
+    """
+    Tái dựng các phiên bản của MỘT bản ghi từ giá trị hiện tại + Version (cũ -> mới).
+    Trả [(valid_from, valid_to, snapshot, changed_by)] theo thứ tự thời gian.
+    """
+    fields = set(TRACKED_FIELDS[ref_doctype])
+    state = _snapshot(ref_doctype, current)
+    # (valid_from, snapshot, changed_by) — đi từ mới nhất về cũ nhất
+    backwards = []
+    for v in reversed(versions):
+        try:
+            changed = (json.loads(v.data or "{}") or {}).get("changed") or []
+        except ValueError:
+            continue
+        touched = [e for e in changed if isinstance(e, (list, tuple)) and len(e) >= 3 and e[0] in fields]
+        if not touched:
+            continue
+        backwards.append((get_datetime(v.creation), dict(state), v.owner))
+        for entry in touched:
+            state[entry[0]] = _normalise(entry[1])
+    backwards.append((get_datetime(current.creation), dict(state), current.owner))
+
+    revisions = []
+    valid_to = None
+    for valid_from, snapshot, changed_by in backwards:
+        # Version cũ nhất có thể trùng giây với lúc tạo — giữ phiên bản muộn hơn
+        if valid_to is not None and valid_from >= valid_to:
+            continue
+        revisions.append((valid_from, valid_to, snapshot, changed_by))
+        valid_to = valid_from
+    revisions.reverse()
+    return revisions
+
+
+def backfill() -> dict:
+    """Dựng lịch sử cho mọi phòng / bản gán chưa có dòng nào, commit theo lô."""
+    if not frappe.db.table_exists(DOCTYPE):
+        return {}
+    summary = {}
+    for ref_doctype, fields in TRACKED_FIELDS.items():
+        done = set(frappe.db.sql_list(
+            f"SELECT DISTINCT docname FROM `{TABLE}` WHERE ref_doctype = %s", (ref_doctype,)
+        ))
+        docs = [
+            d for d in frappe.get_all(
+                ref_doctype,
+                fields=["name", "creation", "owner", *fields],
+                ignore_permissions=True,
+            )
+            if d.name not in done
+        ]
+        inserted = 0
+        for i in range(0, len(docs), BACKFILL_CHUNK):
+            chunk = docs[i:i + BACKFILL_CHUNK]
+            versions = {}
+            for v in frappe.db.sql(
+                """
+                SELECT docname, creation, owner, data FROM `tabVersion`
+                WHERE ref_doctype = %(dt)s AND docname IN %(names)s
+                ORDER BY creation ASC
+                """,
+                {"dt": ref_doctype, "names": [d.name for d in chunk]},
+                as_dict=True,
+            ):
+                versions.setdefault(v.docname, []).append(v)
+            for d in chunk:
+                for valid_from, valid_to, snapshot, changed_by in _revisions_from_versions(
+                    ref_doctype, d, versions.get(d.name, [])
+                ):
+                    _insert_revision(ref_doctype, d.name, snapshot, valid_from, valid_to, changed_by)
+                    inserted += 1
+            frappe.db.commit()
+        summary[ref_doctype] = {"docs": len(docs), "revisions": inserted}
+    frappe.logger().info(f"room_history backfill: {summary}")
+    return summary
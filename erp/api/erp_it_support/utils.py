@@ -13,6 +13,7 @@ import frappe
 from frappe import _
 from frappe.utils import get_files_path, now_datetime
 
+from erp.api.erp_it_support import workload
 from erp.it_support.doctype.erp_it_support_team_member.erp_it_support_team_member import (
 	SUPPORT_ROLES,
 )
@@ -217,7 +218,7 @@ def _resolve_category_doc(category_input: str) -> Optional[str]:
 
 
 def _resolve_pic_from_category_role(category_input: str) -> Optional[str]:
-	"""Auto-assign theo role — load balancing số ticket đang xử lý."""
+	"""Auto-assign theo role — người ít ticket đang xử lý nhất (bộ đếm trong workload.py)."""
 	cat_name = _resolve_category_doc(category_input)
 	if not cat_name:
 		return None
@@ -225,34 +226,7 @@ def _resolve_pic_from_category_role(category_input: str) -> Optional[str]:
 	if not support_role:
 		support_role = CATEGORY_TO_ROLE.get(category_input) or category_input
 
-	members = frappe.get_all(
-		TEAM_DOCTYPE,
-		filters={"is_active": 1},
-		fields=["name", "user", "roles_json"],
-	)
-	candidates = []
-	for m in members:
-		roles = _parse_json_field(m.get("roles_json"))
-		if support_role in roles:
-			candidates.append(m.get("user"))
-
-	if not candidates:
-		return None
-	if len(candidates) == 1:
-		return candidates[0]
-
-	stats = []
-	for uid in candidates:
-		cnt = frappe.db.count(
-			DOCTYPE,
-			{
-				"assigned_to": uid,
-				"status": ["in", list(ACTIVE_ASSIGN_STATUSES)],
-			},
-		)
-		stats.append((cnt, uid))
-	stats.sort(key=lambda x: x[0])
-	return stats[0][1]
+	return workload.pick_assignee(workload.role_members(support_role))
 
 
 def _append_history(ticket_id: str, action: str, user=None, detail=None):
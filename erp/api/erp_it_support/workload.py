@@ -0,0 +1,361 @@
+# Copyright (c) 2026, Wellspring International School and contributors
+# Tải việc đội IT — bộ đếm ticket đang xử lý theo người, dùng cho auto-assign
+"""
+VÌ SAO CẦN
+----------
+Auto-assign cũ mỗi ticket: đọc toàn bộ thành viên active, parse `roles_json`
+trong Python, rồi một `frappe.db.count` cho MỖI ứng viên. Email đổ về theo đợt
+lặp lại y hệt cho từng ticket, và hai ticket đồng thời đọc cùng số đếm nên dồn
+về cùng một người.
+
+Ở đây:
+	- Redis hash `it_support:open_tickets` {user: số ticket Assigned/Processing}.
+	  Hook ticket (on_update / on_trash) cộng/trừ phần chênh SAU commit.
+	- Chỉ mục role → thành viên cache bằng `frappe.cache().set_value`, xoá khi
+	  thành viên đội đổi (controller Team Member).
+	- `pick_assignee` chạy một Lua script: chọn người ít việc nhất trong ứng
+	  viên VÀ cộng 1 cho họ — nguyên tử, nên ticket đồng thời chia đều.
+
+	⚠️ Redis chỉ là bộ đếm phụ, DB vẫn là nguồn sự thật. Redis lỗi thì chọn
+	bằng một câu GROUP BY trên DB; cron 15 phút `reconcile` ghi đè bộ đếm từ DB.
+
+Giữ chỗ khi chọn
+----------------
+`pick_assignee` đã cộng 1 trước khi ticket được insert. Hook của chính ticket
+đó (cùng giao dịch) "tiêu" giữ chỗ thay vì cộng thêm. Khi commit: giữ chỗ chưa
+tiêu (chọn xong nhưng không insert) được trả lại. Khi rollback: trả lại mọi
+giữ chỗ của giao dịch, bỏ các delta đang chờ.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+import frappe
+
+from erp.it_support.doctype.erp_it_support_team_member.erp_it_support_team_member import (
+	_normalize_roles_json,
+)
+
+TICKET_DOCTYPE = "ERP IT Support Ticket"
+TEAM_DOCTYPE = "ERP IT Support Team Member"
+
+# Khớp utils.ACTIVE_ASSIGN_STATUSES
+OPEN_STATUSES = ("Assigned", "Processing")
+
+KEY_OPEN_TICKETS = "it_support:open_tickets"
+KEY_ROLE_INDEX = "it_support:role_members"
+
+# Hash tự hết hạn nếu cron reconcile ngừng chạy (tránh số đếm mồ côi lệch mãi)
+KEY_TTL_SECONDS = 86400
+ROLE_INDEX_TTL_SECONDS = 3600
+
+_STATE_FLAG = "it_support_workload_state"
+
+# Kết quả pick khi có ứng viên chưa seed
+UNSEEDED = -1
+
+# KEYS[1] hash số ticket. ARGV: ứng viên theo thứ tự ưu tiên (hoà thì người đứng trước).
+_PICK_LUA = """
+local best, best_count
+for i = 1, #ARGV do
+	local c = redis.call('HGET', KEYS[1], ARGV[i])
+	if not c then
+		return {-1, ARGV[i]}
+	end
+	c = tonumber(c)
+	if not best_count or c < best_count then
+		best, best_count = ARGV[i], c
+	end
+end
+redis.call('HINCRBY', KEYS[1], best, 1)
+return {best_count, best}
+"""
+
+# KEYS[1] hash số ticket. ARGV: cặp (user, delta). User chưa seed thì bỏ qua —
+# HINCRBY trên field thiếu sẽ tạo số đếm sai (bắt đầu từ 0 thay vì từ DB).
+_APPLY_LUA = """
+for i = 1, #ARGV, 2 do
+	if redis.call('HEXISTS', KEYS[1], ARGV[i]) == 1 then
+		if redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1]) < 0 then
+			redis.call('HSET', KEYS[1], ARGV[i], 0)
+		end
+	end
+end
+return 1
+"""
+
+
+def _logger():
+	return frappe.logger("it_support_workload")
+
+
+def _decode(value):
+	return value.decode() if isinstance(value, bytes) else value
+
+
+# ---------------------------------------------------------------------------
+# Phần thuần
+# ---------------------------------------------------------------------------
+
+
+def build_role_index(members: Iterable[dict]) -> dict[str, list[str]]:
+	"""{role: [user, ...]} từ các dòng Team Member active — giữ thứ tự, bỏ trùng."""
+	index: dict[str, list[str]] = {}
+	for m in members:
+		user = m.get("user")
+		if not user:
+			continue
+		for role in _normalize_roles_json(m.get("roles_json")):
+			users = index.setdefault(role, [])
+			if user not in users:
+				users.append(user)
+	return index
+
+
+def ticket_load(doc) -> dict[str, int]:
+	"""Phần đóng góp của một ticket vào bộ đếm: {assigned_to: 1} nếu đang xử lý."""
+	if not doc:
+		return {}
+	user = doc.get("assigned_to")
+	if user and doc.get("status") in OPEN_STATUSES:
+		return {user: 1}
+	return {}
+
+
+def load_delta(before: dict[str, int], after: dict[str, int]) -> dict[str, int]:
+	"""after - before theo user, bỏ các user không đổi."""
+	delta = {}
+	for user in set(before) | set(after):
+		diff = after.get(user, 0) - before.get(user, 0)
+		if diff:
+			delta[user] = diff
+	return delta
+
+
+def consume_reserved(delta: dict[str, int], reserved: dict[str, int]):
+	"""
+	Trừ phần cộng của `delta` vào các giữ chỗ còn mở (pick đã cộng sẵn).
+
+	Trả (delta còn lại, giữ chỗ còn lại) — không sửa dict đầu vào.
+	"""
+	delta, reserved = dict(delta), dict(reserved)
+	for user, diff in list(delta.items()):
+		held = reserved.get(user, 0)
+		if diff <= 0 or held <= 0:
+			continue
+		used = min(diff, held)
+		delta[user] = diff - used
+		reserved[user] = held - used
+		if not delta[user]:
+			del delta[user]
+		if not reserved[user]:
+			del reserved[user]
+	return delta, reserved
+
+
+def least_loaded(candidates: list[str], counts: dict[str, int]) -> str | None:
+	"""Người ít ticket nhất; hoà thì người đứng trước trong danh sách (như Lua)."""
+	best, best_count = None, None
+	for user in candidates:
+		c = int(counts.get(user) or 0)
+		if best_count is None or c < best_count:
+			best, best_count = user, c
+	return best
+
+
+# ---------------------------------------------------------------------------
+# Chỉ mục role → thành viên
+# ---------------------------------------------------------------------------
+
+
+def role_members(role: str) -> list[str]:
+	"""Thành viên active có `role`, từ chỉ mục cache (dựng lại bằng một get_all khi thiếu)."""
+	if not role:
+		return []
+	cache = frappe.cache()
+	index = cache.get_value(KEY_ROLE_INDEX)
+	if index is None:
+		members = frappe.get_all(
+			TEAM_DOCTYPE,
+			filters={"is_active": 1},
+			fields=["user", "roles_json"],
+			order_by="creation asc",
+		)
+		index = build_role_index(members)
+		cache.set_value(KEY_ROLE_INDEX, index, expires_in_sec=ROLE_INDEX_TTL_SECONDS)
+	return list(index.get(role) or [])
+
+
+def invalidate_role_index():
+	"""Xoá chỉ mục ngay và sau commit (request khác có thể dựng lại từ dữ liệu cũ giữa chừng)."""
+	frappe.cache().delete_value(KEY_ROLE_INDEX)
+	frappe.db.after_commit.add(lambda: frappe.cache().delete_value(KEY_ROLE_INDEX))
+
+
+# ---------------------------------------------------------------------------
+# Bộ đếm Redis
+# ---------------------------------------------------------------------------
+
+
+def _open_counts(users: list[str] | None = None) -> dict[str, int]:
+	"""{user: số ticket đang xử lý} theo DB — một câu GROUP BY; user không có ticket = 0."""
+	if users is not None and not users:
+		return {}
+	where = "status IN %(statuses)s AND IFNULL(assigned_to, '') != ''"
+	values = {"statuses": OPEN_STATUSES}
+	if users is not None:
+		where += " AND assigned_to IN %(users)s"
+		values["users"] = tuple(users)
+	rows = frappe.db.sql(
+		f"""
+		SELECT assigned_to, COUNT(*) FROM `tab{TICKET_DOCTYPE}`
+		WHERE {where}
+		GROUP BY assigned_to
+		""",
+		values,
+	)
+	counts = {user: int(cnt) for user, cnt in rows}
+	for user in users or []:
+		counts.setdefault(user, 0)
+	return counts
+
+
+def _seed(cache, users: list[str]):
+	"""Nạp số đếm DB cho các user còn thiếu (HSETNX — không đè số đang chạy)."""
+	key = cache.make_key(KEY_OPEN_TICKETS)
+	pipe = cache.pipeline(transaction=False)
+	for user, cnt in _open_counts(users).items():
+		pipe.hsetnx(key, user, cnt)
+	pipe.expire(key, KEY_TTL_SECONDS)
+	pipe.execute()
+
+
+def _apply(deltas: dict[str, int]):
+	deltas = {u: d for u, d in (deltas or {}).items() if u and d}
+	if not deltas:
+		return
+	try:
+		cache = frappe.cache()
+		script = cache.register_script(_APPLY_LUA)
+		args = []
+		for user, diff in deltas.items():
+			args.extend([user, int(diff)])
+		script(keys=[cache.make_key(KEY_OPEN_TICKETS)], args=args)
+	except Exception as e:
+		# Lệch tới lần reconcile kế tiếp (tối đa 15 phút) — chỉ ảnh hưởng độ cân bằng
+		_logger().warning(f"it support workload apply failed {deltas}: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Trạng thái theo giao dịch: delta chờ commit + giữ chỗ của pick
+# ---------------------------------------------------------------------------
+
+
+def _state() -> dict:
+	state = frappe.flags.get(_STATE_FLAG)
+	if state is None:
+		state = frappe.flags[_STATE_FLAG] = {"pending": {}, "made": {}, "open": {}}
+		frappe.db.after_commit.add(_on_commit)
+		frappe.db.after_rollback.add(_on_rollback)
+	return state
+
+
+def _on_commit():
+	state = frappe.flags.pop(_STATE_FLAG, None)
+	if not state:
+		return
+	deltas = dict(state["pending"])
+	# Chọn xong nhưng không có ticket nào nhận người đó → trả lại
+	for user, held in state["open"].items():
+		deltas[user] = deltas.get(user, 0) - held
+	_apply(deltas)
+
+
+def _on_rollback():
+	state = frappe.flags.pop(_STATE_FLAG, None)
+	if not state:
+		return
+	_apply({user: -held for user, held in state["made"].items()})
+
+
+def _reserve(user: str):
+	state = _state()
+	state["made"][user] = state["made"].get(user, 0) + 1
+	state["open"][user] = state["open"].get(user, 0) + 1
+
+
+def pick_assignee(candidates: list[str]) -> str | None:
+	"""
+	Chọn người ít ticket đang xử lý nhất trong `candidates` và giữ chỗ cho họ.
+
+	Một EVALSHA cho cả danh sách; ứng viên chưa có số đếm thì seed từ DB rồi
+	thử lại một lần. Redis lỗi → một câu GROUP BY trên DB.
+	"""
+	candidates = [u for u in dict.fromkeys(candidates or []) if u]
+	if not candidates:
+		return None
+
+	try:
+		cache = frappe.cache()
+		script = cache.register_script(_PICK_LUA)
+		keys = [cache.make_key(KEY_OPEN_TICKETS)]
+		result = script(keys=keys, args=candidates)
+		if int(result[0]) == UNSEEDED:
+			_seed(cache, candidates)
+			result = script(keys=keys, args=candidates)
+		if int(result[0]) != UNSEEDED:
+			user = _decode(result[1])
+			_reserve(user)
+			return user
+	except Exception as e:
+		_logger().warning(f"it support workload pick failed: {e}")
+
+	return least_loaded(candidates, _open_counts(candidates))
+
+
+# ---------------------------------------------------------------------------
+# Hook + cron
+# ---------------------------------------------------------------------------
+
+
+def on_ticket_change(doc, method=None):
+	"""doc_events on_update / on_trash của ticket: xếp phần chênh bộ đếm chờ commit."""
+	if method == "on_trash":
+		before, after = ticket_load(doc), {}
+	else:
+		before, after = ticket_load(doc.get_doc_before_save()), ticket_load(doc)
+
+	delta = load_delta(before, after)
+	if not delta:
+		return
+
+	state = _state()
+	delta, state["open"] = consume_reserved(delta, state["open"])
+	for user, diff in delta.items():
+		state["pending"][user] = state["pending"].get(user, 0) + diff
+
+
+def reconcile():
+	"""Cron 15 phút: ghi đè bộ đếm bằng số DB của mọi thành viên active."""
+	users = sorted(
+		{
+			m.user
+			for m in frappe.get_all(TEAM_DOCTYPE, filters={"is_active": 1}, fields=["user"])
+			if m.user
+		}
+	)
+	counts = _open_counts(users)
+	try:
+		cache = frappe.cache()
+		key = cache.make_key(KEY_OPEN_TICKETS)
+		pipe = cache.pipeline(transaction=True)
+		pipe.delete(key)
+		if counts:
+			pipe.hset(key, mapping=counts)
+			pipe.expire(key, KEY_TTL_SECONDS)
+		pipe.execute()
+	except Exception as e:
+		_logger().warning(f"it support workload reconcile failed: {e}")
+		return 0
+	return len(counts)
@@ -13,6 +13,7 @@ from frappe.utils import add_to_date, now
 
 from . import fields as cond_fields
 from . import notify
+from . import principal_cache
 
 APPROVAL_STEP_DT = "ERP Approval Step"
 APPROVAL_TEMPLATE_DT = "ERP Approval Template"
@@ -29,20 +30,13 @@ ORG_WIDE_ROLES = ("System Manager", "SIS BOD")
 # ---------------------------------------------------------------------------
 
 def units_led_by(email):
-    rows = frappe.get_all(
-        ORG_LEADER_DT, filters={"user": email, "parenttype": ORG_DT}, pluck="parent"
-    )
-    return list({r for r in rows if r})
+    return list(principal_cache.principal_set(email).leads)
 
 
 def is_leader_of(unit, email):
     if not unit:
         return False
-    return bool(
-        frappe.db.exists(
-            ORG_LEADER_DT, {"parent": unit, "parenttype": ORG_DT, "user": email}
-        )
-    )
+    return unit in principal_cache.principal_set(email).leads
 
 
 def first_leader_of(unit):
@@ -226,8 +220,16 @@ def act_reject(doc, email, reason=None):
 # Hàng chờ - query SQL trên tabERP Approval Step
 # ---------------------------------------------------------------------------
 
+def _in_param(values):
+    return tuple(values) if values else ("__none__",)
+
+
 def pending_parent_names(email, parenttypes):
-    units = units_led_by(email)
+    """Phiếu có bước Pending mà `email` duyệt được — MỘT query trên tabERP Approval Step.
+
+    Danh sách (loại principal, giá trị) của người dùng lấy sẵn từ principal_cache,
+    khớp cùng quy tắc với can_act_node / principals.node_assignee_grants.
+    """
     roles = frappe.get_roles(email)
     org_wide = bool(set(roles) & set(ORG_WIDE_ROLES))
 
@@ -236,16 +238,30 @@ def pending_parent_names(email, parenttypes):
     where = ["s.is_active = 1", "s.status = 'Pending'", "s.parenttype IN %(pts)s"]
 
     if not org_wide:
+        pset = principal_cache.principal_set(email)
         clauses = []
         # bước council/role (scope_unit rỗng) -> theo role
-        params["roles"] = tuple(roles) if roles else ("__none__",)
+        params["roles"] = _in_param(roles)
         clauses.append("(s.scope_unit IS NULL AND s.approver_role IN %(roles)s)")
         # bước scoped -> theo đơn vị mình lãnh đạo
-        params["units"] = tuple(units) if units else ("__none__",)
+        params["units"] = _in_param(pset.leads)
         clauses.append("s.scope_unit IN %(units)s")
         # bước người-cụ-thể (approver_type=user)
         params["me"] = email
         clauses.append("s.approver_user = %(me)s")
+        # bước principal: thành viên / liên kết của đơn vị, chức danh (trong đơn vị hoặc xuyên đơn vị)
+        if pset.members:
+            params["member_units"] = _in_param(pset.members)
+            clauses.append("(s.assignee_principal_type = 'unit_members' AND s.scope_unit IN %(member_units)s)")
+        if pset.associates:
+            params["associate_units"] = _in_param(pset.associates)
+            clauses.append("(s.assignee_principal_type = 'unit_associate' AND s.scope_unit IN %(associate_units)s)")
+        if pset.positions:
+            params["positions"] = _in_param({f"{u}|{p}" for u, p in pset.positions} | {f"|{p}" for _u, p in pset.positions})
+            clauses.append(
+                "(s.assignee_principal_type = 'position'"
+                " AND CONCAT(IFNULL(s.scope_unit, ''), '|', s.assignee_position) IN %(positions)s)"
+            )
         where.append("(" + " OR ".join(clauses) + ")")
 
     rows = frappe.db.sql(
@@ -457,6 +473,9 @@ def _activate(s):
             h = 0
         if h > 0:
             s.deadline_at = add_to_date(s.activated_at, hours=h)
+            from . import sla
+
+            sla.track_step(s)
 
 
 def _propagate(doc):
@@ -0,0 +1,133 @@
+"""
+Tập principal của một người trên Sơ đồ tổ chức (đơn vị lãnh đạo / thành viên / liên kết,
+chức danh) — cache theo tem phiên bản.
+
+Mở hàng chờ duyệt hay dựng tracker trước đây gọi units_led_by + is_member_of +
+is_associate_of + has_position, mỗi hàm một `frappe.db.exists`, lặp lại theo từng
+bước. Giờ một người chỉ tốn MỘT query UNION (đọc cả ba bảng con) mỗi lần sơ đồ đổi:
+
+- Redis `CACHE_PREFIX:<email>` giữ tập đã dựng kèm tem `v`;
+- `VERSION_KEY` là số nguyên, doc hook `ERP Organization Unit` (lưu / xoá / chuyển
+  cấp — bảng con lưu cùng đơn vị) INCR SAU commit: mọi tập có tem cũ bị bỏ khi đọc.
+  Sơ đồ đổi vài lần mỗi tháng nên xoá toàn cục rẻ hơn theo dõi ai bị ảnh hưởng;
+- trong một request, tập đã đọc nằm ở frappe.flags (tracker gọi gate theo từng bước).
+
+Role KHÔNG cache ở đây: frappe.get_roles đã có cache riêng, xoá khi lưu User.
+"""
+
+import json
+
+import frappe
+
+ORG_DT = "ERP Organization Unit"
+
+VERSION_KEY = "approval_principal_version"
+CACHE_PREFIX = "approval_principals"
+CACHE_TTL_SEC = 6 * 3600
+_REQUEST_FLAG = "approval_principal_sets"
+
+
+def _empty():
+    return frappe._dict(leads=set(), members=set(), associates=set(), positions=set())
+
+
+def _load(email):
+    rows = frappe.db.sql(
+        """
+        SELECT 'leads' AS kind, parent, position FROM `tabERP Organization Unit Leader`
+        WHERE user = %(user)s AND parenttype = %(dt)s
+        UNION ALL
+        SELECT 'members', parent, position FROM `tabERP Organization Unit Member`
+        WHERE user = %(user)s AND parenttype = %(dt)s
+        UNION ALL
+        SELECT 'associates', parent, NULL FROM `tabERP Organization Unit Associate`
+        WHERE user = %(user)s AND parenttype = %(dt)s
+        """,
+        {"user": email, "dt": ORG_DT},
+        as_dict=True,
+    )
+    return from_rows(rows)
+
+
+def from_rows(rows):
+    """rows (kind, parent, position) -> tập principal. positions chứa cặp (đơn vị, chức danh)."""
+    out = _empty()
+    for r in rows:
+        if not r.get("parent"):
+            continue
+        out[r["kind"]].add(r["parent"])
+        if r.get("position") and r["kind"] in ("leads", "members"):
+            out.positions.add((r["parent"], r["position"]))
+    return out
+
+
+def _dump(pset, version):
+    return json.dumps(
+        {
+            "v": version,
+            "leads": sorted(pset.leads),
+            "members": sorted(pset.members),
+            "associates": sorted(pset.associates),
+            "positions": sorted(list(p) for p in pset.positions),
+        }
+    )
+
+
+def _parse(raw, version):
+    if not raw:
+        return None
+    data = json.loads(raw)
+    if data.get("v") != version:
+        return None
+    return frappe._dict(
+        leads=set(data["leads"]),
+        members=set(data["members"]),
+        associates=set(data["associates"]),
+        positions={tuple(p) for p in data["positions"]},
+    )
+
+
+def principal_set(email):
+    """Tập principal của `email` (leads / members / associates / positions)."""
+    if not email:
+        return _empty()
+    memo = frappe.flags.get(_REQUEST_FLAG)
+    if memo is None:
+        memo = frappe.flags[_REQUEST_FLAG] = {}
+    if email in memo:
+        return memo[email]
+
+    pset = None
+    try:
+        cache = frappe.cache()
+        user_key = cache.make_key(f"{CACHE_PREFIX}:{email}")
+        pipe = cache.pipeline()
+        pipe.get(cache.make_key(VERSION_KEY))
+        pipe.get(user_key)
+        version, raw = pipe.execute()
+        version = int(version or 0)
+        pset = _parse(raw, version)
+        if pset is None:
+            pset = _load(email)
+            cache.pipeline().set(user_key, _dump(pset, version), ex=CACHE_TTL_SEC).execute()
+    except Exception:
+        # Redis lỗi: vẫn trả đúng từ DB, chỉ mất phần cache
+        if pset is None:
+            pset = _load(email)
+
+    memo[email] = pset
+    return pset
+
+
+def _bump():
+    try:
+        cache = frappe.cache()
+        cache.pipeline().incr(cache.make_key(VERSION_KEY)).execute()
+    except Exception:
+        frappe.log_error(frappe.get_traceback(), "approval.principal_cache.bump")
+
+
+def invalidate(doc=None, method=None):
+    """Doc hook ERP Organization Unit (on_update / on_trash / after_rename): đổi tem sau commit."""
+    frappe.flags.pop(_REQUEST_FLAG, None)
+    frappe.db.after_commit.add(_bump)
@@ -14,6 +14,7 @@ giữ nguyên đường legacy (kind/approver_role/scope_unit + CSV) → PR/PO k
 import frappe
 
 from . import engine
+from . import principal_cache
 
 ORG_DT = "ERP Organization Unit"
 ORG_TYPE_DT = "ERP Organization Unit Type"
@@ -32,26 +33,23 @@ TEAM_TYPE_ORDER = 4
 def is_member_of(unit, email):
     if not (unit and email):
         return False
-    return bool(frappe.db.exists(MEMBER_DT, {"parent": unit, "parenttype": ORG_DT, "user": email}))
+    return unit in principal_cache.principal_set(email).members
 
 
 def is_associate_of(unit, email):
     if not (unit and email):
         return False
-    return bool(frappe.db.exists(ASSOCIATE_DT, {"parent": unit, "parenttype": ORG_DT, "user": email}))
+    return unit in principal_cache.principal_set(email).associates
 
 
 def has_position(unit, position, email):
     """Người có chức danh = position (trong unit nếu có, không thì xuyên đơn vị) — dùng GĐ5."""
     if not (position and email):
         return False
-    for dt in (LEADER_DT, MEMBER_DT):
-        flt = {"parenttype": ORG_DT, "user": email, "position": position}
-        if unit:
-            flt["parent"] = unit
-        if frappe.db.exists(dt, flt):
-            return True
-    return False
+    positions = principal_cache.principal_set(email).positions
+    if unit:
+        return (unit, position) in positions
+    return any(p == position for _u, p in positions)
 
 
 def _unit_type_name(type_order):
@@ -61,19 +59,26 @@ def _unit_type_name(type_order):
 
 
 def _walk_to_department(unit):
-    """Đi lên cây tới đơn vị type_order=3 (Phòng); trả về chính nó nếu đã là Phòng."""
-    cur = unit
-    seen = 0
-    while cur and seen < 12:
-        seen += 1
-        row = frappe.db.get_value(ORG_DT, cur, ["parent_organization_unit", "unit_type"], as_dict=True)
-        if not row:
-            return None
-        torder = frappe.db.get_value(ORG_TYPE_DT, row.unit_type, "type_order") if row.unit_type else None
-        if torder == DEPARTMENT_TYPE_ORDER:
-            return cur
-        cur = row.parent_organization_unit
-    return None
+    """Tổ tiên gần nhất (kể cả chính nó) có type_order=3 (Phòng).
+
+    Đơn vị là NestedSet nên lft/rgt đã là bảng tổ tiên vật chất hoá: một query theo
+    khoảng thay cho leo từng cấp bằng get_value.
+    """
+    if not unit:
+        return None
+    rows = frappe.db.sql(
+        """
+        SELECT a.name
+        FROM `tabERP Organization Unit` u
+        INNER JOIN `tabERP Organization Unit` a ON a.lft <= u.lft AND a.rgt >= u.rgt
+        INNER JOIN `tabERP Organization Unit Type` t ON t.name = a.unit_type
+        WHERE u.name = %(unit)s AND t.type_order = %(order)s
+        ORDER BY a.lft DESC
+        LIMIT 1
+        """,
+        {"unit": unit, "order": DEPARTMENT_TYPE_ORDER},
+    )
+    return rows[0][0] if rows else None
 
 
 def _find_team_unit(parent_unit, user):
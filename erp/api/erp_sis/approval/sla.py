@@ -1,11 +1,16 @@
 """
-Quét hạn xử lý (SLA) các bước duyệt đang chờ, đánh dấu quá hạn + leo thang thông báo.
-Nhân bản mẫu erp/api/crm/sla_scheduler.py. Đăng ký ở hooks.py scheduler_events.cron.
+Hạn xử lý (SLA) các bước duyệt đang chờ, đánh dấu quá hạn + leo thang thông báo.
+Nhân bản mẫu erp/api/crm/sla_scheduler.py.
+
+engine._activate đặt hạn (deadline_at) vào erp/common/deadlines.py; dispatcher gọi
+process_step_deadline đúng giờ, rồi nhắc lại 00:00 mỗi ngày tới khi bước được xử lý.
+check_workflow_deadlines giữ lại để quét tay.
 """
 
 import frappe
 from frappe.utils import getdate, now
 
+from erp.common import deadlines
 from erp.common.notification_emit import emit_staff_notify
 
 from . import notify as wf_notify
@@ -36,32 +41,68 @@ def _notify(parenttype, parent, label, recipients):
         frappe.log_error(title="WF SLA notify fail", message=frappe.get_traceback())
 
 
-def check_workflow_deadlines():
-    """Job định kỳ: bước Pending quá deadline_at -> overdue + thông báo (debounce 1 lần/ngày)."""
-    rows = frappe.db.sql(
-        """
-        SELECT name, parent, parenttype, label, scope_unit, escalation,
-               assignee_principal_type, approver_role, approver_user, assignee_position, last_escalated_at
-        FROM `tabERP Approval Step`
-        WHERE is_active = 1 AND status = 'Pending'
-          AND deadline_at IS NOT NULL AND deadline_at < %(now)s
-        """,
-        {"now": now()},
-        as_dict=True,
+_OVERDUE_SQL = """
+    SELECT name, parent, parenttype, label, scope_unit, escalation,
+           assignee_principal_type, approver_role, approver_user, assignee_position, last_escalated_at
+    FROM `tabERP Approval Step`
+    WHERE is_active = 1 AND status = 'Pending'
+      AND deadline_at IS NOT NULL AND deadline_at < %(now)s
+"""
+
+
+def _escalate(r, today):
+    """Một bước quá hạn: thông báo (debounce 1 lần/ngày) + đánh dấu overdue."""
+    mode = r.get("escalation") or "notify"
+    already = r.get("last_escalated_at") and getdate(r.get("last_escalated_at")) == today
+    if mode != "none" and not already:
+        recipients = set(principals.assignee_emails(r))
+        if mode == "escalate_up":
+            recipients |= set(principals.parent_unit_leader(r.get("scope_unit")))
+        _notify(r.parenttype, r.parent, r.get("label"), recipients)
+    frappe.db.set_value(
+        STEP_DT, r.name, {"overdue": 1, "last_escalated_at": now()}, update_modified=False
     )
+
+
+def check_workflow_deadlines():
+    """Quét tay: bước Pending quá deadline_at -> overdue + thông báo (debounce 1 lần/ngày)."""
+    rows = frappe.db.sql(_OVERDUE_SQL, {"now": now()}, as_dict=True)
     today = getdate()
     for r in rows:
         try:
-            mode = r.get("escalation") or "notify"
-            already = r.get("last_escalated_at") and getdate(r.get("last_escalated_at")) == today
-            if mode != "none" and not already:
-                recipients = set(principals.assignee_emails(r))
-                if mode == "escalate_up":
-                    recipients |= set(principals.parent_unit_leader(r.get("scope_unit")))
-                _notify(r.parenttype, r.parent, r.get("label"), recipients)
-            frappe.db.set_value(
-                STEP_DT, r.name, {"overdue": 1, "last_escalated_at": now()}, update_modified=False
-            )
+            _escalate(r, today)
         except Exception:
             frappe.log_error(title="WF SLA step fail", message=frappe.get_traceback())
     frappe.db.commit()
+
+
+def process_step_deadline(name):
+    """Handler deadlines: bước còn Pending và đã quá hạn thì leo thang; nhắc lại 00:00 hôm sau."""
+    rows = frappe.db.sql(_OVERDUE_SQL + " AND name = %(name)s", {"now": now(), "name": name}, as_dict=True)
+    if not rows:
+        return None
+    _escalate(rows[0], getdate())
+    return deadlines.start_of_next_day()
+
+
+def pending_step_deadlines():
+    """Nguồn cho deadlines.rebuild: bước Pending có hạn; đã leo thang hôm nay thì hẹn 00:00 mai."""
+    today = getdate()
+    rows = frappe.db.sql(
+        """
+        SELECT name, deadline_at, last_escalated_at FROM `tabERP Approval Step`
+        WHERE is_active = 1 AND status = 'Pending' AND deadline_at IS NOT NULL
+        """,
+        as_dict=True,
+    )
+    for r in rows:
+        if r.last_escalated_at and getdate(r.last_escalated_at) == today:
+            yield r.name, deadlines.start_of_next_day()
+        else:
+            yield r.name, r.deadline_at
+
+
+def track_step(step):
+    """Gọi khi bước vừa có deadline_at: tên dòng con chỉ có sau khi lưu nên đặt hạn sau commit."""
+    if step.get("deadline_at"):
+        deadlines.schedule(deadlines.APPROVAL_STEP, lambda: step.name, step.deadline_at)
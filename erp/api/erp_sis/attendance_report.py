@@ -8,6 +8,7 @@ from frappe import _
 import json
 from datetime import datetime, timedelta
 from erp.utils.api_response import success_response, error_response
+from erp.api.erp_sis.timetable import schedule_engine
 
 
 def _get_json_body():
@@ -213,63 +214,45 @@ def get_period_attendance_overview(date=None, period=None, campus_id=None, educa
         # Lấy giáo viên và môn học dạy tiết này (từ timetable)
         teacher_map = {}
         if period_name.lower() != 'homeroom':
-            # day_of_week trong database là format viết tắt: mon, tue, wed, thu, fri, sat, sun
-            day_map = {0: 'mon', 1: 'tue', 2: 'wed', 3: 'thu', 4: 'fri', 5: 'sat', 6: 'sun'}
-            day_of_week_short = day_map.get(date_obj.weekday(), 'mon')
+            # Các dòng TKB hiệu lực trong ngày của mọi lớp (schedule_engine: pattern có
+            # valid_from mới nhất thắng, override theo ngày thay pattern)
+            rows_by_class = schedule_engine.rows_for_classes_on(class_ids, date_obj)
+            day_rows = [(cid, r) for cid, rs in rows_by_class.items() for r in rs]
             
-            # Query timetable để lấy môn học
-            # SIS Timetable Instance Row có subject_id link đến SIS Subject
-            # SIS Subject có timetable_subject_id link đến SIS Timetable Subject (có title_vn)
-            timetable_data = frappe.db.sql("""
-                SELECT 
-                    ti.class_id,
-                    tr.name as row_id,
-                    tr.subject_id,
-                    COALESCE(ts.title_vn, sub.title) as subject_name
-                FROM `tabSIS Timetable Instance` ti
-                INNER JOIN `tabSIS Timetable Instance Row` tr ON tr.parent = ti.name
-                LEFT JOIN `tabSIS Subject` sub ON tr.subject_id = sub.name
-                LEFT JOIN `tabSIS Timetable Subject` ts ON sub.timetable_subject_id = ts.name
-                WHERE ti.class_id IN %(class_ids)s
-                    AND ti.start_date <= %(date)s
-                    AND (ti.end_date >= %(date)s OR ti.end_date IS NULL)
-                    AND tr.timetable_column_id = %(period_id)s
-                    AND tr.day_of_week = %(day_of_week)s
-                    AND (tr.valid_from IS NULL OR tr.valid_from <= %(date)s)
-                    AND (tr.valid_to IS NULL OR tr.valid_to >= %(date)s)
-            """, {
-                "class_ids": class_ids,
-                "date": date_obj,
-                "period_id": period if period.startswith("SIS-TIMETABLE-COLUMN") else None,
-                "day_of_week": day_of_week_short
-            }, as_dict=True)
+            # Khớp tiết theo timetable_column_id, không có thì theo period_name
+            matched = []
+            if period.startswith("SIS-TIMETABLE-COLUMN"):
+                matched = [(cid, r) for cid, r in day_rows if r.timetable_column_id == period]
+            if not matched and day_rows:
+                column_ids = list({r.timetable_column_id for _, r in day_rows if r.timetable_column_id})
+                same_name = set(frappe.get_all(
+                    "SIS Timetable Column",
+                    filters={"name": ["in", column_ids], "period_name": period_name},
+                    pluck="name"
+                )) if column_ids else set()
+                matched = [(cid, r) for cid, r in day_rows if r.timetable_column_id in same_name]
             
-            # Nếu không tìm được bằng period_id, thử tìm bằng period_name
-            if not timetable_data:
-                timetable_data = frappe.db.sql("""
-                    SELECT 
-                        ti.class_id,
-                        tr.name as row_id,
-                        tr.subject_id,
-                        COALESCE(ts.title_vn, sub.title) as subject_name
-                    FROM `tabSIS Timetable Instance` ti
-                    INNER JOIN `tabSIS Timetable Instance Row` tr ON tr.parent = ti.name
-                    INNER JOIN `tabSIS Timetable Column` tc ON tr.timetable_column_id = tc.name
-                    LEFT JOIN `tabSIS Subject` sub ON tr.subject_id = sub.name
+            # SIS Subject có timetable_subject_id link đến SIS Timetable Subject (có title_vn)
+            subject_ids = list({r.subject_id for _, r in matched if r.subject_id})
+            subject_names = {}
+            if subject_ids:
+                for sub in frappe.db.sql("""
+                    SELECT sub.name, COALESCE(ts.title_vn, sub.title) as subject_name
+                    FROM `tabSIS Subject` sub
                     LEFT JOIN `tabSIS Timetable Subject` ts ON sub.timetable_subject_id = ts.name
-                    WHERE ti.class_id IN %(class_ids)s
-                        AND ti.start_date <= %(date)s
-                        AND (ti.end_date >= %(date)s OR ti.end_date IS NULL)
-                        AND tc.period_name = %(period_name)s
-                        AND tr.day_of_week = %(day_of_week)s
-                        AND (tr.valid_from IS NULL OR tr.valid_from <= %(date)s)
-                        AND (tr.valid_to IS NULL OR tr.valid_to >= %(date)s)
-                """, {
-                    "class_ids": class_ids,
-                    "date": date_obj,
-                    "period_name": period_name,
-                    "day_of_week": day_of_week_short
-                }, as_dict=True)
+                    WHERE sub.name IN %(ids)s
+                """, {"ids": subject_ids}, as_dict=True):
+                    subject_names[sub['name']] = sub['subject_name']
+            
+            timetable_data = [
+                {
+                    "class_id": cid,
+                    "row_id": r.name,
+                    "subject_id": r.subject_id,
+                    "subject_name": subject_names.get(r.subject_id)
+                }
+                for cid, r in matched
+            ]
             
             # Lấy teacher từ child table cho các rows tìm được
             row_ids = [row['row_id'] for row in timetable_data if row.get('row_id')]
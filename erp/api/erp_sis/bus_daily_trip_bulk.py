@@ -0,0 +1,308 @@
+# Copyright (c) 2026, Wellspring International School and contributors
+"""
+Sinh và lưu trữ SIS Bus Daily Trip theo lô (set-based).
+
+Sinh (`generate_trips`)
+-----------------------
+Đường cũ vòng từng tuyến × loại chuyến: `get_all` học sinh tuyến, `exists` từng chuyến,
+insert ORM từng chuyến + từng học sinh, `get_value("CRM Student")` từng dòng. Ở đây
+dựng N ngày cho MỌI tuyến Active trong một lượt:
+
+- 1 truy vấn tuyến, 1 truy vấn học sinh tuyến (JOIN CRM Student — học sinh đã xoá bị
+  bỏ như trước), 1 truy vấn chuyến đã có trong khoảng ngày (kèm xe/tài xế/monitor).
+- Kiểm tra trùng xe/tài xế/monitor giữa các tuyến Active làm trong bộ nhớ, đúng quy
+  tắc `SISBusDailyTrip.validate_trip_assignment`; chuyến vi phạm bị bỏ và báo lỗi.
+- INSERT IGNORE nhiều dòng; khoá duy nhất (route_id, trip_date, trip_type) giữ idempotent
+  kể cả khi hai job chạy chồng — học sinh chỉ chèn cho chuyến thực sự vào bảng. Thiếu
+  khoá (migrate chưa xong) thì từ chối chạy thay vì lặng lẽ sinh trùng.
+
+Tên bản ghi là hash như `bulk_sync_engine` (Teacher Timetable) — naming series
+`SIS_DAILY_TRIP-#####` chỉ dùng cho đường tạo qua form.
+
+Lưu trữ (`archive_trips`)
+-------------------------
+Mỗi lô `ARCHIVE_BATCH` chuyến Completed cũ: một INSERT ... SELECT (JSON_ARRAYAGG học
+sinh) sang bảng archive (ROW_FORMAT=COMPRESSED, xem patch), một DELETE học sinh, một
+DELETE chuyến, rồi commit. Bản archive lấy đúng tên chuyến gốc nên chạy lại sau khi
+đứt giữa chừng không sinh bản trùng.
+
+Cả hai trả thống kê kèm rows_per_sec.
+"""
+
+import time
+from datetime import timedelta
+
+import frappe
+from frappe.utils import getdate, now_datetime
+
+TRIP = "tabSIS Bus Daily Trip"
+TRIP_STUDENT = "tabSIS Bus Daily Trip Student"
+ARCHIVE = "tabSIS Bus Daily Trip Archive"
+
+# Khoá duy nhất (route_id, trip_date, trip_type) — patch add_bus_daily_trip_bulk_keys
+UNIQUE_KEY = "uq_bus_daily_trip_key"
+
+INSERT_BATCH = 500
+ARCHIVE_BATCH = 500
+DEFAULT_TRIP_TYPES = ("Đón", "Trả")
+WEEKDAYS = ("Thứ 2", "Thứ 3", "Thứ 4", "Thứ 5", "Thứ 6", "Thứ 7", "Chủ nhật")
+
+_STUDENT_JSON_FIELDS = (
+	"name", "student_id", "class_student_id", "student_code", "student_name", "class_name",
+	"pickup_order", "pickup_location", "drop_off_location", "student_status",
+	"boarding_time", "drop_off_time", "absent_reason", "notes", "campus_id",
+)
+
+
+def _rate(rows, seconds):
+	return round(rows / seconds, 1) if seconds > 0 else float(rows)
+
+
+def _resources(trip):
+	"""(loại, id) của xe / tài xế / monitor gắn với một chuyến."""
+	out = []
+	if trip.get("vehicle_id"):
+		out.append(("vehicle", trip["vehicle_id"]))
+	if trip.get("driver_id"):
+		out.append(("driver", trip["driver_id"]))
+	for field in ("monitor1_id", "monitor2_id"):
+		if trip.get(field):
+			out.append(("monitor", trip[field]))
+	return out
+
+
+def plan_trips(routes, route_students, existing, dates):
+	"""
+	Chuyến cần tạo (thuần, không đụng DB).
+
+	routes: tuyến Active; route_students: {(route_id, weekday): [dòng]};
+	existing: chuyến đã có trong khoảng ngày [{route_id, trip_date, trip_type, ..., route_active}].
+	Trả (planned, skipped, errors); planned giữ thứ tự tuyến như đường cũ.
+	"""
+	existing_keys = {(e["route_id"], getdate(e["trip_date"]), e["trip_type"]) for e in existing}
+	# (ngày, loại chuyến, tài nguyên) -> tập tuyến Active đang dùng
+	usage = {}
+	for e in existing:
+		if not e.get("route_active"):
+			continue
+		for res in _resources(e):
+			usage.setdefault((getdate(e["trip_date"]), e["trip_type"], res), set()).add(e["route_id"])
+
+	planned, errors = [], []
+	skipped = 0
+	for trip_date in dates:
+		weekday = WEEKDAYS[trip_date.weekday()]
+		for route in routes:
+			rows = route_students.get((route["name"], weekday), [])
+			trip_types = sorted({r["trip_type"] for r in rows}) or list(DEFAULT_TRIP_TYPES)
+			for trip_type in trip_types:
+				if (route["name"], trip_date, trip_type) in existing_keys:
+					skipped += 1
+					continue
+				if route.get("monitor1_id") == route.get("monitor2_id"):
+					errors.append(f"Route {route['name']} {trip_date} {trip_type}: Monitor 1 và Monitor 2 không được giống nhau")
+					continue
+				clash = [
+					res for res in _resources(route)
+					if usage.get((trip_date, trip_type, res), set()) - {route["name"]}
+				]
+				if clash:
+					kinds = ", ".join(sorted({kind for kind, _ in clash}))
+					errors.append(f"Route {route['name']} {trip_date} {trip_type}: trùng {kinds} với tuyến khác")
+					continue
+				for res in _resources(route):
+					usage.setdefault((trip_date, trip_type, res), set()).add(route["name"])
+				planned.append({
+					"route": route,
+					"trip_date": trip_date,
+					"weekday": weekday,
+					"trip_type": trip_type,
+					"students": [r for r in rows if r["trip_type"] == trip_type],
+				})
+	return planned, skipped, errors
+
+
+def _load_inputs(start_date, end_date):
+	routes = frappe.get_all(
+		"SIS Bus Route",
+		filters={"status": "Active"},
+		fields=["name", "vehicle_id", "driver_id", "monitor1_id", "monitor2_id", "campus_id", "school_year_id"],
+		order_by="name asc",
+	)
+	route_students = {}
+	if routes:
+		for r in frappe.db.sql(
+			"""
+			SELECT rs.route_id, rs.weekday, rs.trip_type, rs.student_id, rs.class_student_id,
+				rs.pickup_order, rs.pickup_location, rs.drop_off_location,
+				s.student_code, s.student_name
+			FROM `tabSIS Bus Route Student` rs
+			INNER JOIN `tabCRM Student` s ON s.name = rs.student_id
+			WHERE rs.route_id IN %(routes)s
+			ORDER BY rs.route_id, rs.pickup_order, rs.name
+			""",
+			{"routes": [r.name for r in routes]},
+			as_dict=True,
+		):
+			route_students.setdefault((r.route_id, r.weekday), []).append(r)
+	existing = frappe.db.sql(
+		f"""
+		SELECT dt.route_id, dt.trip_date, dt.trip_type, dt.vehicle_id, dt.driver_id,
+			dt.monitor1_id, dt.monitor2_id, IF(br.status = 'Active', 1, 0) AS route_active
+		FROM `{TRIP}` dt
+		LEFT JOIN `tabSIS Bus Route` br ON br.name = dt.route_id
+		WHERE dt.trip_date BETWEEN %s AND %s
+		""",
+		(start_date, end_date),
+		as_dict=True,
+	)
+	return routes, route_students, existing
+
+
+def _insert_rows(table, columns, rows, ignore=False):
+	if not rows:
+		return
+	placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+	for i in range(0, len(rows), INSERT_BATCH):
+		chunk = rows[i:i + INSERT_BATCH]
+		frappe.db.sql(
+			f"INSERT {'IGNORE ' if ignore else ''}INTO `{table}` ({', '.join(columns)}) "
+			f"VALUES {', '.join([placeholders] * len(chunk))}",
+			[v for row in chunk for v in row],
+		)
+
+
+def _require_unique_key():
+	"""INSERT IGNORE chỉ idempotent khi có unique key — thiếu thì dừng, không sinh chuyến trùng."""
+	if not frappe.db.sql(f"SHOW INDEX FROM `{TRIP}` WHERE Key_name = %s", (UNIQUE_KEY,)):
+		frappe.throw(
+			f"Thiếu {UNIQUE_KEY} trên `{TRIP}` — chạy bench migrate "
+			"(patch add_bus_daily_trip_bulk_keys) trước khi sinh chuyến"
+		)
+
+
+def generate_trips(start_date, days=1):
+	"""Sinh chuyến cho [start_date, start_date + days) của mọi tuyến Active. KHÔNG commit."""
+	t0 = time.perf_counter()
+	_require_unique_key()
+	start_date = getdate(start_date)
+	dates = [start_date + timedelta(days=i) for i in range(int(days))]
+	routes, route_students, existing = _load_inputs(dates[0], dates[-1])
+	planned, skipped, errors = plan_trips(routes, route_students, existing, dates)
+
+	now = now_datetime()
+	user = frappe.session.user
+	trip_rows = []
+	for p in planned:
+		p["name"] = frappe.generate_hash(length=10)
+		route = p["route"]
+		trip_rows.append((
+			p["name"], route["name"], p["trip_date"], p["weekday"], p["trip_type"],
+			route.get("vehicle_id"), route.get("driver_id"), route.get("monitor1_id"),
+			route.get("monitor2_id"), "Not Started", route.get("campus_id"), route.get("school_year_id"),
+			now, now, user, user, 0,
+		))
+	_insert_rows(TRIP, (
+		"name", "route_id", "trip_date", "weekday", "trip_type", "vehicle_id", "driver_id",
+		"monitor1_id", "monitor2_id", "trip_status", "campus_id", "school_year_id",
+		"creation", "modified", "owner", "modified_by", "docstatus",
+	), trip_rows, ignore=True)
+
+	# Chuyến bị INSERT IGNORE bỏ (job khác vừa tạo cùng khoá) thì không chèn học sinh
+	inserted = set()
+	names = [p["name"] for p in planned]
+	for i in range(0, len(names), INSERT_BATCH):
+		inserted.update(frappe.db.sql_list(
+			f"SELECT name FROM `{TRIP}` WHERE name IN %(names)s", {"names": names[i:i + INSERT_BATCH]}
+		))
+
+	student_rows = []
+	for p in planned:
+		if p["name"] not in inserted:
+			continue
+		for s in p["students"]:
+			student_rows.append((
+				frappe.generate_hash(length=10), p["name"], p["route"].get("campus_id"),
+				s.student_id, s.class_student_id, s.student_code, s.student_name, s.pickup_order,
+				s.pickup_location, s.drop_off_location, "Not Boarded",
+				now, now, user, user, 0,
+			))
+	_insert_rows(TRIP_STUDENT, (
+		"name", "daily_trip_id", "campus_id", "student_id", "class_student_id", "student_code",
+		"student_name", "pickup_order", "pickup_location", "drop_off_location", "student_status",
+		"creation", "modified", "owner", "modified_by", "docstatus",
+	), student_rows)
+
+	seconds = time.perf_counter() - t0
+	rows = len(inserted) + len(student_rows)
+	return {
+		"start_date": str(dates[0]),
+		"end_date": str(dates[-1]),
+		"created_count": len(inserted),
+		"skipped_count": skipped + len(planned) - len(inserted),
+		"student_rows": len(student_rows),
+		"errors": errors,
+		"seconds": round(seconds, 3),
+		"rows_per_sec": _rate(rows, seconds),
+	}
+
+
+def archive_trips(cutoff_date, batch_size=ARCHIVE_BATCH, max_batches=None):
+	"""Chuyển chuyến Completed có trip_date < cutoff_date sang archive, commit theo lô."""
+	t0 = time.perf_counter()
+	json_pairs = ", ".join(f"'{f}', s.`{f}`" for f in _STUDENT_JSON_FIELDS)
+	# JSON_ARRAYAGG bị giới hạn bởi group_concat_max_len như GROUP_CONCAT
+	frappe.db.sql("SET SESSION group_concat_max_len = 16777216")
+	trips = students = batches = 0
+	while max_batches is None or batches < int(max_batches):
+		names = frappe.db.sql_list(
+			f"""
+			SELECT name FROM `{TRIP}`
+			WHERE trip_date < %s AND trip_status = 'Completed'
+			ORDER BY trip_date, name
+			LIMIT %s
+			""",
+			(cutoff_date, int(batch_size)),
+		)
+		if not names:
+			break
+		now = now_datetime()
+		user = frappe.session.user
+		frappe.db.sql(
+			f"""
+			INSERT IGNORE INTO `{ARCHIVE}`
+				(name, original_trip_id, route_id, trip_date, weekday, trip_type, vehicle_id,
+				 driver_id, monitor1_id, monitor2_id, trip_status, campus_id, school_year_id,
+				 student_count, students_data, archived_at,
+				 creation, modified, owner, modified_by, docstatus)
+			SELECT dt.name, dt.name, dt.route_id, dt.trip_date, dt.weekday, dt.trip_type,
+				dt.vehicle_id, dt.driver_id, dt.monitor1_id, dt.monitor2_id, dt.trip_status,
+				dt.campus_id, dt.school_year_id,
+				COUNT(s.name),
+				IF(COUNT(s.name) = 0, '[]', JSON_ARRAYAGG(JSON_OBJECT({json_pairs}))),
+				%(now)s, %(now)s, %(now)s, %(user)s, %(user)s, 0
+			FROM `{TRIP}` dt
+			LEFT JOIN `{TRIP_STUDENT}` s ON s.daily_trip_id = dt.name
+			WHERE dt.name IN %(names)s
+			GROUP BY dt.name
+			""",
+			{"names": names, "now": now, "user": user},
+		)
+		students += frappe.db.sql(
+			f"SELECT COUNT(*) FROM `{TRIP_STUDENT}` WHERE daily_trip_id IN %(names)s", {"names": names}
+		)[0][0]
+		frappe.db.sql(f"DELETE FROM `{TRIP_STUDENT}` WHERE daily_trip_id IN %(names)s", {"names": names})
+		frappe.db.sql(f"DELETE FROM `{TRIP}` WHERE name IN %(names)s", {"names": names})
+		frappe.db.commit()
+		trips += len(names)
+		batches += 1
+
+	seconds = time.perf_counter() - t0
+	return {
+		"cutoff_date": str(cutoff_date),
+		"archived_count": trips,
+		"student_records_archived": students,
+		"batches": batches,
+		"seconds": round(seconds, 3),
+		"rows_per_sec": _rate(trips + students, seconds),
+	}
@@ -2476,86 +2476,24 @@ def archive_old_daily_trips():
 	"""
 	Archive daily trips cũ hơn 30 ngày sang bảng archive.
 	Giữ lại data để báo cáo nhưng giảm tải cho bảng chính.
+	Chuyển theo lô set-based — xem bus_daily_trip_bulk.archive_trips.
 	"""
 	from datetime import datetime, timedelta
+	from erp.api.erp_sis.bus_daily_trip_bulk import archive_trips
 	
 	try:
 		cutoff_date = (datetime.now().date() - timedelta(days=30)).strftime('%Y-%m-%d')
+		result = archive_trips(cutoff_date)
 		
-		# Chỉ archive trips đã Completed
-		# Lấy danh sách trips cần archive
-		trips_to_archive = frappe.db.sql("""
-			SELECT name FROM `tabSIS Bus Daily Trip`
-			WHERE trip_date < %s AND trip_status = 'Completed'
-		""", (cutoff_date,), as_dict=True)
-		
-		if not trips_to_archive:
+		if not result["archived_count"]:
 			return success_response(
-				data={"archived_count": 0, "student_records_archived": 0},
+				data=result,
 				message="Không có daily trips nào cần archive"
 			)
 		
-		trip_names = [t.name for t in trips_to_archive]
-		archived_count = 0
-		student_records_archived = 0
-		
-		for trip_name in trip_names:
-			try:
-				# Lấy trip data
-				trip = frappe.get_doc("SIS Bus Daily Trip", trip_name)
-				
-				# Lấy students của trip
-				students = frappe.get_all(
-					"SIS Bus Daily Trip Student",
-					filters={"daily_trip_id": trip_name},
-					fields=["*"]
-				)
-				
-				# Tạo bản ghi archive
-				archive_doc = frappe.get_doc({
-					"doctype": "SIS Bus Daily Trip Archive",
-					"original_trip_id": trip.name,
-					"route_id": trip.route_id,
-					"trip_date": trip.trip_date,
-					"weekday": trip.weekday,
-					"trip_type": trip.trip_type,
-					"vehicle_id": trip.vehicle_id,
-					"driver_id": trip.driver_id,
-					"monitor1_id": trip.monitor1_id,
-					"monitor2_id": trip.monitor2_id,
-					"trip_status": trip.trip_status,
-					"campus_id": trip.campus_id,
-					"school_year_id": trip.school_year_id,
-					"student_count": len(students),
-					"students_data": json.dumps([s for s in students]),  # Lưu JSON
-					"archived_at": datetime.now()
-				})
-				archive_doc.insert(ignore_permissions=True)
-				
-				# Xóa students của trip gốc
-				frappe.db.sql("""
-					DELETE FROM `tabSIS Bus Daily Trip Student`
-					WHERE daily_trip_id = %s
-				""", (trip_name,))
-				student_records_archived += len(students)
-				
-				# Xóa trip gốc
-				frappe.delete_doc("SIS Bus Daily Trip", trip_name, ignore_permissions=True)
-				archived_count += 1
-				
-			except Exception as e:
-				frappe.log_error(f"Error archiving trip {trip_name}: {str(e)}")
-				continue
-		
-		frappe.db.commit()
-		
 		return success_response(
-			data={
-				"archived_count": archived_count,
-				"student_records_archived": student_records_archived,
-				"cutoff_date": cutoff_date
-			},
-			message=f"Đã archive {archived_count} daily trips và {student_records_archived} student records"
+			data=result,
+			message=f"Đã archive {result['archived_count']} daily trips và {result['student_records_archived']} student records ({result['rows_per_sec']} dòng/giây)"
 		)
 		
 	except Exception as e:
@@ -2565,124 +2503,36 @@ def archive_old_daily_trips():
 
 
 @frappe.whitelist()
-def extend_daily_trips_for_all_routes():
+def extend_daily_trips_for_all_routes(start_offset=7, days=1):
 	"""
-	Tạo daily trips cho ngày tiếp theo cho tất cả routes.
-	Được gọi bởi scheduled job hàng ngày.
+	Tạo daily trips cho tất cả routes Active.
+	Được gọi bởi scheduled job hàng ngày (mặc định: ngày thứ 7 kể từ hôm nay).
+
+	days > 1 dựng nhiều ngày một lượt (bù ngày job bị lỡ) — idempotent theo
+	khoá (route_id, trip_date, trip_type), xem bus_daily_trip_bulk.generate_trips.
 	"""
 	from datetime import datetime, timedelta
+	from erp.api.erp_sis.bus_daily_trip_bulk import WEEKDAYS, generate_trips
 	
 	try:
-		# Tính ngày cần tạo (7 ngày tới)
-		target_date = datetime.now().date() + timedelta(days=7)
-		target_weekday_num = target_date.weekday()
-		
-		weekdays_map = {
-			0: "Thứ 2",
-			1: "Thứ 3",
-			2: "Thứ 4",
-			3: "Thứ 5",
-			4: "Thứ 6",
-			5: "Thứ 7",
-			6: "Chủ nhật"
-		}
-		target_weekday = weekdays_map.get(target_weekday_num)
-		
-		# Bỏ qua nếu là cuối tuần (tùy config)
-		# if target_weekday_num >= 5:
-		#     return success_response(data={"created": 0}, message="Bỏ qua cuối tuần")
-		
-		# Lấy tất cả active routes
-		active_routes = frappe.get_all(
-			"SIS Bus Route",
-			filters={"status": "Active"},
-			fields=["name", "route_name", "vehicle_id", "driver_id", "monitor1_id", "monitor2_id", "campus_id", "school_year_id"]
-		)
-		
-		created_count = 0
-		skipped_count = 0
-		errors = []
-		
-		for route in active_routes:
-			# Lấy route students cho ngày này
-			route_students = frappe.get_all(
-				"SIS Bus Route Student",
-				filters={"route_id": route.name, "weekday": target_weekday},
-				fields=["*"]
-			)
-			
-			# Nhóm theo trip_type
-			trip_types = set([rs.trip_type for rs in route_students])
-			if not trip_types:
-				trip_types = {'Đón', 'Trả'}  # Default nếu không có students
-			
-			for trip_type in trip_types:
-				# Check if trip already exists
-				existing = frappe.db.exists("SIS Bus Daily Trip", {
-					"route_id": route.name,
-					"trip_date": target_date,
-					"trip_type": trip_type
-				})
-				
-				if existing:
-					skipped_count += 1
-					continue
-				
-				try:
-					# Tạo daily trip
-					daily_trip = frappe.get_doc({
-						"doctype": "SIS Bus Daily Trip",
-						"route_id": route.name,
-						"trip_date": target_date,
-						"weekday": target_weekday,
-						"trip_type": trip_type,
-						"vehicle_id": route.vehicle_id,
-						"driver_id": route.driver_id,
-						"monitor1_id": route.monitor1_id,
-						"monitor2_id": route.monitor2_id,
-						"trip_status": "Not Started",
-						"campus_id": route.campus_id,
-						"school_year_id": route.school_year_id
-					})
-					daily_trip.insert(ignore_permissions=True)
-					
-					# Thêm students vào trip
-					students_for_trip = [rs for rs in route_students if rs.trip_type == trip_type]
-					for rs in students_for_trip:
-						# Lấy student info
-						student_info = frappe.db.get_value(
-							"CRM Student", rs.student_id,
-							["student_code", "student_name"], as_dict=True
-						)
-						if student_info:
-							frappe.get_doc({
-								"doctype": "SIS Bus Daily Trip Student",
-								"daily_trip_id": daily_trip.name,
-								"student_id": rs.student_id,
-								"student_code": student_info.student_code,
-								"student_name": student_info.student_name,
-								"pickup_order": rs.pickup_order,
-								"pickup_location": rs.pickup_location,
-								"drop_off_location": rs.drop_off_location,
-								"student_status": "Not Boarded"
-							}).insert(ignore_permissions=True)
-					
-					created_count += 1
-					
-				except Exception as e:
-					errors.append(f"Route {route.name}: {str(e)}")
+		target_date = datetime.now().date() + timedelta(days=int(start_offset))
+		target_weekday = WEEKDAYS[target_date.weekday()]
 		
+		result = generate_trips(target_date, days=int(days))
 		frappe.db.commit()
 		
 		return success_response(
 			data={
 				"target_date": str(target_date),
 				"target_weekday": target_weekday,
-				"created_count": created_count,
-				"skipped_count": skipped_count,
-				"errors": errors[:10]  # Chỉ trả về 10 errors đầu
+				"end_date": result["end_date"],
+				"created_count": result["created_count"],
+				"skipped_count": result["skipped_count"],
+				"student_rows": result["student_rows"],
+				"rows_per_sec": result["rows_per_sec"],
+				"errors": result["errors"][:10]  # Chỉ trả về 10 errors đầu
 			},
-			message=f"Đã tạo {created_count} daily trips cho {target_date} ({target_weekday})"
+			message=f"Đã tạo {result['created_count']} daily trips cho {target_date} ({target_weekday})"
 		)
 		
 	except Exception as e:
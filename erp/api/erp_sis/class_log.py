@@ -965,6 +965,15 @@ def save_class_log():
             )
         timings_ms["inserts_loop"] = round((time.perf_counter() - t_mark) * 1000)
 
+        # Học sinh được ghi bằng SQL thô (không qua doc hook) — báo rollup sổ đầu bài
+        # tính lại (lớp, ngày) sau commit
+        try:
+            from erp.api.erp_sis import class_log_compliance
+            log_date = date or frappe.db.get_value("SIS Class Log Subject", subject_id, "log_date")
+            class_log_compliance.mark_dirty(class_id, log_date)
+        except Exception as compliance_error:
+            frappe.logger().warning(f"Class log compliance mark failed: {compliance_error}")
+
         t_mark = time.perf_counter()
         frappe.db.commit()
         timings_ms["commit"] = round((time.perf_counter() - t_mark) * 1000)
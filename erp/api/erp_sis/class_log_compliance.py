@@ -0,0 +1,518 @@
+"""
+Class Log Compliance - rollup "tiết theo lịch / đã nhập sổ đầu bài"
+
+Dashboard và báo cáo sổ đầu bài (class_log_report) trước đây tính lại từ dòng TKB
+thô + `SIS Class Log Subject` ở MỖI lượt gọi; xuất báo cáo một tháng cho cả
+campus mất hàng chục giây. Bảng `SIS Class Log Compliance` giữ sẵn kết quả:
+
+    (log_date, class_id, period_number, teacher_id)
+        -> is_scheduled, is_entered, is_updated, period_name, subject_id, ...
+
+- Mỗi tiết Study trong TKB hiệu lực của ngày (schedule_engine) là một dòng
+  is_scheduled=1, mỗi GV (GV đầu tiên của dòng TKB) một dòng.
+- Sổ đầu bài có nội dung mà không khớp tiết nào theo lịch (Homeroom, tiết lệch
+  TKB) là dòng is_scheduled=0, is_entered=1, teacher_id=''.
+- (lớp, ngày) không có gì vẫn có MỘT dòng đánh dấu period_number=-1 — để biết
+  ngày đó đã được tổng hợp.
+
+Giữ tươi
+--------
+- Sổ đầu bài: `save_class_log` và doc hook SIS Class Log Subject / Student đánh
+  dấu (lớp, ngày); sau commit tổng hợp lại đúng các cặp đó.
+- TKB: mỗi dòng rollup lưu chữ ký TKB (schedule_engine) lúc tổng hợp. Lúc đọc,
+  `read_rows` so với chữ ký hiện tại — TKB đổi (kể cả ghi SQL thô bởi import
+  hay sync phân công) hoặc ngày chưa có trong rollup thì các cặp đó được tính
+  trực tiếp cho lượt đọc và xếp cho job nền `refresh_stale`. Đường đọc KHÔNG
+  ghi: dashboard tải đồng thời không tranh nhau DELETE/INSERT cùng dòng.
+- `backfill_recent` chạy hằng đêm tổng hợp lại `BACKFILL_DAYS` ngày gần nhất để
+  bắt những thay đổi sổ đầu bài đi vòng qua hook.
+- `check_consistency` so rollup với phép tính trực tiếp.
+
+Lệnh tay:
+    bench --site <site> execute erp.api.erp_sis.class_log_compliance.backfill \
+        --kwargs "{'start_date': '2026-09-01', 'end_date': '2026-10-18'}"
+    bench --site <site> execute erp.api.erp_sis.class_log_compliance.check_consistency \
+        --kwargs "{'date': '2026-10-17'}"
+"""
+
+import hashlib
+from datetime import timedelta
+
+import frappe
+
+from erp.api.erp_sis.timetable import schedule_engine
+
+DOCTYPE = "SIS Class Log Compliance"
+TABLE = f"tab{DOCTYPE}"
+
+# Dòng đánh dấu "(lớp, ngày) đã tổng hợp, không có tiết/sổ nào"
+MARKER_PERIOD = -1
+# Số ngày job đêm tổng hợp lại (tính cả hôm nay)
+BACKFILL_DAYS = 7
+# Số (lớp, ngày) mỗi lô khi backfill — commit sau mỗi lô
+BATCH_PAIRS = 400
+INSERT_CHUNK = 500
+
+_PENDING_FLAG = "class_log_compliance_pending"
+# Tập (lớp|ngày) chờ tổng hợp lại do dashboard phát hiện lệch TKB
+STALE_KEY = "class_log_compliance:stale"
+REFRESH_JOB_ID = "class_log_compliance_refresh_stale"
+
+_COLUMNS = (
+    "log_date", "class_id", "campus_id", "timetable_instance_id", "period_number",
+    "period_name", "teacher_id", "subject_id", "is_scheduled", "is_entered",
+    "is_updated", "class_log_subject", "schedule_signature",
+)
+
+
+def _period_number(period_name):
+    # Cùng quy tắc với class_log_report._extract_period_number
+    from erp.api.erp_sis.class_log_report import _extract_period_number
+
+    return _extract_period_number(period_name)
+
+
+def _date_list(start_date, end_date):
+    start = frappe.utils.getdate(start_date)
+    end = frappe.utils.getdate(end_date)
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _day_signatures(class_ids, dates):
+    """
+    {(class_id, date): chữ ký TKB} — gộp chữ ký nội dung của mọi instance phủ ngày đó.
+    Trả thêm {(class_id, date): [instance]} để tổng hợp dùng lại, khỏi tra lần nữa.
+    """
+    if not class_ids or not dates:
+        return {}, {}
+    instances = schedule_engine.find_instances(class_ids, min(dates), max(dates))
+    schedules = schedule_engine.get_schedules([i.name for i in instances])
+
+    by_class = {}
+    for inst in instances:
+        compiled = schedules.get(inst.name)
+        if compiled is not None:
+            by_class.setdefault(inst.class_id, []).append(compiled)
+
+    signatures = {}
+    covering = {}
+    for class_id in class_ids:
+        compiled_list = sorted(by_class.get(class_id, []), key=lambda c: c.instance_id)
+        for day in dates:
+            cover = [
+                c for c in compiled_list
+                if (not c.start_date or c.start_date <= day) and (not c.end_date or c.end_date >= day)
+            ]
+            raw = repr([(c.instance_id, c.signature) for c in cover])
+            signatures[(class_id, day)] = hashlib.sha1(raw.encode()).hexdigest()[:16]
+            covering[(class_id, day)] = cover
+    return signatures, covering
+
+
+def _new_row(class_id, day, campus_id, signature, **values):
+    row = {
+        "log_date": day,
+        "class_id": class_id,
+        "campus_id": campus_id,
+        "timetable_instance_id": None,
+        "period_number": MARKER_PERIOD,
+        "period_name": None,
+        "teacher_id": "",
+        "subject_id": None,
+        "is_scheduled": 0,
+        "is_entered": 0,
+        "is_updated": 0,
+        "class_log_subject": None,
+        "schedule_signature": signature,
+    }
+    row.update(values)
+    return row
+
+
+def compute(class_ids, dates):
+    """
+    Phép tính TRỰC TIẾP (không đọc rollup). Trả {(class_id, date): [dòng rollup]}.
+    Dùng cho cả tổng hợp lẫn kiểm tra nhất quán.
+    """
+    from erp.api.erp_sis.class_log_report import _study_period_labels
+
+    class_ids = list(dict.fromkeys(class_ids or ()))
+    dates = sorted({frappe.utils.getdate(d) for d in dates or ()})
+    if not class_ids or not dates:
+        return {}
+
+    signatures, covering = _day_signatures(class_ids, dates)
+    campus_map = dict(frappe.get_all(
+        "SIS Class", filters={"name": ["in", class_ids]}, fields=["name", "campus_id"], as_list=True
+    ))
+
+    # 1) Tiết theo lịch
+    day_rows = {}
+    for key, cover in covering.items():
+        for compiled in cover:
+            for row in compiled.rows_on(key[1]):
+                day_rows.setdefault(key, []).append((compiled.instance_id, row))
+    labels = _study_period_labels([row for rows in day_rows.values() for _, row in rows])
+
+    result = {}
+    for key in signatures:
+        class_id, day = key
+        slots = {}
+        for instance_id, row in day_rows.get(key, ()):
+            label = labels.get(row.name)
+            if not label:
+                continue
+            slot = (_period_number(label['period_name']), label['teacher_id'] or "")
+            if slot in slots:
+                continue
+            slots[slot] = _new_row(
+                class_id, day, campus_map.get(class_id), signatures[key],
+                timetable_instance_id=instance_id,
+                period_number=slot[0],
+                period_name=label['period_name'],
+                teacher_id=slot[1],
+                subject_id=label.get('subject_id'),
+                is_scheduled=1,
+            )
+        result[key] = slots
+
+    # 2) Sổ đầu bài có nội dung
+    logs = frappe.db.sql("""
+        SELECT cls.name, cls.class_id, cls.log_date, cls.period, cls.general_comment,
+               cls.modified, cls.creation, COUNT(clst.name) AS student_log_count
+        FROM `tabSIS Class Log Subject` cls
+        LEFT JOIN `tabSIS Class Log Student` clst ON clst.subject_id = cls.name
+        WHERE cls.class_id IN %(cids)s
+            AND cls.log_date IN %(dates)s
+        GROUP BY cls.name, cls.class_id, cls.log_date, cls.period,
+                 cls.general_comment, cls.modified, cls.creation
+        ORDER BY cls.creation
+    """, {"cids": class_ids, "dates": dates}, as_dict=True)
+
+    for lg in logs:
+        if not (lg.get('general_comment') or (lg.get('student_log_count') or 0) > 0):
+            continue
+        key = (lg['class_id'], frappe.utils.getdate(lg['log_date']))
+        slots = result.get(key)
+        if slots is None:
+            continue
+        pnum = _period_number(lg['period'])
+        matched = [s for (n, _), s in slots.items() if n == pnum and s['is_scheduled']]
+        if not matched:
+            unscheduled = slots.get((pnum, ""))
+            if unscheduled is None:
+                unscheduled = slots[(pnum, "")] = _new_row(
+                    key[0], key[1], campus_map.get(key[0]), signatures[key],
+                    period_number=pnum,
+                    period_name=lg['period'],
+                )
+            matched = [unscheduled]
+        for slot in matched:
+            if slot['is_entered']:
+                continue
+            slot['is_entered'] = 1
+            slot['is_updated'] = 1 if lg.get('modified') != lg.get('creation') else 0
+            slot['class_log_subject'] = lg['name']
+
+    out = {}
+    for key, slots in result.items():
+        rows = list(slots.values())
+        if not rows:
+            rows = [_new_row(key[0], key[1], campus_map.get(key[0]), signatures[key])]
+        out[key] = rows
+    return out
+
+
+def _write(computed):
+    """Thay toàn bộ dòng của các (lớp, ngày) trong `computed`. Không commit."""
+    if not computed:
+        return 0
+    by_class = {}
+    for class_id, day in computed:
+        by_class.setdefault(class_id, []).append(day)
+    for class_id, days in by_class.items():
+        frappe.db.sql(
+            f"DELETE FROM `{TABLE}` WHERE class_id = %(cid)s AND log_date IN %(dates)s",
+            {"cid": class_id, "dates": days},
+        )
+
+    rows = [row for rows in computed.values() for row in rows]
+    now = frappe.utils.now_datetime()
+    user = frappe.session.user
+    columns = ("name",) + _COLUMNS + ("creation", "modified", "owner", "modified_by", "docstatus")
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    for i in range(0, len(rows), INSERT_CHUNK):
+        chunk = rows[i:i + INSERT_CHUNK]
+        values = []
+        for row in chunk:
+            values.append(frappe.generate_hash(length=12))
+            values.extend(row[c] for c in _COLUMNS)
+            values.extend([now, now, user, user, 0])
+        frappe.db.sql(
+            f"""
+            INSERT INTO `{TABLE}` ({", ".join(f"`{c}`" for c in columns)})
+            VALUES {", ".join([placeholders] * len(chunk))}
+            ON DUPLICATE KEY UPDATE
+                is_scheduled = VALUES(is_scheduled),
+                is_entered = VALUES(is_entered),
+                is_updated = VALUES(is_updated),
+                period_name = VALUES(period_name),
+                subject_id = VALUES(subject_id),
+                class_log_subject = VALUES(class_log_subject),
+                schedule_signature = VALUES(schedule_signature),
+                modified = VALUES(modified)
+            """,
+            tuple(values),
+        )
+    return len(rows)
+
+
+def refresh(class_ids, dates):
+    """Tổng hợp lại các cặp (lớp × ngày). Không commit — caller quyết định."""
+    return _write(compute(class_ids, dates))
+
+
+def _stale_pairs(class_ids, dates):
+    """(lớp, ngày) chưa có trong rollup hoặc lưu chữ ký TKB khác chữ ký hiện tại."""
+    class_ids = list(dict.fromkeys(class_ids or ()))
+    dates = sorted({frappe.utils.getdate(d) for d in dates or ()})
+    if not class_ids or not dates:
+        return []
+
+    signatures, _ = _day_signatures(class_ids, dates)
+    stored = {}
+    for r in frappe.db.sql(f"""
+        SELECT DISTINCT class_id, log_date, schedule_signature
+        FROM `{TABLE}`
+        WHERE class_id IN %(cids)s AND log_date BETWEEN %(s)s AND %(e)s
+    """, {"cids": class_ids, "s": dates[0], "e": dates[-1]}, as_dict=True):
+        stored.setdefault((r.class_id, frappe.utils.getdate(r.log_date)), set()).add(r.schedule_signature)
+
+    return [key for key, sig in signatures.items() if stored.get(key) != {sig}]
+
+
+def _queue_pairs(pairs):
+    """Đưa (lớp, ngày) vào tập chờ trên Redis và xếp MỘT job nền `refresh_stale`."""
+    if not pairs:
+        return
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline(transaction=False)
+        pipe.sadd(cache.make_key(STALE_KEY), *(_encode_pair(c, d) for c, d in pairs))
+        pipe.execute()
+        frappe.enqueue(
+            "erp.api.erp_sis.class_log_compliance.refresh_stale",
+            queue="short",
+            job_id=REFRESH_JOB_ID,
+            deduplicate=True,
+        )
+    except Exception as e:
+        frappe.logger().warning(f"class_log_compliance queue refresh failed: {e}")
+
+
+def read_rows(class_ids, dates):
+    """
+    CHỈ ĐỌC — gọi từ dashboard GET. Trả dòng rollup của (lớp × ngày), sắp theo
+    ngày, lớp, tiết. Cặp thiếu / lệch TKB được tính trực tiếp (`compute`) cho
+    lượt đọc này và xếp job nền tổng hợp bù — không trả số cũ hay số 0.
+    """
+    class_ids = list(dict.fromkeys(class_ids or ()))
+    dates = sorted({frappe.utils.getdate(d) for d in dates or ()})
+    if not class_ids or not dates:
+        return []
+
+    stale = set(_stale_pairs(class_ids, dates))
+    _queue_pairs(stale)
+
+    wanted = set(dates)
+    rows = []
+    for r in frappe.db.sql(f"""
+        SELECT {", ".join(f"`{c}`" for c in _COLUMNS)}
+        FROM `{TABLE}`
+        WHERE class_id IN %(cids)s AND log_date BETWEEN %(s)s AND %(e)s
+    """, {"cids": class_ids, "s": dates[0], "e": dates[-1]}, as_dict=True):
+        key = (r['class_id'], frappe.utils.getdate(r['log_date']))
+        if key[1] in wanted and key not in stale:
+            r['log_date'] = key[1]
+            rows.append(r)
+    if stale:
+        computed = compute({c for c, _ in stale}, {d for _, d in stale})
+        rows.extend(row for key, live in computed.items() if key in stale for row in live)
+
+    rows.sort(key=lambda r: (r['log_date'], r['class_id'], r['period_number']))
+    return rows
+
+
+def _encode_pair(class_id, day):
+    return f"{class_id}|{frappe.utils.getdate(day).isoformat()}"
+
+
+def _decode_pair(raw):
+    if isinstance(raw, bytes):
+        raw = raw.decode()
+    class_id, _, day = raw.rpartition("|")
+    return class_id, frappe.utils.getdate(day)
+
+
+def refresh_stale():
+    """
+    Job nền (một job duy nhất — job_id cố định): rút dần tập chờ của `read_rows`,
+    kiểm lại chữ ký (job trước / hook có thể đã làm) rồi tổng hợp, commit theo lô.
+    Cặp thêm vào lúc job sắp xong thì lượt đọc kế tiếp sẽ xếp lại.
+    """
+    cache = frappe.cache()
+    key = cache.make_key(STALE_KEY)
+    written = 0
+    while True:
+        # Đi qua pipeline: RedisWrapper.spop tự thêm tiền tố lần nữa
+        pipe = cache.pipeline(transaction=False)
+        pipe.spop(key, BATCH_PAIRS)
+        popped = pipe.execute()[0] or []
+        if not popped:
+            break
+        batch = {_decode_pair(raw) for raw in popped}
+        stale = set(_stale_pairs({c for c, _ in batch}, {d for _, d in batch})) & batch
+        if not stale:
+            continue
+        computed = compute({c for c, _ in stale}, {d for _, d in stale})
+        written += _write({k: v for k, v in computed.items() if k in stale})
+        frappe.db.commit()
+    return written
+
+
+def _flush_pending():
+    pending = frappe.flags.pop(_PENDING_FLAG, None) or set()
+    if not pending:
+        return
+    try:
+        by_date = {}
+        for class_id, day in pending:
+            by_date.setdefault(day, set()).add(class_id)
+        for day, class_ids in by_date.items():
+            refresh(class_ids, [day])
+        frappe.db.commit()
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.logger().warning(f"class_log_compliance refresh failed for {sorted(pending)}: {e}")
+
+
+def mark_dirty(class_id, log_date):
+    """Đánh dấu (lớp, ngày) để tổng hợp lại ngay sau commit của giao dịch hiện tại."""
+    if not class_id or not log_date:
+        return
+    pending = frappe.flags.get(_PENDING_FLAG)
+    if pending is None:
+        pending = frappe.flags[_PENDING_FLAG] = set()
+        frappe.db.after_commit.add(_flush_pending)
+        frappe.db.after_rollback.add(lambda: frappe.flags.pop(_PENDING_FLAG, None))
+    pending.add((class_id, frappe.utils.getdate(log_date)))
+
+
+def on_class_log_subject_change(doc, method=None):
+    """Doc hook SIS Class Log Subject (on_update / on_trash)."""
+    try:
+        mark_dirty(doc.class_id, doc.log_date)
+    except Exception as e:
+        frappe.logger().warning(f"class_log_compliance hook failed {doc.name}: {e}")
+
+
+def on_class_log_student_change(doc, method=None):
+    """Doc hook SIS Class Log Student — nhận xét học sinh cũng làm tiết thành 'đã nhập'."""
+    try:
+        subject = frappe.db.get_value(
+            "SIS Class Log Subject", doc.subject_id, ["class_id", "log_date"], as_dict=True
+        ) if doc.subject_id else None
+        if subject:
+            mark_dirty(subject.class_id, subject.log_date)
+    except Exception as e:
+        frappe.logger().warning(f"class_log_compliance hook failed {doc.name}: {e}")
+
+
+def _regular_class_ids(campus_id=None):
+    filters = {"class_type": "Regular"}
+    school_years = frappe.get_all("SIS School Year", filters={"is_enable": 1}, pluck="name")
+    if not school_years:
+        return []
+    filters["school_year_id"] = ["in", school_years]
+    if campus_id:
+        filters["campus_id"] = campus_id
+    return frappe.get_all("SIS Class", filters=filters, pluck="name")
+
+
+def backfill(start_date, end_date, campus_id=None):
+    """Tổng hợp lại TOÀN BỘ (lớp Regular năm học đang bật × khoảng ngày), commit theo lô."""
+    class_ids = _regular_class_ids(campus_id)
+    dates = _date_list(start_date, end_date)
+    if not class_ids or not dates:
+        return {"classes": 0, "days": 0, "rows": 0}
+
+    started = frappe.utils.now_datetime()
+    per_batch = max(1, BATCH_PAIRS // len(dates))
+    written = 0
+    for i in range(0, len(class_ids), per_batch):
+        written += refresh(class_ids[i:i + per_batch], dates)
+        frappe.db.commit()
+    elapsed = (frappe.utils.now_datetime() - started).total_seconds()
+    summary = {"classes": len(class_ids), "days": len(dates), "rows": written, "seconds": round(elapsed, 1)}
+    frappe.logger().info(f"class_log_compliance backfill {start_date}..{end_date}: {summary}")
+    return summary
+
+
+def backfill_recent():
+    """Job đêm: tổng hợp lại `BACKFILL_DAYS` ngày gần nhất (tính cả hôm nay)."""
+    today = frappe.utils.getdate(frappe.utils.today())
+    return backfill(today - timedelta(days=BACKFILL_DAYS - 1), today)
+
+
+def _comparable(row):
+    return (
+        row['period_number'], row['teacher_id'] or "", int(row['is_scheduled'] or 0),
+        int(row['is_entered'] or 0), int(row['is_updated'] or 0), row.get('subject_id') or None,
+    )
+
+
+def check_consistency(date=None, campus_id=None, start_date=None, end_date=None, limit=50):
+    """
+    So rollup đang lưu với phép tính trực tiếp. Không sửa gì — chỉ báo lệch.
+    Trả {pairs, mismatched, samples: [{class_id, date, missing, extra}]}.
+    """
+    start_date = start_date or date or frappe.utils.today()
+    end_date = end_date or date or start_date
+    class_ids = _regular_class_ids(campus_id)
+    dates = _date_list(start_date, end_date)
+    if not class_ids or not dates:
+        return {"pairs": 0, "mismatched": 0, "samples": []}
+
+    live = compute(class_ids, dates)
+    stored = {}
+    for r in frappe.db.sql(f"""
+        SELECT class_id, log_date, period_number, teacher_id, is_scheduled,
+               is_entered, is_updated, subject_id
+        FROM `{TABLE}`
+        WHERE class_id IN %(cids)s AND log_date BETWEEN %(s)s AND %(e)s
+    """, {"cids": class_ids, "s": dates[0], "e": dates[-1]}, as_dict=True):
+        key = (r.class_id, frappe.utils.getdate(r.log_date))
+        stored.setdefault(key, set()).add(_comparable(r))
+
+    mismatched = 0
+    samples = []
+    for key, rows in live.items():
+        expected = {_comparable(r) for r in rows}
+        actual = stored.get(key, set())
+        if expected == actual:
+            continue
+        mismatched += 1
+        if len(samples) < limit:
+            samples.append({
+                "class_id": key[0],
+                "date": str(key[1]),
+                "missing": sorted((list(r) for r in expected - actual), key=str),
+                "extra": sorted((list(r) for r in actual - expected), key=str),
+            })
+
+    result = {"pairs": len(live), "mismatched": mismatched, "samples": samples}
+    if mismatched:
+        frappe.logger().warning(
+            f"class_log_compliance: {mismatched}/{len(live)} (lớp, ngày) lệch {start_date}..{end_date}"
+        )
+    return result
@@ -9,6 +9,8 @@ import json
 import re
 from datetime import datetime, timedelta
 from erp.utils.api_response import success_response, error_response
+from erp.api.erp_sis.timetable import schedule_engine
+from erp.api.erp_sis import class_log_compliance
 
 
 def _get_json_body():
@@ -30,6 +32,66 @@ def _extract_period_number(period_name):
     return int(match.group()) if match else 999
 
 
+def _study_period_labels(rows):
+    """
+    Nhãn hiển thị cho các dòng TKB (từ schedule_engine), chỉ giữ tiết Study (có chứa "tiết").
+    3 query gộp cho cả lô dòng thay vì JOIN lại trên từng lần query TKB.
+    
+    Returns:
+        {row_name: {period_name, period_priority, subject_id, subject_name, teacher_id, teacher_name}}
+    """
+    if not rows:
+        return {}
+    
+    column_ids = list({r.timetable_column_id for r in rows if r.get('timetable_column_id')})
+    subject_ids = list({r.subject_id for r in rows if r.get('subject_id')})
+    teacher_ids = list({r.teachers[0] for r in rows if r.get('teachers')})
+    
+    columns = {}
+    if column_ids:
+        for c in frappe.db.sql("""
+            SELECT name, period_name, period_priority
+            FROM `tabSIS Timetable Column`
+            WHERE name IN %(ids)s AND LOWER(period_name) LIKE '%%tiết%%'
+        """, {"ids": column_ids}, as_dict=True):
+            columns[c['name']] = c
+    
+    subject_names = {}
+    if subject_ids:
+        for sub in frappe.db.sql("""
+            SELECT sub.name, COALESCE(ts.title_vn, sub.title) AS subject_name
+            FROM `tabSIS Subject` sub
+            LEFT JOIN `tabSIS Timetable Subject` ts ON sub.timetable_subject_id = ts.name
+            WHERE sub.name IN %(ids)s
+        """, {"ids": subject_ids}, as_dict=True):
+            subject_names[sub['name']] = sub['subject_name']
+    
+    teacher_names = {}
+    if teacher_ids:
+        for td in frappe.db.sql("""
+            SELECT t.name, u.full_name FROM `tabSIS Teacher` t
+            LEFT JOIN `tabUser` u ON t.user_id = u.name
+            WHERE t.name IN %(ids)s
+        """, {"ids": teacher_ids}, as_dict=True):
+            teacher_names[td['name']] = td['full_name']
+    
+    labels = {}
+    for r in rows:
+        column = columns.get(r.get('timetable_column_id'))
+        if not column:
+            continue
+        teacher_id = r.teachers[0] if r.get('teachers') else None
+        labels[r.name] = {
+            "period_name": column['period_name'],
+            "period_priority": column.get('period_priority'),
+            "subject_id": r.get('subject_id'),
+            "subject_name": subject_names.get(r.get('subject_id')),
+            "teacher_id": teacher_id,
+            "teacher_name": teacher_names.get(teacher_id)
+        }
+    return labels
+
+
 def _calculate_class_periods_stats(class_id, date_obj, timetable_instance, homeroom_teacher=None, homeroom_teacher_name=None):
     """
     Tính toán số liệu sổ đầu bài cho 1 lớp (logic dùng chung cho dashboard và detail)
@@ -69,42 +131,24 @@ def _calculate_class_periods_stats(class_id, date_obj, timetable_instance, homer
             "period_numbers": set()
         }
     
-    # day_of_week trong database là format viết tắt: mon, tue, wed, thu, fri, sat, sun
-    day_map = {0: 'mon', 1: 'tue', 2: 'wed', 3: 'thu', 4: 'fri', 5: 'sat', 6: 'sun'}
-    day_of_week_short = day_map.get(date_obj.weekday(), 'mon')
+    # Lấy các tiết học trong ngày (chỉ tiết Study - có chứa "tiết") qua schedule_engine:
+    # pattern có valid_from mới nhất thắng, override theo ngày thay pattern
+    compiled = schedule_engine.get_schedule(timetable_instance)
+    day_rows = compiled.rows_on(date_obj) if compiled else []
+    labels = _study_period_labels(day_rows)
     
-    # Lấy các tiết học trong ngày (chỉ tiết Study - có chứa "tiết")
-    # GROUP BY period_name để tránh duplicate
-    periods_data = frappe.db.sql("""
-        SELECT 
-            tc.period_name,
-            MIN(tc.period_priority) as period_priority,
-            MAX(tr.subject_id) as subject_id,
-            MAX(COALESCE(ts.title_vn, sub.title)) as subject_name,
-            MAX(COALESCE(trt.teacher_id, tr.teacher_1_id)) as teacher_id,
-            MAX(COALESCE(u_new.full_name, u_old.full_name)) as teacher_name
-        FROM `tabSIS Timetable Instance Row` tr
-        INNER JOIN `tabSIS Timetable Column` tc ON tr.timetable_column_id = tc.name
-        LEFT JOIN `tabSIS Subject` sub ON tr.subject_id = sub.name
-        LEFT JOIN `tabSIS Timetable Subject` ts ON sub.timetable_subject_id = ts.name
-        LEFT JOIN `tabSIS Timetable Instance Row Teacher` trt ON trt.parent = tr.name 
-            AND trt.idx = (SELECT MIN(idx) FROM `tabSIS Timetable Instance Row Teacher` WHERE parent = tr.name)
-        LEFT JOIN `tabSIS Teacher` t_new ON trt.teacher_id = t_new.name
-        LEFT JOIN `tabUser` u_new ON t_new.user_id = u_new.name
-        LEFT JOIN `tabSIS Teacher` t_old ON tr.teacher_1_id = t_old.name
-        LEFT JOIN `tabUser` u_old ON t_old.user_id = u_old.name
-        WHERE tr.parent = %(instance)s
-            AND tr.day_of_week = %(day)s
-            AND LOWER(tc.period_name) LIKE '%%tiết%%'
-            AND (tr.valid_from IS NULL OR tr.valid_from <= %(date)s)
-            AND (tr.valid_to IS NULL OR tr.valid_to >= %(date)s)
-        GROUP BY tc.period_name
-        ORDER BY MIN(tc.period_priority) ASC
-    """, {
-        "instance": timetable_instance,
-        "day": day_of_week_short,
-        "date": date_obj
-    }, as_dict=True)
+    # Gộp theo period_name để tránh duplicate
+    periods_by_name = {}
+    for row in day_rows:
+        label = labels.get(row.name)
+        if not label:
+            continue
+        existing = periods_by_name.get(label['period_name'])
+        if existing is None:
+            periods_by_name[label['period_name']] = dict(label)
+        elif (label.get('period_priority') or 0) < (existing.get('period_priority') or 0):
+            existing['period_priority'] = label['period_priority']
+    periods_data = sorted(periods_by_name.values(), key=lambda p: p.get('period_priority') or 0)
     
     # Sort theo số tiết
     periods_data.sort(key=lambda p: _extract_period_number(p.get('period_name', '')))
@@ -275,6 +319,82 @@ def _calculate_class_periods_stats(class_id, date_obj, timetable_instance, homer
     }
 
 
+def _subject_teacher_periods(start_obj, end_obj, school_year, campus_id=None):
+    """
+    Tiết dạy của GV bộ môn trong khoảng ngày (chỉ lớp Regular, bỏ tiểu học) kèm trạng thái
+    nhập sổ — đọc từ rollup class_log_compliance, chỉ JOIN tên ở bước cuối.
+    
+    Returns:
+        [{date, teacher_id, teacher_name, class_id, class_title, education_stage_id,
+          period_name, subject_id, subject_name, status}] theo thứ tự ngày, lớp, tiết
+    """
+    # Bỏ tiểu học: education_stage_id != 'EDU-STAGE-00001' VÀ tên lớp không phải lớp 1-5
+    classes = frappe.db.sql("""
+        SELECT c.name, c.title, eg.education_stage_id
+        FROM `tabSIS Class` c
+        LEFT JOIN `tabSIS Education Grade` eg ON c.education_grade = eg.name
+        WHERE c.class_type = 'Regular'
+            AND c.school_year_id = %(school_year)s
+            AND (eg.education_stage_id IS NULL OR eg.education_stage_id != 'EDU-STAGE-00001')
+            AND NOT (c.title REGEXP '^Lớp [1-5][^0-9]' OR c.title REGEXP '^Lớp [1-5]$')
+            {campus_filter}
+    """.format(
+        campus_filter="AND c.campus_id = %(campus_id)s" if campus_id else ""
+    ), {"school_year": school_year, "campus_id": campus_id}, as_dict=True)
+    if not classes:
+        return []
+    class_map = {c['name']: c for c in classes}
+    
+    days = [start_obj + timedelta(days=i) for i in range((end_obj - start_obj).days + 1)]
+    periods = [
+        r for r in class_log_compliance.read_rows(list(class_map), days)
+        if r['is_scheduled'] and r['teacher_id']
+    ]
+    if not periods:
+        return []
+    
+    teacher_names = {}
+    teacher_ids = list({p['teacher_id'] for p in periods})
+    for td in frappe.db.sql("""
+        SELECT t.name, u.full_name FROM `tabSIS Teacher` t
+        INNER JOIN `tabUser` u ON t.user_id = u.name
+        WHERE t.name IN %(ids)s
+    """, {"ids": teacher_ids}, as_dict=True):
+        teacher_names[td['name']] = td['full_name']
+    
+    subject_names = {}
+    subject_ids = list({p['subject_id'] for p in periods if p.get('subject_id')})
+    if subject_ids:
+        for sub in frappe.db.sql("""
+            SELECT sub.name, COALESCE(ts.title_vn, sub.title) AS subject_name
+            FROM `tabSIS Subject` sub
+            LEFT JOIN `tabSIS Timetable Subject` ts ON sub.timetable_subject_id = ts.name
+            WHERE sub.name IN %(ids)s
+        """, {"ids": subject_ids}, as_dict=True):
+            subject_names[sub['name']] = sub['subject_name']
+    
+    result = []
+    for p in periods:
+        cls = class_map[p['class_id']]
+        if p['is_entered']:
+            status = "updated" if p['is_updated'] else "entered"
+        else:
+            status = "not_entered"
+        result.append({
+            "date": p['log_date'],
+            "teacher_id": p['teacher_id'],
+            "teacher_name": teacher_names.get(p['teacher_id']),
+            "class_id": p['class_id'],
+            "class_title": cls['title'],
+            "education_stage_id": cls.get('education_stage_id'),
+            "period_name": p['period_name'],
+            "subject_id": p.get('subject_id'),
+            "subject_name": subject_names.get(p.get('subject_id')),
+            "status": status,
+        })
+    return result
+
+
 def _calculate_contact_log_stats(class_id, date_obj, include_students_detail=False):
     """
     Tính toán số liệu sổ liên lạc cho 1 lớp (logic dùng chung cho dashboard và detail)
@@ -952,50 +1072,17 @@ def get_campus_class_log_overview(campus_id=None, date=None):
         
         class_ids = [c.name for c in classes]
         
-        # day_of_week trong database là format viết tắt: mon, tue, wed, thu, fri, sat, sun
-        day_map = {0: 'mon', 1: 'tue', 2: 'wed', 3: 'thu', 4: 'fri', 5: 'sat', 6: 'sun'}
-        day_of_week_short = day_map.get(date_obj.weekday(), 'mon')
-        
-        # Đếm số tiết theo lịch cho mỗi lớp
-        scheduled_counts = frappe.db.sql("""
-            SELECT 
-                ti.class_id,
-                COUNT(DISTINCT tc.period_name) as period_count
-            FROM `tabSIS Timetable Instance` ti
-            INNER JOIN `tabSIS Timetable Instance Row` tr ON tr.parent = ti.name
-            INNER JOIN `tabSIS Timetable Column` tc ON tr.timetable_column_id = tc.name
-            WHERE ti.class_id IN %(class_ids)s
-                AND ti.start_date <= %(date)s
-                AND (ti.end_date >= %(date)s OR ti.end_date IS NULL)
-                AND tr.day_of_week = %(day)s
-                AND (tr.valid_from IS NULL OR tr.valid_from <= %(date)s)
-                AND (tr.valid_to IS NULL OR tr.valid_to >= %(date)s)
-            GROUP BY ti.class_id
-        """, {
-            "class_ids": class_ids,
-            "date": date_obj,
-            "day": day_of_week_short
-        }, as_dict=True)
-        
-        scheduled_map = {r['class_id']: r['period_count'] + 1 for r in scheduled_counts}  # +1 for Homeroom
-        
-        # Đếm số log đã nhập
-        entered_counts = frappe.db.sql("""
-            SELECT 
-                cls.class_id,
-                COUNT(DISTINCT cls.period) as entered_count
-            FROM `tabSIS Class Log Subject` cls
-            LEFT JOIN `tabSIS Class Log Student` clst ON clst.subject_id = cls.name
-            WHERE cls.class_id IN %(class_ids)s
-                AND cls.log_date = %(date)s
-                AND (cls.general_comment IS NOT NULL OR clst.name IS NOT NULL)
-            GROUP BY cls.class_id
-        """, {
-            "class_ids": class_ids,
-            "date": date_obj
-        }, as_dict=True)
+        # Đọc rollup sổ đầu bài (class_log_compliance) — thiếu/lệch TKB thì tính trực tiếp
+        scheduled_periods = {}
+        entered_periods = {}
+        for r in class_log_compliance.read_rows(class_ids, [date_obj]):
+            if r['is_scheduled']:
+                scheduled_periods.setdefault(r['class_id'], set()).add(r['period_number'])
+            if r['is_entered']:
+                entered_periods.setdefault(r['class_id'], set()).add(r['period_number'])
         
-        entered_map = {r['class_id']: r['entered_count'] for r in entered_counts}
+        scheduled_map = {cid: len(p) + 1 for cid, p in scheduled_periods.items()}  # +1 for Homeroom
+        entered_map = {cid: len(p) for cid, p in entered_periods.items()}
         
         # Build kết quả
         classes_result = []
@@ -1147,7 +1234,7 @@ def get_class_log_dashboard(date=None, campus_id=None):
         
         class_ids = [c.name for c in classes]
 
-        # --- BATCH QUERY OPTIMIZATION: 6 queries thay vì 700+ ---
+        # --- BATCH QUERY OPTIMIZATION: 4 queries thay vì 700+ ---
 
         # Q1: Tên GVCN
         teacher_ids = [c.homeroom_teacher for c in classes if c.homeroom_teacher]
@@ -1160,63 +1247,20 @@ def get_class_log_dashboard(date=None, campus_id=None):
             """, {"ids": teacher_ids}, as_dict=True):
                 teacher_names[td['name']] = td['full_name']
 
-        # Q2: Timetable instances
-        timetable_instances = frappe.db.sql("""
-            SELECT class_id, name FROM `tabSIS Timetable Instance`
-            WHERE class_id IN %(cids)s
-                AND start_date <= %(date)s AND (end_date >= %(date)s OR end_date IS NULL)
-        """, {"cids": class_ids, "date": date_obj}, as_dict=True)
-        timetable_map = {ti['class_id']: ti['name'] for ti in timetable_instances}
-        instance_names = [ti['name'] for ti in timetable_instances]
-
-        # day_of_week
-        day_map = {0: 'mon', 1: 'tue', 2: 'wed', 3: 'thu', 4: 'fri', 5: 'sat', 6: 'sun'}
-        dow = day_map.get(date_obj.weekday(), 'mon')
-
-        # Q3: Tất cả timetable rows cho tất cả lớp trong ngày (batch)
-        class_period_numbers = {}  # class_id -> set of period_numbers
-        if instance_names:
-            tt_rows = frappe.db.sql("""
-                SELECT ti.class_id, tc.period_name
-                FROM `tabSIS Timetable Instance Row` tr
-                INNER JOIN `tabSIS Timetable Instance` ti ON tr.parent = ti.name
-                INNER JOIN `tabSIS Timetable Column` tc ON tr.timetable_column_id = tc.name
-                WHERE ti.name IN %(inames)s
-                    AND tr.day_of_week = %(dow)s
-                    AND LOWER(tc.period_name) LIKE '%%tiết%%'
-                    AND (tr.valid_from IS NULL OR tr.valid_from <= %(date)s)
-                    AND (tr.valid_to IS NULL OR tr.valid_to >= %(date)s)
-                GROUP BY ti.class_id, tc.period_name
-            """, {"inames": instance_names, "dow": dow, "date": date_obj}, as_dict=True)
-            for r in tt_rows:
-                pnum = _extract_period_number(r['period_name'])
-                class_period_numbers.setdefault(r['class_id'], set()).add(pnum)
-
-        # Q4: Tất cả class logs (batch) — đếm entered periods
-        entered_periods_map = {}  # class_id -> set of entered period_numbers
-        if class_ids:
-            all_logs = frappe.db.sql("""
-                SELECT cls.class_id, cls.period, cls.general_comment,
-                       cls.modified, cls.creation,
-                       COUNT(clst.name) AS student_log_count
-                FROM `tabSIS Class Log Subject` cls
-                LEFT JOIN `tabSIS Class Log Student` clst ON clst.subject_id = cls.name
-                WHERE cls.class_id IN %(cids)s
-                    AND cls.log_date = %(date)s
-                    AND LOWER(cls.period) LIKE '%%tiết%%'
-                GROUP BY cls.name, cls.class_id, cls.period
-            """, {"cids": class_ids, "date": date_obj}, as_dict=True)
-            for lg in all_logs:
-                has_content = lg.get('general_comment') or lg.get('student_log_count', 0) > 0
-                if not has_content:
-                    continue
-                cid = lg['class_id']
-                pnum = _extract_period_number(lg['period'])
-                pnums = class_period_numbers.get(cid, set())
-                if pnum in pnums:
-                    entered_periods_map.setdefault(cid, set()).add(pnum)
+        # Q2: Tiết theo lịch / đã nhập từ rollup sổ đầu bài (class_log_compliance)
+        study_periods = {}  # class_id -> ({tiết theo lịch}, {tiết theo lịch đã nhập})
+        for r in class_log_compliance.read_rows(class_ids, [date_obj]):
+            if not r['is_scheduled']:
+                continue
+            total, entered = study_periods.setdefault(r['class_id'], (set(), set()))
+            total.add(r['period_number'])
+            if r['is_entered']:
+                entered.add(r['period_number'])
+        class_period_counts = {  # class_id -> (total_study, entered_study)
+            cid: (len(total), len(entered)) for cid, (total, entered) in study_periods.items()
+        }
 
-        # Q5: Tổng HS mỗi lớp (batch)
+        # Q3: Tổng HS mỗi lớp (batch)
         student_count_map = {}
         if class_ids:
             for r in frappe.db.sql("""
@@ -1225,7 +1269,7 @@ def get_class_log_dashboard(date=None, campus_id=None):
             """, {"cids": class_ids}, as_dict=True):
                 student_count_map[r['class_id']] = r['cnt']
 
-        # Q6: Đếm distinct student đã gửi contact log (batch)
+        # Q4: Đếm distinct student đã gửi contact log (batch)
         sent_count_map = {}
         if class_ids:
             for r in frappe.db.sql("""
@@ -1245,8 +1289,7 @@ def get_class_log_dashboard(date=None, campus_id=None):
 
         for cls in classes:
             cid = cls.name
-            total_study = len(class_period_numbers.get(cid, set()))
-            entered_study = len(entered_periods_map.get(cid, set()))
+            total_study, entered_study = class_period_counts.get(cid, (0, 0))
             total_students = student_count_map.get(cid, 0)
             students_sent = sent_count_map.get(cid, 0)
 
@@ -1507,51 +1550,8 @@ def get_subject_teachers_dashboard(date=None, campus_id=None):
                 message=f"Không tìm thấy năm học đang hoạt động (campus_id={campus_id})"
             )
         
-        # day_of_week format: mon, tue, wed, thu, fri, sat, sun
-        day_map = {0: 'mon', 1: 'tue', 2: 'wed', 3: 'thu', 4: 'fri', 5: 'sat', 6: 'sun'}
-        day_of_week_short = day_map.get(date_obj.weekday(), 'mon')
-        
-        # Lấy tất cả tiết dạy của GV bộ môn trong ngày (chỉ lớp Regular, bỏ tiểu học)
-        # Bỏ tiểu học: education_stage_id != 'EDU-STAGE-00001' VÀ tên lớp không phải lớp 1-5
-        # Sử dụng GROUP BY để loại bỏ duplicate (do JOIN với nhiều bảng)
-        scheduled_periods = frappe.db.sql("""
-            SELECT 
-                COALESCE(trt.teacher_id, tr.teacher_1_id) as teacher_id,
-                ti.class_id,
-                c.title as class_title,
-                eg.education_stage_id,
-                tc.period_name,
-                MAX(COALESCE(ts.title_vn, sub.title)) as subject_name,
-                tr.subject_id
-            FROM `tabSIS Timetable Instance Row` tr
-            INNER JOIN `tabSIS Timetable Instance` ti ON tr.parent = ti.name
-            INNER JOIN `tabSIS Timetable Column` tc ON tr.timetable_column_id = tc.name
-            INNER JOIN `tabSIS Class` c ON ti.class_id = c.name
-            LEFT JOIN `tabSIS Education Grade` eg ON c.education_grade = eg.name
-            LEFT JOIN `tabSIS Subject` sub ON tr.subject_id = sub.name
-            LEFT JOIN `tabSIS Timetable Subject` ts ON sub.timetable_subject_id = ts.name
-            LEFT JOIN `tabSIS Timetable Instance Row Teacher` trt ON trt.parent = tr.name 
-                AND trt.idx = (SELECT MIN(idx) FROM `tabSIS Timetable Instance Row Teacher` WHERE parent = tr.name)
-            WHERE ti.start_date <= %(date)s
-                AND (ti.end_date >= %(date)s OR ti.end_date IS NULL)
-                AND tr.day_of_week = %(day)s
-                AND LOWER(tc.period_name) LIKE '%%tiết%%'
-                AND (tr.valid_from IS NULL OR tr.valid_from <= %(date)s)
-                AND (tr.valid_to IS NULL OR tr.valid_to >= %(date)s)
-                AND c.class_type = 'Regular'
-                AND c.school_year_id = %(school_year)s
-                AND (eg.education_stage_id IS NULL OR eg.education_stage_id != 'EDU-STAGE-00001')
-                AND NOT (c.title REGEXP '^Lớp [1-5][^0-9]' OR c.title REGEXP '^Lớp [1-5]$')
-                {campus_filter}
-            GROUP BY COALESCE(trt.teacher_id, tr.teacher_1_id), ti.class_id, tc.period_name, tr.subject_id, c.title, eg.education_stage_id
-        """.format(
-            campus_filter="AND c.campus_id = %(campus_id)s" if campus_id else ""
-        ), {
-            "date": date_obj,
-            "day": day_of_week_short,
-            "school_year": school_year,
-            "campus_id": campus_id
-        }, as_dict=True)
+        # Lấy tất cả tiết dạy của GV bộ môn trong ngày kèm trạng thái (rollup sổ đầu bài)
+        scheduled_periods = _subject_teacher_periods(date_obj, date_obj, school_year, campus_id)
         
         if not scheduled_periods:
             return success_response(
@@ -1566,50 +1566,6 @@ def get_subject_teachers_dashboard(date=None, campus_id=None):
                 message="Không có tiết dạy nào trong ngày này"
             )
         
-        # Lấy tên giáo viên
-        teacher_ids = list(set(p['teacher_id'] for p in scheduled_periods if p.get('teacher_id')))
-        teacher_names = {}
-        if teacher_ids:
-            teacher_data = frappe.db.sql("""
-                SELECT t.name, u.full_name
-                FROM `tabSIS Teacher` t
-                INNER JOIN `tabUser` u ON t.user_id = u.name
-                WHERE t.name IN %(teacher_ids)s
-            """, {"teacher_ids": teacher_ids}, as_dict=True)
-            teacher_names = {t['name']: t['full_name'] for t in teacher_data}
-        
-        # Lấy tất cả class logs trong ngày cho các lớp liên quan
-        class_ids = list(set(p['class_id'] for p in scheduled_periods))
-        
-        entered_logs = {}
-        if class_ids:
-            logs_data = frappe.db.sql("""
-                SELECT 
-                    cls.class_id,
-                    cls.period,
-                    cls.recorded_by,
-                    cls.general_comment,
-                    cls.modified,
-                    cls.creation,
-                    COUNT(clst.name) as student_log_count
-                FROM `tabSIS Class Log Subject` cls
-                LEFT JOIN `tabSIS Class Log Student` clst ON clst.subject_id = cls.name
-                WHERE cls.class_id IN %(class_ids)s
-                    AND cls.log_date = %(date)s
-                    AND LOWER(cls.period) LIKE '%%tiết%%'
-                GROUP BY cls.name, cls.class_id, cls.period
-            """, {
-                "class_ids": class_ids,
-                "date": date_obj
-            }, as_dict=True)
-            
-            for log in logs_data:
-                period_num = _extract_period_number(log['period'])
-                key = (log['class_id'], period_num)
-                has_content = log.get('general_comment') or log.get('student_log_count', 0) > 0
-                if has_content:
-                    entered_logs[key] = log
-        
         # Group theo teacher
         teacher_data_map = {}
         for p in scheduled_periods:
@@ -1620,25 +1576,14 @@ def get_subject_teachers_dashboard(date=None, campus_id=None):
             if teacher_id not in teacher_data_map:
                 teacher_data_map[teacher_id] = {
                     "teacher_id": teacher_id,
-                    "teacher_name": teacher_names.get(teacher_id, "Không xác định"),
+                    "teacher_name": p.get('teacher_name') or "Không xác định",
                     "total_periods": 0,
                     "entered_periods": 0,
                     "education_stage_ids": set(),
                     "classes": []
                 }
             
-            period_num = _extract_period_number(p['period_name'])
-            key = (p['class_id'], period_num)
-            log = entered_logs.get(key)
-            
-            if log:
-                has_content = log.get('general_comment') or log.get('student_log_count', 0) > 0
-                if has_content:
-                    status = "updated" if log.get('modified') != log.get('creation') else "entered"
-                else:
-                    status = "not_entered"
-            else:
-                status = "not_entered"
+            status = p['status']
             
             teacher_data_map[teacher_id]["total_periods"] += 1
             if status in ("entered", "updated"):
@@ -1708,7 +1653,7 @@ def get_subject_teachers_dashboard(date=None, campus_id=None):
 @frappe.whitelist(allow_guest=False)
 def export_subject_teacher_report(start_date=None, end_date=None, campus_id=None):
     """
-    Xuất báo cáo GV bộ môn theo khoảng ngày (batch query tối ưu).
+    Xuất báo cáo GV bộ môn theo khoảng ngày (đọc rollup sổ đầu bài).
     Trả về danh sách flat cho FE build Excel: mỗi item = 1 tiết/GV/ngày.
     """
     try:
@@ -1737,128 +1682,22 @@ def export_subject_teacher_report(start_date=None, end_date=None, campus_id=None
             school_year_filters["campus_id"] = campus_id
         school_year = frappe.db.get_value("SIS School Year", school_year_filters, "name")
 
-        # 1) Batch query: tất cả tiết dạy trong khoảng ngày (chỉ Regular, bỏ tiểu học)
-        #    Bao gồm valid_from/valid_to để lọc chính xác theo từng ngày trong Python
-        scheduled = frappe.db.sql("""
-            SELECT
-                tr.day_of_week,
-                COALESCE(trt.teacher_id, tr.teacher_1_id) AS teacher_id,
-                ti.class_id,
-                c.title AS class_title,
-                eg.education_stage_id,
-                tc.period_name,
-                tr.valid_from,
-                tr.valid_to,
-                MAX(COALESCE(ts.title_vn, sub.title)) AS subject_name
-            FROM `tabSIS Timetable Instance Row` tr
-            INNER JOIN `tabSIS Timetable Instance` ti ON tr.parent = ti.name
-            INNER JOIN `tabSIS Timetable Column` tc ON tr.timetable_column_id = tc.name
-            INNER JOIN `tabSIS Class` c ON ti.class_id = c.name
-            LEFT JOIN `tabSIS Education Grade` eg ON c.education_grade = eg.name
-            LEFT JOIN `tabSIS Subject` sub ON tr.subject_id = sub.name
-            LEFT JOIN `tabSIS Timetable Subject` ts ON sub.timetable_subject_id = ts.name
-            LEFT JOIN `tabSIS Timetable Instance Row Teacher` trt ON trt.parent = tr.name
-                AND trt.idx = (SELECT MIN(idx) FROM `tabSIS Timetable Instance Row Teacher` WHERE parent = tr.name)
-            WHERE ti.start_date <= %(end_date)s
-                AND (ti.end_date >= %(start_date)s OR ti.end_date IS NULL)
-                AND LOWER(tc.period_name) LIKE '%%tiết%%'
-                AND c.class_type = 'Regular'
-                AND c.school_year_id = %(school_year)s
-                AND (eg.education_stage_id IS NULL OR eg.education_stage_id != 'EDU-STAGE-00001')
-                AND NOT (c.title REGEXP '^Lớp [1-5][^0-9]' OR c.title REGEXP '^Lớp [1-5]$')
-                {campus_filter}
-            GROUP BY tr.day_of_week, COALESCE(trt.teacher_id, tr.teacher_1_id),
-                     ti.class_id, tc.period_name, c.title, eg.education_stage_id,
-                     tr.valid_from, tr.valid_to
-        """.format(
-            campus_filter="AND c.campus_id = %(campus_id)s" if campus_id else ""
-        ), {
-            "start_date": start_obj, "end_date": end_obj,
-            "school_year": school_year, "campus_id": campus_id
-        }, as_dict=True)
-
+        # Tiết + trạng thái cả khoảng ngày đọc từ rollup sổ đầu bài (đã sắp theo ngày)
+        scheduled = _subject_teacher_periods(start_obj, end_obj, school_year, campus_id)
         if not scheduled:
             return success_response(data={"rows": []}, message="Không có tiết dạy")
 
-        # Tên GV batch
-        teacher_ids = list(set(s['teacher_id'] for s in scheduled if s.get('teacher_id')))
-        teacher_names = {}
-        if teacher_ids:
-            for td in frappe.db.sql("""
-                SELECT t.name, u.full_name FROM `tabSIS Teacher` t
-                INNER JOIN `tabUser` u ON t.user_id = u.name
-                WHERE t.name IN %(ids)s
-            """, {"ids": teacher_ids}, as_dict=True):
-                teacher_names[td['name']] = td['full_name']
-
-        # 2) Batch class logs cho khoảng ngày
-        class_ids = list(set(s['class_id'] for s in scheduled))
-        logs_map = {}
-        if class_ids:
-            logs = frappe.db.sql("""
-                SELECT cls.class_id, cls.log_date, cls.period,
-                       cls.general_comment, cls.modified, cls.creation,
-                       COUNT(clst.name) AS student_log_count
-                FROM `tabSIS Class Log Subject` cls
-                LEFT JOIN `tabSIS Class Log Student` clst ON clst.subject_id = cls.name
-                WHERE cls.class_id IN %(cids)s
-                    AND cls.log_date BETWEEN %(s)s AND %(e)s
-                    AND LOWER(cls.period) LIKE '%%tiết%%'
-                GROUP BY cls.name, cls.class_id, cls.log_date, cls.period
-            """, {"cids": class_ids, "s": start_obj, "e": end_obj}, as_dict=True)
-            for lg in logs:
-                has_content = lg.get('general_comment') or lg.get('student_log_count', 0) > 0
-                if has_content:
-                    pnum = _extract_period_number(lg['period'])
-                    key = (str(lg['log_date']), lg['class_id'], pnum)
-                    logs_map[key] = lg
-
-        # 3) Sinh kết quả: duyệt từng ngày trong khoảng
-        day_map = {0: 'mon', 1: 'tue', 2: 'wed', 3: 'thu', 4: 'fri', 5: 'sat', 6: 'sun'}
-
-        # Nhóm scheduled theo day_of_week
-        sched_by_dow = {}
-        for s in scheduled:
-            dow = s['day_of_week']
-            sched_by_dow.setdefault(dow, []).append(s)
-
         rows = []
-        current = start_obj
-        while current <= end_obj:
-            date_str = str(current)
-            dow = day_map.get(current.weekday(), 'mon')
-            day_periods = sched_by_dow.get(dow, [])
-
-            for p in day_periods:
-                tid = p.get('teacher_id')
-                if not tid:
-                    continue
-                # Kiểm tra valid_from / valid_to cho từng ngày cụ thể
-                vf = p.get('valid_from')
-                vt = p.get('valid_to')
-                if vf and frappe.utils.getdate(vf) > current:
-                    continue
-                if vt and frappe.utils.getdate(vt) < current:
-                    continue
-
-                pnum = _extract_period_number(p['period_name'])
-                lg = logs_map.get((date_str, p['class_id'], pnum))
-                if lg:
-                    status = "updated" if lg.get('modified') != lg.get('creation') else "entered"
-                else:
-                    status = "not_entered"
-
-                rows.append({
-                    "date": date_str,
-                    "teacher_id": tid,
-                    "teacher_name": teacher_names.get(tid, ""),
-                    "class_title": p['class_title'],
-                    "period": p['period_name'],
-                    "subject_name": p.get('subject_name') or "",
-                    "status": status,
-                })
-
-            current += timedelta(days=1)
+        for p in scheduled:
+            rows.append({
+                "date": str(p['date']),
+                "teacher_id": p['teacher_id'],
+                "teacher_name": p.get('teacher_name') or "",
+                "class_title": p['class_title'],
+                "period": p['period_name'],
+                "subject_name": p.get('subject_name') or "",
+                "status": p['status'],
+            })
 
         return success_response(data={"rows": rows}, message="OK")
 
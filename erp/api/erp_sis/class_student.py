@@ -523,6 +523,9 @@ def assign_student(class_id=None, student_id=None, school_year_id=None, class_ty
                         "class_id": class_id,
                         "campus_id": campus_id,
                     }, update_modified=True)
+                    # set_value không qua doc hook: tự xoá roster người nhận thông báo
+                    from erp.utils.notification_recipients import invalidate_school_year
+                    invalidate_school_year(school_year_id)
                     
                     # 🆕 SYNC STUDENT SUBJECT: Update all Student Subject records to new class
                     sync_result = sync_student_subjects_for_class_change(
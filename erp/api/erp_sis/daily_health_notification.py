@@ -498,9 +498,75 @@ def notify_examination_created(visit_name: str, disease_classification: str = ""
 
 
 # =====================================================================
-# Scheduled job: kiểm tra visit quá HEALTH_STALE_MINUTES phút chưa chuyển trạng thái
+# Escalation: visit quá HEALTH_STALE_MINUTES phút chưa chuyển trạng thái
 # =====================================================================
 
+_STALE_VISIT_SQL = """
+    SELECT name, student_id, student_name, class_id, class_name,
+           reason, creation, reported_by
+    FROM `tabSIS Daily Health Visit`
+    WHERE status = 'left_class'
+      AND visit_date = %(today)s
+      AND creation <= %(threshold)s
+"""
+
+
+def _escalate_visit(visit, redis) -> bool:
+    """Gửi escalation cho một visit quá hạn. True nếu đã gửi."""
+    debounce_key = f"health_escalation:{visit.name}"
+    if redis.get_value(debounce_key):
+        frappe.logger().info(f"[health_notification] Skip visit {visit.name} - đã gửi escalation trước đó")
+        return False
+
+    student_name = visit.student_name or visit.student_id
+    r_class_id, class_name = _regular_class_id_and_title(
+        visit.student_id, visit.class_id, visit.class_name
+    )
+    label_hs = _label_hoc_sinh(student_name)
+
+    # Gửi cho Mobile Medical + Mobile Supervisory + Homeroom + Vice-homeroom + Reporter
+    extra_users = []
+    if visit.reported_by:
+        extra_users.append(visit.reported_by)
+
+    recipients = get_health_notification_recipients(
+        class_id=r_class_id,
+        include_medical=True,
+        include_homeroom=True,
+        include_supervisory=True,
+        extra_users=extra_users,
+    )
+    frappe.logger().info(f"[health_notification] Escalation recipients cho visit {visit.name}: {recipients}")
+
+    if not recipients:
+        frappe.logger().warning(f"[health_notification] Không tìm thấy người nhận nào cho escalation visit {visit.name}")
+        return False
+
+    title = STANDARD_HEALTH_NOTIFICATION_TITLE
+    body = f"{label_hs} ({class_name}) đã rời lớp hơn {HEALTH_STALE_MINUTES} phút nhưng chưa đến phòng Y tế"
+
+    data = {
+        "type": "health_visit_escalation",
+        "visit_id": visit.name,
+        "student_id": visit.student_id,
+        "student_name": student_name,
+        "class_id": r_class_id,
+        "class_name": class_name,
+        "status": "left_class",
+    }
+
+    _send_to_recipients(recipients, title, body, data)
+
+    # Đánh dấu đã gửi escalation, TTL 4 giờ (tránh gửi lặp trong ngày)
+    redis.set_value(debounce_key, "1", expires_in_sec=14400)
+
+    frappe.logger().info(
+        f"[health_notification] Đã gửi escalation cho visit {visit.name} - "
+        f"{student_name} (left_class > {HEALTH_STALE_MINUTES} phút)"
+    )
+    return True
+
+
 @frappe.whitelist(allow_guest=False)
 def check_stale_health_visits():
     """
@@ -510,9 +576,10 @@ def check_stale_health_visits():
     Dùng Redis debounce để tránh gửi lặp cho cùng một visit.
 
     Được gọi bởi:
-    - Scheduled job (hooks.py) mỗi 2 phút (production)
     - Piggyback khi load trang DailyHealth (development & production)
     - Có thể gọi thủ công qua API để test
+    Lịch thường ngày: mỗi visit có hạn riêng trong erp/common/deadlines.py
+    (escalate_stale_visit), không còn cron quét 2 phút.
     """
     try:
         from datetime import timedelta
@@ -521,14 +588,7 @@ def check_stale_health_visits():
 
         threshold = now_datetime() - timedelta(minutes=HEALTH_STALE_MINUTES)
 
-        stale_visits = frappe.db.sql("""
-            SELECT name, student_id, student_name, class_id, class_name,
-                   reason, creation, reported_by
-            FROM `tabSIS Daily Health Visit`
-            WHERE status = 'left_class'
-              AND visit_date = %(today)s
-              AND creation <= %(threshold)s
-        """, {"today": today(), "threshold": threshold}, as_dict=True)
+        stale_visits = frappe.db.sql(_STALE_VISIT_SQL, {"today": today(), "threshold": threshold}, as_dict=True)
 
         frappe.logger().info(f"[health_notification] Tìm thấy {len(stale_visits) if stale_visits else 0} visit quá {HEALTH_STALE_MINUTES} phút (threshold={threshold})")
 
@@ -539,58 +599,8 @@ def check_stale_health_visits():
         sent_count = 0
 
         for visit in stale_visits:
-            debounce_key = f"health_escalation:{visit.name}"
-            if redis.get_value(debounce_key):
-                frappe.logger().info(f"[health_notification] Skip visit {visit.name} - đã gửi escalation trước đó")
-                continue
-
-            student_name = visit.student_name or visit.student_id
-            r_class_id, class_name = _regular_class_id_and_title(
-                visit.student_id, visit.class_id, visit.class_name
-            )
-            label_hs = _label_hoc_sinh(student_name)
-
-            # Gửi cho Mobile Medical + Mobile Supervisory + Homeroom + Vice-homeroom + Reporter
-            extra_users = []
-            if visit.reported_by:
-                extra_users.append(visit.reported_by)
-
-            recipients = get_health_notification_recipients(
-                class_id=r_class_id,
-                include_medical=True,
-                include_homeroom=True,
-                include_supervisory=True,
-                extra_users=extra_users,
-            )
-            frappe.logger().info(f"[health_notification] Escalation recipients cho visit {visit.name}: {recipients}")
-
-            if not recipients:
-                frappe.logger().warning(f"[health_notification] Không tìm thấy người nhận nào cho escalation visit {visit.name}")
-                continue
-
-            title = STANDARD_HEALTH_NOTIFICATION_TITLE
-            body = f"{label_hs} ({class_name}) đã rời lớp hơn {HEALTH_STALE_MINUTES} phút nhưng chưa đến phòng Y tế"
-
-            data = {
-                "type": "health_visit_escalation",
-                "visit_id": visit.name,
-                "student_id": visit.student_id,
-                "student_name": student_name,
-                "class_id": r_class_id,
-                "class_name": class_name,
-                "status": "left_class",
-            }
-
-            _send_to_recipients(recipients, title, body, data)
-
-            # Đánh dấu đã gửi escalation, TTL 4 giờ (tránh gửi lặp trong ngày)
-            redis.set_value(debounce_key, "1", expires_in_sec=14400)
-            sent_count += 1
-
-            frappe.logger().info(
-                f"[health_notification] Đã gửi escalation cho visit {visit.name} - "
-                f"{student_name} (left_class > {HEALTH_STALE_MINUTES} phút)"
-            )
+            if _escalate_visit(visit, redis):
+                sent_count += 1
 
         frappe.logger().info(f"[health_notification] === KẾT THÚC check_stale_health_visits - gửi {sent_count} escalation ===")
 
@@ -600,6 +610,50 @@ def check_stale_health_visits():
         frappe.logger().error(f"[health_notification] Traceback: {traceback.format_exc()}")
 
 
+def _stale_due(creation):
+    from datetime import timedelta
+
+    return get_datetime(creation) + timedelta(minutes=HEALTH_STALE_MINUTES)
+
+
+def schedule_stale_check(doc, method=None):
+    """Doc hook SIS Daily Health Visit (after_insert / on_update): hẹn kiểm visit sau HEALTH_STALE_MINUTES."""
+    from erp.common import deadlines
+
+    if doc.get("status") == "left_class":
+        deadlines.schedule(deadlines.HEALTH_VISIT_STALE, doc.name, _stale_due(doc.creation))
+    else:
+        deadlines.cancel(deadlines.HEALTH_VISIT_STALE, doc.name)
+
+
+def escalate_stale_visit(name):
+    """Handler deadlines: visit vẫn left_class quá hạn thì escalation (một lần)."""
+    from datetime import timedelta
+
+    rows = frappe.db.sql(
+        _STALE_VISIT_SQL + " AND name = %(name)s",
+        {
+            "today": today(),
+            "threshold": now_datetime() - timedelta(minutes=HEALTH_STALE_MINUTES),
+            "name": name,
+        },
+        as_dict=True,
+    )
+    if rows:
+        _escalate_visit(rows[0], frappe.cache())
+    return None
+
+
+def pending_stale_visits():
+    """Nguồn cho deadlines.rebuild: visit hôm nay còn left_class."""
+    rows = frappe.get_all(
+        "SIS Daily Health Visit",
+        filters={"status": "left_class", "visit_date": today()},
+        fields=["name", "creation"],
+    )
+    return [(r.name, _stale_due(r.creation)) for r in rows]
+
+
 def piggyback_check_stale_visits():
     """
     Kiểm tra stale visits khi load trang DailyHealth.
@@ -10,6 +10,7 @@ import json
 from collections import Counter, defaultdict
 
 import frappe
+from erp.api.erp_sis import discipline_counters
 from erp.utils.api_response import success_response, error_response, paginated_response
 from erp.utils.search import build_search_condition, order_rows_by_names, search_names
 from erp.sis.discipline_record_permissions import (
@@ -1608,50 +1609,12 @@ def get_student_violation_stats(
             first_day = today.replace(day=1)
             last_day = today
 
-        # Đếm số bản ghi: học sinh này mắc lỗi violation_id trong khoảng ngày
-        # - target_student: record ghi trực tiếp 1 học sinh
-        # - target_students (SIS Discipline Record Student Entry): record ghi nhiều học sinh
-        # - target_classes (SIS Discipline Record Class Entry): record ghi theo lớp -> học sinh nằm trong SIS Class Student
-        count_sql = """
-            SELECT COUNT(DISTINCT r.name) as cnt
-            FROM `tabSIS Discipline Record` r
-            LEFT JOIN `tabSIS Discipline Record Student Entry` se
-                ON se.parent = r.name AND se.parenttype = 'SIS Discipline Record'
-            LEFT JOIN `tabSIS Discipline Record Class Entry` ce
-                ON ce.parent = r.name AND ce.parenttype = 'SIS Discipline Record'
-            LEFT JOIN `tabSIS Class Student` cs
-                ON cs.class_id = ce.class_id AND cs.student_id = %(student_id)s
-            WHERE r.violation = %(violation_id)s
-                AND r.date >= %(first_day)s AND r.date <= %(last_day)s
-                AND (
-                    r.target_student = %(student_id)s
-                    OR se.student_id = %(student_id)s
-                    OR (ce.class_id IS NOT NULL AND cs.student_id IS NOT NULL)
-                )
-        """
-        result = frappe.db.sql(
-            count_sql,
-            {"violation_id": violation_id, "student_id": student_id, "first_day": first_day, "last_day": last_day},
-            as_dict=True,
-        )
-        count = result[0]["cnt"] if result else 0
-
-        student_rows, _ = _get_violation_point_tables_for_stats(violation_id, last_day)
-        tier = _match_tier_from_point_rows(student_rows, count)
-        points_total = _sum_student_stored_deduction_points(
-            student_id, violation_id, first_day, last_day
-        )
+        stats = _student_violation_stats_internal(student_id, violation_id, first_day, last_day)
 
         return success_response(
-            data={
-                "count": count,
-                "level": tier["level"],
-                "level_label": tier["level_label"],
-                "points": points_total,
-            },
+            data=stats,
             message="Lấy thống kê thành công",
         )
-
     except frappe.DoesNotExistError:
         return error_response(
             message="Không tìm thấy vi phạm",
@@ -1704,60 +1667,12 @@ def get_class_violation_stats(
             first_day = today.replace(day=1)
             last_day = today
 
-        # Đếm DISTINCT: target lớp HOẶC HS trên bản ghi thuộc lớp regular này
-        count_sql = """
-            SELECT COUNT(DISTINCT r.name) as cnt
-            FROM `tabSIS Discipline Record` r
-            WHERE r.violation = %(violation_id)s
-                AND r.date >= %(first_day)s AND r.date <= %(last_day)s
-                AND (
-                    EXISTS (
-                        SELECT 1 FROM `tabSIS Discipline Record Class Entry` ce
-                        WHERE ce.parent = r.name AND ce.parenttype = 'SIS Discipline Record'
-                            AND ce.class_id = %(class_id)s
-                    )
-                    OR EXISTS (
-                        SELECT 1 FROM `tabSIS Discipline Record Student Entry` se
-                        INNER JOIN `tabSIS Class Student` cs
-                            ON cs.student_id = se.student_id
-                            AND cs.class_id = %(class_id)s
-                            AND cs.class_type = 'regular'
-                        WHERE se.parent = r.name AND se.parenttype = 'SIS Discipline Record'
-                    )
-                    OR (
-                        IFNULL(r.target_student, '') != ''
-                        AND EXISTS (
-                            SELECT 1 FROM `tabSIS Class Student` cs
-                            WHERE cs.student_id = r.target_student
-                                AND cs.class_id = %(class_id)s
-                                AND cs.class_type = 'regular'
-                        )
-                    )
-                )
-        """
-        result = frappe.db.sql(
-            count_sql,
-            {"violation_id": violation_id, "class_id": class_id, "first_day": first_day, "last_day": last_day},
-            as_dict=True,
-        )
-        count = result[0]["cnt"] if result else 0
-
-        _, class_rows = _get_violation_point_tables_for_stats(violation_id, last_day)
-        tier = _match_tier_from_point_rows(class_rows, count)
-        points_total = _sum_class_stored_deduction_points(
-            class_id, violation_id, first_day, last_day
-        )
+        stats = _class_violation_stats_internal(class_id, violation_id, first_day, last_day)
 
         return success_response(
-            data={
-                "count": count,
-                "level": tier["level"],
-                "level_label": tier["level_label"],
-                "points": points_total,
-            },
+            data=stats,
             message="Lấy thống kê thành công",
         )
-
     except frappe.DoesNotExistError:
         return error_response(
             message="Không tìm thấy vi phạm",
@@ -1869,6 +1784,20 @@ def _sum_class_stored_deduction_points(class_id, violation_id, first_day, last_d
 
 def _student_violation_stats_internal(student_id, violation_id, first_day, last_day):
     """Logic thống kê HS–vi phạm (dùng chung get_student_violation_stats và batch)."""
+    student_rows, _ = _get_violation_point_tables_for_stats(violation_id, last_day)
+    counted = discipline_counters.range_counts(
+        discipline_counters.STUDENT, [(student_id, violation_id)], first_day, last_day
+    )
+    if counted:
+        hit = counted[(student_id, violation_id)]
+        tier = _match_tier_from_point_rows(student_rows, hit["count"])
+        return {
+            "count": hit["count"],
+            "level": tier["level"],
+            "level_label": tier["level_label"],
+            "points": hit["points"],
+        }
+
     count_sql = """
         SELECT COUNT(DISTINCT r.name) as cnt
         FROM `tabSIS Discipline Record` r
@@ -1897,7 +1826,6 @@ def _student_violation_stats_internal(student_id, violation_id, first_day, last_
         as_dict=True,
     )
     count = result[0]["cnt"] if result else 0
-    student_rows, _ = _get_violation_point_tables_for_stats(violation_id, last_day)
     tier = _match_tier_from_point_rows(student_rows, count)
     points_total = _sum_student_stored_deduction_points(
         student_id, violation_id, first_day, last_day
@@ -1912,6 +1840,20 @@ def _student_violation_stats_internal(student_id, violation_id, first_day, last_
 
 def _class_violation_stats_internal(class_id, violation_id, first_day, last_day):
     """Logic thống kê Lớp–vi phạm (dùng chung get_class_violation_stats và batch)."""
+    _, class_rows = _get_violation_point_tables_for_stats(violation_id, last_day)
+    counted = discipline_counters.range_counts(
+        discipline_counters.CLASS, [(class_id, violation_id)], first_day, last_day
+    )
+    if counted:
+        hit = counted[(class_id, violation_id)]
+        tier = _match_tier_from_point_rows(class_rows, hit["count"])
+        return {
+            "count": hit["count"],
+            "level": tier["level"],
+            "level_label": tier["level_label"],
+            "points": hit["points"],
+        }
+
     count_sql = """
         SELECT COUNT(DISTINCT r.name) as cnt
         FROM `tabSIS Discipline Record` r
@@ -1953,7 +1895,6 @@ def _class_violation_stats_internal(class_id, violation_id, first_day, last_day)
         as_dict=True,
     )
     count = result[0]["cnt"] if result else 0
-    _, class_rows = _get_violation_point_tables_for_stats(violation_id, last_day)
     tier = _match_tier_from_point_rows(class_rows, count)
     points_total = _sum_class_stored_deduction_points(
         class_id, violation_id, first_day, last_day
@@ -2139,14 +2080,21 @@ def get_bulk_violation_stats(pairs=None, date_from=None, date_to=None):
 
         stats = {}
 
-        # ---- Student: batch count + points + cache bảng điểm theo violation ----
+        # ---- Student: bộ đếm tháng trước, cặp nào không trả lời được thì batch count ----
         if student_pairs:
-            sids = {p[0] for p in student_pairs}
-            vids = {p[1] for p in student_pairs}
-            counts = _batch_student_violation_counts(sids, vids, first_day, last_day)
-            points_map = _batch_student_deduction_points(sids, vids, first_day, last_day)
+            counted = discipline_counters.range_counts(
+                discipline_counters.STUDENT, student_pairs, first_day, last_day
+            ) or {}
+            counts = {k: v["count"] for k, v in counted.items()}
+            points_map = {k: v["points"] for k, v in counted.items()}
+            rest = [p for p in student_pairs if p not in counted]
+            if rest:
+                sids = {p[0] for p in rest}
+                vids = {p[1] for p in rest}
+                counts.update(_batch_student_violation_counts(sids, vids, first_day, last_day))
+                points_map.update(_batch_student_deduction_points(sids, vids, first_day, last_day))
             point_tables = {}
-            for vid in vids:
+            for vid in {p[1] for p in student_pairs}:
                 student_rows, _ = _get_violation_point_tables_for_stats(vid, last_day)
                 point_tables[vid] = student_rows
 
@@ -2160,7 +2108,7 @@ def get_bulk_violation_stats(pairs=None, date_from=None, date_to=None):
                     "points": int(points_map.get((sid, vid), 0)),
                 }
 
-        # Class pairs thường ít hơn student — giữ helper cũ (đã có index discipline)
+        # Class pairs: _class_violation_stats_internal tự đọc bộ đếm trước
         for class_id, vid in class_pairs:
             stats[f"c|{class_id}|{vid}"] = _class_violation_stats_internal(
                 class_id, vid, first_day, last_day
@@ -0,0 +1,594 @@
+# Copyright (c) 2026, Wellspring International School and contributors
+"""
+Bộ đếm kỷ luật theo tháng: (học sinh | lớp, vi phạm, tháng) -> số bản ghi, lượt,
+lượt cấp 1, tổng điểm trừ đã lưu.
+
+Vì sao
+------
+Chọn tier (`_match_tier_from_point_rows`), ngữ cảnh tháng lúc ghi nhận và email
+17:00 đều đếm lại `SIS Discipline Record` theo khoảng ngày — mỗi lần là vài JOIN
+qua Student Entry / Class Entry / SIS Class Student. Bảng này giữ sẵn kết quả để
+các câu hỏi đó thành một lần đọc theo khoá.
+
+Ghi
+---
+Doc hook `on_record_change` (on_update / on_trash) cộng CHÊNH LỆCH đóng góp của
+bản ghi (mới − trước khi lưu) bằng `col = col + delta` trong CÙNG giao dịch với
+bản ghi: rollback thì bộ đếm cũng lùi, hai người ghi cùng lúc chỉ khoá dòng đếm,
+không ai đọc snapshot cũ rồi ghi đè.
+
+Đọc
+---
+- Chỉ tháng đã có dòng đánh dấu `entity_type = 'Month'` (do `rebuild_month` tạo)
+  mới được tin; tháng chưa dựng thì caller quay về query cũ.
+- Hỏi "đến ngày X" trong tháng chỉ dùng bộ đếm khi `last_record_date <= X` —
+  nghĩa là không có bản ghi nào sau X đã được cộng vào. Ghi lùi ngày thì
+  rơi về query cũ, không bao giờ trả số sai.
+
+Lệch
+----
+Đóng góp qua Class Entry dùng danh sách lớp (`SIS Class Student`) tại lúc ghi.
+Chuyển lớp giữa tháng làm phép tính trực tiếp đổi theo còn bộ đếm thì không —
+job đêm `rebuild_current_month` dựng lại tháng hiện tại, và
+`erp.scripts.rebuild_discipline_counters` dựng lại bất kỳ khoảng nào.
+"""
+
+from __future__ import annotations
+
+import calendar
+from datetime import date
+
+import frappe
+
+DOCTYPE = "SIS Discipline Monthly Counter"
+TABLE = f"tab{DOCTYPE}"
+STUDENT = "Student"
+CLASS = "Class"
+MONTH_MARKER = "Month"
+# Khoảng ngày dài hơn thì caller tự đếm — tránh IN quá dài
+MAX_MONTHS = 24
+INSERT_CHUNK = 500
+
+_METRICS = ("record_count", "instance_count", "level1_count", "deduction_points")
+
+
+def month_start(value) -> date:
+    return frappe.utils.getdate(value).replace(day=1)
+
+
+def _month_end(first: date) -> date:
+    return first.replace(day=calendar.monthrange(first.year, first.month)[1])
+
+
+def _months_between(first_day: date, last_day: date) -> list[date]:
+    months = []
+    cur = month_start(first_day)
+    while cur <= last_day:
+        months.append(cur)
+        cur = date.fromordinal(_month_end(cur).toordinal() + 1)
+    return months
+
+
+def _dp(value) -> int:
+    """Giống `CAST(IFNULL(x, '10') AS UNSIGNED)` của các query thống kê."""
+    if value is None:
+        return 10
+    try:
+        return int(str(value).strip() or 0)
+    except ValueError:
+        return 0
+
+
+# ---------------------------------------------------------------------------
+# Đóng góp của một bản ghi
+# ---------------------------------------------------------------------------
+
+
+def _contributions(doc) -> dict:
+    """
+    {(entity_type, entity_id, violation, month_start): [record, instance, level1, points]}
+    cho MỘT bản ghi — cùng luật với các query trong discipline.py:
+      - HS có mặt: target_student / Student Entry / thành viên lớp ở Class Entry
+      - Lớp có mặt: Class Entry / lớp regular của HS trên bản ghi
+      - Điểm Class Entry cộng cho HS không có Student Entry riêng trên bản ghi;
+        điểm Student Entry cộng cho lớp regular không có Class Entry riêng
+    """
+    if doc is None or not doc.get("date"):
+        return {}
+    vid = doc.get("violation") or ""
+    ms = month_start(doc.get("date"))
+    target_student = doc.get("target_student") or ""
+    se_rows = [r for r in (doc.get("target_students") or []) if r.get("student_id")]
+    ce_rows = [r for r in (doc.get("target_classes") or []) if r.get("class_id")]
+    se_students = {r.get("student_id") for r in se_rows}
+    ce_classes = {r.get("class_id") for r in ce_rows}
+
+    members = {}
+    if ce_classes:
+        for row in frappe.get_all(
+            "SIS Class Student",
+            filters={"class_id": ["in", list(ce_classes)]},
+            fields=["class_id", "student_id"],
+            ignore_permissions=True,
+        ):
+            if row.student_id:
+                members.setdefault(row.class_id, []).append(row.student_id)
+
+    students_for_class = set(se_students)
+    if target_student:
+        students_for_class.add(target_student)
+    regular = {}
+    if students_for_class:
+        for row in frappe.get_all(
+            "SIS Class Student",
+            filters={"student_id": ["in", list(students_for_class)], "class_type": "regular"},
+            fields=["student_id", "class_id"],
+            ignore_permissions=True,
+        ):
+            regular.setdefault(row.student_id, []).append(row.class_id)
+
+    out = {}
+
+    def add(entity_type, entity_id, idx, amount=1):
+        key = (entity_type, entity_id, vid, ms)
+        out.setdefault(key, [0, 0, 0, 0])[idx] += amount
+
+    # Học sinh
+    on_record = set(se_students)
+    if target_student:
+        on_record.add(target_student)
+    for ce in ce_rows:
+        on_record.update(members.get(ce.get("class_id"), ()))
+    for sid in on_record:
+        add(STUDENT, sid, 0)
+    for se in se_rows:
+        add(STUDENT, se.get("student_id"), 1)
+        if str(se.get("applied_level") or "") == "1":
+            add(STUDENT, se.get("student_id"), 2)
+        add(STUDENT, se.get("student_id"), 3, _dp(se.get("deduction_points")))
+    # Bản ghi cũ: chỉ target_student, không có dòng Student Entry nào
+    if not (doc.get("target_students") or []) and target_student:
+        add(STUDENT, target_student, 1)
+    for ce in ce_rows:
+        for sid in members.get(ce.get("class_id"), ()):
+            if sid not in se_students:
+                add(STUDENT, sid, 3, _dp(ce.get("deduction_points")))
+
+    # Lớp
+    classes_on_record = set(ce_classes)
+    for sid in students_for_class:
+        classes_on_record.update(regular.get(sid, ()))
+    for cid in classes_on_record:
+        add(CLASS, cid, 0)
+    for ce in ce_rows:
+        add(CLASS, ce.get("class_id"), 3, _dp(ce.get("deduction_points")))
+    for se in se_rows:
+        for cid in regular.get(se.get("student_id"), ()):
+            if cid not in ce_classes:
+                add(CLASS, cid, 3, _dp(se.get("deduction_points")))
+
+    return out
+
+
+def _apply_deltas(deltas: dict, last_dates: dict) -> None:
+    # Khoá có delta 0 vẫn ghi nếu nằm trong phần cộng — đổi ngày trong cùng tháng
+    # phải đẩy last_record_date dù số đếm không đổi
+    rows = [(key, values) for key, values in deltas.items() if any(values) or key in last_dates]
+    if not rows:
+        return
+    now = frappe.utils.now_datetime()
+    user = frappe.session.user
+    columns = (
+        "name", "entity_type", "entity_id", "violation", "month_start",
+        *_METRICS, "last_record_date", "creation", "modified", "owner", "modified_by", "docstatus",
+    )
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    values = []
+    for key, metrics in rows:
+        values.append(frappe.generate_hash(length=12))
+        values.extend(key)
+        values.extend(metrics)
+        values.extend([last_dates.get(key), now, now, user, user, 0])
+    frappe.db.sql(
+        f"""
+        INSERT INTO `{TABLE}` ({", ".join(f"`{c}`" for c in columns)})
+        VALUES {", ".join([placeholders] * len(rows))}
+        ON DUPLICATE KEY UPDATE
+            record_count = record_count + VALUES(record_count),
+            instance_count = instance_count + VALUES(instance_count),
+            level1_count = level1_count + VALUES(level1_count),
+            deduction_points = deduction_points + VALUES(deduction_points),
+            last_record_date = GREATEST(
+                COALESCE(last_record_date, VALUES(last_record_date)),
+                COALESCE(VALUES(last_record_date), last_record_date)
+            ),
+            modified = VALUES(modified)
+        """,
+        tuple(values),
+    )
+
+
+def on_record_change(doc, method=None):
+    """
+    Doc hook SIS Discipline Record (on_update / on_trash). Chạy trong giao dịch của
+    bản ghi — lỗi ở đây làm hỏng cả lần lưu, đúng ý: bộ đếm không được lệch âm thầm.
+    """
+    if not frappe.db.table_exists(DOCTYPE):
+        return
+    if method == "on_trash":
+        before, after = doc, None
+    else:
+        before, after = doc.get_doc_before_save(), doc
+
+    added = _contributions(after)
+    deltas = {key: list(metrics) for key, metrics in added.items()}
+    for key, metrics in _contributions(before).items():
+        cur = deltas.setdefault(key, [0, 0, 0, 0])
+        for i, v in enumerate(metrics):
+            cur[i] -= v
+
+    # Chỉ phần CỘNG mới đẩy last_record_date lên; phần trừ giữ nguyên (thận trọng:
+    # đọc "đến ngày X" rơi về query cũ thay vì trả số sai)
+    last_dates = {}
+    if added:
+        last_date = frappe.utils.getdate(after.get("date"))
+        last_dates = {key: last_date for key in added}
+    _apply_deltas(deltas, last_dates)
+
+
+# ---------------------------------------------------------------------------
+# Dựng lại theo tháng (set-based)
+# ---------------------------------------------------------------------------
+
+_RECORD_SCOPE = """
+    r.date >= %(first_day)s AND r.date <= %(last_day)s
+"""
+
+
+def _compute_month(first: date) -> dict:
+    """Tính trực tiếp mọi bộ đếm của một tháng — vài query GROUP BY, không vòng theo bản ghi."""
+    params = {"first_day": first, "last_day": _month_end(first)}
+    out = {}
+
+    def put(entity_type, rows, column):
+        for row in rows:
+            key = (entity_type, row.entity_id, row.violation or "", first)
+            cur = out.setdefault(key, {m: 0 for m in _METRICS} | {"last_record_date": None})
+            cur[column] = int(row.value or 0)
+            last = row.get("last_date")
+            if last and (cur["last_record_date"] is None or last > cur["last_record_date"]):
+                cur["last_record_date"] = frappe.utils.getdate(last)
+
+    # HS: số bản ghi DISTINCT (target_student / Student Entry / thành viên lớp ở Class Entry)
+    put(STUDENT, frappe.db.sql(f"""
+        SELECT t.sid AS entity_id, t.vid AS violation,
+               COUNT(DISTINCT t.name) AS value, MAX(t.date) AS last_date
+        FROM (
+            SELECT r.name, IFNULL(r.violation, '') AS vid, r.date, r.target_student AS sid
+            FROM `tabSIS Discipline Record` r
+            WHERE IFNULL(r.target_student, '') != '' AND {_RECORD_SCOPE}
+            UNION ALL
+            SELECT r.name, IFNULL(r.violation, '') AS vid, r.date, se.student_id AS sid
+            FROM `tabSIS Discipline Record` r
+            INNER JOIN `tabSIS Discipline Record Student Entry` se
+                ON se.parent = r.name AND se.parenttype = 'SIS Discipline Record'
+            WHERE IFNULL(se.student_id, '') != '' AND {_RECORD_SCOPE}
+            UNION ALL
+            SELECT r.name, IFNULL(r.violation, '') AS vid, r.date, cs.student_id AS sid
+            FROM `tabSIS Discipline Record` r
+            INNER JOIN `tabSIS Discipline Record Class Entry` ce
+                ON ce.parent = r.name AND ce.parenttype = 'SIS Discipline Record'
+            INNER JOIN `tabSIS Class Student` cs ON cs.class_id = ce.class_id
+            WHERE {_RECORD_SCOPE}
+        ) t
+        GROUP BY t.sid, t.vid
+    """, params, as_dict=True), "record_count")
+
+    # HS: lượt (mỗi Student Entry một lượt) + lượt cấp 1
+    se_rows = frappe.db.sql(f"""
+        SELECT se.student_id AS entity_id, IFNULL(r.violation, '') AS violation,
+               COUNT(*) AS value,
+               SUM(IFNULL(se.applied_level, '') = '1') AS level1
+        FROM `tabSIS Discipline Record` r
+        INNER JOIN `tabSIS Discipline Record Student Entry` se
+            ON se.parent = r.name AND se.parenttype = 'SIS Discipline Record'
+        WHERE IFNULL(se.student_id, '') != '' AND {_RECORD_SCOPE}
+        GROUP BY se.student_id, IFNULL(r.violation, '')
+    """, params, as_dict=True)
+    put(STUDENT, se_rows, "instance_count")
+    put(STUDENT, [frappe._dict(r, value=r.level1) for r in se_rows], "level1_count")
+    # Bản ghi cũ chỉ có target_student, không có Student Entry nào: vẫn là một lượt
+    for row in frappe.db.sql(f"""
+        SELECT r.target_student AS entity_id, IFNULL(r.violation, '') AS violation, COUNT(*) AS value
+        FROM `tabSIS Discipline Record` r
+        WHERE IFNULL(r.target_student, '') != '' AND {_RECORD_SCOPE}
+            AND NOT EXISTS (
+                SELECT 1 FROM `tabSIS Discipline Record Student Entry` se2 WHERE se2.parent = r.name
+            )
+        GROUP BY r.target_student, IFNULL(r.violation, '')
+    """, params, as_dict=True):
+        key = (STUDENT, row.entity_id, row.violation or "", first)
+        cur = out.setdefault(key, {m: 0 for m in _METRICS} | {"last_record_date": None})
+        cur["instance_count"] += int(row.value or 0)
+
+    # HS: điểm trừ đã lưu (Student Entry + Class Entry cho HS không có Student Entry riêng)
+    put(STUDENT, frappe.db.sql(f"""
+        SELECT t.sid AS entity_id, t.vid AS violation, SUM(t.dp) AS value
+        FROM (
+            SELECT se.student_id AS sid, IFNULL(r.violation, '') AS vid,
+                   CAST(IFNULL(se.deduction_points, '10') AS UNSIGNED) AS dp
+            FROM `tabSIS Discipline Record` r
+            INNER JOIN `tabSIS Discipline Record Student Entry` se
+                ON se.parent = r.name AND se.parenttype = 'SIS Discipline Record'
+            WHERE IFNULL(se.student_id, '') != '' AND {_RECORD_SCOPE}
+            UNION ALL
+            SELECT cs.student_id AS sid, IFNULL(r.violation, '') AS vid,
+                   CAST(IFNULL(ce.deduction_points, '10') AS UNSIGNED) AS dp
+            FROM `tabSIS Discipline Record` r
+            INNER JOIN `tabSIS Discipline Record Class Entry` ce
+                ON ce.parent = r.name AND ce.parenttype = 'SIS Discipline Record'
+            INNER JOIN `tabSIS Class Student` cs ON cs.class_id = ce.class_id
+            WHERE {_RECORD_SCOPE}
+                AND NOT EXISTS (
+                    SELECT 1 FROM `tabSIS Discipline Record Student Entry` se2
+                    WHERE se2.parent = r.name
+                        AND se2.parenttype = 'SIS Discipline Record'
+                        AND se2.student_id = cs.student_id
+                )
+        ) t
+        GROUP BY t.sid, t.vid
+    """, params, as_dict=True), "deduction_points")
+
+    # Lớp: số bản ghi DISTINCT (Class Entry / HS trên bản ghi thuộc lớp regular)
+    put(CLASS, frappe.db.sql(f"""
+        SELECT t.cid AS entity_id, t.vid AS violation,
+               COUNT(DISTINCT t.name) AS value, MAX(t.date) AS last_date
+        FROM (
+            SELECT r.name, IFNULL(r.violation, '') AS vid, r.date, ce.class_id AS cid
+            FROM `tabSIS Discipline Record` r
+            INNER JOIN `tabSIS Discipline Record Class Entry` ce
+                ON ce.parent = r.name AND ce.parenttype = 'SIS Discipline Record'
+            WHERE IFNULL(ce.class_id, '') != '' AND {_RECORD_SCOPE}
+            UNION ALL
+            SELECT r.name, IFNULL(r.violation, '') AS vid, r.date, cs.class_id AS cid
+            FROM `tabSIS Discipline Record` r
+            INNER JOIN `tabSIS Discipline Record Student Entry` se
+                ON se.parent = r.name AND se.parenttype = 'SIS Discipline Record'
+            INNER JOIN `tabSIS Class Student` cs
+                ON cs.student_id = se.student_id AND cs.class_type = 'regular'
+            WHERE {_RECORD_SCOPE}
+            UNION ALL
+            SELECT r.name, IFNULL(r.violation, '') AS vid, r.date, cs.class_id AS cid
+            FROM `tabSIS Discipline Record` r
+            INNER JOIN `tabSIS Class Student` cs
+                ON cs.student_id = r.target_student AND cs.class_type = 'regular'
+            WHERE IFNULL(r.target_student, '') != '' AND {_RECORD_SCOPE}
+        ) t
+        GROUP BY t.cid, t.vid
+    """, params, as_dict=True), "record_count")
+
+    # Lớp: điểm trừ (Class Entry + HS thuộc lớp khi bản ghi không có Class Entry của lớp đó)
+    put(CLASS, frappe.db.sql(f"""
+        SELECT t.cid AS entity_id, t.vid AS violation, SUM(t.dp) AS value
+        FROM (
+            SELECT ce.class_id AS cid, IFNULL(r.violation, '') AS vid,
+                   CAST(IFNULL(ce.deduction_points, '10') AS UNSIGNED) AS dp
+            FROM `tabSIS Discipline Record` r
+            INNER JOIN `tabSIS Discipline Record Class Entry` ce
+                ON ce.parent = r.name AND ce.parenttype = 'SIS Discipline Record'
+            WHERE IFNULL(ce.class_id, '') != '' AND {_RECORD_SCOPE}
+            UNION ALL
+            SELECT cs.class_id AS cid, IFNULL(r.violation, '') AS vid,
+                   CAST(IFNULL(se.deduction_points, '10') AS UNSIGNED) AS dp
+            FROM `tabSIS Discipline Record` r
+            INNER JOIN `tabSIS Discipline Record Student Entry` se
+                ON se.parent = r.name AND se.parenttype = 'SIS Discipline Record'
+            INNER JOIN `tabSIS Class Student` cs
+                ON cs.student_id = se.student_id AND cs.class_type = 'regular'
+            WHERE {_RECORD_SCOPE}
+                AND NOT EXISTS (
+                    SELECT 1 FROM `tabSIS Discipline Record Class Entry` ce2
+                    WHERE ce2.parent = r.name
+                        AND ce2.parenttype = 'SIS Discipline Record'
+                        AND ce2.class_id = cs.class_id
+                )
+        ) t
+        GROUP BY t.cid, t.vid
+    """, params, as_dict=True), "deduction_points")
+
+    return out
+
+
+def rebuild_month(value) -> int:
+    """Thay toàn bộ bộ đếm của tháng chứa `value` + đặt dòng đánh dấu. Không commit."""
+    first = month_start(value)
+    computed = _compute_month(first)
+
+    frappe.db.sql(f"DELETE FROM `{TABLE}` WHERE month_start = %s", (first,))
+    rows = [(key, metrics) for key, metrics in computed.items()]
+    rows.append(((MONTH_MARKER, "", "", first), {m: 0 for m in _METRICS} | {"last_record_date": None}))
+
+    now = frappe.utils.now_datetime()
+    user = frappe.session.user
+    columns = (
+        "name", "entity_type", "entity_id", "violation", "month_start",
+        *_METRICS, "last_record_date", "creation", "modified", "owner", "modified_by", "docstatus",
+    )
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    for i in range(0, len(rows), INSERT_CHUNK):
+        chunk = rows[i:i + INSERT_CHUNK]
+        values = []
+        for key, metrics in chunk:
+            values.append(frappe.generate_hash(length=12))
+            values.extend(key)
+            values.extend(metrics[m] for m in _METRICS)
+            values.extend([metrics["last_record_date"], now, now, user, user, 0])
+        frappe.db.sql(
+            f"""
+            INSERT INTO `{TABLE}` ({", ".join(f"`{c}`" for c in columns)})
+            VALUES {", ".join([placeholders] * len(chunk))}
+            """,
+            tuple(values),
+        )
+    return len(rows) - 1
+
+
+def rebuild(start_date=None, end_date=None) -> dict:
+    """
+    Dựng lại các tháng trong khoảng (mặc định: mọi tháng có bản ghi), commit từng tháng.
+    Trả {months, rows, seconds}.
+    """
+    if not start_date or not end_date:
+        bounds = frappe.db.sql(
+            "SELECT MIN(date), MAX(date) FROM `tabSIS Discipline Record`"
+        )
+        lo, hi = bounds[0] if bounds else (None, None)
+        start_date = start_date or lo
+        end_date = end_date or hi
+    if not start_date or not end_date:
+        return {"months": 0, "rows": 0, "seconds": 0}
+
+    started = frappe.utils.now_datetime()
+    months = _months_between(frappe.utils.getdate(start_date), frappe.utils.getdate(end_date))
+    written = 0
+    for first in months:
+        written += rebuild_month(first)
+        frappe.db.commit()
+    elapsed = (frappe.utils.now_datetime() - started).total_seconds()
+    summary = {"months": len(months), "rows": written, "seconds": round(elapsed, 1)}
+    frappe.logger().info(f"discipline_counters rebuild {start_date}..{end_date}: {summary}")
+    return summary
+
+
+def rebuild_current_month():
+    """Job đêm: dựng lại tháng hiện tại (bắt kịp chuyển lớp giữa tháng)."""
+    today = frappe.utils.getdate(frappe.utils.today())
+    rebuild_month(today)
+    frappe.db.commit()
+    # Đầu tháng: tháng trước vừa khép lại, dựng lại lần cuối
+    if today.day == 1:
+        rebuild_month(date.fromordinal(today.toordinal() - 1))
+        frappe.db.commit()
+
+
+# ---------------------------------------------------------------------------
+# Đọc
+# ---------------------------------------------------------------------------
+
+
+def _built_months(months) -> set:
+    return {
+        frappe.utils.getdate(r[0])
+        for r in frappe.db.sql(
+            f"""
+            SELECT month_start FROM `{TABLE}`
+            WHERE entity_type = %(marker)s AND entity_id = '' AND violation = ''
+                AND month_start IN %(months)s
+            """,
+            {"marker": MONTH_MARKER, "months": list(months)},
+        )
+    }
+
+
+def range_counts(entity_type, pairs, first_day, last_day) -> dict | None:
+    """
+    {(entity_id, violation): {"count", "points"}} cho khoảng [first_day, last_day] đọc từ
+    bộ đếm. Trả None khi khoảng không trả lời được bằng bộ đếm (không bắt đầu từ mùng 1,
+    quá MAX_MONTHS, tháng chưa dựng). Cặp vắng trong dict = có bản ghi sau last_day
+    trong tháng cuối — caller tự đếm cặp đó.
+    """
+    pairs = list(dict.fromkeys(pairs or ()))
+    if not pairs:
+        return {}
+    first_day = frappe.utils.getdate(first_day)
+    last_day = frappe.utils.getdate(last_day)
+    if first_day.day != 1 or last_day < first_day:
+        return None
+    months = _months_between(first_day, last_day)
+    if len(months) > MAX_MONTHS or not frappe.db.table_exists(DOCTYPE):
+        return None
+    if _built_months(months) != set(months):
+        return None
+
+    partial = months[-1] if last_day < _month_end(months[-1]) else None
+    entity_ids = list({p[0] for p in pairs})
+    violation_ids = list({p[1] or "" for p in pairs})
+    found = {}
+    stale = set()
+    for r in frappe.db.sql(
+        f"""
+        SELECT entity_id, violation, month_start, record_count, deduction_points, last_record_date
+        FROM `{TABLE}`
+        WHERE entity_type = %(etype)s AND entity_id IN %(ids)s
+            AND violation IN %(vids)s AND month_start IN %(months)s
+        """,
+        {"etype": entity_type, "ids": entity_ids, "vids": violation_ids, "months": months},
+        as_dict=True,
+    ):
+        key = (r.entity_id, r.violation)
+        if (
+            partial is not None
+            and frappe.utils.getdate(r.month_start) == partial
+            and r.last_record_date
+            and frappe.utils.getdate(r.last_record_date) > last_day
+        ):
+            stale.add(key)
+            continue
+        cur = found.setdefault(key, {"count": 0, "points": 0})
+        cur["count"] += int(r.record_count or 0)
+        cur["points"] += int(r.deduction_points or 0)
+
+    return {
+        (eid, vid): found.get((eid, vid or ""), {"count": 0, "points": 0})
+        for eid, vid in pairs
+        if (eid, vid or "") not in stale
+    }
+
+
+def month_to_date_count(entity_type, entity_id, violation_id, as_of) -> int | None:
+    """Số bản ghi DISTINCT từ mùng 1 đến `as_of` (tính cả), hoặc None nếu phải đếm trực tiếp."""
+    as_of = frappe.utils.getdate(as_of)
+    got = range_counts(entity_type, [(entity_id, violation_id)], month_start(as_of), as_of)
+    if not got:
+        return None
+    return got[(entity_id, violation_id)]["count"]
+
+
+def student_month_totals(student_as_of: dict) -> dict:
+    """
+    {(student_id, "YYYY-MM"): {"instances", "level1"}} — tổng qua mọi vi phạm, từ mùng 1
+    đến ngày as_of. Chỉ trả các khoá trả lời được; khoá vắng thì caller tự đếm.
+    """
+    if not student_as_of or not frappe.db.table_exists(DOCTYPE):
+        return {}
+    months = {month_start(as_of) for as_of in student_as_of.values()}
+    built = _built_months(months)
+    wanted = {k: v for k, v in student_as_of.items() if month_start(v) in built}
+    if not wanted:
+        return {}
+
+    agg = {}
+    for r in frappe.db.sql(
+        f"""
+        SELECT entity_id, month_start, SUM(instance_count) AS instances,
+               SUM(level1_count) AS level1, MAX(last_record_date) AS last_date
+        FROM `{TABLE}`
+        WHERE entity_type = %(etype)s AND entity_id IN %(ids)s AND month_start IN %(months)s
+        GROUP BY entity_id, month_start
+        """,
+        {"etype": STUDENT, "ids": list({sid for sid, _ in wanted}), "months": list(built)},
+        as_dict=True,
+    ):
+        agg[(r.entity_id, frappe.utils.getdate(r.month_start))] = r
+
+    out = {}
+    for (sid, month_key), as_of in wanted.items():
+        as_of = frappe.utils.getdate(as_of)
+        r = agg.get((sid, month_start(as_of)))
+        if r is None:
+            out[(sid, month_key)] = {"instances": 0, "level1": 0}
+            continue
+        if r.last_date and frappe.utils.getdate(r.last_date) > as_of:
+            continue
+        out[(sid, month_key)] = {"instances": int(r.instances or 0), "level1": int(r.level1 or 0)}
+    return out
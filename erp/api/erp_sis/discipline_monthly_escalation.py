@@ -10,6 +10,8 @@ from datetime import date, datetime
 import frappe
 from frappe.utils import get_datetime, get_system_timezone
 
+from erp.api.erp_sis import discipline_counters
+
 
 _DATE_ONLY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 
@@ -110,6 +112,13 @@ def count_violation_records_in_month(
     exclude_record_name: str | None = None,
 ) -> int:
     """Số bản ghi DISTINCT (cùng vi phạm) của HS trong tháng của record_date, tính đến ngày ghi nhận."""
+    if not exclude_record_name:
+        counted = discipline_counters.month_to_date_count(
+            discipline_counters.STUDENT, student_id, violation_id, _as_date(record_date)
+        )
+        if counted is not None:
+            return counted
+
     first, last = calendar_month_bounds(record_date)
     params = {
         "student_id": student_id,
@@ -148,6 +157,12 @@ def count_cross_level1_instances_in_month(
     Đếm lượt vi phạm trong tháng đã áp dụng cấp 1 (applied_level=1 trên Student Entry).
   Dữ liệu cũ không có applied_level: không tính (phase 1).
     """
+    if not exclude_record_name:
+        as_of = _as_date(record_date)
+        totals = discipline_counters.student_month_totals({(student_id, as_of.isoformat()[:7]): as_of})
+        if totals:
+            return next(iter(totals.values()))["level1"]
+
     first, _last = calendar_month_bounds(record_date)
     params = {
         "student_id": student_id,
@@ -183,6 +198,12 @@ def count_student_violation_instances_in_month(
     exclude_record_name: str | None = None,
 ) -> int:
     """Tổng lượt HS trên mọi bản ghi trong tháng (mỗi Student Entry = 1 lượt)."""
+    if not exclude_record_name:
+        as_of = _as_date(record_date)
+        totals = discipline_counters.student_month_totals({(student_id, as_of.isoformat()[:7]): as_of})
+        if totals:
+            return next(iter(totals.values()))["instances"]
+
     first, _last = calendar_month_bounds(record_date)
     params = {
         "student_id": student_id,
@@ -325,6 +346,13 @@ def count_class_violation_records_in_month(
     exclude_record_name: str | None = None,
 ) -> int:
     """Số bản ghi DISTINCT (cùng vi phạm) của lớp trong tháng, tính đến ngày ghi nhận."""
+    if not exclude_record_name:
+        counted = discipline_counters.month_to_date_count(
+            discipline_counters.CLASS, class_id, violation_id, _as_date(record_date)
+        )
+        if counted is not None:
+            return counted
+
     first, _last = calendar_month_bounds(record_date)
     params = {
         "class_id": class_id,
@@ -392,12 +420,23 @@ def _batch_monthly_stats_for_students(
     student_as_of: dict[tuple[str, str], date],
 ) -> dict[tuple[str, str], dict]:
     """
-    Gom COUNT theo (student_id, YYYY-MM) — 2 query thay vì 2N.
+    Gom COUNT theo (student_id, YYYY-MM): đọc bộ đếm tháng trước, khoá nào không trả
+    lời được thì 2 query gom như cũ.
     student_as_of: (sid, month_key) -> ngày as_of (dùng max ngày trong batch).
     """
     if not student_as_of:
         return {}
 
+    out: dict[tuple[str, str], dict] = {}
+    for key, totals in discipline_counters.student_month_totals(student_as_of).items():
+        out[key] = {
+            "violations_total_this_month": totals["instances"],
+            "violations_as_level1_this_month": totals["level1"],
+        }
+    student_as_of = {k: v for k, v in student_as_of.items() if k not in out}
+    if not student_as_of:
+        return out
+
     sids = list({sid for sid, _mk in student_as_of})
     window_dates: list[date] = []
     for (_sid, _mk), as_of in student_as_of.items():
@@ -441,7 +480,6 @@ def _batch_monthly_stats_for_students(
     for e in legacy:
         legacy_by_sid.setdefault(e["student_id"], []).append(e)
 
-    out: dict[tuple[str, str], dict] = {}
     for (sid, mk), as_of in student_as_of.items():
         first, _last = calendar_month_bounds(as_of)
         total = 0
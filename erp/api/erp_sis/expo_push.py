@@ -0,0 +1,283 @@
+"""
+Gửi Expo Push theo lô song song + poll receipt nền.
+
+Vì sao
+------
+`_post_expo_batch` trước đây POST lần lượt từng lô 100 message bằng `requests.post`
+(mỗi lô một kết nối TLS mới), retry 429 cố định 1 giây: broadcast 3.000 thiết bị =
+30 POST nối đuôi ~0,4–1 s mỗi cái, còn Expo báo 429 thì lô đó gần như chắc chắn fail.
+
+Cách chạy
+---------
+- Một `requests.Session` keep-alive dùng chung trong process, pool kết nối bằng
+  `EXPO_CONCURRENCY` (Expo cho tối đa 6 request đồng thời mỗi project).
+- `post_chunks` POST các lô trên ThreadPoolExecutor cỡ `EXPO_CONCURRENCY`. Luồng phụ
+  KHÔNG đụng frappe (frappe.local theo luồng): URL / header tính ở luồng chính.
+- 429 / 5xx / lỗi mạng: thử lại lùi theo cấp số nhân (`backoff_delay`), tôn trọng
+  Retry-After, tối đa `EXPO_MAX_ATTEMPTS` lần.
+- `summarize` gom kết quả theo thứ tự message (cùng dạng trả về như trước); token
+  DeviceNotRegistered được deactivate một UPDATE duy nhất ở cuối.
+- Ticket "ok" chưa có nghĩa là đã tới máy: (ticket_id, token) được đẩy vào sorted set
+  Redis `RECEIPTS_KEY` với điểm = lúc nên hỏi receipt (Expo khuyên đợi ~15 phút).
+  `poll_receipts` (cron 5 phút) hỏi getReceipts theo lô 1000 id và deactivate token
+  DeviceNotRegistered phát hiện muộn. Chỉ id Expo đã trả receipt mới rời hàng chờ; id
+  chưa có receipt được hẹn hỏi lại sau `RECEIPT_RETRY_SEC`, tới khi quá
+  `RECEIPT_MAX_AGE_SEC` kể từ lúc gửi (sorted set `RECEIPTS_QUEUED_KEY`, điểm = lúc gửi).
+
+Đo thông lượng với Expo giả (erp/scripts/fake_expo_server.py): đặt site_config
+`EXPO_PUSH_URL` = "http://127.0.0.1:8765/--/api/v2/push/send".
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+from frappe.utils import now_datetime
+
+DEFAULT_PUSH_URL = "https://exp.host/--/api/v2/push/send"
+
+EXPO_CONCURRENCY = 6
+EXPO_MAX_ATTEMPTS = 4
+EXPO_POST_TIMEOUT = 5  # giây
+BACKOFF_BASE_SEC = 0.5
+BACKOFF_MAX_SEC = 8
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+RECEIPTS_KEY = "expo_pending_receipts"
+RECEIPTS_QUEUED_KEY = "expo_pending_receipts_queued"  # cùng member, điểm = lúc gửi
+RECEIPT_DELAY_SEC = 15 * 60
+RECEIPT_RETRY_SEC = 15 * 60  # id chưa có receipt: hỏi lại sau ngần này
+RECEIPT_BATCH = 1000  # giới hạn id mỗi lần gọi getReceipts
+RECEIPT_MAX_AGE_SEC = 24 * 3600  # Expo chỉ giữ receipt ~24h
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def push_url():
+    return (frappe.conf.get("EXPO_PUSH_URL") or DEFAULT_PUSH_URL).strip()
+
+
+def receipts_url(url=None):
+    """getReceipts cùng host với push/send (để Expo giả phục vụ được cả hai)."""
+    url = url or push_url()
+    return url.rsplit("/", 1)[0] + "/getReceipts"
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=EXPO_CONCURRENCY)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _session = s
+    return _session
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Giây nghỉ trước lần thử `attempt + 1` (attempt đếm từ 0).
+
+    Retry-After (giây) của server được ưu tiên; không có thì 0.5, 1, 2, 4… chặn ở
+    BACKOFF_MAX_SEC, cộng jitter tới 10% để các luồng không dội lại cùng lúc.
+    """
+    try:
+        if retry_after is not None:
+            return min(max(float(retry_after), 0.0), BACKOFF_MAX_SEC)
+    except (TypeError, ValueError):
+        pass
+    delay = min(BACKOFF_BASE_SEC * (2 ** attempt), BACKOFF_MAX_SEC)
+    return delay + random.uniform(0, delay * 0.1)
+
+
+def _post_one(session, url, headers, payload):
+    """POST một lô có retry. Trả (status_code | None, json | None, lỗi | None)."""
+    import requests
+
+    for attempt in range(EXPO_MAX_ATTEMPTS):
+        last = attempt == EXPO_MAX_ATTEMPTS - 1
+        try:
+            response = session.post(url, json=payload, headers=headers, timeout=EXPO_POST_TIMEOUT)
+        except requests.RequestException as e:
+            if last:
+                return None, None, str(e)
+            time.sleep(backoff_delay(attempt))
+            continue
+        if response.status_code in RETRY_STATUS and not last:
+            time.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+            continue
+        if response.status_code != 200:
+            return response.status_code, None, None
+        try:
+            return 200, response.json(), None
+        except ValueError as e:
+            return 200, None, str(e)
+    return None, None, "retries exhausted"
+
+
+def post_chunks(chunks, url, headers):
+    """POST song song các lô; trả outcome theo đúng thứ tự `chunks`."""
+    if not chunks:
+        return []
+    session = _get_session()
+    if len(chunks) == 1:
+        return [_post_one(session, url, headers, chunks[0])]
+    with ThreadPoolExecutor(max_workers=min(EXPO_CONCURRENCY, len(chunks))) as pool:
+        return list(pool.map(lambda chunk: _post_one(session, url, headers, chunk), chunks))
+
+
+def summarize(chunks, outcomes):
+    """Gom outcome các lô thành kết quả từng message.
+
+    Trả dict: results, success_count, failed_count, unregistered (token), tickets
+    [(ticket_id, token)] của message "ok" để poll receipt.
+    """
+    out = frappe._dict(results=[], success_count=0, failed_count=0, unregistered=[], tickets=[])
+    for chunk, (status, body, error) in zip(chunks, outcomes):
+        if error is not None and body is None:
+            for msg in chunk:
+                out.failed_count += 1
+                entry = {"token": msg.get("to"), "status": "error", "error": error}
+                if status:
+                    entry["http_code"] = status
+                out.results.append(entry)
+            continue
+        if status != 200:
+            for msg in chunk:
+                out.failed_count += 1
+                out.results.append({"token": msg.get("to"), "status": "failed", "http_code": status})
+            continue
+
+        # Expo trả {"data": [...]} — mỗi phần tử là ticket của một message
+        tickets = (body or {}).get("data", [])
+        if not isinstance(tickets, list):
+            tickets = [tickets]
+        for idx, msg in enumerate(chunk):
+            token = msg.get("to")
+            if idx >= len(tickets):
+                out.failed_count += 1
+                out.results.append({"token": token, "status": "failed", "error": "No ticket returned"})
+                continue
+            ticket = tickets[idx]
+            if isinstance(ticket, dict) and ticket.get("status") == "ok":
+                out.success_count += 1
+                out.results.append({"token": token, "status": "success"})
+                if ticket.get("id") and token:
+                    out.tickets.append((ticket["id"], token))
+                continue
+            out.failed_count += 1
+            out.results.append({
+                "token": token,
+                "status": "failed",
+                "error": ticket if isinstance(ticket, dict) else str(ticket),
+            })
+            if is_device_not_registered(ticket) and token:
+                out.unregistered.append(token)
+    return out
+
+
+def is_device_not_registered(ticket_or_receipt):
+    if not isinstance(ticket_or_receipt, dict):
+        return False
+    return (ticket_or_receipt.get("details") or {}).get("error") == "DeviceNotRegistered"
+
+
+# ---------------------------------------------------------------------------
+# Receipt
+# ---------------------------------------------------------------------------
+
+
+def receipt_member(ticket_id, token):
+    return f"{ticket_id}|{token}"
+
+
+def parse_receipt_member(raw):
+    raw = raw.decode() if isinstance(raw, bytes) else raw
+    ticket_id, _, token = raw.partition("|")
+    return ticket_id, token
+
+
+def queue_receipts(tickets):
+    """Hẹn hỏi receipt cho [(ticket_id, token)] sau RECEIPT_DELAY_SEC — một pipeline."""
+    if not tickets:
+        return
+    try:
+        cache = frappe.cache()
+        now_ts = now_datetime().timestamp()
+        members = [receipt_member(t, tok) for t, tok in tickets]
+        pipe = cache.pipeline()
+        pipe.zadd(cache.make_key(RECEIPTS_KEY), dict.fromkeys(members, now_ts + RECEIPT_DELAY_SEC))
+        pipe.zadd(cache.make_key(RECEIPTS_QUEUED_KEY), dict.fromkeys(members, now_ts))
+        pipe.execute()
+    except Exception:
+        # Mất receipt chỉ làm chậm việc phát hiện token hỏng, không ảnh hưởng lần gửi
+        frappe.logger().warning("📱 [Expo] Không ghi được ticket chờ receipt")
+
+
+def unregistered_from_receipts(members, receipts):
+    """members [(ticket_id, token)] + {"data": {ticket_id: receipt}} -> token DeviceNotRegistered."""
+    data = (receipts or {}).get("data") or {}
+    return sorted({token for ticket_id, token in members if token and is_device_not_registered(data.get(ticket_id))})
+
+
+def split_answered(raw, receipts):
+    """raw member + {"data": {ticket_id: receipt}} -> (member đã có receipt, member chưa có)."""
+    data = (receipts or {}).get("data") or {}
+    answered, pending = [], []
+    for member in raw:
+        (answered if parse_receipt_member(member)[0] in data else pending).append(member)
+    return answered, pending
+
+
+def poll_receipts():
+    """Scheduled (5 phút): hỏi getReceipts cho các ticket tới hạn, deactivate token hỏng."""
+    from erp.api.erp_sis.mobile_push_notification import _deactivate_unregistered_tokens, _expo_request_headers
+
+    cache = frappe.cache()
+    key = cache.make_key(RECEIPTS_KEY)
+    queued_key = cache.make_key(RECEIPTS_QUEUED_KEY)
+    now_ts = now_datetime().timestamp()
+    # Ticket quá hạn lưu của Expo (tính từ lúc gửi): không còn receipt để hỏi
+    expired = cache.zrangebyscore(queued_key, "-inf", now_ts - RECEIPT_MAX_AGE_SEC)
+    if expired:
+        cache.zrem(key, *expired)
+        cache.zrem(queued_key, *expired)
+
+    url, headers = receipts_url(), _expo_request_headers()
+    checked, unregistered = 0, set()
+    while True:
+        raw = cache.zrangebyscore(key, "-inf", now_ts, start=0, num=RECEIPT_BATCH)
+        if not raw:
+            break
+        members = [parse_receipt_member(m) for m in raw]
+        status, body, error = _post_one(_get_session(), url, headers, {"ids": [t for t, _ in members]})
+        if status != 200 or body is None:
+            frappe.logger().warning(f"📱 [Expo] getReceipts lỗi: status={status} error={error}")
+            break
+        unregistered.update(unregistered_from_receipts(members, body))
+        answered, pending = split_answered(raw, body)
+        pipe = cache.pipeline()
+        if answered:
+            pipe.zrem(key, *answered)
+            pipe.zrem(queued_key, *answered)
+        if pending:
+            # Expo chưa có receipt: hẹn lượt sau (điểm > now_ts nên vòng này không lấy lại)
+            pipe.zadd(key, dict.fromkeys(pending, now_ts + RECEIPT_RETRY_SEC))
+            # nx: giữ lúc gửi đã ghi; ticket xếp trước khi có RECEIPTS_QUEUED_KEY tính từ giờ
+            pipe.zadd(queued_key, dict.fromkeys(pending, now_ts), nx=True)
+        pipe.execute()
+        checked += len(answered)
+
+    _deactivate_unregistered_tokens(sorted(unregistered))
+    if checked:
+        frappe.logger().info(
+            f"📱 [Expo] poll_receipts: {checked} receipt, {len(unregistered)} DeviceNotRegistered"
+        )
+    return {"checked": checked, "unregistered": len(unregistered)}
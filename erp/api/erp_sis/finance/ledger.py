@@ -0,0 +1,434 @@
+"""
+Sổ cái tổng hợp tài chính — cập nhật tổng học sinh / năm bằng delta.
+
+Vì sao
+------
+Mỗi lần ghi nhận thanh toán, `_update_finance_student_summary` cộng lại toàn bộ Order
+Student của học sinh; dashboard năm (`get_finance_year_statistics`) quét ba bảng
+Finance Student / Order / Order Item mỗi lần mở. Mùa thu phí hai đường này chạy liên
+tục trên cùng các bảng đang bị ghi.
+
+Cách chạy
+---------
+- Học sinh: luồng thanh toán tính phần đóng góp (total, paid) của dòng Order Student
+  trước / sau khi sửa (`contribution`), cộng hiệu vào SIS Finance Student bằng
+  `apply_student_delta` — khoá dòng (SELECT ... FOR UPDATE), cùng giao dịch.
+- Năm: bảng `SIS Finance Year Counter` giữ (năm, phạm vi, trạng thái) -> số dòng + tổng
+  tiền. Mỗi thay đổi trạng thái / số tiền của Finance Student (phạm vi "student") hoặc
+  Order Item (phạm vi "order_item") cộng delta bằng một INSERT ... ON DUPLICATE KEY
+  UPDATE. Dashboard đọc tối đa vài dòng.
+- Ghi không qua các đường trên (import SQL, xoá hàng loạt) sẽ lệch: `reconcile` (hằng
+  đêm) tính lại toàn bộ, sửa tổng học sinh lệch, dựng lại bộ đếm năm lệch và ghi log
+  số chỗ lệch — số này khác 0 thường xuyên là dấu hiệu còn đường ghi chưa đi qua sổ cái.
+
+    bench --site <site> execute erp.api.erp_sis.finance.ledger.reconcile
+"""
+
+import frappe
+from frappe.utils import flt, now_datetime
+
+COUNTER_DT = "SIS Finance Year Counter"
+COUNTER_TABLE = f"tab{COUNTER_DT}"
+
+SCOPE_STUDENT = "student"
+SCOPE_ORDER_ITEM = "order_item"
+
+# Dòng Order Student được tính vào tổng học sinh khi nào (giữ đúng rule cũ)
+COUNTED_SQL = (
+    "fo.is_active = 1 AND IFNULL(fos.tuition_paid_elsewhere, 0) != 1 "
+    "AND IFNULL(fo.is_superseded, 0) != 1"
+)
+
+
+# ---------------------------------------------------------------------------
+# Thuần
+# ---------------------------------------------------------------------------
+
+
+def summarize_totals(total_amount, paid_amount):
+    """(total, paid) của học sinh -> (outstanding, payment_status)."""
+    total_amount, paid_amount = flt(total_amount), flt(paid_amount)
+    if total_amount <= 0:
+        status = "unpaid"
+    elif paid_amount >= total_amount:
+        status = "paid"
+    elif paid_amount > 0:
+        status = "partial"
+    else:
+        status = "unpaid"
+    return total_amount - paid_amount, status
+
+
+def contribution(total_amount, paid_amount, tuition_paid_elsewhere, order):
+    """Phần (total, paid) một dòng Order Student góp vào tổng học sinh."""
+    counted = (
+        order
+        and int(order.get("is_active") or 0) == 1
+        and not int(order.get("is_superseded") or 0)
+        and not int(tuition_paid_elsewhere or 0)
+    )
+    if not counted:
+        return 0.0, 0.0
+    return flt(total_amount), flt(paid_amount)
+
+
+def counter_deltas(before, after):
+    """before / after: (status, total, paid, outstanding) hoặc None (chưa có / đã xoá).
+
+    Trả {status: [số dòng, total, paid, outstanding]} — chỉ các trạng thái có thay đổi.
+    """
+    out = {}
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        status, total, paid, outstanding = state
+        row = out.setdefault(status or "", [0, 0.0, 0.0, 0.0])
+        row[0] += sign
+        row[1] += sign * flt(total)
+        row[2] += sign * flt(paid)
+        row[3] += sign * flt(outstanding)
+    return {k: v for k, v in out.items() if v[0] or any(abs(x) > 0.005 for x in v[1:])}
+
+
+def statistics_from_counters(rows):
+    """Dòng bộ đếm của một năm -> khối "students" + "payments" của dashboard."""
+    students = {"total": 0, "paid": 0, "partial": 0, "unpaid": 0}
+    payments = {"total_amount": 0, "total_paid": 0, "total_outstanding": 0}
+    for r in rows:
+        if r["scope"] == SCOPE_STUDENT:
+            students["total"] += int(r["row_count"] or 0)
+            if r["payment_status"] in ("paid", "partial", "unpaid"):
+                students[r["payment_status"]] += int(r["row_count"] or 0)
+        elif r["scope"] == SCOPE_ORDER_ITEM:
+            payments["total_amount"] += flt(r["total_amount"])
+            payments["total_paid"] += flt(r["paid_amount"])
+            payments["total_outstanding"] += flt(r["outstanding_amount"])
+    collection_rate = 0
+    if payments["total_amount"] > 0:
+        collection_rate = (payments["total_paid"] / payments["total_amount"]) * 100
+    payments["collection_rate"] = round(collection_rate, 2)
+    return {"students": students, "payments": payments}
+
+
+def _counter_name(year, scope, status):
+    return f"{year}|{scope}|{status or ''}"
+
+
+# ---------------------------------------------------------------------------
+# Bộ đếm năm
+# ---------------------------------------------------------------------------
+
+
+def bump_counters(year, scope, deltas):
+    """Cộng `deltas` (xem counter_deltas) vào bộ đếm của năm — một câu lệnh."""
+    if not year or not deltas:
+        return
+    now = now_datetime()
+    values = []
+    for status, (count, total, paid, outstanding) in deltas.items():
+        values.extend([_counter_name(year, scope, status), year, scope, status, count, total, paid, outstanding, now, now])
+    frappe.db.sql(
+        f"""
+        INSERT INTO `{COUNTER_TABLE}`
+            (name, finance_year_id, scope, payment_status, row_count, total_amount,
+             paid_amount, outstanding_amount, creation, modified, owner, modified_by, docstatus)
+        VALUES {", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'Administrator', 'Administrator', 0)"] * len(deltas))}
+        ON DUPLICATE KEY UPDATE
+            row_count = row_count + VALUES(row_count),
+            total_amount = total_amount + VALUES(total_amount),
+            paid_amount = paid_amount + VALUES(paid_amount),
+            outstanding_amount = outstanding_amount + VALUES(outstanding_amount),
+            modified = VALUES(modified)
+        """,
+        tuple(values),
+    )
+
+
+def _student_state(doc):
+    if doc is None:
+        return None
+    return (doc.get("payment_status"), doc.get("total_amount"), doc.get("paid_amount"), doc.get("outstanding_amount"))
+
+
+def _order_item_state(doc):
+    if doc is None:
+        return None
+    return (doc.get("payment_status"), doc.get("amount"), doc.get("paid_amount"), doc.get("outstanding_amount"))
+
+
+def _apply_doc_change(scope, year_of, state_of, doc, method):
+    if not frappe.db.table_exists(COUNTER_DT):
+        return
+    if method == "on_trash":
+        bump_counters(year_of(doc), scope, counter_deltas(state_of(doc), None))
+        return
+    # on_update chạy cả lúc insert: chưa có bản trước -> chỉ cộng trạng thái mới
+    before = doc.get_doc_before_save()
+    new_year = year_of(doc)
+    old_year = year_of(before) if before is not None else new_year
+    if old_year == new_year:
+        bump_counters(new_year, scope, counter_deltas(state_of(before), state_of(doc)))
+    else:
+        bump_counters(old_year, scope, counter_deltas(state_of(before), None))
+        bump_counters(new_year, scope, counter_deltas(None, state_of(doc)))
+
+
+def on_finance_student_change(doc, method=None):
+    """Doc hook SIS Finance Student (on_update — cả lúc insert — / on_trash)."""
+    _apply_doc_change(SCOPE_STUDENT, lambda d: d.get("finance_year_id"), _student_state, doc, method)
+
+
+def _order_year(doc):
+    return frappe.db.get_value("SIS Finance Order", doc.get("order_id"), "finance_year_id") if doc.get("order_id") else None
+
+
+def on_order_item_change(doc, method=None):
+    """Doc hook SIS Finance Order Item (on_update / on_trash)."""
+    _apply_doc_change(SCOPE_ORDER_ITEM, _order_year, _order_item_state, doc, method)
+
+
+def record_student_totals(doc, before_state):
+    """Finance Student vừa ghi tổng bằng db_update (không qua on_update): cộng delta bộ đếm."""
+    if frappe.db.table_exists(COUNTER_DT):
+        bump_counters(doc.finance_year_id, SCOPE_STUDENT, counter_deltas(before_state, _student_state(doc)))
+
+
+# ---------------------------------------------------------------------------
+# Tổng học sinh
+# ---------------------------------------------------------------------------
+
+
+def apply_student_delta(finance_student_id, delta_total, delta_paid):
+    """Cộng (delta_total, delta_paid) vào SIS Finance Student, cập nhật bộ đếm năm.
+
+    Khoá dòng học sinh tới hết giao dịch: hai lần thu cùng học sinh chạy song song
+    không đè delta của nhau. Trả _dict tổng mới (None nếu không thấy học sinh).
+    """
+    row = frappe.db.sql(
+        """
+        SELECT name, finance_year_id, total_amount, paid_amount, outstanding_amount, payment_status
+        FROM `tabSIS Finance Student` WHERE name = %s FOR UPDATE
+        """,
+        (finance_student_id,),
+        as_dict=True,
+    )
+    if not row:
+        return None
+    row = row[0]
+    if abs(flt(delta_total)) < 0.005 and abs(flt(delta_paid)) < 0.005:
+        return row
+
+    total = flt(row.total_amount) + flt(delta_total)
+    paid = flt(row.paid_amount) + flt(delta_paid)
+    outstanding, status = summarize_totals(total, paid)
+    frappe.db.set_value(
+        "SIS Finance Student",
+        finance_student_id,
+        {"total_amount": total, "paid_amount": paid, "outstanding_amount": outstanding, "payment_status": status},
+        update_modified=True,
+    )
+    new = frappe._dict(row, total_amount=total, paid_amount=paid, outstanding_amount=outstanding, payment_status=status)
+    if frappe.db.table_exists(COUNTER_DT):
+        bump_counters(row.finance_year_id, SCOPE_STUDENT, counter_deltas(_student_state(row), _student_state(new)))
+    return new
+
+
+def expected_student_totals(finance_year_id):
+    """{finance_student_id: (total, paid)} tính lại từ Order Student — rule của luồng thanh toán."""
+    rows = frappe.db.sql(
+        f"""
+        SELECT fos.finance_student_id,
+               COALESCE(SUM(CASE WHEN {COUNTED_SQL} THEN fos.total_amount ELSE 0 END), 0),
+               COALESCE(SUM(CASE WHEN {COUNTED_SQL} THEN fos.paid_amount ELSE 0 END), 0)
+        FROM `tabSIS Finance Order Student` fos
+        INNER JOIN `tabSIS Finance Student` fs ON fs.name = fos.finance_student_id
+        INNER JOIN `tabSIS Finance Order` fo ON fo.name = fos.order_id
+        WHERE fs.finance_year_id = %s
+        GROUP BY fos.finance_student_id
+        """,
+        (finance_year_id,),
+    )
+    return {r[0]: (flt(r[1]), flt(r[2])) for r in rows}
+
+
+def student_drift(stored, expected):
+    """stored {id: (total, paid, status)}, expected {id: (total, paid)} -> [(id, total, paid)] lệch.
+
+    Chỉ xét học sinh có Order Student (có trong `expected`): học sinh chỉ có Order Item
+    kiểu cũ được SIS Finance Student.update_finance_summary tính theo nguồn khác.
+    """
+    out = []
+    for sid, (total, paid) in expected.items():
+        if sid not in stored:
+            continue
+        s_total, s_paid, s_status = stored[sid]
+        _, status = summarize_totals(total, paid)
+        if abs(flt(s_total) - total) > 0.005 or abs(flt(s_paid) - paid) > 0.005 or s_status != status:
+            out.append((sid, total, paid))
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Dựng lại / đối soát
+# ---------------------------------------------------------------------------
+
+
+def computed_counters(finance_year_id):
+    """Bộ đếm của năm tính lại từ bảng nguồn: {(scope, status): (count, total, paid, outstanding)}."""
+    out = {}
+    for r in frappe.db.sql(
+        """
+        SELECT IFNULL(payment_status, ''), COUNT(*), COALESCE(SUM(total_amount), 0),
+               COALESCE(SUM(paid_amount), 0), COALESCE(SUM(outstanding_amount), 0)
+        FROM `tabSIS Finance Student`
+        WHERE finance_year_id = %s
+        GROUP BY IFNULL(payment_status, '')
+        """,
+        (finance_year_id,),
+    ):
+        out[(SCOPE_STUDENT, r[0])] = (int(r[1]), flt(r[2]), flt(r[3]), flt(r[4]))
+    for r in frappe.db.sql(
+        """
+        SELECT IFNULL(foi.payment_status, ''), COUNT(*), COALESCE(SUM(foi.amount), 0),
+               COALESCE(SUM(foi.paid_amount), 0), COALESCE(SUM(foi.outstanding_amount), 0)
+        FROM `tabSIS Finance Order Item` foi
+        INNER JOIN `tabSIS Finance Order` fo ON foi.order_id = fo.name
+        WHERE fo.finance_year_id = %s
+        GROUP BY IFNULL(foi.payment_status, '')
+        """,
+        (finance_year_id,),
+    ):
+        out[(SCOPE_ORDER_ITEM, r[0])] = (int(r[1]), flt(r[2]), flt(r[3]), flt(r[4]))
+    return out
+
+
+def stored_counters(finance_year_id):
+    return {
+        (r.scope, r.payment_status or ""): (int(r.row_count or 0), flt(r.total_amount), flt(r.paid_amount), flt(r.outstanding_amount))
+        for r in frappe.db.sql(
+            f"""
+            SELECT scope, payment_status, row_count, total_amount, paid_amount, outstanding_amount
+            FROM `{COUNTER_TABLE}` WHERE finance_year_id = %s
+            """,
+            (finance_year_id,),
+            as_dict=True,
+        )
+    }
+
+
+def counters_differ(stored, computed):
+    """Các khoá (scope, status) lệch giữa bộ đếm và số tính lại (bỏ dòng toàn 0)."""
+    keys = set(stored) | set(computed)
+    zero = (0, 0.0, 0.0, 0.0)
+    diff = []
+    for key in sorted(keys):
+        a, b = stored.get(key, zero), computed.get(key, zero)
+        if a[0] != b[0] or any(abs(x - y) > 0.005 for x, y in zip(a[1:], b[1:])):
+            diff.append(key)
+    return diff
+
+
+def rebuild_year(finance_year_id, computed=None):
+    """Ghi đè bộ đếm của năm bằng số tính lại."""
+    computed = computed if computed is not None else computed_counters(finance_year_id)
+    frappe.db.sql(f"DELETE FROM `{COUNTER_TABLE}` WHERE finance_year_id = %s", (finance_year_id,))
+    for scope in (SCOPE_STUDENT, SCOPE_ORDER_ITEM):
+        bump_counters(
+            finance_year_id,
+            scope,
+            {status: list(v) for (s, status), v in computed.items() if s == scope},
+        )
+
+
+def counter_rows(computed):
+    """{(scope, status): (count, total, paid, outstanding)} -> dạng dòng bảng bộ đếm."""
+    return [
+        {
+            "scope": scope,
+            "payment_status": status,
+            "row_count": v[0],
+            "total_amount": v[1],
+            "paid_amount": v[2],
+            "outstanding_amount": v[3],
+        }
+        for (scope, status), v in computed.items()
+    ]
+
+
+def year_statistics(finance_year_id):
+    """
+    Khối students + payments của dashboard từ bộ đếm. CHỈ ĐỌC.
+
+    Năm chưa có dòng bộ đếm (patch / reconcile chưa chạy tới) thì tính thẳng từ
+    bảng nguồn cho lượt này — không dựng bộ đếm trong request GET: hai lượt mở
+    đầu tiên song song sẽ cùng DELETE rồi cùng cộng dồn.
+    """
+    rows = frappe.db.sql(
+        f"""
+        SELECT scope, payment_status, row_count, total_amount, paid_amount, outstanding_amount
+        FROM `{COUNTER_TABLE}` WHERE finance_year_id = %s
+        """,
+        (finance_year_id,),
+        as_dict=True,
+    )
+    if not rows:
+        rows = counter_rows(computed_counters(finance_year_id))
+    return statistics_from_counters(rows)
+
+
+def _reconcile_students(finance_year_id):
+    stored = {
+        r[0]: (flt(r[1]), flt(r[2]), r[3])
+        for r in frappe.db.sql(
+            """
+            SELECT name, total_amount, paid_amount, payment_status
+            FROM `tabSIS Finance Student` WHERE finance_year_id = %s
+            """,
+            (finance_year_id,),
+        )
+    }
+    drift = student_drift(stored, expected_student_totals(finance_year_id))
+    for sid, total, paid in drift:
+        outstanding, status = summarize_totals(total, paid)
+        frappe.db.set_value(
+            "SIS Finance Student",
+            sid,
+            {"total_amount": total, "paid_amount": paid, "outstanding_amount": outstanding, "payment_status": status},
+            update_modified=False,
+        )
+    return [sid for sid, _, _ in drift]
+
+
+def reconcile(finance_year_id=None):
+    """Scheduled (hằng đêm): đối soát delta với số tính lại toàn bộ, sửa chỗ lệch.
+
+    Trả {năm: {"students": [id lệch], "counters": [(scope, status) lệch]}}.
+    """
+    if not frappe.db.table_exists(COUNTER_DT):
+        return {}
+    years = [finance_year_id] if finance_year_id else frappe.db.sql_list("SELECT name FROM `tabSIS Finance Year`")
+    if not finance_year_id:
+        # Bộ đếm của năm đã bị xoá
+        frappe.db.sql(
+            f"""
+            DELETE c FROM `{COUNTER_TABLE}` c
+            LEFT JOIN `tabSIS Finance Year` y ON y.name = c.finance_year_id
+            WHERE y.name IS NULL
+            """
+        )
+    report = {}
+    for year in years:
+        students = _reconcile_students(year)
+        computed = computed_counters(year)
+        counters = counters_differ(stored_counters(year), computed)
+        if counters:
+            rebuild_year(year, computed)
+        frappe.db.commit()
+        if students or counters:
+            report[year] = {"students": students, "counters": counters}
+    logger = frappe.logger("finance_ledger")
+    if report:
+        logger.warning(f"finance ledger reconcile: lệch {report}")
+    else:
+        logger.info(f"finance ledger reconcile: {len(years)} năm khớp")
+    return report
@@ -14,6 +14,7 @@ from erp.utils.api_response import (
     not_found_response
 )
 
+from . import ledger
 from .utils import _check_admin_permission
 
 
@@ -26,7 +27,7 @@ def _should_legacy_flag_tuition_elsewhere(order_doc):
     return not (getattr(order_doc, "parent_order_id", None) or "").strip()
 
 
-def _flag_other_tuition_orders(finance_student_id, paid_order_id, finance_year_id, paid_order_title, logs=None):
+def _flag_other_tuition_orders(finance_student_id, paid_order_id, finance_year_id, paid_order_title, logs=None, removed=None):
     """
     Đánh dấu các bản ghi Order Student khác của học sinh trong các order tuition khác.
     Khi học sinh đã có ghi nhận thanh toán (paid/partial) ở một order tuition,
@@ -38,6 +39,7 @@ def _flag_other_tuition_orders(finance_student_id, paid_order_id, finance_year_i
         finance_year_id: ID năm tài chính
         paid_order_title: Tên của order vừa được thanh toán
         logs: List để append logs
+        removed: List nhận (total, paid) mà các dòng vừa flag không còn góp vào tổng học sinh
     
     Returns:
         Số lượng bản ghi đã được flag
@@ -49,7 +51,8 @@ def _flag_other_tuition_orders(finance_student_id, paid_order_id, finance_year_i
         # Tìm các Order Student của cùng học sinh trong các order tuition khác
         # có payment_status là unpaid hoặc partial (chưa hoàn thành thanh toán)
         other_order_students = frappe.db.sql("""
-            SELECT os.name, os.order_id, o.title as order_title
+            SELECT os.name, os.order_id, o.title as order_title,
+                os.total_amount, os.paid_amount, o.is_active, o.is_superseded
             FROM `tabSIS Finance Order Student` os
             JOIN `tabSIS Finance Order` o ON o.name = os.order_id
             WHERE os.finance_student_id = %(finance_student_id)s
@@ -71,6 +74,8 @@ def _flag_other_tuition_orders(finance_student_id, paid_order_id, finance_year_i
                 "tuition_paid_elsewhere": 1,
                 "tuition_paid_elsewhere_order": paid_order_title
             }, update_modified=True)
+            if removed is not None:
+                removed.append(ledger.contribution(os_record.total_amount, os_record.paid_amount, 0, os_record))
             flagged_count += 1
             logs.append(f"Đã đánh dấu Order Student {os_record.name} (order: {os_record.order_title})")
         
@@ -84,12 +89,27 @@ def _flag_other_tuition_orders(finance_student_id, paid_order_id, finance_year_i
         return 0
 
 
-def _update_finance_student_summary(finance_student_id, logs=None):
+def _order_student_amounts(order_student):
+    """(total, paid, tuition_paid_elsewhere) của Order Student — chụp trước khi sửa."""
+    return (
+        order_student.total_amount,
+        order_student.paid_amount,
+        order_student.tuition_paid_elsewhere,
+    )
+
+
+def _apply_finance_student_delta(finance_student_id, order_doc, before, order_student, removed=None, logs=None):
     """
-    Cập nhật tổng hợp tài chính cho Finance Student từ các Order Student thuộc order active.
+    Cập nhật tổng hợp tài chính cho Finance Student bằng delta (xem finance/ledger.py):
+    phần chênh của Order Student vừa sửa, trừ phần của các dòng vừa bị flag đóng nơi khác.
+    Không cộng lại toàn bộ Order Student; lệch (nếu có) được ledger.reconcile sửa hằng đêm.
     
     Args:
         finance_student_id: ID của Finance Student
+        order_doc: Order của Order Student
+        before: _order_student_amounts() trước khi sửa
+        order_student: Order Student sau khi lưu
+        removed: (total, paid) các dòng vừa flag — từ _flag_other_tuition_orders
         logs: List để append logs
     
     Returns:
@@ -99,42 +119,24 @@ def _update_finance_student_summary(finance_student_id, logs=None):
         logs = []
     
     try:
-        # Chỉ tính tổng từ Order Student thuộc order active, loại bỏ tuition đã đóng ở nơi khác
-        summary = frappe.db.sql("""
-            SELECT 
-                COALESCE(SUM(fos.total_amount), 0) as total_amount,
-                COALESCE(SUM(fos.paid_amount), 0) as paid_amount
-            FROM `tabSIS Finance Order Student` fos
-            INNER JOIN `tabSIS Finance Order` fo ON fos.order_id = fo.name
-            WHERE fos.finance_student_id = %s
-              AND fo.is_active = 1
-              AND IFNULL(fos.tuition_paid_elsewhere, 0) != 1
-              AND IFNULL(fo.is_superseded, 0) != 1
-        """, (finance_student_id,), as_dict=True)[0]
-        
-        total_amount = summary.get('total_amount', 0)
-        paid_amount = summary.get('paid_amount', 0)
-        outstanding_amount = total_amount - paid_amount
-        
-        # Xác định payment_status
-        if total_amount <= 0:
-            payment_status = 'unpaid'
-        elif paid_amount >= total_amount:
-            payment_status = 'paid'
-        elif paid_amount > 0:
-            payment_status = 'partial'
-        else:
-            payment_status = 'unpaid'
-        
-        # Cập nhật Finance Student
-        frappe.db.set_value("SIS Finance Student", finance_student_id, {
-            "total_amount": total_amount,
-            "paid_amount": paid_amount,
-            "outstanding_amount": outstanding_amount,
-            "payment_status": payment_status
-        }, update_modified=True)
-        
-        logs.append(f"Cascade update Finance Student: {finance_student_id} - total: {total_amount}, paid: {paid_amount}, status: {payment_status}")
+        old_total, old_paid = ledger.contribution(*before, order_doc)
+        new_total, new_paid = ledger.contribution(*_order_student_amounts(order_student), order_doc)
+        delta_total = new_total - old_total
+        delta_paid = new_paid - old_paid
+        for total, paid in removed or []:
+            delta_total -= total
+            delta_paid -= paid
+        
+        summary = ledger.apply_student_delta(finance_student_id, delta_total, delta_paid)
+        if summary is None:
+            logs.append(f"Không tìm thấy Finance Student: {finance_student_id}")
+            return False
+        
+        logs.append(
+            f"Cascade update Finance Student: {finance_student_id} - total: {summary.total_amount}, "
+            f"paid: {summary.paid_amount}, status: {summary.payment_status} "
+            f"(delta total {delta_total:,.0f}, paid {delta_paid:,.0f})"
+        )
         
         return True
         
@@ -308,6 +310,7 @@ def update_order_student_payment():
         
         order_student = frappe.get_doc("SIS Finance Order Student", order_student_id)
         finance_student_id = order_student.finance_student_id
+        amounts_before = _order_student_amounts(order_student)
         
         # Số từ request
         amount_val = float(paid_amount) if paid_amount is not None else 0
@@ -393,17 +396,21 @@ def update_order_student_payment():
         
         # Flag các order tuition khác TRƯỚC khi tính summary (để summary loại bỏ đúng)
         flagged_count = 0
+        removed = []
         if _should_legacy_flag_tuition_elsewhere(order_doc) and order_student.payment_status in ('paid', 'partial'):
             flagged_count = _flag_other_tuition_orders(
                 finance_student_id=finance_student_id,
                 paid_order_id=order_student.order_id,
                 finance_year_id=order_doc.finance_year_id,
                 paid_order_title=order_doc.title,
-                logs=logs
+                logs=logs,
+                removed=removed
             )
         
         # Cascade update lên Finance Student (giờ đã flag chính xác)
-        finance_student_updated = _update_finance_student_summary(finance_student_id, logs)
+        finance_student_updated = _apply_finance_student_delta(
+            finance_student_id, order_doc, amounts_before, order_student, removed, logs
+        )
         
         # Cập nhật thống kê Order
         order_doc.update_statistics()
@@ -487,6 +494,7 @@ def record_payment_choice():
         
         order_student = frappe.get_doc("SIS Finance Order Student", order_student_id)
         finance_student_id = order_student.finance_student_id
+        amounts_before = _order_student_amounts(order_student)
         
         yearly_amount = order_student.total_amount or 0
         # Mỗi kỳ một mức phí riêng (DocType: semester_1_amount / semester_2_amount)
@@ -538,16 +546,18 @@ def record_payment_choice():
         
         # Flag các order tuition khác TRƯỚC khi tính summary
         flagged_count = 0
+        removed = []
         if _should_legacy_flag_tuition_elsewhere(order_doc) and order_student.payment_status in ('paid', 'partial'):
             flagged_count = _flag_other_tuition_orders(
                 finance_student_id=finance_student_id,
                 paid_order_id=order_student.order_id,
                 finance_year_id=order_doc.finance_year_id,
                 paid_order_title=order_doc.title,
-                logs=logs
+                logs=logs,
+                removed=removed
             )
         
-        _update_finance_student_summary(finance_student_id, logs)
+        _apply_finance_student_delta(finance_student_id, order_doc, amounts_before, order_student, removed, logs)
         order_doc.update_statistics()
         
         frappe.db.commit()
@@ -657,6 +667,7 @@ def record_milestone_payment():
         
         order_student = frappe.get_doc("SIS Finance Order Student", order_student_id)
         finance_student_id = order_student.finance_student_id
+        amounts_before = _order_student_amounts(order_student)
         
         # Lấy milestone amounts
         milestone_amounts = order_student.get_milestone_amounts()
@@ -754,17 +765,21 @@ def record_milestone_payment():
         
         # Flag các order tuition khác TRƯỚC khi tính summary
         flagged_count = 0
+        removed = []
         if _should_legacy_flag_tuition_elsewhere(order_doc) and order_student.payment_status in ('paid', 'partial'):
             flagged_count = _flag_other_tuition_orders(
                 finance_student_id=finance_student_id,
                 paid_order_id=order_student.order_id,
                 finance_year_id=order_doc.finance_year_id,
                 paid_order_title=order_doc.title,
-                logs=logs
+                logs=logs,
+                removed=removed
             )
         
         # Cascade update lên Finance Student (giờ đã flag chính xác)
-        finance_student_updated = _update_finance_student_summary(finance_student_id, logs)
+        finance_student_updated = _apply_finance_student_delta(
+            finance_student_id, order_doc, amounts_before, order_student, removed, logs
+        )
         
         # Cập nhật thống kê Order
         order_doc.update_statistics()
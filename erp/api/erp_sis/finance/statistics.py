@@ -12,6 +12,7 @@ from erp.utils.api_response import (
     success_response
 )
 
+from . import ledger
 from .utils import _check_admin_permission
 
 
@@ -41,18 +42,10 @@ def get_finance_year_statistics(finance_year_id=None):
                 {"finance_year_id": ["Finance Year ID là bắt buộc"]}
             )
         
-        # Thống kê học sinh
-        student_stats = frappe.db.sql("""
-            SELECT 
-                COUNT(*) as total_students,
-                SUM(CASE WHEN payment_status = 'paid' THEN 1 ELSE 0 END) as paid_students,
-                SUM(CASE WHEN payment_status = 'partial' THEN 1 ELSE 0 END) as partial_students,
-                SUM(CASE WHEN payment_status = 'unpaid' THEN 1 ELSE 0 END) as unpaid_students
-            FROM `tabSIS Finance Student`
-            WHERE finance_year_id = %s
-        """, (finance_year_id,), as_dict=True)[0]
+        # Học sinh + thanh toán: đọc bộ đếm năm do ledger duy trì (vài dòng), không quét bảng
+        counters = ledger.year_statistics(finance_year_id)
         
-        # Thống kê đơn hàng
+        # Thống kê đơn hàng (vài chục đơn / năm)
         order_stats = frappe.db.sql("""
             SELECT 
                 COUNT(*) as total_orders,
@@ -61,40 +54,14 @@ def get_finance_year_statistics(finance_year_id=None):
             WHERE finance_year_id = %s AND is_active = 1
         """, (finance_year_id,), as_dict=True)[0]
         
-        # Thống kê thanh toán
-        payment_stats = frappe.db.sql("""
-            SELECT 
-                COALESCE(SUM(foi.amount), 0) as total_amount,
-                COALESCE(SUM(foi.paid_amount), 0) as total_paid,
-                COALESCE(SUM(foi.outstanding_amount), 0) as total_outstanding
-            FROM `tabSIS Finance Order Item` foi
-            INNER JOIN `tabSIS Finance Order` fo ON foi.order_id = fo.name
-            WHERE fo.finance_year_id = %s
-        """, (finance_year_id,), as_dict=True)[0]
-        
-        # Tính tỷ lệ thu
-        collection_rate = 0
-        if payment_stats.total_amount > 0:
-            collection_rate = (payment_stats.total_paid / payment_stats.total_amount) * 100
-        
         return success_response(
             data={
-                "students": {
-                    "total": student_stats.total_students or 0,
-                    "paid": student_stats.paid_students or 0,
-                    "partial": student_stats.partial_students or 0,
-                    "unpaid": student_stats.unpaid_students or 0
-                },
+                "students": counters["students"],
                 "orders": {
                     "total": order_stats.total_orders or 0,
                     "total_amount": order_stats.total_order_amount or 0
                 },
-                "payments": {
-                    "total_amount": payment_stats.total_amount or 0,
-                    "total_paid": payment_stats.total_paid or 0,
-                    "total_outstanding": payment_stats.total_outstanding or 0,
-                    "collection_rate": round(collection_rate, 2)
-                }
+                "payments": counters["payments"]
             },
             logs=logs
         )
@@ -0,0 +1,444 @@
+"""
+Bảng tổng hợp báo cáo thư viện theo ngày.
+
+Vì sao
+------
+Dashboard mượn/trả (`reports.get_library_borrow_report`, `get_library_top_books`) mỗi lần
+mở chạy GROUP BY trên toàn bộ bảng phiếu mượn / item / phạt cho khoảng ngày được chọn,
+rồi gom tên sách trong Python — càng nhiều năm lịch sử càng chậm.
+
+Cách chạy
+---------
+- `SIS Library Daily Stat` (name = ngày): số phiếu theo borrow_date (tổng + theo status
+  hiện tại), số item mất/hỏng theo date_returned, tiền phạt chờ thu theo ngày tạo, tiền
+  phạt đã thu theo payment_date — đúng các chiều báo cáo cũ đang dùng.
+- `SIS Library Title Daily Stat`: (ngày mượn, tên sách chuẩn hoá) -> số lượt mượn.
+- Doc hook phiếu mượn / phiếu phạt lấy phần đóng góp trước / sau khi ghi, cộng hiệu bằng
+  INSERT ... ON DUPLICATE KEY UPDATE. Sync quá hạn (UPDATE hàng loạt, không doc event)
+  gọi `apply_status_changes`.
+- Báo cáo một khoảng ngày đọc tối đa vài trăm dòng, không phụ thuộc lượng lịch sử.
+- Dựng lại (lần đầu, hoặc sau khi sửa dữ liệu bằng SQL):
+
+    bench --site <site> execute erp.api.erp_sis.library.rollup.rebuild
+    bench --site <site> execute erp.api.erp_sis.library.rollup.rebuild \
+        --kwargs "{'from_date': '2026-01-01', 'to_date': '2026-01-31'}"
+"""
+
+import hashlib
+
+import frappe
+from frappe.utils import flt, getdate, now_datetime
+
+from ._constants import COPY_DTYPE, FINE_DTYPE, TITLE_DTYPE, TRANSACTION_DTYPE, TRANSACTION_ITEM_DTYPE
+
+DAILY_DT = "SIS Library Daily Stat"
+DAILY_TABLE = f"tab{DAILY_DT}"
+TITLE_STAT_DT = "SIS Library Title Daily Stat"
+TITLE_STAT_TABLE = f"tab{TITLE_STAT_DT}"
+
+# Status phiếu mượn -> cột đếm theo ngày mượn
+STATUS_COLUMNS = {
+    "borrowing": "borrowing_count",
+    "partial_return": "partial_return_count",
+    "overdue": "overdue_count",
+    "returned": "returned_count",
+    "lost": "lost_count",
+}
+DAILY_COLUMNS = (
+    "tx_count",
+    *STATUS_COLUMNS.values(),
+    "lost_damaged_count",
+    "pending_fine_amount",
+    "paid_fine_amount",
+)
+
+INSERT_CHUNK = 500
+
+
+# ---------------------------------------------------------------------------
+# Thuần
+# ---------------------------------------------------------------------------
+
+
+def normalize_title_key(title):
+    """Chuẩn hoá tên sách để gom các dòng trùng book_title."""
+    return str(title or "").strip().casefold()
+
+
+def title_hash(key):
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def _day(value):
+    return str(getdate(value)) if value else None
+
+
+def _add(out, key, value):
+    if key[0] and value:
+        out[key] = out.get(key, 0) + value
+
+
+def tx_contribution(tx):
+    """Phiếu mượn (doc / dict, có items) -> {(ngày, cột): số} nó góp vào bảng ngày."""
+    out = {}
+    if tx is None:
+        return out
+    borrow_day = _day(tx.get("borrow_date"))
+    _add(out, (borrow_day, "tx_count"), 1)
+    if tx.get("status") in STATUS_COLUMNS:
+        _add(out, (borrow_day, STATUS_COLUMNS[tx.get("status")]), 1)
+    for item in tx.get("items") or []:
+        if item.get("status") in ("lost", "damaged"):
+            _add(out, (_day(item.get("date_returned")), "lost_damaged_count"), 1)
+    return out
+
+
+def fine_contribution(fine):
+    """Phiếu phạt -> {(ngày, cột): tiền} (chờ thu theo ngày tạo, đã thu theo ngày thu)."""
+    out = {}
+    if fine is None:
+        return out
+    if fine.get("status") == "pending":
+        _add(out, (_day(fine.get("creation")), "pending_fine_amount"), flt(fine.get("total_amount")))
+    elif fine.get("status") == "paid":
+        paid_day = _day(fine.get("payment_date") or fine.get("creation"))
+        _add(out, (paid_day, "paid_fine_amount"), flt(fine.get("paid_amount")))
+    return out
+
+
+def title_contribution(tx):
+    """Phiếu mượn -> {(ngày mượn, tên chuẩn hoá): lượt mượn}."""
+    out = {}
+    if tx is None:
+        return out
+    borrow_day = _day(tx.get("borrow_date"))
+    for item in tx.get("items") or []:
+        key = normalize_title_key(item.get("book_title"))
+        if key:
+            _add(out, (borrow_day, key), 1)
+    return out
+
+
+def diff(before, after):
+    """Hiệu after - before của hai dict đóng góp — bỏ các khoá không đổi."""
+    out = {}
+    for key in set(before) | set(after):
+        delta = after.get(key, 0) - before.get(key, 0)
+        if abs(delta) > 0.005:
+            out[key] = delta
+    return out
+
+
+def rows_by_day(deltas):
+    """{(ngày, cột): v} -> {ngày: {cột: v}}."""
+    out = {}
+    for (day, column), value in deltas.items():
+        out.setdefault(day, {})[column] = value
+    return out
+
+
+def _range_clause(expr, from_date=None, to_date=None):
+    if from_date and to_date:
+        return f"AND {expr} BETWEEN %s AND %s", [from_date, to_date]
+    if from_date:
+        return f"AND {expr} >= %s", [from_date]
+    if to_date:
+        return f"AND {expr} <= %s", [to_date]
+    return "", []
+
+
+# ---------------------------------------------------------------------------
+# Ghi
+# ---------------------------------------------------------------------------
+
+
+def bump_daily(deltas):
+    """Cộng `deltas` {(ngày, cột): v} vào bảng ngày — một INSERT ... ON DUPLICATE KEY UPDATE / lô."""
+    by_day = rows_by_day(deltas)
+    if not by_day:
+        return
+    now = now_datetime()
+    columns = ", ".join(DAILY_COLUMNS)
+    updates = ", ".join(f"{c} = {c} + VALUES({c})" for c in DAILY_COLUMNS)
+    placeholders = "(%s, %s, " + ", ".join(["%s"] * len(DAILY_COLUMNS)) + ", %s, %s, 'Administrator', 'Administrator', 0)"
+    days = sorted(by_day)
+    for i in range(0, len(days), INSERT_CHUNK):
+        chunk = days[i : i + INSERT_CHUNK]
+        values = []
+        for day in chunk:
+            values.extend([day, day, *(by_day[day].get(c, 0) for c in DAILY_COLUMNS), now, now])
+        frappe.db.sql(
+            f"""
+            INSERT INTO `{DAILY_TABLE}`
+                (name, report_date, {columns}, creation, modified, owner, modified_by, docstatus)
+            VALUES {", ".join([placeholders] * len(chunk))}
+            ON DUPLICATE KEY UPDATE {updates}, modified = VALUES(modified)
+            """,
+            tuple(values),
+        )
+
+
+def bump_titles(deltas, info=None):
+    """Cộng lượt mượn {(ngày, tên chuẩn hoá): n}; `info`: tên chuẩn hoá -> (book_title, title_id, library_code)."""
+    info = info or {}
+    keys = sorted(k for k, v in deltas.items() if v)
+    if not keys:
+        return
+    now = now_datetime()
+    for i in range(0, len(keys), INSERT_CHUNK):
+        chunk = keys[i : i + INSERT_CHUNK]
+        values = []
+        for day, key in chunk:
+            book_title, title_id, library_code = info.get(key) or (key, "", "")
+            digest = title_hash(key)
+            values.extend([f"{day}|{digest}", day, digest, key, book_title, title_id or "", library_code or "",
+                           deltas[(day, key)], now, now])
+        frappe.db.sql(
+            f"""
+            INSERT INTO `{TITLE_STAT_TABLE}`
+                (name, report_date, title_hash, title_key, book_title, title_id, library_code, borrow_count,
+                 creation, modified, owner, modified_by, docstatus)
+            VALUES {", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'Administrator', 'Administrator', 0)"] * len(chunk))}
+            ON DUPLICATE KEY UPDATE
+                borrow_count = borrow_count + VALUES(borrow_count),
+                title_id = IF(IFNULL(title_id, '') = '', VALUES(title_id), title_id),
+                library_code = IF(IFNULL(library_code, '') = '', VALUES(library_code), library_code),
+                modified = VALUES(modified)
+            """,
+            tuple(values),
+        )
+
+
+def _title_info(items):
+    """Tên chuẩn hoá -> (book_title, title_id, library_code) cho các item vừa thêm."""
+    codes = [item.get("book_copy_id") for item in items if item.get("book_copy_id")]
+    by_code = {}
+    if codes:
+        by_code = {
+            r[0]: (r[1] or "", r[2] or "")
+            for r in frappe.db.sql(
+                f"""
+                SELECT bc.generated_code, bc.title_id, lt.library_code
+                FROM `tab{COPY_DTYPE}` bc
+                LEFT JOIN `tab{TITLE_DTYPE}` lt ON lt.name = bc.title_id
+                WHERE bc.generated_code IN %s
+                """,
+                (tuple(codes),),
+            )
+        }
+    info = {}
+    for item in items:
+        key = normalize_title_key(item.get("book_title"))
+        if key and key not in info:
+            title_id, library_code = by_code.get(item.get("book_copy_id"), ("", ""))
+            info[key] = (str(item.get("book_title")).strip(), title_id, library_code)
+    return info
+
+
+def _enabled():
+    return frappe.db.table_exists(DAILY_DT)
+
+
+def on_transaction_change(doc, method=None):
+    """Doc hook SIS Library Transaction (on_update — cả lúc insert — / on_trash)."""
+    if not _enabled():
+        return
+    if method == "on_trash":
+        before, after = doc, None
+    else:
+        before, after = doc.get_doc_before_save(), doc
+    bump_daily(diff(tx_contribution(before), tx_contribution(after)))
+    # Lượt mượn chỉ đổi khi thêm / xoá phiếu hoặc sửa tên sách, ngày mượn
+    title_deltas = diff(title_contribution(before), title_contribution(after))
+    if title_deltas:
+        items = (after.get("items") or []) if after is not None else []
+        bump_titles(title_deltas, _title_info(items))
+
+
+def on_fine_change(doc, method=None):
+    """Doc hook SIS Library Fine (on_update / on_trash)."""
+    if not _enabled():
+        return
+    before, after = (doc, None) if method == "on_trash" else (doc.get_doc_before_save(), doc)
+    bump_daily(diff(fine_contribution(before), fine_contribution(after)))
+
+
+def apply_status_changes(rows):
+    """Phiếu đổi status bằng UPDATE hàng loạt: rows có borrow_date, old_status, new_status."""
+    if not rows or not _enabled():
+        return
+    deltas = {}
+    for r in rows:
+        day = _day(r.get("borrow_date"))
+        if r.get("old_status") in STATUS_COLUMNS:
+            _add(deltas, (day, STATUS_COLUMNS[r.get("old_status")]), -1)
+        if r.get("new_status") in STATUS_COLUMNS:
+            _add(deltas, (day, STATUS_COLUMNS[r.get("new_status")]), 1)
+    bump_daily(deltas)
+
+
+# ---------------------------------------------------------------------------
+# Dựng lại từ dữ liệu gốc
+# ---------------------------------------------------------------------------
+
+
+def computed_daily(from_date=None, to_date=None):
+    """{(ngày, cột): v} tính thẳng từ phiếu mượn / item / phạt trong khoảng ngày."""
+    out = {}
+
+    clause, params = _range_clause("borrow_date", from_date, to_date)
+    for day, status, n in frappe.db.sql(
+        f"""
+        SELECT borrow_date, status, COUNT(*) FROM `tab{TRANSACTION_DTYPE}`
+        WHERE borrow_date IS NOT NULL {clause}
+        GROUP BY borrow_date, status
+        """,
+        params,
+    ):
+        _add(out, (_day(day), "tx_count"), n)
+        if status in STATUS_COLUMNS:
+            _add(out, (_day(day), STATUS_COLUMNS[status]), n)
+
+    clause, params = _range_clause("date_returned", from_date, to_date)
+    for day, n in frappe.db.sql(
+        f"""
+        SELECT date_returned, COUNT(*) FROM `tab{TRANSACTION_ITEM_DTYPE}`
+        WHERE status IN ('lost', 'damaged') AND date_returned IS NOT NULL {clause}
+        GROUP BY date_returned
+        """,
+        params,
+    ):
+        _add(out, (_day(day), "lost_damaged_count"), n)
+
+    clause, params = _range_clause("DATE(creation)", from_date, to_date)
+    for day, amount in frappe.db.sql(
+        f"""
+        SELECT DATE(creation), COALESCE(SUM(total_amount), 0) FROM `tab{FINE_DTYPE}`
+        WHERE status = 'pending' {clause}
+        GROUP BY DATE(creation)
+        """,
+        params,
+    ):
+        _add(out, (_day(day), "pending_fine_amount"), flt(amount))
+
+    paid_day = "COALESCE(payment_date, DATE(creation))"
+    clause, params = _range_clause(paid_day, from_date, to_date)
+    for day, amount in frappe.db.sql(
+        f"""
+        SELECT {paid_day}, COALESCE(SUM(paid_amount), 0) FROM `tab{FINE_DTYPE}`
+        WHERE status = 'paid' {clause}
+        GROUP BY {paid_day}
+        """,
+        params,
+    ):
+        _add(out, (_day(day), "paid_fine_amount"), flt(amount))
+
+    return out
+
+
+def computed_titles(from_date=None, to_date=None):
+    """({(ngày mượn, tên chuẩn hoá): lượt}, {tên chuẩn hoá: (book_title, title_id, library_code)})."""
+    clause, params = _range_clause("t.borrow_date", from_date, to_date)
+    deltas, info = {}, {}
+    for day, book_title, title_id, library_code, n in frappe.db.sql(
+        f"""
+        SELECT t.borrow_date, TRIM(ti.book_title), MAX(bc.title_id), MAX(lt.library_code), COUNT(*)
+        FROM `tab{TRANSACTION_ITEM_DTYPE}` ti
+        INNER JOIN `tab{TRANSACTION_DTYPE}` t ON t.name = ti.parent
+        LEFT JOIN `tab{COPY_DTYPE}` bc ON bc.generated_code = ti.book_copy_id
+        LEFT JOIN `tab{TITLE_DTYPE}` lt ON lt.name = bc.title_id
+        WHERE t.borrow_date IS NOT NULL AND TRIM(COALESCE(ti.book_title, '')) != '' {clause}
+        GROUP BY t.borrow_date, TRIM(ti.book_title)
+        """,
+        params,
+    ):
+        key = normalize_title_key(book_title)
+        if not key:
+            continue
+        _add(deltas, (_day(day), key), n)
+        current = info.get(key)
+        if current is None:
+            info[key] = (book_title.strip(), title_id or "", library_code or "")
+        else:
+            info[key] = (current[0], current[1] or title_id or "", current[2] or library_code or "")
+    return deltas, info
+
+
+def rebuild(from_date=None, to_date=None):
+    """Ghi đè bảng tổng hợp (toàn bộ, hoặc khoảng ngày) bằng số tính lại từ dữ liệu gốc."""
+    clause, params = _range_clause("report_date", from_date, to_date)
+    frappe.db.sql(f"DELETE FROM `{DAILY_TABLE}` WHERE 1=1 {clause}", params)
+    frappe.db.sql(f"DELETE FROM `{TITLE_STAT_TABLE}` WHERE 1=1 {clause}", params)
+    daily = computed_daily(from_date, to_date)
+    bump_daily(daily)
+    title_deltas, info = computed_titles(from_date, to_date)
+    bump_titles(title_deltas, info)
+    frappe.db.commit()
+    return {"days": len(rows_by_day(daily)), "title_rows": len(title_deltas)}
+
+
+# ---------------------------------------------------------------------------
+# Đọc
+# ---------------------------------------------------------------------------
+
+
+def daily_rows(from_date, to_date):
+    """{ngày: dòng bảng ngày} trong khoảng — tối đa một dòng / ngày."""
+    rows = frappe.db.sql(
+        f"""
+        SELECT report_date, {", ".join(DAILY_COLUMNS)}
+        FROM `{DAILY_TABLE}` WHERE report_date BETWEEN %s AND %s
+        """,
+        (from_date, to_date),
+        as_dict=True,
+    )
+    return {str(r.report_date): r for r in rows}
+
+
+def daily_totals(from_date=None, to_date=None):
+    """Tổng các cột bảng ngày trong khoảng (cho phép mở một đầu)."""
+    clause, params = _range_clause("report_date", from_date, to_date)
+    row = frappe.db.sql(
+        f"""
+        SELECT {", ".join(f"COALESCE(SUM({c}), 0) AS {c}" for c in DAILY_COLUMNS)}
+        FROM `{DAILY_TABLE}` WHERE 1=1 {clause}
+        """,
+        params,
+        as_dict=True,
+    )
+    return row[0] if row else frappe._dict({c: 0 for c in DAILY_COLUMNS})
+
+
+def top_titles(from_date=None, to_date=None, limit=100, offset=0):
+    """(items, total) top sách mượn nhiều nhất trong khoảng, gom theo tên chuẩn hoá."""
+    clause, params = _range_clause("report_date", from_date, to_date)
+    total = frappe.db.sql(
+        f"""
+        SELECT COUNT(*) FROM (
+            SELECT title_hash FROM `{TITLE_STAT_TABLE}` WHERE 1=1 {clause}
+            GROUP BY title_hash HAVING SUM(borrow_count) > 0
+        ) ranked
+        """,
+        params,
+    )[0][0]
+    items = frappe.db.sql(
+        f"""
+        SELECT
+            MAX(title_id) AS title_id,
+            MAX(library_code) AS library_code,
+            MAX(book_title) AS book_title,
+            SUM(borrow_count) AS borrow_count
+        FROM `{TITLE_STAT_TABLE}` WHERE 1=1 {clause}
+        GROUP BY title_hash
+        HAVING borrow_count > 0
+        ORDER BY borrow_count DESC, book_title
+        LIMIT %s OFFSET %s
+        """,
+        [*params, int(limit), int(offset)],
+        as_dict=True,
+    )
+    for item in items:
+        item.borrow_count = int(item.borrow_count or 0)
+        item.title_id = item.title_id or ""
+        item.library_code = item.library_code or ""
+    return items, int(total or 0)
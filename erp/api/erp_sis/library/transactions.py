@@ -20,6 +20,7 @@ from ._constants import (
 from ._common import _require_library_role, _get_json_payload, _parse_date, _log_library_activity
 from .settings import _get_library_settings
 from .fines import _create_fine_if_needed, _resolve_return_fine_amount, _get_book_copy_cover_price
+from .rollup import apply_status_changes
 
 def _get_user_employee_code(user_id: str) -> str:
     """Lấy mã nhân viên từ User (custom field employee_code)."""
@@ -86,33 +87,36 @@ def _find_active_transaction_for_copy(book_copy_id: str):
         "parent",
     )
 
+CLOSED_ITEM_STATUSES = ("returned", "lost", "damaged")
+OPEN_ITEM_STATUSES = ("borrowing", "overdue")
+
+
+def _transaction_status(items, today):
+    """Status phiếu mượn suy từ items (None nếu phiếu chưa có item).
+
+    Cùng quy tắc với CASE trong `_TX_STATUS_SQL` — sửa một chỗ thì sửa cả hai.
+    """
+    if not items:
+        return None
+    statuses = {item.get("status") for item in items}
+    if not statuses - set(CLOSED_ITEM_STATUSES):
+        return "returned"
+    any_overdue = any(
+        item.get("due_date")
+        and getdate(item.get("due_date")) < today
+        and item.get("status") in OPEN_ITEM_STATUSES
+        for item in items
+    )
+    if any_overdue:
+        return "overdue"
+    return "borrowing" if statuses.isdisjoint(CLOSED_ITEM_STATUSES) else "partial_return"
+
+
 def _sync_transaction_status(transaction_doc):
     """Cập nhật status của transaction dựa trên items."""
-    if not transaction_doc.items:
-        return
-    statuses = {item.status for item in transaction_doc.items}
-    active = statuses - {"returned", "lost", "damaged"}
-    if not active:
-        transaction_doc.status = "returned"
-    elif active == statuses:
-        today = getdate(nowdate())
-        any_overdue = any(
-            item.due_date
-            and getdate(item.due_date) < today
-            and item.status in {"borrowing", "overdue"}
-            for item in transaction_doc.items
-        )
-        transaction_doc.status = "overdue" if any_overdue else "borrowing"
-    else:
-        today = getdate(nowdate())
-        open_items = [
-            item for item in transaction_doc.items if item.status not in {"returned", "lost", "damaged"}
-        ]
-        any_overdue = any(
-            item.due_date and getdate(item.due_date) < today and item.status in {"borrowing", "overdue"}
-            for item in open_items
-        )
-        transaction_doc.status = "overdue" if any_overdue else "partial_return"
+    status = _transaction_status(transaction_doc.items, getdate(nowdate()))
+    if status:
+        transaction_doc.status = status
 
 
 def _create_transaction_internal(
@@ -293,42 +297,116 @@ def _return_items_internal(tx_id: str, return_items: List[Dict[str, Any]]):
     return {"success_count": updated, "errors": errors}
 
 
+# Status mới của từng phiếu đang mở, tính gộp từ items (khớp `_transaction_status`).
+_TX_STATUS_SQL = """
+    SELECT t.name, t.borrow_date, t.status AS old_status,
+        CASE
+            WHEN SUM(IFNULL(i.status, '') NOT IN ('returned', 'lost', 'damaged')) = 0 THEN 'returned'
+            WHEN SUM(i.status IN ('borrowing', 'overdue') AND i.due_date < %(today)s) > 0 THEN 'overdue'
+            WHEN SUM(i.status IN ('returned', 'lost', 'damaged')) = 0 THEN 'borrowing'
+            ELSE 'partial_return'
+        END AS new_status
+    FROM `tabSIS Library Transaction` t
+    JOIN `tabSIS Library Transaction Item` i
+        ON i.parent = t.name AND i.parenttype = 'SIS Library Transaction'
+    WHERE t.status IN ('borrowing', 'overdue', 'partial_return')
+    GROUP BY t.name, t.borrow_date, t.status
+"""
+
+
+# Hook đã được sync_overdue_status xử lý set-based — không gọi lại theo từng phiếu
+_SET_BASED_TX_HOOKS = {"erp.api.erp_sis.library.rollup.on_transaction_change"}
+
+
+def _tx_doc_handlers():
+    """(method, handler) on_update/on_change đang gắn cho phiếu mượn trong hooks, trừ hook set-based."""
+    events = frappe.get_hooks("doc_events") or {}
+    out = []
+    for method in ("on_update", "on_change"):
+        for doctype in (TRANSACTION_DTYPE, "*"):
+            handlers = (events.get(doctype) or {}).get(method) or []
+            if isinstance(handlers, str):
+                handlers = [handlers]
+            out.extend((method, h) for h in handlers if h not in _SET_BASED_TX_HOOKS)
+    return out
+
+
 def sync_overdue_status():
-    """Đồng bộ trạng thái quá hạn — gọi từ cron hoặc thủ công."""
-    today = getdate(nowdate())
-    overdue_items = frappe.db.sql(
+    """Đồng bộ trạng thái quá hạn — gọi từ cron hoặc thủ công.
+
+    Set-based: một UPDATE JOIN cho bản sao, một UPDATE cho item, một UPDATE gộp cho phiếu —
+    không save từng doc. Hook doc event còn lại (nếu có) chạy một lần cho mỗi phiếu đổi status.
+    """
+    params = {"today": getdate(nowdate()), "now": now(), "user": frappe.session.user}
+
+    overdue_count = frappe.db.sql(
         """
-        SELECT name, parent, book_copy_id, due_date
-        FROM `tabSIS Library Transaction Item`
-        WHERE status = 'borrowing' AND due_date IS NOT NULL AND due_date < %s
+        SELECT COUNT(*) FROM `tabSIS Library Transaction Item`
+        WHERE parenttype = 'SIS Library Transaction'
+            AND status = 'borrowing' AND due_date IS NOT NULL AND due_date < %(today)s
         """,
-        today,
-        as_dict=True,
+        params,
+    )[0][0]
+
+    # Bản sao của mọi item còn mở đã quá hạn: status + số ngày quá hạn (cập nhật lại mỗi ngày).
+    frappe.db.sql(
+        """
+        UPDATE `tabSIS Library Book Copy` c
+        JOIN `tabSIS Library Transaction Item` i ON i.book_copy_id = c.generated_code
+        SET c.status = 'overdue',
+            c.overdue_days = DATEDIFF(%(today)s, i.due_date),
+            c.modified = %(now)s,
+            c.modified_by = %(user)s
+        WHERE i.parenttype = 'SIS Library Transaction'
+            AND i.status IN ('borrowing', 'overdue')
+            AND i.due_date IS NOT NULL AND i.due_date < %(today)s
+            AND (IFNULL(c.status, '') != 'overdue'
+                OR IFNULL(c.overdue_days, 0) != DATEDIFF(%(today)s, i.due_date))
+        """,
+        params,
     )
 
-    tx_ids = set()
-    for item in overdue_items:
-        frappe.db.set_value(TRANSACTION_ITEM_DTYPE, item.name, "status", "overdue", update_modified=False)
-        tx_ids.add(item.parent)
-        try:
-            copy_doc = frappe.get_doc(COPY_DTYPE, {"generated_code": item.book_copy_id})
-            copy_doc.status = "overdue"
-            delta = (today - getdate(item.due_date)).days
-            copy_doc.overdue_days = max(delta, 0)
-            copy_doc.save(ignore_permissions=True)
-        except Exception as ex:
-            frappe.log_error(f"sync_overdue_status: copy {item.book_copy_id} failed: {ex}")
+    if overdue_count:
+        frappe.db.sql(
+            """
+            UPDATE `tabSIS Library Transaction Item`
+            SET status = 'overdue'
+            WHERE parenttype = 'SIS Library Transaction'
+                AND status = 'borrowing' AND due_date IS NOT NULL AND due_date < %(today)s
+            """,
+            params,
+        )
 
-    for tx_id in tx_ids:
-        try:
-            tx = frappe.get_doc(TRANSACTION_DTYPE, tx_id)
-            _sync_transaction_status(tx)
-            tx.save(ignore_permissions=True)
-        except Exception as ex:
-            frappe.log_error(f"sync_overdue_status: tx {tx_id} failed: {ex}")
+    changed = frappe.db.sql(
+        f"SELECT name, borrow_date, old_status, new_status FROM ({_TX_STATUS_SQL}) s WHERE new_status != old_status",
+        params,
+        as_dict=True,
+    )
+    if changed:
+        frappe.db.sql(
+            f"""
+            UPDATE `tabSIS Library Transaction` t
+            JOIN ({_TX_STATUS_SQL}) s ON s.name = t.name
+            SET t.status = s.new_status, t.modified = %(now)s, t.modified_by = %(user)s
+            WHERE t.status != s.new_status
+            """,
+            params,
+        )
+        # UPDATE hàng loạt không chạy doc hook -> tự cộng delta bảng tổng hợp báo cáo
+        apply_status_changes(changed)
+
+    handlers = _tx_doc_handlers() if changed else []
+    if handlers:
+        for row in changed:
+            try:
+                tx = frappe.get_doc(TRANSACTION_DTYPE, row.name)
+                for method, handler in handlers:
+                    frappe.get_attr(handler)(tx, method)
+            except Exception as ex:
+                frappe.log_error(f"sync_overdue_status: tx {row.name} hooks failed: {ex}")
 
     frappe.db.commit()
-    return len(overdue_items)
+    return overdue_count
 
 
 @frappe.whitelist(allow_guest=False)
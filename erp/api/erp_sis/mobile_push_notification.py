@@ -920,8 +920,6 @@ def _build_expo_message(token_doc, title, body, data):
 
 # Expo Push API giới hạn 100 messages/POST
 EXPO_BATCH_SIZE = 100
-EXPO_POST_TIMEOUT = 5  # giây — giảm từ 10s
-EXPO_POST_RETRIES = 1  # retry thêm 1 lần khi lỗi mạng / 429 / 5xx
 
 
 def _expo_request_headers():
@@ -967,9 +965,11 @@ def _deactivate_unregistered_tokens(tokens):
 
 def _post_expo_batch(messages):
     """
-    POST danh sách messages tới Expo theo BATCH (max 100/POST).
+    POST danh sách messages tới Expo theo BATCH (max 100/POST), các lô gửi song song
+    qua session keep-alive (xem expo_push.py).
     Expo trả per-message status → parse và đếm success/failed riêng.
-    Token bị Expo báo DeviceNotRegistered sẽ được deactivate trong DB.
+    Token bị Expo báo DeviceNotRegistered sẽ được deactivate trong DB; ticket "ok"
+    được hẹn poll receipt nền.
     """
     if not messages:
         return {
@@ -981,91 +981,22 @@ def _post_expo_batch(messages):
             "failed_count": 0,
         }
     
-    import time
-    import requests
-    
-    success_count = 0
-    failed_count = 0
-    results = []
-    unregistered_tokens = []
-    
-    for chunk_start in range(0, len(messages), EXPO_BATCH_SIZE):
-        chunk = messages[chunk_start:chunk_start + EXPO_BATCH_SIZE]
-        try:
-            response = None
-            for attempt in range(EXPO_POST_RETRIES + 1):
-                try:
-                    response = requests.post(
-                        "https://exp.host/--/api/v2/push/send",
-                        json=chunk,
-                        headers=_expo_request_headers(),
-                        timeout=EXPO_POST_TIMEOUT,
-                    )
-                    # 429 / 5xx: thử lại 1 lần sau khoảng nghỉ ngắn
-                    if response.status_code in (429, 500, 502, 503, 504) and attempt < EXPO_POST_RETRIES:
-                        time.sleep(1)
-                        continue
-                    break
-                except requests.RequestException:
-                    if attempt < EXPO_POST_RETRIES:
-                        time.sleep(1)
-                        continue
-                    raise
-            
-            if response.status_code == 200:
-                resp_json = response.json()
-                # Expo trả {"data": [...]} với mỗi item là kết quả của 1 message
-                tickets = resp_json.get("data", [])
-                if not isinstance(tickets, list):
-                    tickets = [tickets]
-                
-                for idx, ticket in enumerate(tickets):
-                    if idx >= len(chunk):
-                        break
-                    target_token = chunk[idx].get("to")
-                    if isinstance(ticket, dict) and ticket.get("status") == "ok":
-                        success_count += 1
-                        results.append({"token": target_token, "status": "success"})
-                    else:
-                        failed_count += 1
-                        results.append({
-                            "token": target_token,
-                            "status": "failed",
-                            "error": ticket if isinstance(ticket, dict) else str(ticket),
-                        })
-                        # DeviceNotRegistered: app đã gỡ / token hết hạn → deactivate
-                        if isinstance(ticket, dict):
-                            err_code = (ticket.get("details") or {}).get("error")
-                            if err_code == "DeviceNotRegistered" and target_token:
-                                unregistered_tokens.append(target_token)
-                
-                # Trường hợp số ticket < số messages → đánh dấu các message còn lại là failed
-                for idx in range(len(tickets), len(chunk)):
-                    failed_count += 1
-                    results.append({
-                        "token": chunk[idx].get("to"),
-                        "status": "failed",
-                        "error": "No ticket returned",
-                    })
-            else:
-                # HTTP fail → đánh dấu cả batch là failed
-                for msg in chunk:
-                    failed_count += 1
-                    results.append({
-                        "token": msg.get("to"),
-                        "status": "failed",
-                        "http_code": response.status_code,
-                    })
-        except Exception as e:
-            for msg in chunk:
-                failed_count += 1
-                results.append({
-                    "token": msg.get("to"),
-                    "status": "error",
-                    "error": str(e),
-                })
-    
-    _deactivate_unregistered_tokens(unregistered_tokens)
+    from erp.api.erp_sis import expo_push
+
+    chunks = [
+        messages[chunk_start:chunk_start + EXPO_BATCH_SIZE]
+        for chunk_start in range(0, len(messages), EXPO_BATCH_SIZE)
+    ]
+    # URL / header lấy ở luồng chính — luồng gửi song song không đụng frappe
+    outcomes = expo_push.post_chunks(chunks, expo_push.push_url(), _expo_request_headers())
+    summary = expo_push.summarize(chunks, outcomes)
+    success_count = summary.success_count
+    failed_count = summary.failed_count
+    results = summary.results
+
+    # DeviceNotRegistered: app đã gỡ / token hết hạn → deactivate một lần cho cả đợt
+    _deactivate_unregistered_tokens(summary.unregistered)
+    expo_push.queue_receipts(summary.tickets)
 
     msg_summary = f"Sent to {success_count}/{len(messages)} devices successfully"
     if failed_count > 0:
@@ -98,7 +98,38 @@ def _resolve_campus_id(campus_id):
     return None
 
 
-def _auto_create_student_records(config_id, source_school_year_id, campus_id, logs=None, finance_year_id=None):
+# Series đặt tên đơn (khớp autoname "format:SIS-REENROLL-{#####}" của DocType)
+RE_ENROLLMENT_SERIES = "SIS-REENROLL-"
+RE_ENROLLMENT_SERIES_DIGITS = 5
+# Số dòng mỗi câu INSERT/UPDATE/DELETE nhiều dòng
+RE_ENROLLMENT_BULK_CHUNK = 500
+# Cột ghi khi tạo đơn trắng hàng loạt — phần còn lại để mặc định của bảng
+RE_ENROLLMENT_INSERT_COLUMNS = (
+    "name", "creation", "modified", "modified_by", "owner", "docstatus", "idx",
+    "config_id", "student_id", "student_name", "student_code", "current_class",
+    "campus_id", "finance_student_id", "guardian_id", "guardian_name",
+    "payment_status", "dvhs_payment_status", "agreement_accepted",
+)
+# Đầu câu INSERT — cột viết tường minh (khớp RE_ENROLLMENT_INSERT_COLUMNS) để
+# lint_campus_raw_insert thấy campus_id; campus lấy theo CRM Student, rơi về campus đợt
+_RE_ENROLLMENT_INSERT_SQL = """
+    INSERT INTO `tabSIS Re-enrollment` (
+        `name`, `creation`, `modified`, `modified_by`, `owner`, `docstatus`, `idx`,
+        `config_id`, `student_id`, `student_name`, `student_code`, `current_class`,
+        `campus_id`, `finance_student_id`, `guardian_id`, `guardian_name`,
+        `payment_status`, `dvhs_payment_status`, `agreement_accepted`
+    ) VALUES
+"""
+RE_ENROLLMENT_CHILD_TABLES = ("SIS Re-enrollment Answer", "SIS Re-enrollment Note")
+
+
+def _report_progress(progress, percentage, message):
+    """Gọi callback tiến độ (nếu có) — chạy trong background job."""
+    if progress:
+        progress(percentage, message)
+
+
+def _auto_create_student_records(config_id, source_school_year_id, campus_id, logs=None, finance_year_id=None, progress=None):
     """
     Tự động tạo re-enrollment records cho tất cả học sinh.
     Có thể lấy từ SIS Class Student hoặc SIS Finance Student.
@@ -109,15 +140,22 @@ def _auto_create_student_records(config_id, source_school_year_id, campus_id, lo
         campus_id: Campus ID
         logs: List để ghi log
         finance_year_id: (Optional) Nếu có, lấy học sinh từ SIS Finance Student thay vì SIS Class Student
+        progress: (Optional) callback(percentage, message) khi chạy trong background job
     
     Điều kiện:
         - Nếu finance_year_id: lấy từ SIS Finance Student
         - Nếu không: lấy từ SIS Class Student với school_year = source_school_year_id
+
+    Chạy theo tập: đọc đơn đã có của đợt 1 lần, INSERT nhiều dòng cho đơn mới, UPDATE
+    CASE cho bản sao đã đổi, DELETE theo IN cho đơn lớp 12 — số query không tăng theo
+    số học sinh.
     """
     if logs is None:
         logs = []
     
     created_count = 0
+    deleted_count = 0
+    updated_count = 0
     
     try:
         students = []
@@ -136,11 +174,11 @@ def _auto_create_student_records(config_id, source_school_year_id, campus_id, lo
             
             if not finance_year:
                 logs.append(f"Không tìm thấy năm tài chính: {finance_year_id}")
-                return 0
+                return {"created_count": 0, "deleted_count": 0, "updated_count": 0}
             
             if finance_year.campus_id != campus_id:
                 logs.append(f"Năm tài chính không thuộc campus {campus_id}")
-                return 0
+                return {"created_count": 0, "deleted_count": 0, "updated_count": 0}
             
             # Lấy học sinh từ SIS Finance Student - loại trừ lớp 12
             # JOIN với SIS Class Student để kiểm tra grade_code
@@ -149,6 +187,7 @@ def _auto_create_student_records(config_id, source_school_year_id, campus_id, lo
                     fs.student_id,
                     s.student_name,
                     s.student_code,
+                    s.campus_id as student_campus_id,
                     fs.class_title,
                     fs.name as finance_student_id
                 FROM `tabSIS Finance Student` fs
@@ -178,6 +217,7 @@ def _auto_create_student_records(config_id, source_school_year_id, campus_id, lo
                     cs.student_id,
                     s.student_name,
                     s.student_code,
+                    s.campus_id as student_campus_id,
                     c.name as class_name,
                     c.title as class_title
                 FROM `tabSIS Class Student` cs
@@ -195,12 +235,13 @@ def _auto_create_student_records(config_id, source_school_year_id, campus_id, lo
             }, as_dict=True)
             
             logs.append(f"Tìm thấy {len(students)} học sinh đã xếp lớp (đã loại bỏ lớp 12)")
+
+        _report_progress(progress, 15, f"Đã tải {len(students)} học sinh nguồn")
         
         # Xóa học sinh lớp 12 đã có trong config (chưa submit)
         # Chỉ xóa những record chưa có decision để không mất dữ liệu đã submit
-        deleted_count = 0
         grade12_records = frappe.db.sql("""
-            SELECT re.name, re.student_code, re.current_class
+            SELECT re.name
             FROM `tabSIS Re-enrollment` re
             WHERE re.config_id = %(config_id)s
               AND (re.decision IS NULL OR re.decision = '')
@@ -218,83 +259,69 @@ def _auto_create_student_records(config_id, source_school_year_id, campus_id, lo
         """, {
             "config_id": config_id,
             "school_year_id": source_school_year_id
-        }, as_dict=True)
-        
-        for record in grade12_records:
-            try:
-                frappe.delete_doc("SIS Re-enrollment", record.name, ignore_permissions=True, force=True)
-                deleted_count += 1
-            except Exception as e:
-                logs.append(f"Lỗi xóa record lớp 12 {record.student_code}: {str(e)}")
+        })
         
+        deleted_count = _delete_re_enrollments([row[0] for row in grade12_records])
         if deleted_count > 0:
             logs.append(f"Đã xóa {deleted_count} học sinh lớp 12 (chưa submit)")
+        _report_progress(progress, 25, f"Đã xóa {deleted_count} đơn lớp 12")
         
         # Lấy sẵn guardian cho tất cả học sinh (key_person = 1) để tránh N+1 query
-        student_ids = [s.student_id for s in students]
+        student_ids = list({s.student_id for s in students})
         guardian_map = {}
-        if student_ids:
+        for chunk in _chunks(student_ids, RE_ENROLLMENT_BULK_CHUNK):
             guardian_rows = frappe.db.sql("""
-                SELECT fr.student, fr.guardian
+                SELECT fr.student, fr.guardian, g.guardian_name
                 FROM `tabCRM Family Relationship` fr
+                LEFT JOIN `tabCRM Guardian` g ON g.name = fr.guardian
                 WHERE fr.student IN %(student_ids)s
                   AND fr.key_person = 1
-            """, {"student_ids": student_ids}, as_dict=True)
+            """, {"student_ids": chunk}, as_dict=True)
             for row in guardian_rows:
-                guardian_map[row.student] = row.guardian
+                guardian_map[row.student] = (row.guardian, row.guardian_name)
+
+        # Đơn đã có của đợt — 1 query thay cho frappe.db.exists từng học sinh
+        existing = {
+            row.student_id: row
+            for row in frappe.db.sql("""
+                SELECT name, student_id, student_code, student_name, current_class,
+                    finance_student_id, guardian_id, guardian_name
+                FROM `tabSIS Re-enrollment`
+                WHERE config_id = %(config_id)s
+            """, {"config_id": config_id}, as_dict=True)
+        }
 
-        # Tạo records cho từng học sinh
-        updated_count = 0
-        for student in students:
-            try:
-                # Kiểm tra đã có record chưa
-                existing = frappe.db.exists("SIS Re-enrollment", {
-                    "config_id": config_id,
-                    "student_id": student.student_id
-                })
+        new_students, updates = _plan_student_records(students, existing, guardian_map)
+        _report_progress(
+            progress, 35, f"Cần tạo {len(new_students)} đơn, cập nhật {len(updates)} đơn"
+        )
 
-                if existing:
-                    # Đơn đã có → cập nhật lại thông tin sao chép từ CRM Student
-                    # (mã học sinh / tên / lớp có thể đã đổi sau khi đơn được tạo)
-                    updated_count += _refresh_student_snapshot(
-                        existing,
-                        student,
-                        guardian_map.get(student.student_id),
-                        logs
-                    )
-                    continue
+        created_count = _bulk_insert_re_enrollments(
+            config_id, campus_id, new_students, guardian_map, progress=progress
+        )
 
-                # Tạo record mới (chưa có decision, chưa submit)
-                key_guardian = guardian_map.get(student.student_id)
-                re_doc = frappe.get_doc({
-                    "doctype": "SIS Re-enrollment",
-                    "config_id": config_id,
-                    "student_id": student.student_id,
-                    "student_name": student.student_name,
-                    "student_code": student.student_code,
-                    "current_class": student.class_title or student.class_name,
-                    "campus_id": campus_id,
-                    "finance_student_id": student.get("finance_student_id"),
-                    "guardian_id": key_guardian or None,
-                    # Không set status — cột đã bỏ khỏi DocType SIS Re-enrollment
-                })
-                # Skip validation thời gian khi admin tạo records
-                re_doc.flags.skip_config_validation = True
-                re_doc.insert(ignore_permissions=True)
-                created_count += 1
-                
-            except Exception as e:
-                logs.append(f"Lỗi tạo record cho {student.student_code}: {str(e)}")
-                continue
+        # Đơn đã có → cập nhật lại thông tin sao chép từ CRM Student
+        # (mã học sinh / tên / lớp có thể đã đổi sau khi đơn được tạo)
+        updated_count = _bulk_update_snapshots(updates)
+        old_codes = {row.name: row.student_code for row in existing.values()}
+        for re_name, changes in updates.items():
+            if "student_code" in changes:
+                logs.append(
+                    f"Cập nhật mã học sinh: {old_codes.get(re_name) or '(trống)'} → {changes['student_code']} ({re_name})"
+                )
 
         if updated_count > 0:
             logs.append(f"Đã cập nhật lại thông tin cho {updated_count} đơn đã có")
+        _report_progress(progress, 95, f"Đã cập nhật {updated_count} đơn đã có")
 
         frappe.db.commit()
 
     except Exception as e:
+        # Chưa commit gì — rollback để số liệu trả về khớp với DB
+        frappe.db.rollback()
         logs.append(f"Lỗi auto-create records: {str(e)}")
         frappe.log_error(frappe.get_traceback(), "Auto Create Re-enrollment Records Error")
+        created_count = 0
         deleted_count = 0
         updated_count = 0
 
@@ -305,8 +332,13 @@ def _auto_create_student_records(config_id, source_school_year_id, campus_id, lo
     }
 
 
-def _refresh_student_snapshot(re_name, student, key_guardian, logs):
-    """Cập nhật lại thông tin học sinh đã sao chép sang đơn tái ghi danh.
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _snapshot_updates(current, student, guardian=None):
+    """Các field bản sao thông tin học sinh cần ghi đè lên đơn tái ghi danh đã có.
 
     student_code / student_name / current_class trên SIS Re-enrollment là bản sao tại
     thời điểm tạo đơn (fetch_from chỉ chạy khi lưu doc), nên khi CRM Student đổi Mã học
@@ -314,51 +346,211 @@ def _refresh_student_snapshot(re_name, student, key_guardian, logs):
 
     Không đụng tới quyết định / thông tin phụ huynh đã nhập.
 
+    Args:
+        current: dict các field hiện tại của đơn
+        student: dòng học sinh nguồn
+        guardian: (guardian_id, guardian_name) của phụ huynh chính, hoặc None
+
     Returns:
-        1 nếu có thay đổi, 0 nếu không.
+        dict {field: giá trị mới} — rỗng nếu không đổi gì.
     """
-    current = frappe.db.get_value(
-        "SIS Re-enrollment",
-        re_name,
-        ["student_code", "student_name", "current_class", "finance_student_id", "guardian_id"],
-        as_dict=True
-    )
-    if not current:
-        return 0
-
     updates = {}
 
-    if student.get("student_code") and current.student_code != student.get("student_code"):
+    if student.get("student_code") and current.get("student_code") != student.get("student_code"):
         updates["student_code"] = student.get("student_code")
 
-    if student.get("student_name") and current.student_name != student.get("student_name"):
+    if student.get("student_name") and current.get("student_name") != student.get("student_name"):
         updates["student_name"] = student.get("student_name")
 
     new_class = student.get("class_title") or student.get("class_name")
-    if new_class and current.current_class != new_class:
+    if new_class and current.get("current_class") != new_class:
         updates["current_class"] = new_class
 
     # Các link chỉ điền khi đang trống — không ghi đè dữ liệu admin đã gán
     finance_student_id = student.get("finance_student_id")
-    if finance_student_id and not current.finance_student_id:
+    if finance_student_id and not current.get("finance_student_id"):
         updates["finance_student_id"] = finance_student_id
 
-    if key_guardian and not current.guardian_id:
-        updates["guardian_id"] = key_guardian
+    guardian_id, guardian_name = guardian or (None, None)
+    if guardian_id and not current.get("guardian_id"):
+        updates["guardian_id"] = guardian_id
+        if guardian_name:
+            updates["guardian_name"] = guardian_name
 
-    if not updates:
-        return 0
+    return updates
 
-    # Dùng db.set_value để không chạy lại validate (đợt có thể đã đóng) và không
-    # đánh dấu "admin đã sửa" cho đơn phụ huynh đã nộp
-    frappe.db.set_value("SIS Re-enrollment", re_name, updates, update_modified=False)
 
-    if "student_code" in updates:
-        logs.append(
-            f"Cập nhật mã học sinh: {current.student_code or '(trống)'} → {updates['student_code']} ({re_name})"
+def _plan_student_records(students, existing, guardian_map):
+    """Chia học sinh nguồn thành đơn cần tạo và đơn cần cập nhật bản sao.
+
+    Args:
+        students: dòng học sinh nguồn (student_id, student_code, ...)
+        existing: {student_id: dict đơn đã có của đợt (có name)}
+        guardian_map: {student_id: (guardian_id, guardian_name)}
+
+    Returns:
+        (new_students, updates) — updates: {tên đơn: {field: giá trị}}.
+        Học sinh lặp lại trong danh sách nguồn chỉ tính lần đầu.
+    """
+    new_students = []
+    updates = {}
+    seen = set()
+    for student in students:
+        student_id = student.get("student_id")
+        if not student_id or student_id in seen:
+            continue
+        seen.add(student_id)
+
+        current = existing.get(student_id)
+        if not current:
+            new_students.append(student)
+            continue
+
+        changes = _snapshot_updates(current, student, guardian_map.get(student_id))
+        if changes:
+            updates[current["name"]] = changes
+    return new_students, updates
+
+
+def _new_record_values(name, config_id, campus_id, student, guardian, timestamp, user):
+    """Giá trị 1 dòng INSERT đơn trắng, theo thứ tự RE_ENROLLMENT_INSERT_COLUMNS.
+
+    Giống SISReenrollment.validate khi tạo qua doc: campus lấy theo CRM Student (rơi về
+    campus của đợt), chưa có decision nên không set submitted_at.
+    """
+    guardian_id, guardian_name = guardian or (None, None)
+    return (
+        name, timestamp, timestamp, user, user, 0, 0,
+        config_id,
+        student.get("student_id"),
+        student.get("student_name"),
+        student.get("student_code"),
+        student.get("class_title") or student.get("class_name"),
+        student.get("student_campus_id") or campus_id,
+        student.get("finance_student_id"),
+        guardian_id or None,
+        guardian_name if guardian_id else None,
+        "unpaid", "unpaid", 0,
+    )
+
+
+def _series_names(prefix, start, count, digits=RE_ENROLLMENT_SERIES_DIGITS):
+    """Tên `count` đơn kế tiếp sau số `start` của series (giống frappe getseries)."""
+    return [f"{prefix}{n:0{digits}d}" for n in range(start + 1, start + count + 1)]
+
+
+def _reserve_series_names(count):
+    """Giữ trước `count` số liên tiếp của series SIS-REENROLL- với 1 lần khoá dòng tabSeries."""
+    if count <= 0:
+        return []
+    row = frappe.db.sql(
+        "SELECT `current` FROM `tabSeries` WHERE `name` = %s FOR UPDATE", (RE_ENROLLMENT_SERIES,)
+    )
+    if row:
+        start = int(row[0][0] or 0)
+        frappe.db.sql(
+            "UPDATE `tabSeries` SET `current` = %s WHERE `name` = %s",
+            (start + count, RE_ENROLLMENT_SERIES),
+        )
+    else:
+        start = 0
+        frappe.db.sql(
+            "INSERT INTO `tabSeries` (`name`, `current`) VALUES (%s, %s)",
+            (RE_ENROLLMENT_SERIES, count),
+        )
+    return _series_names(RE_ENROLLMENT_SERIES, start, count)
+
+
+def _bulk_insert_re_enrollments(config_id, campus_id, students, guardian_map, progress=None):
+    """Tạo đơn trắng cho `students` bằng INSERT nhiều dòng (chunk RE_ENROLLMENT_BULK_CHUNK).
+
+    Bỏ qua controller như db.set_value ở nhánh cập nhật: đơn trắng không cần
+    validate_config_active (admin tạo) và validate_duplicate đã xử lý ở bước lập kế hoạch.
+    """
+    if not students:
+        return 0
+
+    names = _reserve_series_names(len(students))
+    timestamp = now()
+    user = frappe.session.user
+    row_placeholder = "(" + ", ".join(["%s"] * len(RE_ENROLLMENT_INSERT_COLUMNS)) + ")"
+
+    created = 0
+    pairs = list(zip(names, students))
+    for chunk in _chunks(pairs, RE_ENROLLMENT_BULK_CHUNK):
+        values = []
+        for name, student in chunk:
+            values.extend(_new_record_values(
+                name, config_id, campus_id, student,
+                guardian_map.get(student.get("student_id")), timestamp, user,
+            ))
+        frappe.db.sql(
+            _RE_ENROLLMENT_INSERT_SQL + ", ".join([row_placeholder] * len(chunk)),
+            tuple(values),
+        )
+        created += len(chunk)
+        _report_progress(
+            progress, 35 + int(50 * created / len(pairs)), f"Đã tạo {created}/{len(pairs)} đơn"
         )
+    return created
 
-    return 1
+
+def _case_update_sql(updates):
+    """Câu UPDATE ... SET col = CASE name WHEN ... END cho 1 chunk {tên đơn: {field: giá trị}}.
+
+    Mỗi cột chỉ đổi ở các đơn có field đó trong updates (ELSE giữ giá trị cũ).
+    Không đổi `modified` — giống db.set_value(update_modified=False) trước đây.
+    """
+    params = {}
+    names = []
+    for i, name in enumerate(updates):
+        params[f"n{i}"] = name
+        names.append(f"%(n{i})s")
+
+    fields = sorted({field for changes in updates.values() for field in changes})
+    assignments = []
+    for field in fields:
+        cases = []
+        for i, changes in enumerate(updates.values()):
+            if field in changes:
+                params[f"v{i}_{field}"] = changes[field]
+                cases.append(f"WHEN %(n{i})s THEN %(v{i}_{field})s")
+        assignments.append(f"`{field}` = CASE name {' '.join(cases)} ELSE `{field}` END")
+
+    sql = (
+        "UPDATE `tabSIS Re-enrollment` SET "
+        + ", ".join(assignments)
+        + f" WHERE name IN ({', '.join(names)})"
+    )
+    return sql, params
+
+
+def _bulk_update_snapshots(updates):
+    """Ghi các thay đổi bản sao {tên đơn: {field: giá trị}} — 1 UPDATE mỗi chunk."""
+    items = list(updates.items())
+    for chunk in _chunks(items, RE_ENROLLMENT_BULK_CHUNK):
+        sql, params = _case_update_sql(dict(chunk))
+        frappe.db.sql(sql, params)
+    return len(items)
+
+
+def _delete_re_enrollments(names):
+    """Xoá đơn (và bảng con) theo IN — thay cho delete_doc từng đơn.
+
+    Chỉ dùng cho đơn trắng chưa có decision nên không cần on_trash / Deleted Document.
+    """
+    for chunk in _chunks(list(names), RE_ENROLLMENT_BULK_CHUNK):
+        for child in RE_ENROLLMENT_CHILD_TABLES:
+            frappe.db.sql(
+                f"""DELETE FROM `tab{child}`
+                WHERE parenttype = 'SIS Re-enrollment' AND parent IN %(names)s""",
+                {"names": chunk},
+            )
+        frappe.db.sql(
+            "DELETE FROM `tabSIS Re-enrollment` WHERE name IN %(names)s",
+            {"names": chunk},
+        )
+    return len(names)
 
 
 def _sync_not_re_enroll_to_crm_lead(submission, logs=None):
@@ -4362,6 +4554,106 @@ def import_decision_from_excel():
 
 # ==================== PAYMENT SYNC APIs ====================
 
+# Trạng thái Finance giữ nguyên khi sang Re-enrollment; còn lại (no_fee) → unpaid
+FINANCE_PAYMENT_STATUSES = ("paid", "partial", "unpaid")
+
+# Biểu thức SQL tương đương _map_payment_status (dùng trong UPDATE ... JOIN)
+_PAYMENT_STATUS_SQL = (
+    "CASE WHEN fs.payment_status IN ('paid', 'partial', 'unpaid') "
+    "THEN fs.payment_status ELSE 'unpaid' END"
+)
+
+
+def _map_payment_status(finance_status):
+    """
+    Đồng bộ chính xác payment_status từ Finance → Re-enrollment
+    Finance: paid, partial, unpaid, no_fee
+    Re-enrollment: paid, partial, unpaid, refunded
+    """
+    if finance_status in FINANCE_PAYMENT_STATUSES:
+        return finance_status
+    return 'unpaid'
+
+
+def _sync_payment_status(config_id, logs, progress=None):
+    """Đồng bộ payment_status của cả đợt bằng 1 UPDATE ... JOIN `tabSIS Finance Student`.
+
+    Trước khi UPDATE đọc 1 lần danh sách đơn có liên kết để đếm và ghi log các đơn đổi.
+
+    Returns:
+        {"synced_count", "updated_count"}
+    """
+    reenrollments = frappe.db.sql("""
+        SELECT 
+            re.name as reenrollment_id,
+            re.student_code,
+            re.payment_status as current_payment_status,
+            fs.payment_status as finance_payment_status
+        FROM `tabSIS Re-enrollment` re
+        INNER JOIN `tabSIS Finance Student` fs ON re.finance_student_id = fs.name
+        WHERE re.config_id = %(config_id)s
+          AND re.finance_student_id IS NOT NULL
+          AND re.finance_student_id != ''
+    """, {
+        "config_id": config_id
+    }, as_dict=True)
+
+    logs.append(f"Tìm thấy {len(reenrollments)} Re-enrollment có liên kết Finance Student")
+    _report_progress(progress, 40, f"Tìm thấy {len(reenrollments)} đơn có liên kết Finance Student")
+
+    changed = [
+        re for re in reenrollments
+        if re.current_payment_status != _map_payment_status(re.finance_payment_status)
+    ]
+    if changed:
+        # Không update modified — giống db.set_value(update_modified=False) trước đây
+        frappe.db.sql(f"""
+            UPDATE `tabSIS Re-enrollment` re
+            INNER JOIN `tabSIS Finance Student` fs ON re.finance_student_id = fs.name
+            SET re.payment_status = {_PAYMENT_STATUS_SQL}
+            WHERE re.config_id = %(config_id)s
+              AND re.finance_student_id IS NOT NULL
+              AND re.finance_student_id != ''
+              AND NOT (re.payment_status <=> {_PAYMENT_STATUS_SQL})
+        """, {"config_id": config_id})
+        frappe.db.commit()
+
+    for re in changed:
+        logs.append(
+            f"✓ {re.student_code}: {re.current_payment_status} → "
+            f"{_map_payment_status(re.finance_payment_status)} (Finance: {re.finance_payment_status})"
+        )
+    logs.append(f"✓ Đã đồng bộ: {len(changed)} / {len(reenrollments)} records")
+    _report_progress(progress, 95, f"Đã đồng bộ {len(changed)} trạng thái thanh toán")
+
+    return {
+        "synced_count": len(reenrollments),
+        "updated_count": len(changed)
+    }
+
+
+def _validate_payment_sync_config(config_id, logs):
+    """Kiểm tra config tồn tại và có Năm tài chính. Trả (config, error response)."""
+    config = frappe.db.get_value(
+        "SIS Re-enrollment Config",
+        config_id,
+        ["name", "finance_year_id", "title"],
+        as_dict=True
+    )
+
+    if not config:
+        return None, not_found_response(f"Không tìm thấy config: {config_id}")
+
+    if not config.finance_year_id:
+        return None, error_response(
+            "Config này không có liên kết với Năm tài chính. Không thể đồng bộ payment status.",
+            logs=logs
+        )
+
+    logs.append(f"Finance Year: {config.finance_year_id}")
+    return config, None
+
+
 @frappe.whitelist()
 def sync_payment_status(config_id):
     """
@@ -4389,110 +4681,243 @@ def sync_payment_status(config_id):
         
         logs.append(f"Đồng bộ payment status cho config: {config_id}")
         
-        # Kiểm tra config có tồn tại và có finance_year_id không
-        config = frappe.db.get_value(
-            "SIS Re-enrollment Config",
-            config_id,
-            ["name", "finance_year_id", "title"],
-            as_dict=True
-        )
+        config, error = _validate_payment_sync_config(config_id, logs)
+        if error:
+            return error
         
-        if not config:
-            return not_found_response(f"Không tìm thấy config: {config_id}")
+        result = _sync_payment_status(config_id, logs)
         
-        if not config.finance_year_id:
-            return error_response(
-                "Config này không có liên kết với Năm tài chính. Không thể đồng bộ payment status.",
+        if not result["synced_count"]:
+            return success_response(
+                data=result,
+                message="Không có Re-enrollment nào được liên kết với Finance Student",
                 logs=logs
             )
         
-        logs.append(f"Finance Year: {config.finance_year_id}")
+        return success_response(
+            data=result,
+            message=f"Đã đồng bộ {result['updated_count']} trạng thái thanh toán",
+            logs=logs
+        )
         
-        # Lấy danh sách Re-enrollment có finance_student_id (đã link với Finance Student)
-        reenrollments = frappe.db.sql("""
-            SELECT 
-                re.name as reenrollment_id,
-                re.student_code,
-                re.payment_status as current_payment_status,
-                re.finance_student_id,
-                fs.payment_status as finance_payment_status,
-                fs.total_amount,
-                fs.paid_amount
-            FROM `tabSIS Re-enrollment` re
-            INNER JOIN `tabSIS Finance Student` fs ON re.finance_student_id = fs.name
-            WHERE re.config_id = %(config_id)s
-              AND re.finance_student_id IS NOT NULL
-              AND re.finance_student_id != ''
-        """, {
-            "config_id": config_id
-        }, as_dict=True)
+    except Exception as e:
+        logs.append(f"Lỗi: {str(e)}")
+        frappe.log_error(frappe.get_traceback(), "Sync Payment Status Error")
+        return error_response(
+            message=f"Lỗi khi đồng bộ: {str(e)}",
+            logs=logs
+        )
+
+
+# ==================== BACKGROUND SYNC JOBS ====================
+
+RE_ENROLLMENT_JOB_ACTIONS = ("sync_students", "sync_payment_status")
+RE_ENROLLMENT_JOB_TTL = 86400
+
+
+def _job_cache_key(job_id):
+    return f"re_enrollment_job:{job_id}"
+
+
+def _set_job_state(job_id, state, user=None):
+    """Lưu trạng thái job vào cache (client poll qua get_sync_job_status) và đẩy realtime."""
+    state = dict(state, job_id=job_id)
+    frappe.cache().set_value(_job_cache_key(job_id), state, expires_in_sec=RE_ENROLLMENT_JOB_TTL)
+    if user:
+        frappe.publish_realtime("re_enrollment_sync_progress", state, user=user)
+
+
+def _run_sync_job(job_id, action, config_id, finance_year_id=None, user=None):
+    """Chạy sync học sinh / payment status của 1 đợt trong background, báo tiến độ qua cache."""
+    logs = []
+
+    def progress(percentage, message):
+        _set_job_state(job_id, {
+            "status": "running",
+            "action": action,
+            "config_id": config_id,
+            "percentage": percentage,
+            "message": message,
+        }, user=user)
+
+    try:
+        if user:
+            frappe.set_user(user)
+        progress(0, "Bắt đầu đồng bộ")
+
+        if action == "sync_students":
+            config = frappe.db.get_value(
+                "SIS Re-enrollment Config",
+                config_id,
+                ["source_school_year_id", "campus_id", "finance_year_id"],
+                as_dict=True
+            )
+            result = _auto_create_student_records(
+                config_id,
+                config.source_school_year_id,
+                config.campus_id,
+                logs,
+                finance_year_id=finance_year_id or config.finance_year_id,
+                progress=progress
+            )
+        else:
+            result = _sync_payment_status(config_id, logs, progress=progress)
+
+        _set_job_state(job_id, {
+            "status": "completed",
+            "action": action,
+            "config_id": config_id,
+            "percentage": 100,
+            "message": "Hoàn tất",
+            "result": result,
+            "logs": logs,
+        }, user=user)
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), f"Re-enrollment Sync Job Error - {action} - {config_id}")
+        _set_job_state(job_id, {
+            "status": "failed",
+            "action": action,
+            "config_id": config_id,
+            "error": str(e),
+            "logs": logs,
+        }, user=user)
+
+
+def _enqueue_sync_job(action, config_id, finance_year_id=None):
+    """Enqueue job sync cho 1 đợt. job_id cố định theo (action, config) nên 1 đợt chỉ
+    có 1 job cùng loại chạy tại một thời điểm (deduplicate) — tránh 2 lần tạo đơn
+    song song sinh đơn trùng."""
+    from frappe.utils.background_jobs import is_job_enqueued
+
+    job_id = f"re_enrollment_{action}_{config_id}"
+    if is_job_enqueued(job_id):
+        # Job cùng loại của đợt này đang chờ/chạy — trả job_id đó để client poll tiếp
+        return {"job_id": job_id, "status": "running", "already_running": True}
+
+    # Ghi "queued" TRƯỚC khi enqueue: worker bắt đầu là ghi đè bằng "running", không ngược lại.
+    # Không dùng enqueue_after_commit — frappe.enqueue khi đó luôn trả None.
+    state = {"status": "queued", "action": action, "config_id": config_id, "percentage": 0}
+    _set_job_state(job_id, state)
+    frappe.enqueue(
+        "erp.api.erp_sis.re_enrollment._run_sync_job",
+        queue="long",
+        timeout=3600,
+        job_id=job_id,
+        deduplicate=True,
+        action=action,
+        config_id=config_id,
+        finance_year_id=finance_year_id,
+        user=frappe.session.user,
+    )
+    return dict(state, job_id=job_id, already_running=False)
+
+
+@frappe.whitelist(allow_guest=False, methods=['POST'])
+def enqueue_sync_students():
+    """
+    Đồng bộ danh sách học sinh cho một config tái ghi danh trong background.
+    Trả về job_id để poll qua get_sync_job_status (hoặc nghe realtime
+    `re_enrollment_sync_progress`).
+    
+    POST body:
+    {
+        "config_id": "SIS-REENROLL-CFG-00001",
+        "finance_year_id": "..." (optional)
+    }
+    """
+    logs = []
+    
+    try:
+        if not _check_admin_permission():
+            return error_response("Bạn không có quyền truy cập", logs=logs)
         
-        logs.append(f"Tìm thấy {len(reenrollments)} Re-enrollment có liên kết Finance Student")
+        if frappe.request.is_json:
+            data = frappe.request.json or {}
+        else:
+            data = frappe.form_dict
         
-        if not reenrollments:
-            return success_response(
-                data={"synced_count": 0, "updated_count": 0},
-                message="Không có Re-enrollment nào được liên kết với Finance Student",
-                logs=logs
+        config_id = data.get('config_id')
+        if not config_id:
+            return validation_error_response(
+                "Thiếu config_id",
+                {"config_id": ["Config ID là bắt buộc"]}
             )
         
-        # Mapping trạng thái - giữ nguyên trạng thái
-        def map_payment_status(finance_status):
-            """
-            Đồng bộ chính xác payment_status từ Finance → Re-enrollment
-            Finance: paid, partial, unpaid, no_fee
-            Re-enrollment: paid, partial, unpaid, refunded
-            """
-            # Giữ nguyên trạng thái, chỉ chuyển no_fee → unpaid
-            if finance_status in ['paid', 'partial', 'unpaid']:
-                return finance_status
-            else:
-                # no_fee → unpaid
-                return 'unpaid'
+        if not frappe.db.exists("SIS Re-enrollment Config", config_id):
+            return not_found_response("Không tìm thấy cấu hình")
         
-        updated_count = 0
-        for re in reenrollments:
-            try:
-                # Map status
-                new_status = map_payment_status(re.finance_payment_status)
-                
-                # Chỉ update nếu status thay đổi
-                if re.current_payment_status != new_status:
-                    frappe.db.set_value(
-                        "SIS Re-enrollment",
-                        re.reenrollment_id,
-                        "payment_status",
-                        new_status,
-                        update_modified=False  # Không update modified time
-                    )
-                    updated_count += 1
-                    logs.append(
-                        f"✓ {re.student_code}: {re.current_payment_status} → {new_status} "
-                        f"(Finance: {re.finance_payment_status})"
-                    )
-                
-            except Exception as e:
-                logs.append(f"⚠️ Lỗi sync {re.student_code}: {str(e)}")
-                continue
+        job = _enqueue_sync_job("sync_students", config_id, data.get('finance_year_id'))
+        logs.append(f"Job: {job['job_id']}")
         
-        frappe.db.commit()
+        return success_response(
+            data=job,
+            message="Đang đồng bộ danh sách học sinh trong nền",
+            logs=logs
+        )
         
-        logs.append(f"✓ Đã đồng bộ: {updated_count} / {len(reenrollments)} records")
+    except Exception as e:
+        logs.append(f"Lỗi: {str(e)}")
+        frappe.log_error(frappe.get_traceback(), "Enqueue Sync Students Error")
+        return error_response(
+            message=f"Lỗi khi đồng bộ: {str(e)}",
+            logs=logs
+        )
+
+
+@frappe.whitelist(methods=['POST'])
+def enqueue_sync_payment_status(config_id):
+    """
+    Đồng bộ trạng thái thanh toán Finance Student → Re-enrollment trong background.
+    Trả về job_id để poll qua get_sync_job_status.
+    """
+    logs = []
+    
+    try:
+        if not _check_admin_permission():
+            return error_response("Bạn không có quyền đồng bộ", logs=logs)
+        
+        config, error = _validate_payment_sync_config(config_id, logs)
+        if error:
+            return error
+        
+        job = _enqueue_sync_job("sync_payment_status", config_id)
+        logs.append(f"Job: {job['job_id']}")
         
         return success_response(
-            data={
-                "synced_count": len(reenrollments),
-                "updated_count": updated_count
-            },
-            message=f"Đã đồng bộ {updated_count} trạng thái thanh toán",
+            data=job,
+            message="Đang đồng bộ trạng thái thanh toán trong nền",
             logs=logs
         )
         
     except Exception as e:
         logs.append(f"Lỗi: {str(e)}")
-        frappe.log_error(frappe.get_traceback(), "Sync Payment Status Error")
+        frappe.log_error(frappe.get_traceback(), "Enqueue Sync Payment Status Error")
         return error_response(
             message=f"Lỗi khi đồng bộ: {str(e)}",
             logs=logs
         )
 
+
+@frappe.whitelist(methods=['GET'])
+def get_sync_job_status(job_id=None):
+    """
+    Trạng thái job sync đã enqueue.
+    Trả về: {status: queued|running|completed|failed|unknown, percentage, message, result?, error?}
+    """
+    if not _check_admin_permission():
+        return error_response("Bạn không có quyền truy cập")
+    
+    job_id = job_id or frappe.form_dict.get("job_id")
+    if not job_id:
+        return validation_error_response(
+            "Thiếu job_id",
+            {"job_id": ["Job ID là bắt buộc"]}
+        )
+    
+    state = frappe.cache().get_value(_job_cache_key(job_id))
+    if not state:
+        return single_item_response(
+            {"job_id": job_id, "status": "unknown"},
+            "Không tìm thấy job (chưa chạy hoặc đã hết hạn)"
+        )
+    return single_item_response(state, "Lấy trạng thái job thành công")
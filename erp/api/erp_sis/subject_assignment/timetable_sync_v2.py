@@ -41,16 +41,9 @@ def sync_assignment_to_timetable(assignment_id: str, replace_teacher_map: dict =
 		}
 	"""
 	try:
-		assignment = frappe.get_doc("SIS Subject Assignment", assignment_id)
-		
-		# VALIDATE
-		validation = validate_assignment_for_sync(assignment)
-		if not validation["valid"]:
-			return {
-				"success": False,
-				"message": validation["error"],
-				"debug_info": [validation["error"]]
-			}
+		assignment, error = load_assignment_for_sync(assignment_id)
+		if error:
+			return error
 		
 		# ROUTE to appropriate sync function
 		if assignment.application_type == "full_year":
@@ -66,6 +59,19 @@ def sync_assignment_to_timetable(assignment_id: str, replace_teacher_map: dict =
 		}
 
 
+def load_assignment_for_sync(assignment_id: str) -> Tuple:
+	"""Load + VALIDATE assignment. Returns (assignment, None) hoặc (None, kết quả lỗi)."""
+	assignment = frappe.get_doc("SIS Subject Assignment", assignment_id)
+	validation = validate_assignment_for_sync(assignment)
+	if not validation["valid"]:
+		return None, {
+			"success": False,
+			"message": validation["error"],
+			"debug_info": [validation["error"]]
+		}
+	return assignment, None
+
+
 # ============= FULL YEAR SYNC =============
 
 def sync_full_year_assignment(assignment, replace_teacher_map: dict = None) -> Dict:
@@ -250,7 +256,7 @@ def sync_full_year_assignment(assignment, replace_teacher_map: dict = None) -> D
 
 # ============= DATE RANGE SYNC =============
 
-def sync_date_range_assignment(assignment, replace_teacher_map: dict = None) -> Dict:
+def sync_date_range_assignment(assignment, replace_teacher_map: dict = None, slot_index: Dict = None) -> Dict:
 	"""
 	Sync from_date assignment: Create override rows with ALL teachers.
 	
@@ -263,44 +269,43 @@ def sync_date_range_assignment(assignment, replace_teacher_map: dict = None) ->
 	⚡ FIX: Chỉ tạo override khi pattern row còn hiệu lực đúng ngày (valid_from/valid_to),
 	tránh dùng bản pattern cũ (cùng subject) ghi đè ô đã đổi môn trong đợt mới.
 	
-	NO MORE CONFLICTS: Since we support unlimited teachers, no conflict detection needed.
+	⚡ SET-BASED: Đọc toàn bộ override hiện có của các instance trong khoảng ngày bằng
+	một query (load_override_index), diff trong bộ nhớ (plan_override_changes), rồi ghi
+	bằng một INSERT nhiều dòng + một lần viết lại bảng con giáo viên. Có xung đột thì
+	trả về ngay — chưa ghi gì xuống DB.
 	
 	Args:
 		assignment: SIS Subject Assignment doc
-		replace_teacher_map: DEPRECATED - no longer used
+		replace_teacher_map: Optional dict for resolving teacher conflicts
+		slot_index: Index override dựng sẵn (batch_sync_assignments dùng chung cho
+		            các phân công cùng lớp); None → tự đọc
 	
-	Performance: ~200ms cho 50 override rows
+	Performance: số query cố định cho cả năm học — không tăng theo số override row
 	"""
 	debug_info = []
-	teacher_id = assignment.teacher_id
-	class_id = assignment.class_id
-	actual_subject_id = assignment.actual_subject_id
-	campus_id = assignment.campus_id
+	specs = build_date_range_specs(assignment, debug_info)
+	if isinstance(specs, dict):
+		return specs
+
+	if slot_index is None:
+		slot_index = load_override_index(specs)
+
+	return apply_date_range_specs(assignment, specs, slot_index, replace_teacher_map, debug_info)
+
+
+def build_date_range_specs(assignment, debug_info: List[str]):
+	"""
+	COMPUTE: (date, pattern_row) override specs của một from_date assignment.
+	
+	Returns list specs (đã dedupe theo ngày + slot), hoặc dict lỗi dạng kết quả sync.
+	"""
 	start_date = assignment.start_date
 	end_date = assignment.end_date
-	replace_teacher_map = replace_teacher_map or {}
-	
 	debug_info.append(
-		f"🔄 Syncing from_date assignment: teacher={teacher_id}, class={class_id}, "
-		f"subject={actual_subject_id}, dates={start_date} to {end_date}"
+		f"🔄 Syncing from_date assignment: teacher={assignment.teacher_id}, class={assignment.class_id}, "
+		f"subject={assignment.actual_subject_id}, dates={start_date} to {end_date}"
 	)
-	
-	# ✅ NEW APPROACH: Use subject_id as key instead of row_id
-	# This way resolution persists across rollback/retry cycles
-	resolution_by_subject = {}
-	
-	if replace_teacher_map:
-		# Try to detect format by checking if keys look like subject IDs
-		first_key = next(iter(replace_teacher_map.keys()))
-		if first_key.startswith("SIS_ACTUAL_SUBJECT-") or first_key.startswith("SIS-SUBJECT-"):
-			# Already subject_id format
-			resolution_by_subject = replace_teacher_map
-			debug_info.append(f"📋 Using subject-based resolution map: {len(resolution_by_subject)} subjects")
-		else:
-			# Legacy row_id format - keep for backward compatibility
-			debug_info.append(f"📋 Using row-based resolution map: {len(replace_teacher_map)} rows")
-			resolution_by_subject = {}  # Will use row-based logic below
-	
+
 	# VALIDATE dates
 	if not start_date:
 		return {
@@ -317,9 +322,9 @@ def sync_date_range_assignment(assignment, replace_teacher_map: dict = None) ->
 	
 	# COMPUTE: Find pattern rows
 	pattern_rows = find_pattern_rows(
-		class_id=class_id,
-		actual_subject_id=actual_subject_id,
-		campus_id=campus_id
+		class_id=assignment.class_id,
+		actual_subject_id=assignment.actual_subject_id,
+		campus_id=assignment.campus_id
 	)
 	
 	if not pattern_rows:
@@ -345,28 +350,29 @@ def sync_date_range_assignment(assignment, replace_teacher_map: dict = None) ->
 	
 	debug_info.append(f"📅 Weekdays filter: {assignment_weekdays if assignment_weekdays else 'ALL DAYS'}")
 	
-	# Group by day_of_week for efficiency
+	# Group by (day_of_week, instance): mỗi instance tính ngày theo khoảng của chính nó
 	rows_by_day = {}
 	for row in pattern_rows:
-		day = row.day_of_week
 		# ⚡ NEW: Skip days not in weekdays (if weekdays specified)
-		if assignment_weekdays and day not in assignment_weekdays:
+		if assignment_weekdays and row.day_of_week not in assignment_weekdays:
 			continue
-		if day not in rows_by_day:
-			rows_by_day[day] = []
-		rows_by_day[day].append(row)
-	
-	# Calculate dates for each day
-	override_specs = []  # List of (date, pattern_row)
+		rows_by_day.setdefault((row.day_of_week, row.parent), []).append(row)
 	
-	for day, rows in rows_by_day.items():
-		# Get instance date range from first row
-		instance_info = frappe.db.get_value(
+	instance_ranges = {
+		i.name: i
+		for i in frappe.get_all(
 			"SIS Timetable Instance",
-			rows[0].parent,
-			["start_date", "end_date"],
-			as_dict=True
+			filters={"name": ["in", list({parent for _, parent in rows_by_day})]},
+			fields=["name", "start_date", "end_date"]
 		)
+	} if rows_by_day else {}
+	
+	override_specs = []  # List of (date, pattern_row)
+	
+	for (day, parent), rows in rows_by_day.items():
+		instance_info = instance_ranges.get(parent)
+		if not instance_info or not instance_info.start_date or not instance_info.end_date:
+			continue
 		
 		dates = calculate_dates_for_day(
 			day_of_week=day,
@@ -376,7 +382,7 @@ def sync_date_range_assignment(assignment, replace_teacher_map: dict = None) ->
 			instance_end=instance_info.end_date
 		)
 		
-		debug_info.append(f"📅 Day {day}: {len(dates)} dates calculated")
+		debug_info.append(f"📅 Day {day} ({parent}): {len(dates)} dates calculated")
 		
 		for date in dates:
 			for row in rows:
@@ -390,209 +396,62 @@ def sync_date_range_assignment(assignment, replace_teacher_map: dict = None) ->
 	debug_info.append(
 		f"📊 Override specs: {before_dedupe} → {len(override_specs)} sau dedupe (cùng ngày + slot)"
 	)
+	return override_specs
+
+
+def apply_date_range_specs(assignment, override_specs: List[Tuple], slot_index: Dict,
+		replace_teacher_map: dict = None, debug_info: List[str] = None) -> Dict:
+	"""DIFF + APPLY: so specs với index override trong bộ nhớ rồi ghi một lượt."""
+	debug_info = debug_info if debug_info is not None else []
+	teacher_id = assignment.teacher_id
+	replace_teacher_map = replace_teacher_map or {}
 	debug_info.append(f"📊 Total override specs to process: {len(override_specs)}")
 	
-	# APPLY: Bulk create/update override rows
-	created_count = 0
-	updated_count = 0
-	conflicts = []  # Track conflicts for user resolution
-	affected_row_ids = []  # ⚡ FIX: Track created/updated override row IDs for sync
+	# ✅ NEW APPROACH: Use subject_id as key instead of row_id
+	# This way resolution persists across rollback/retry cycles
+	resolution_by_subject = {}
+	if replace_teacher_map:
+		# Try to detect format by checking if keys look like subject IDs
+		first_key = next(iter(replace_teacher_map.keys()))
+		if first_key.startswith("SIS_ACTUAL_SUBJECT-") or first_key.startswith("SIS-SUBJECT-"):
+			resolution_by_subject = replace_teacher_map
+			debug_info.append(f"📋 Using subject-based resolution map: {len(resolution_by_subject)} subjects")
+		else:
+			# Legacy row_id format - keep for backward compatibility
+			debug_info.append(f"📋 Using row-based resolution map: {len(replace_teacher_map)} rows")
 	
 	try:
-		# NOTE: Don't begin transaction here - caller manages transaction
-		# frappe.db.begin()
-
-		for date, pattern_row in override_specs:
-			# Check if override already exists
-			# ⚡ FIX: Search by parent_timetable_instance OR parent (handle both cases)
-			# Also search ANY override row with same date + slot, not just from current pattern
-			existing = frappe.db.sql("""
-				SELECT name, teacher_1_id, teacher_2_id
-				FROM `tabSIS Timetable Instance Row`
-				WHERE date = %s
-				  AND day_of_week = %s
-				  AND timetable_column_id = %s
-				  AND subject_id = %s
-				  AND (parent = %s OR parent_timetable_instance = %s)
-				ORDER BY creation DESC
-				LIMIT 1
-			""", (date, pattern_row.day_of_week, pattern_row.timetable_column_id,
-				  pattern_row.subject_id, pattern_row.parent, pattern_row.parent),
-			as_dict=True)
-			existing = existing[0] if existing else None
-			
-			if existing:
-				# Check if teacher is already assigned to this row
-				if existing.teacher_1_id == teacher_id or existing.teacher_2_id == teacher_id:
-					# Teacher already assigned, skip
-					continue
-				
-				# Check if both teacher slots are full → CONFLICT!
-				if existing.teacher_1_id and existing.teacher_2_id:
-					# Both slots full - need user to choose who to replace
-					frappe.logger().warning(
-						f"⚠️ FROM_DATE CONFLICT: Existing override {existing.name} on {date} - "
-						f"teacher_1={existing.teacher_1_id}, teacher_2={existing.teacher_2_id}, "
-						f"trying to add teacher={teacher_id}"
-					)
-					
-					# ✅ Check resolution by SUBJECT_ID first (persistent across retries)
-					replace_slot = None
-					if resolution_by_subject and pattern_row.subject_id in resolution_by_subject:
-						replace_slot = resolution_by_subject[pattern_row.subject_id]
-						frappe.logger().info(f"✅ Found subject-based resolution: {pattern_row.subject_id} → {replace_slot}")
-					elif existing.name in replace_teacher_map:
-						# Legacy: check by row_id
-						replace_slot = replace_teacher_map[existing.name]
-						frappe.logger().info(f"✅ Found row-based resolution: {existing.name} → {replace_slot}")
-					
-					if replace_slot:
-						# User provided resolution
-						if replace_slot not in ["teacher_1", "teacher_2"]:
-							frappe.logger().error(f"Invalid replace_slot: {replace_slot} for row {existing.name}")
-							continue
-						
-						# ⚡ FIX: Use direct SQL to update child table
-						# Build teacher list based on resolution
-						if replace_slot == "teacher_1":
-							# Replace teacher_1 with new teacher, keep teacher_2
-							new_teachers = [tid for tid in [teacher_id, existing.teacher_2_id] if tid]
-						else:  # replace_slot == "teacher_2"
-							# Keep teacher_1, replace teacher_2 with new teacher
-							new_teachers = [tid for tid in [existing.teacher_1_id, teacher_id] if tid]
-						
-						update_row_teachers_sql(existing.name, new_teachers)
-						affected_row_ids.append(existing.name)
-						updated_count += 1
-						debug_info.append(
-							f"✅ Replaced {replace_slot} on {date} - {pattern_row.timetable_column_id} (subject: {pattern_row.subject_id})"
-						)
-					else:
-						# No resolution provided → Add to conflicts list
-						conflicts.append({
-							"row_id": existing.name,
-							"date": str(date),
-							"day_of_week": pattern_row.day_of_week,
-							"period_id": pattern_row.timetable_column_id,
-							"period_name": pattern_row.period_name,
-							"subject_id": pattern_row.subject_id,
-							"teacher_1_id": existing.teacher_1_id,
-							"teacher_1_name": get_teacher_name(existing.teacher_1_id),
-							"teacher_2_id": existing.teacher_2_id,
-							"teacher_2_name": get_teacher_name(existing.teacher_2_id),
-							"new_teacher_id": teacher_id,
-							"new_teacher_name": get_teacher_name(teacher_id)
-						})
-						frappe.logger().warning(
-							f"⚠️ FROM_DATE: Added existing override conflict: {len(conflicts)} total conflicts"
-						)
-				elif not existing.teacher_2_id:
-					# teacher_2 is empty → Add as co-teacher
-					# ⚡ FIX: Use direct SQL - get existing teachers and add new one
-					existing_teachers = frappe.db.sql("""
-						SELECT teacher_id FROM `tabSIS Timetable Instance Row Teacher`
-						WHERE parent = %s ORDER BY sort_order
-					""", (existing.name,), as_dict=True)
-					new_teachers = [t.teacher_id for t in existing_teachers] + [teacher_id]
-					update_row_teachers_sql(existing.name, new_teachers)
-					affected_row_ids.append(existing.name)
-					updated_count += 1
-				elif not existing.teacher_1_id:
-					# teacher_1 is empty (edge case) → Add to teacher_1
-					# ⚡ FIX: Use direct SQL - get existing teachers and add new one
-					existing_teachers = frappe.db.sql("""
-						SELECT teacher_id FROM `tabSIS Timetable Instance Row Teacher`
-						WHERE parent = %s ORDER BY sort_order
-					""", (existing.name,), as_dict=True)
-					new_teachers = [teacher_id] + [t.teacher_id for t in existing_teachers]
-					update_row_teachers_sql(existing.name, new_teachers)
-					affected_row_ids.append(existing.name)
-					updated_count += 1
-			else:
-				# No existing override row - need to create one
-				
-				# ⚡ FIX: Get teachers from pattern row's child table
-				pattern_teachers = frappe.db.sql("""
-					SELECT teacher_id FROM `tabSIS Timetable Instance Row Teacher`
-					WHERE parent = %s ORDER BY sort_order
-				""", (pattern_row.name,), as_dict=True)
-				pattern_teacher_ids = [t.teacher_id for t in pattern_teachers]
-				
-				if teacher_id in pattern_teacher_ids:
-					# Teacher already assigned in pattern, skip
-					continue
-				
-				# ⚡ SIMPLIFIED: Create override with ALL existing teachers + new teacher
-				override_doc = frappe.get_doc({
-					"doctype": "SIS Timetable Instance Row",
-					"parent": pattern_row.parent,
-					"parent_timetable_instance": pattern_row.parent,
-					"parenttype": "SIS Timetable Instance",
-					"parentfield": "date_overrides",
-					"date": date,
-					"day_of_week": pattern_row.day_of_week,
-					"timetable_column_id": pattern_row.timetable_column_id,
-					"period_priority": pattern_row.period_priority,
-					"period_name": pattern_row.period_name,
-					"subject_id": pattern_row.subject_id,
-					"room_id": pattern_row.room_id
-				})
-				
-				# Insert first to get name
-				override_doc.insert(ignore_permissions=True, ignore_mandatory=True)
-				
-				# ⚡ FIX: Copy ALL teachers from pattern row + add new teacher
-				new_teachers = pattern_teacher_ids.copy()
-				if teacher_id and teacher_id not in new_teachers:
-					new_teachers.append(teacher_id)
-				
-				if new_teachers:
-					update_row_teachers_sql(override_doc.name, new_teachers)
-				
-				affected_row_ids.append(override_doc.name)
-				created_count += 1
+		plan = plan_override_changes(
+			teacher_id, override_specs, slot_index,
+			resolution_by_subject=resolution_by_subject,
+			replace_teacher_map=replace_teacher_map
+		)
+		for message in plan["log"]:
+			debug_info.append(message)
 		
-		# Check if there are unresolved conflicts
-		if conflicts:
-			# Group conflicts by subject_id - user only needs to choose once per subject
-			# For date range assignments, conflicts may span multiple dates
-			# ✅ KEY CHANGE: Use subject_id as conflict identifier (not row_id)
-			conflicts_grouped = {}
-			row_ids_by_subject = {}  # Map subject_id -> list of row_ids
-			
-			for conflict in conflicts:
-				subject_id = conflict["subject_id"]
-				
-				if subject_id not in conflicts_grouped:
-					# First conflict for this subject - use as representative
-					# ✅ Use subject_id as the conflict key
-					conflict["conflict_key"] = subject_id  # Use subject_id instead of row_id
-					conflicts_grouped[subject_id] = conflict
-					row_ids_by_subject[subject_id] = []
-				
-				# Track all row_ids for this subject
-				row_ids_by_subject[subject_id].append(conflict["row_id"])
-			
-			# Convert to list and add row_ids info
-			grouped_conflicts = []
-			for subject_id, conflict in conflicts_grouped.items():
-				conflict["affected_row_ids"] = row_ids_by_subject[subject_id]
-				conflict["affected_row_count"] = len(row_ids_by_subject[subject_id])
-				grouped_conflicts.append(conflict)
+		# Check if there are unresolved conflicts — chưa ghi gì, caller không cần rollback phần này
+		if plan["conflicts"]:
+			names = get_teacher_names(
+				[c["teacher_1_id"] for c in plan["conflicts"]]
+				+ [c["teacher_2_id"] for c in plan["conflicts"]]
+				+ [teacher_id]
+			)
+			for conflict in plan["conflicts"]:
+				conflict["teacher_1_name"] = names.get(conflict["teacher_1_id"], conflict["teacher_1_id"])
+				conflict["teacher_2_name"] = names.get(conflict["teacher_2_id"], conflict["teacher_2_id"])
+				conflict["new_teacher_name"] = names.get(teacher_id, teacher_id)
+			grouped_conflicts = group_conflicts_by_subject(plan["conflicts"])
 			
-			# Return conflicts to caller - caller handles rollback
 			frappe.logger().warning(
-				f"⚠️ FROM_DATE: DETECTED CONFLICTS: {len(conflicts)} total rows, "
+				f"⚠️ FROM_DATE: DETECTED CONFLICTS: {len(plan['conflicts'])} total rows, "
 				f"grouped into {len(grouped_conflicts)} subject conflicts. "
 				f"Returning to caller for resolution."
 			)
-			
 			debug_info.append(
-				f"⚠️ Found {len(conflicts)} conflict rows, "
+				f"⚠️ Found {len(plan['conflicts'])} conflict rows, "
 				f"grouped into {len(grouped_conflicts)} conflicts (by subject)"
 			)
-			
-			conflict_response = {
+			return {
 				"success": False,
 				"message": f"Phát hiện {len(grouped_conflicts)} xung đột giáo viên. Vui lòng chọn giáo viên để thay thế.",
 				"error_type": "teacher_conflict",
@@ -601,11 +460,10 @@ def sync_date_range_assignment(assignment, replace_teacher_map: dict = None) ->
 				"rows_updated": 0,
 				"debug_info": debug_info
 			}
-			
-			frappe.logger().info(f"🚫 FROM_DATE Conflict response: {conflict_response}")
-			return conflict_response
-
-		# No conflicts or all resolved → Return success (caller handles commit)
+		
+		affected_row_ids = apply_override_plan(plan, slot_index)
+		created_count = len(plan["creates"])
+		updated_count = len(plan["updates"])
 		debug_info.append(f"✅ Created {created_count} override rows")
 		debug_info.append(f"✅ Updated {updated_count} override rows")
 		
@@ -618,7 +476,7 @@ def sync_date_range_assignment(assignment, replace_teacher_map: dict = None) ->
 			# Background jobs are unreliable - we need immediate feedback
 			try:
 				from erp.api.erp_sis.utils.materialized_view_optimizer import sync_for_rows
-				frappe.logger().info(f"🔄 Syncing Teacher Timetable for {total_changes} override rows: {affected_row_ids}")
+				frappe.logger().info(f"🔄 Syncing Teacher Timetable for {total_changes} override rows")
 				sync_for_rows(affected_row_ids)
 				debug_info.append(f"✅ Synced materialized view for {total_changes} override rows")
 			except Exception as sync_err:
@@ -651,6 +509,287 @@ def sync_date_range_assignment(assignment, replace_teacher_map: dict = None) ->
 		}
 
 
+# ============= SET-BASED OVERRIDE SYNC =============
+
+def override_slot_key(instance_id: str, date, day_of_week: str, timetable_column_id: str, subject_id: str) -> Tuple:
+	"""Khoá một ô override: (instance, ngày, thứ, tiết, môn)."""
+	return (instance_id, str(frappe.utils.getdate(date)), day_of_week, timetable_column_id, subject_id)
+
+
+def index_override_rows(rows: List[Dict], teacher_rows: List[Dict]) -> Dict:
+	"""
+	Dựng index override từ kết quả query (thuần — không chạm DB).
+	
+	rows: override rows, sắp creation DESC — cùng slot giữ bản mới nhất (như LIMIT 1 cũ).
+	      Row khớp instance qua parent HOẶC parent_timetable_instance → đánh index cả hai.
+	teacher_rows: (parent, teacher_id) của bảng con, sắp theo sort_order.
+	"""
+	slots = {}
+	for row in rows:
+		for instance_id in {row.get("parent"), row.get("parent_timetable_instance")}:
+			if not instance_id:
+				continue
+			key = override_slot_key(instance_id, row["date"], row.get("day_of_week"),
+				row.get("timetable_column_id"), row.get("subject_id"))
+			slots.setdefault(key, row)
+	teachers = {}
+	for t in teacher_rows:
+		teachers.setdefault(t["parent"], []).append(t["teacher_id"])
+	return {"slots": slots, "teachers": teachers}
+
+
+def load_override_index(override_specs: List[Tuple]) -> Dict:
+	"""
+	Đọc một lần toàn bộ override row (và giáo viên của chúng + của pattern row) cho các
+	instance / môn / khoảng ngày mà specs chạm tới.
+	"""
+	if not override_specs:
+		return index_override_rows([], [])
+	
+	instances = sorted({row.parent for _, row in override_specs})
+	subjects = sorted({row.subject_id for _, row in override_specs})
+	dates = [date for date, _ in override_specs]
+	
+	rows = frappe.db.sql("""
+		SELECT name, parent, parent_timetable_instance, date, day_of_week,
+			timetable_column_id, subject_id, teacher_1_id, teacher_2_id
+		FROM `tabSIS Timetable Instance Row`
+		WHERE (parent IN %(instances)s OR parent_timetable_instance IN %(instances)s)
+		  AND subject_id IN %(subjects)s
+		  AND date BETWEEN %(date_from)s AND %(date_to)s
+		ORDER BY creation DESC
+	""", {
+		"instances": tuple(instances),
+		"subjects": tuple(subjects),
+		"date_from": min(dates),
+		"date_to": max(dates),
+	}, as_dict=True)
+	
+	parents = list({r.name for r in rows} | {row.name for _, row in override_specs})
+	teacher_rows = []
+	for i in range(0, len(parents), 1000):
+		teacher_rows.extend(frappe.db.sql("""
+			SELECT parent, teacher_id FROM `tabSIS Timetable Instance Row Teacher`
+			WHERE parent IN %(parents)s
+			ORDER BY parent, sort_order
+		""", {"parents": tuple(parents[i:i + 1000])}, as_dict=True))
+	
+	return index_override_rows(rows, teacher_rows)
+
+
+def plan_override_changes(teacher_id: str, override_specs: List[Tuple], slot_index: Dict,
+		resolution_by_subject: dict = None, replace_teacher_map: dict = None) -> Dict:
+	"""
+	DIFF (thuần): specs × index → việc cần ghi, không chạm DB.
+	
+	Returns:
+		{
+			"creates": [(date, pattern_row, teacher_ids)],
+			"updates": {row_name: teacher_ids},
+			"conflicts": [dict] (chưa có tên giáo viên),
+			"log": [str]
+		}
+	"""
+	resolution_by_subject = resolution_by_subject or {}
+	replace_teacher_map = replace_teacher_map or {}
+	slots = slot_index["slots"]
+	teachers = slot_index["teachers"]
+	plan = {"creates": [], "updates": {}, "conflicts": [], "log": []}
+	
+	for date, pattern_row in override_specs:
+		existing = slots.get(override_slot_key(pattern_row.parent, date, pattern_row.day_of_week,
+			pattern_row.timetable_column_id, pattern_row.subject_id))
+		
+		if not existing:
+			# Chưa có override: copy ALL teachers từ pattern row + thêm giáo viên mới
+			pattern_teacher_ids = teachers.get(pattern_row.name, [])
+			if teacher_id in pattern_teacher_ids:
+				continue
+			plan["creates"].append((date, pattern_row, pattern_teacher_ids + [teacher_id]))
+			continue
+		
+		teacher_1_id = existing.get("teacher_1_id")
+		teacher_2_id = existing.get("teacher_2_id")
+		current = teachers.get(existing["name"], [])
+		# Teacher already assigned to this row → skip
+		if teacher_id in (teacher_1_id, teacher_2_id) or teacher_id in current:
+			continue
+		
+		if teacher_1_id and teacher_2_id:
+			# Both slots full → cần user chọn người bị thay
+			replace_slot = None
+			if pattern_row.subject_id in resolution_by_subject:
+				replace_slot = resolution_by_subject[pattern_row.subject_id]
+			elif existing["name"] in replace_teacher_map:
+				replace_slot = replace_teacher_map[existing["name"]]
+			
+			if not replace_slot:
+				plan["conflicts"].append({
+					"row_id": existing["name"],
+					"date": str(date),
+					"day_of_week": pattern_row.day_of_week,
+					"period_id": pattern_row.timetable_column_id,
+					"period_name": pattern_row.period_name,
+					"subject_id": pattern_row.subject_id,
+					"teacher_1_id": teacher_1_id,
+					"teacher_2_id": teacher_2_id,
+					"new_teacher_id": teacher_id,
+				})
+				continue
+			if replace_slot not in ("teacher_1", "teacher_2"):
+				frappe.logger().error(f"Invalid replace_slot: {replace_slot} for row {existing['name']}")
+				continue
+			if replace_slot == "teacher_1":
+				new_teachers = [tid for tid in (teacher_id, teacher_2_id) if tid]
+			else:
+				new_teachers = [tid for tid in (teacher_1_id, teacher_id) if tid]
+			plan["log"].append(
+				f"✅ Replaced {replace_slot} on {date} - {pattern_row.timetable_column_id} (subject: {pattern_row.subject_id})"
+			)
+		elif not teacher_2_id:
+			# teacher_2 trống → thêm làm co-teacher
+			new_teachers = current + [teacher_id]
+		else:
+			# teacher_1 trống (edge case) → thêm lên đầu
+			new_teachers = [teacher_id] + current
+		
+		plan["updates"][existing["name"]] = new_teachers
+	
+	return plan
+
+
+def apply_override_plan(plan: Dict, slot_index: Dict) -> List[str]:
+	"""
+	APPLY: override mới bằng một INSERT nhiều dòng, giáo viên của mọi row đổi bằng một lần
+	viết lại bảng con. Cập nhật index trong bộ nhớ để phân công kế tiếp (batch) thấy ngay.
+	
+	Returns danh sách row id đã tạo/sửa (cho sync materialized view).
+	"""
+	from frappe.model.naming import make_autoname
+	
+	teachers_by_row = dict(plan["updates"])
+	new_rows = []
+	for date, pattern_row, teacher_ids in plan["creates"]:
+		# INSERT thô không qua naming series → tên hash như child row thông thường
+		name = make_autoname("hash", "SIS Timetable Instance Row")
+		new_rows.append((name, date, pattern_row))
+		teachers_by_row[name] = teacher_ids
+	
+	if new_rows:
+		now = frappe.utils.now()
+		user = frappe.session.user
+		for i in range(0, len(new_rows), 500):
+			chunk = new_rows[i:i + 500]
+			values = []
+			for name, date, row in chunk:
+				values.extend([
+					name, row.parent, row.parent, date, row.day_of_week, row.timetable_column_id,
+					row.period_priority, row.period_name, row.subject_id, row.room_id,
+					now, now, user, user,
+				])
+			frappe.db.sql("""
+				INSERT INTO `tabSIS Timetable Instance Row`
+				(name, parent, parent_timetable_instance, parenttype, parentfield, idx, docstatus,
+				 date, day_of_week, timetable_column_id, period_priority, period_name, subject_id, room_id,
+				 creation, modified, owner, modified_by)
+				VALUES {}
+			""".format(", ".join(
+				["(%s, %s, %s, 'SIS Timetable Instance', 'date_overrides', 0, 0, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"]
+				* len(chunk)
+			)), tuple(values))
+	
+	bulk_set_row_teachers(teachers_by_row)
+	
+	# INSERT thô bỏ qua after_insert hook của Instance Row → tự invalidate cache một lần / instance
+	if new_rows:
+		invalidate_instance_caches({row.parent for _, _, row in new_rows})
+	
+	for name, date, row in new_rows:
+		slot_index["slots"][override_slot_key(row.parent, date, row.day_of_week,
+			row.timetable_column_id, row.subject_id)] = {
+			"name": name, "parent": row.parent, "parent_timetable_instance": row.parent,
+			"teacher_1_id": None, "teacher_2_id": None,
+		}
+	for row_name, teacher_ids in teachers_by_row.items():
+		slot_index["teachers"][row_name] = list(dict.fromkeys(t for t in teacher_ids if t))
+	
+	return list(plan["updates"]) + [name for name, _, _ in new_rows]
+
+
+def bulk_set_row_teachers(teachers_by_row: Dict[str, List[str]]) -> int:
+	"""
+	Viết lại bảng con giáo viên cho nhiều row cùng lúc: một DELETE + INSERT nhiều dòng.
+	Cùng quy tắc update_row_teachers_sql (bỏ trùng, giữ thứ tự, sort_order = idx).
+	"""
+	if not teachers_by_row:
+		return 0
+	row_names = list(teachers_by_row)
+	for i in range(0, len(row_names), 1000):
+		frappe.db.sql("""
+			DELETE FROM `tabSIS Timetable Instance Row Teacher`
+			WHERE parent IN %(parents)s
+		""", {"parents": tuple(row_names[i:i + 1000])})
+	
+	values = []
+	for row_name, teacher_ids in teachers_by_row.items():
+		for idx, tid in enumerate(dict.fromkeys(t for t in teacher_ids if t), start=1):
+			values.append((frappe.generate_hash(length=10), row_name, tid, idx, idx))
+	
+	for i in range(0, len(values), 1000):
+		chunk = values[i:i + 1000]
+		frappe.db.sql("""
+			INSERT INTO `tabSIS Timetable Instance Row Teacher`
+			(name, parent, parenttype, parentfield, teacher_id, sort_order, idx)
+			VALUES {}
+		""".format(", ".join(["(%s, %s, 'SIS Timetable Instance Row', 'teachers', %s, %s, %s)"] * len(chunk))),
+		tuple(v for row in chunk for v in row))
+	return len(values)
+
+
+def invalidate_instance_caches(instance_ids) -> None:
+	"""Việc của hook after_insert Instance Row (cache môn của lớp + lịch biên dịch), một lần / instance."""
+	from erp.api.erp_sis.utils.assignment_cache import invalidate_class_subjects_cache
+	from erp.api.erp_sis.timetable.schedule_engine import invalidate
+	
+	instance_ids = [i for i in instance_ids if i]
+	if not instance_ids:
+		return
+	try:
+		for inst in frappe.get_all(
+			"SIS Timetable Instance",
+			filters={"name": ["in", instance_ids]},
+			fields=["name", "class_id", "campus_id"]
+		):
+			invalidate_class_subjects_cache(inst.class_id, inst.campus_id)
+			invalidate(inst.name)
+	except Exception as e:
+		frappe.log_error(f"Failed to invalidate cache after override rows insert: {str(e)}")
+
+
+def group_conflicts_by_subject(conflicts: List[Dict]) -> List[Dict]:
+	"""
+	Group conflicts by subject_id - user only needs to choose once per subject.
+	✅ KEY CHANGE: Use subject_id as conflict identifier (not row_id)
+	"""
+	conflicts_grouped = {}
+	row_ids_by_subject = {}  # Map subject_id -> list of row_ids
+	for conflict in conflicts:
+		subject_id = conflict["subject_id"]
+		if subject_id not in conflicts_grouped:
+			# First conflict for this subject - use as representative
+			conflict["conflict_key"] = subject_id
+			conflicts_grouped[subject_id] = conflict
+			row_ids_by_subject[subject_id] = []
+		row_ids_by_subject[subject_id].append(conflict["row_id"])
+	
+	grouped_conflicts = []
+	for subject_id, conflict in conflicts_grouped.items():
+		conflict["affected_row_ids"] = row_ids_by_subject[subject_id]
+		conflict["affected_row_count"] = len(row_ids_by_subject[subject_id])
+		grouped_conflicts.append(conflict)
+	return grouped_conflicts
+
+
 # ============= HELPER FUNCTIONS =============
 
 def update_row_teachers_sql(row_name: str, teacher_ids: List[str]) -> int:
@@ -1053,16 +1192,59 @@ def get_teacher_name(teacher_id: str) -> str:
 		return teacher_id
 
 
+def get_teacher_names(teacher_ids: List[str]) -> Dict[str, str]:
+	"""
+	Tên hiển thị cho nhiều giáo viên trong một query — cùng quy tắc get_teacher_name
+	(User.full_name → user_id → teacher_id).
+	"""
+	teacher_ids = list({t for t in teacher_ids if t})
+	if not teacher_ids:
+		return {}
+	rows = frappe.db.sql("""
+		SELECT t.name, t.user_id, u.full_name
+		FROM `tabSIS Teacher` t
+		LEFT JOIN `tabUser` u ON u.name = t.user_id
+		WHERE t.name IN %(teachers)s
+	""", {"teachers": tuple(teacher_ids)}, as_dict=True)
+	names = {r.name: (r.full_name or r.user_id or r.name) for r in rows}
+	return {t: names.get(t, t) for t in teacher_ids}
+
+
 # detect_teacher_conflicts function removed - no longer needed with unlimited teachers support
 
 
 # ============= BATCH OPERATIONS =============
 
+def _apply_date_range_groups(groups: dict, results: list) -> None:
+	"""
+	Ghi một đoạn from_date đã gom theo lớp: đọc index override MỘT lần mỗi lớp rồi
+	từng phân công diff + ghi trên index đó. Làm rỗng `groups`.
+	"""
+	for members in groups.values():
+		try:
+			slot_index = load_override_index([spec for _, _, specs, _ in members for spec in specs])
+		except Exception as e:
+			frappe.log_error(f"Batch sync: load override index failed: {str(e)}")
+			for pos, _, _, _ in members:
+				results[pos] = {"success": False, "message": f"Critical error: {str(e)}"}
+			continue
+		for pos, assignment, specs, debug_info in members:
+			results[pos] = apply_date_range_specs(assignment, specs, slot_index, debug_info=debug_info)
+	groups.clear()
+
+
 def batch_sync_assignments(assignment_ids: List[str]) -> Dict:
 	"""
 	Sync multiple assignments in a batch.
 	
-	More efficient than syncing one by one.
+	⚡ from_date assignments gom theo lớp (= tập instance của lớp): tính specs cả nhóm
+	trước, đọc index override MỘT lần cho cả nhóm, rồi từng phân công diff + ghi trên
+	index đó (index cập nhật sau mỗi lần ghi → phân công sau thấy thay đổi của phân
+	công trước). full_year giữ nguyên đường sync_full_year_assignment.
+	
+	Thứ tự ghi theo đúng assignment_ids: chỉ gom các from_date ĐỨNG LIỀN nhau — gặp một
+	full_year thì ghi xong đoạn from_date trước nó rồi mới chạy full_year, from_date sau
+	nó tính specs trên dữ liệu full_year vừa ghi.
 	
 	Returns:
 		{
@@ -1070,21 +1252,35 @@ def batch_sync_assignments(assignment_ids: List[str]) -> Dict:
 			"total": int,
 			"succeeded": int,
 			"failed": int,
-			"results": List[Dict]
+			"results": List[Dict]  (cùng thứ tự assignment_ids)
 		}
 	"""
-	results = []
-	succeeded = 0
-	failed = 0
+	results = [None] * len(assignment_ids)
+	groups = {}  # class_id -> [(position, assignment, specs, debug_info)] của đoạn from_date hiện tại
 	
-	for assignment_id in assignment_ids:
-		result = sync_assignment_to_timetable(assignment_id)
-		results.append(result)
-		
-		if result["success"]:
-			succeeded += 1
-		else:
-			failed += 1
+	for pos, assignment_id in enumerate(assignment_ids):
+		try:
+			assignment, error = load_assignment_for_sync(assignment_id)
+			if error:
+				results[pos] = error
+			elif assignment.application_type == "full_year":
+				_apply_date_range_groups(groups, results)
+				results[pos] = sync_full_year_assignment(assignment)
+			else:
+				debug_info = []
+				specs = build_date_range_specs(assignment, debug_info)
+				if isinstance(specs, dict):
+					results[pos] = specs
+				else:
+					groups.setdefault(assignment.class_id, []).append((pos, assignment, specs, debug_info))
+		except Exception as e:
+			frappe.log_error(f"Sync failed for assignment {assignment_id}: {str(e)}")
+			results[pos] = {"success": False, "message": f"Critical error: {str(e)}"}
+	
+	_apply_date_range_groups(groups, results)
+
+	succeeded = sum(1 for r in results if r["success"])
+	failed = len(results) - succeeded
 	
 	return {
 		"success": failed == 0,
@@ -1093,4 +1289,3 @@ def batch_sync_assignments(assignment_ids: List[str]) -> Dict:
 		"failed": failed,
 		"results": results
 	}
-
@@ -13,6 +13,7 @@ Structure:
 - crud.py: Timetable CRUD
 - instance_rows.py: Instance row operations
 - overrides.py: Date-specific overrides
+- schedule_engine.py: Effective-schedule expansion (pattern rows + overrides) shared by reports/sync
 - helpers.py: Shared utility functions
 """
 
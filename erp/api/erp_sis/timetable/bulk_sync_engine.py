@@ -18,6 +18,8 @@ from typing import Dict, List, Set, Tuple, Optional
 from datetime import datetime, timedelta, date
 from collections import defaultdict
 
+from . import schedule_engine
+
 
 class BulkSyncEngine:
 	"""
@@ -312,163 +314,45 @@ class BulkSyncEngine:
 		"""
 		return True
 	
-	def _is_pattern_valid_for_date(self, row: Dict, target_date: date) -> bool:
-		"""
-		⚡ NEW (2025-12-19): Kiểm tra pattern row có valid cho ngày target_date không.
-		
-		Pattern row valid nếu:
-		- (valid_from IS NULL OR valid_from <= target_date)
-		- AND (valid_to IS NULL OR valid_to >= target_date)
-		"""
-		valid_from = row.get('valid_from')
-		valid_to = row.get('valid_to')
-		
-		# Parse dates if needed
-		if valid_from:
-			if isinstance(valid_from, str):
-				valid_from = datetime.strptime(valid_from, "%Y-%m-%d").date()
-			elif hasattr(valid_from, 'date'):
-				valid_from = valid_from.date()
-		
-		if valid_to:
-			if isinstance(valid_to, str):
-				valid_to = datetime.strptime(valid_to, "%Y-%m-%d").date()
-			elif hasattr(valid_to, 'date'):
-				valid_to = valid_to.date()
-		
-		# Check validity
-		if valid_from and target_date < valid_from:
-			return False
-		if valid_to and target_date > valid_to:
-			return False
-		
-		return True
-	
-	def _get_best_pattern_for_date(self, patterns: List[Dict], target_date: date) -> Optional[Dict]:
-		"""
-		⚡ NEW (2025-12-19): Tìm pattern row phù hợp nhất cho target_date.
-		
-		Nếu nhiều patterns match, chọn pattern có valid_from gần nhất với target_date.
-		(Pattern cụ thể hơn được ưu tiên)
-		"""
-		valid_patterns = [p for p in patterns if self._is_pattern_valid_for_date(p, target_date)]
-		
-		if not valid_patterns:
-			return None
-		
-		if len(valid_patterns) == 1:
-			return valid_patterns[0]
-		
-		# Sort by valid_from DESC (NULL treated as very old date)
-		def sort_key(p):
-			vf = p.get('valid_from')
-			if vf:
-				if isinstance(vf, str):
-					vf = datetime.strptime(vf, "%Y-%m-%d").date()
-				elif hasattr(vf, 'date'):
-					vf = vf.date()
-				return vf
-			return date(1900, 1, 1)  # NULL = very old
-		
-		valid_patterns.sort(key=sort_key, reverse=True)
-		return valid_patterns[0]  # Return pattern with most recent valid_from
-	
 	def _prepare_teacher_entries(self, pattern_rows: List[Dict], 
 	                             override_rows: List[Dict], 
 	                             all_weeks: List[date]) -> List[Dict]:
 		"""
 		Prepare all teacher timetable entries in memory.
 		
-		⚡ UPDATED (2025-12-19): Hỗ trợ pattern rows với valid_from/valid_to.
+		⚡ UPDATED (2026-10): Mở rộng qua schedule_engine — cùng quy tắc valid_from/valid_to
+		và override với báo cáo/TKB phụ huynh. Pattern có valid_from mới nhất thắng; nếu
+		nhiều pattern hoà nhau thì vẫn chỉ lấy dòng đầu như trước.
 		
 		Returns:
 			List of dicts ready for bulk insert
 		"""
 		entries = []
-		override_dates = self._build_override_index(override_rows)
-		
-		# Group pattern rows by (day_of_week, timetable_column_id)
-		# để có thể chọn pattern phù hợp nhất cho mỗi ngày
-		pattern_groups = {}
-		for row in pattern_rows:
-			normalized_day = self._normalize_day(row.day_of_week)
-			key = (normalized_day, row.timetable_column_id)
-			if key not in pattern_groups:
-				pattern_groups[key] = []
-			pattern_groups[key].append(row)
-		
-		# Generate entries for all dates in range
-		current_date = self.start_date
-		while current_date <= self.end_date:
-			day_of_week = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun'][current_date.weekday()]
-			
-			# Check each pattern group for this day
-			for (pattern_day, column_id), patterns in pattern_groups.items():
-				if pattern_day != day_of_week:
-					continue
-				
-				# Skip if has override
-				override_key = (day_of_week, column_id, current_date)
-				if override_key in override_dates:
+		compiled = schedule_engine.compile_rows(pattern_rows + override_rows, instance_id=self.instance_id)
+		seen_slots = set()
+		
+		for current_date, row in compiled.expand(self.start_date, self.end_date):
+			is_override = bool(row.get('date'))
+			slot = (current_date, row.timetable_column_id)
+			if not is_override:
+				if slot in seen_slots:
 					continue
-				
-				# Find best pattern for this date
-				best_pattern = self._get_best_pattern_for_date(patterns, current_date)
-				if not best_pattern:
-					continue
-				
-				# Get teachers
-				teachers = best_pattern.get('teachers_list', [])
-				if not teachers:
-					if best_pattern.get('teacher_1_id'):
-						teachers.append(best_pattern['teacher_1_id'])
-					if best_pattern.get('teacher_2_id'):
-						teachers.append(best_pattern['teacher_2_id'])
-				
-				if not teachers:
-					continue
-				
-				# Create entries for each teacher
-				for teacher_id in teachers:
-					if not self._has_assignment(teacher_id, best_pattern['subject_id']):
-						continue
-					
-					entries.append({
-						"teacher_id": teacher_id,
-						"class_id": self.class_id,
-						"day_of_week": day_of_week,
-						"timetable_column_id": column_id,
-						"subject_id": best_pattern['subject_id'],
-						"room_id": best_pattern.get('room_id'),
-						"date": current_date,
-						"timetable_instance_id": self.instance_id
-					})
+				seen_slots.add(slot)
 			
-			current_date += timedelta(days=1)
-		
-		# Process override rows (unchanged)
-		for row in override_rows:
-			normalized_day = self._normalize_day(row.day_of_week)
-			if normalized_day not in self.day_to_num:
-				continue
-			
-			specific_date = row.date
-			if isinstance(specific_date, str):
-				specific_date = datetime.strptime(specific_date, "%Y-%m-%d").date()
-			elif hasattr(specific_date, 'date'):
-				specific_date = specific_date.date()
-			
-			# Skip if outside range
-			if specific_date < self.start_date or specific_date > self.end_date:
-				continue
-			
-			teachers = row.get('teachers_list', [])
+			# Get teachers
+			teachers = list(row.get('teachers_list') or [])
 			if not teachers:
 				if row.get('teacher_1_id'):
 					teachers.append(row['teacher_1_id'])
 				if row.get('teacher_2_id'):
 					teachers.append(row['teacher_2_id'])
 			
+			day_of_week = (
+				self._normalize_day(row.day_of_week) if is_override
+				else schedule_engine.DAY_CODES[current_date.weekday()]
+			)
+			
+			# Create entries for each teacher
 			for teacher_id in teachers:
 				if not self._has_assignment(teacher_id, row.subject_id):
 					continue
@@ -476,11 +360,11 @@ class BulkSyncEngine:
 				entries.append({
 					"teacher_id": teacher_id,
 					"class_id": self.class_id,
-					"day_of_week": normalized_day,
+					"day_of_week": day_of_week,
 					"timetable_column_id": row.timetable_column_id,
 					"subject_id": row.subject_id,
-					"room_id": row.room_id,
-					"date": specific_date,
+					"room_id": row.get('room_id'),
+					"date": current_date,
 					"timetable_instance_id": self.instance_id
 				})
 		
@@ -747,7 +631,12 @@ def sync_instance_bulk(instance_id: str, class_id: str, start_date: str,
 		(teacher_count, student_count): Number of entries created
 	"""
 	engine = BulkSyncEngine(instance_id, class_id, start_date, end_date, campus_id, job_id)
-	return engine.sync()
+	result = engine.sync()
+	# Teacher Timetable ghi bằng SQL thô, không qua doc hook -> xoá chỉ mục phòng trống của campus
+	if campus_id:
+		from erp.api.erp_administrative.room_availability import invalidate_campus
+		invalidate_campus(campus_id)
+	return result
 
 
 def delete_entries_in_range(instance_id: str, start_date: str, end_date: str, delete_all_outside: bool = False):
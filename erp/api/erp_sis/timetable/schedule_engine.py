@@ -0,0 +1,399 @@
+# Copyright (c) 2026, Wellspring International School and contributors
+# For license information, please see license.txt
+
+"""
+Schedule Engine - "lớp X học những tiết nào vào ngày D"
+
+Trước đây ít nhất 5 chỗ tự cài lại câu hỏi này (báo cáo sổ đầu bài, báo cáo
+điểm danh theo tiết, TKB phụ huynh, BulkSyncEngine...), mỗi chỗ một kiểu lọc
+valid_from/valid_to và không chỗ nào giống chỗ nào:
+
+- có chỗ trả về CẢ pattern cũ lẫn pattern mới khi hai khoảng hiệu lực chồng nhau
+- có chỗ coi dòng override (date != NULL) là pattern, lặp lại ở mọi tuần
+- có chỗ không chặn theo start_date/end_date của instance
+
+Engine này "biên dịch" các dòng của MỘT instance thành chỉ mục khoảng:
+
+    weekday -> [(từ ordinal, đến ordinal, column_id, (dòng thắng, ...)), ...]
+    ordinal -> [dòng override của ngày đó]
+
+Quy tắc (giống BulkSyncEngine từ 2025-12-19):
+1. Dòng pattern (date IS NULL) có hiệu lực trong [valid_from, valid_to],
+   NULL thì lấy start_date/end_date của instance.
+2. Nhiều pattern cùng (thứ, tiết) cùng hiệu lực → pattern có valid_from MỚI
+   NHẤT thắng (NULL = cũ nhất). Hoà nhau thì giữ cả nhóm theo thứ tự idx.
+3. Dòng override (date != NULL) thay thế MỌI pattern của (ngày, tiết) đó.
+
+Khoảng thắng được tính MỘT lần lúc biên dịch; mở rộng một khoảng ngày chỉ là
+bước nhảy 7 ngày trên từng đoạn — không kiểm tra hiệu lực lại cho từng cặp
+(dòng, ngày) như trước.
+
+Cache và vô hiệu hoá
+--------------------
+Bản biên dịch giữ ở bộ nhớ tiến trình (LRU theo instance), kèm CHỮ KÝ nội dung:
+COUNT + BIT_XOR(CRC32(...)) trên các dòng và giáo viên của instance. Dòng TKB
+bị ghi bằng SQL thô ở nhiều nơi (import, sync phân công, dọn dữ liệu) nên doc
+hook không đủ — chữ ký được kiểm lại bằng MỘT query gộp cho cả lô instance ở
+mỗi request, và chỉ instance nào lệch mới nạp lại. Trong cùng request, instance
+đã kiểm không kiểm lại; doc hook `on_instance_row_change` xoá dấu đó để request
+vừa ghi qua ORM đọc lại ngay bản mới.
+"""
+
+from collections import OrderedDict
+from datetime import date, datetime
+
+import frappe
+
+DAY_CODES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+DAY_ALIASES = {
+	"monday": "mon", "tuesday": "tue", "wednesday": "wed", "thursday": "thu",
+	"friday": "fri", "saturday": "sat", "sunday": "sun",
+	"thứ 2": "mon", "thu 2": "mon", "thứ 3": "tue", "thu 3": "tue",
+	"thứ 4": "wed", "thu 4": "wed", "thứ 5": "thu", "thu 5": "thu",
+	"thứ 6": "fri", "thu 6": "fri", "thứ 7": "sat", "thu 7": "sat",
+	"chủ nhật": "sun", "cn": "sun"
+}
+
+# Số instance giữ trong bộ nhớ mỗi tiến trình (một năm học ~ vài trăm lớp)
+CACHE_MAX = 512
+
+_MIN_ORD = date.min.toordinal()
+_MAX_ORD = date.max.toordinal()
+
+_ROW_FIELDS = (
+	"name", "day_of_week", "date", "valid_from", "valid_to",
+	"timetable_column_id", "subject_id", "teacher_1_id", "teacher_2_id", "room_id"
+)
+
+# instance_id -> CompiledSchedule (kèm chữ ký lúc nạp)
+_compiled = OrderedDict()
+
+_CHECKED_FLAG = "schedule_engine_checked"
+
+
+def normalize_day(day_str):
+	"""Chuẩn hoá day_of_week về mã 3 chữ (mon..sun)."""
+	day_str = str(day_str or "").strip().lower()
+	return DAY_ALIASES.get(day_str, day_str)
+
+
+def _to_date(value):
+	if not value:
+		return None
+	if isinstance(value, datetime):
+		return value.date()
+	if isinstance(value, date):
+		return value
+	return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+def _weekday_of(ordinal):
+	# date(1, 1, 1) là thứ Hai → weekday suy thẳng từ ordinal
+	return (ordinal - 1) % 7
+
+
+class CompiledSchedule:
+	"""Chỉ mục khoảng hiệu lực của MỘT instance. Dòng trả ra là dùng chung — không sửa."""
+
+	__slots__ = ("instance_id", "class_id", "start_date", "end_date", "signature",
+	             "_segments", "_overrides", "_override_keys")
+
+	def __init__(self, instance_id, class_id, start_date, end_date, signature=None):
+		self.instance_id = instance_id
+		self.class_id = class_id
+		self.start_date = _to_date(start_date)
+		self.end_date = _to_date(end_date)
+		self.signature = signature
+		self._segments = {wd: [] for wd in range(7)}
+		self._overrides = {}
+		self._override_keys = set()
+
+	def rows_on(self, target_date):
+		"""Các dòng có hiệu lực vào `target_date` (pattern thắng + override)."""
+		ordinal = _to_date(target_date).toordinal()
+		rows = []
+		for start, end, column_id, winners in self._segments[_weekday_of(ordinal)]:
+			if start <= ordinal <= end and (ordinal, column_id) not in self._override_keys:
+				rows.extend(winners)
+		rows.extend(self._overrides.get(ordinal, ()))
+		return rows
+
+	def expand(self, start_date, end_date):
+		"""Yield (date, row) cho mọi tiết trong [start_date, end_date], theo ngày tăng dần."""
+		lo = _to_date(start_date).toordinal()
+		hi = _to_date(end_date).toordinal()
+		by_day = {}
+		for wd, segments in self._segments.items():
+			for start, end, column_id, winners in segments:
+				first = max(start, lo)
+				last = min(end, hi)
+				if first > last:
+					continue
+				first += (wd - _weekday_of(first)) % 7
+				for ordinal in range(first, last + 1, 7):
+					if (ordinal, column_id) in self._override_keys:
+						continue
+					by_day.setdefault(ordinal, []).extend(winners)
+		for ordinal, rows in self._overrides.items():
+			if lo <= ordinal <= hi:
+				by_day.setdefault(ordinal, []).extend(rows)
+		for ordinal in sorted(by_day):
+			day = date.fromordinal(ordinal)
+			for row in by_day[ordinal]:
+				yield day, row
+
+
+def compile_rows(rows, instance_id=None, class_id=None, start_date=None, end_date=None, signature=None):
+	"""Biên dịch dòng đã nạp sẵn (cần các field trong `_ROW_FIELDS`, tuỳ chọn `teachers`).
+
+	BulkSyncEngine dùng trực tiếp hàm này trên dòng nó vừa đọc — không qua cache.
+	"""
+	compiled = CompiledSchedule(instance_id, class_id, start_date, end_date, signature)
+	lo_default = compiled.start_date.toordinal() if compiled.start_date else _MIN_ORD
+	hi_default = compiled.end_date.toordinal() if compiled.end_date else _MAX_ORD
+
+	groups = {}
+	for row in rows:
+		day = normalize_day(row.get("day_of_week"))
+		if day not in DAY_CODES:
+			continue
+		if row.get("date"):
+			ordinal = _to_date(row["date"]).toordinal()
+			compiled._overrides.setdefault(ordinal, []).append(row)
+			compiled._override_keys.add((ordinal, row.get("timetable_column_id")))
+			continue
+		valid_from = _to_date(row.get("valid_from"))
+		valid_to = _to_date(row.get("valid_to"))
+		start = valid_from.toordinal() if valid_from else lo_default
+		end = valid_to.toordinal() if valid_to else hi_default
+		if start > end:
+			continue
+		# Độ ưu tiên theo valid_from THẬT — NULL là cũ nhất dù đã được chặn theo instance
+		priority = valid_from.toordinal() if valid_from else 0
+		key = (DAY_CODES.index(day), row.get("timetable_column_id"))
+		groups.setdefault(key, []).append((start, end, priority, row))
+
+	for (wd, column_id), members in groups.items():
+		compiled._segments[wd].extend(_resolve_segments(column_id, members))
+	return compiled
+
+
+def _resolve_segments(column_id, members):
+	"""Cắt trục thời gian tại mọi biên valid_from / valid_to+1, chọn nhóm thắng từng đoạn."""
+	bounds = sorted({m[0] for m in members} | {m[1] + 1 for m in members if m[1] < _MAX_ORD})
+	segments = []
+	for i, seg_start in enumerate(bounds):
+		seg_end = bounds[i + 1] - 1 if i + 1 < len(bounds) else _MAX_ORD
+		active = [m for m in members if m[0] <= seg_start <= m[1]]
+		if not active:
+			continue
+		best = max(m[2] for m in active)
+		winners = tuple(m[3] for m in active if m[2] == best)
+		if segments and segments[-1][1] == seg_start - 1 and segments[-1][3] == winners:
+			segments[-1] = (segments[-1][0], seg_end, column_id, winners)
+		else:
+			segments.append((seg_start, seg_end, column_id, winners))
+	return segments
+
+
+def _crc_expr(alias, fields):
+	# IFNULL để (NULL, 'x') và ('x', NULL) không ra cùng chuỗi
+	parts = ", ".join(f"IFNULL({alias}.{f}, '')" for f in fields)
+	return f"BIT_XOR(CRC32(CONCAT_WS('|', {parts})))"
+
+
+def _load_signatures(instance_ids):
+	"""Chữ ký nội dung của nhiều instance trong 2 query gộp."""
+	signatures = {}
+	heads = frappe.db.sql(f"""
+		SELECT
+			ti.name, ti.class_id, ti.start_date, ti.end_date,
+			COUNT(tr.name) AS row_count,
+			{_crc_expr("tr", _ROW_FIELDS)} AS row_sum
+		FROM `tabSIS Timetable Instance` ti
+		LEFT JOIN `tabSIS Timetable Instance Row` tr ON tr.parent = ti.name
+		WHERE ti.name IN %(ids)s
+		GROUP BY ti.name, ti.class_id, ti.start_date, ti.end_date
+	""", {"ids": tuple(instance_ids)}, as_dict=True)
+	for h in heads:
+		signatures[h.name] = {
+			"class_id": h.class_id,
+			"start_date": h.start_date,
+			"end_date": h.end_date,
+			"signature": [str(h.start_date), str(h.end_date), h.row_count, h.row_sum, 0, 0],
+		}
+	if not signatures:
+		return signatures
+
+	teacher_sums = frappe.db.sql(f"""
+		SELECT tr.parent, COUNT(trt.name) AS cnt,
+			{_crc_expr("trt", ("parent", "teacher_id", "sort_order", "idx"))} AS total
+		FROM `tabSIS Timetable Instance Row` tr
+		INNER JOIN `tabSIS Timetable Instance Row Teacher` trt ON trt.parent = tr.name
+		WHERE tr.parent IN %(ids)s
+		GROUP BY tr.parent
+	""", {"ids": tuple(signatures)}, as_dict=True)
+	for t in teacher_sums:
+		if t.parent in signatures:
+			signatures[t.parent]["signature"][4:6] = [t.cnt, t.total]
+
+	for info in signatures.values():
+		info["signature"] = tuple(info["signature"])
+	return signatures
+
+
+def load_instance_rows(instance_ids):
+	"""Nạp dòng + giáo viên (theo sort_order) của nhiều instance. Trả {instance_id: [row]}."""
+	rows = frappe.db.sql("""
+		SELECT parent, {fields}
+		FROM `tabSIS Timetable Instance Row`
+		WHERE parent IN %(ids)s
+		ORDER BY parent, idx, name
+	""".format(fields=", ".join(_ROW_FIELDS)), {"ids": tuple(instance_ids)}, as_dict=True)
+
+	teachers = {}
+	if rows:
+		for t in frappe.db.sql("""
+			SELECT trt.parent, trt.teacher_id
+			FROM `tabSIS Timetable Instance Row Teacher` trt
+			INNER JOIN `tabSIS Timetable Instance Row` tr ON tr.name = trt.parent
+			WHERE tr.parent IN %(ids)s
+			ORDER BY trt.parent, trt.sort_order, trt.idx
+		""", {"ids": tuple(instance_ids)}, as_dict=True):
+			if t.teacher_id:
+				teachers.setdefault(t.parent, []).append(t.teacher_id)
+
+	by_instance = {}
+	for row in rows:
+		row_teachers = teachers.get(row.name)
+		if not row_teachers:
+			# Định dạng cũ: chưa có child table, dùng teacher_1_id / teacher_2_id
+			row_teachers = [t for t in (row.teacher_1_id, row.teacher_2_id) if t]
+		row["teachers"] = tuple(row_teachers)
+		by_instance.setdefault(row.pop("parent"), []).append(row)
+	return by_instance
+
+
+def _checked_in_request():
+	checked = frappe.flags.get(_CHECKED_FLAG)
+	if checked is None:
+		checked = frappe.flags[_CHECKED_FLAG] = set()
+	return checked
+
+
+def get_schedules(instance_ids):
+	"""{instance_id: CompiledSchedule} — kiểm chữ ký 1 lần/request, chỉ nạp lại instance lệch."""
+	instance_ids = [i for i in dict.fromkeys(instance_ids or ()) if i]
+	if not instance_ids:
+		return {}
+
+	checked = _checked_in_request()
+	result = {}
+	to_verify = []
+	for instance_id in instance_ids:
+		compiled = _compiled.get(instance_id)
+		if compiled is not None and instance_id in checked:
+			result[instance_id] = compiled
+		else:
+			to_verify.append(instance_id)
+
+	if to_verify:
+		signatures = _load_signatures(to_verify)
+		stale = []
+		for instance_id in to_verify:
+			info = signatures.get(instance_id)
+			if info is None:
+				_compiled.pop(instance_id, None)
+				continue
+			compiled = _compiled.get(instance_id)
+			if compiled is not None and compiled.signature == info["signature"]:
+				result[instance_id] = compiled
+				checked.add(instance_id)
+			else:
+				stale.append(instance_id)
+
+		if stale:
+			rows_by_instance = load_instance_rows(stale)
+			for instance_id in stale:
+				info = signatures[instance_id]
+				compiled = compile_rows(
+					rows_by_instance.get(instance_id, []),
+					instance_id=instance_id,
+					class_id=info["class_id"],
+					start_date=info["start_date"],
+					end_date=info["end_date"],
+					signature=info["signature"],
+				)
+				_remember(instance_id, compiled)
+				result[instance_id] = compiled
+				checked.add(instance_id)
+
+	for instance_id in result:
+		_compiled.move_to_end(instance_id)
+	return result
+
+
+def get_schedule(instance_id):
+	return get_schedules([instance_id]).get(instance_id)
+
+
+def _remember(instance_id, compiled):
+	_compiled[instance_id] = compiled
+	_compiled.move_to_end(instance_id)
+	while len(_compiled) > CACHE_MAX:
+		_compiled.popitem(last=False)
+
+
+def find_instances(class_ids, start_date, end_date=None):
+	"""Instance của các lớp giao với [start_date, end_date] (end_date NULL = còn hiệu lực)."""
+	if not class_ids:
+		return []
+	return frappe.db.sql("""
+		SELECT name, class_id, start_date, end_date
+		FROM `tabSIS Timetable Instance`
+		WHERE class_id IN %(class_ids)s
+			AND start_date <= %(end_date)s
+			AND (end_date >= %(start_date)s OR end_date IS NULL)
+	""", {
+		"class_ids": tuple(class_ids),
+		"start_date": _to_date(start_date),
+		"end_date": _to_date(end_date or start_date),
+	}, as_dict=True)
+
+
+def rows_for_classes_on(class_ids, target_date):
+	"""{class_id: [row]} hiệu lực vào `target_date`, gộp mọi instance phủ ngày đó."""
+	instances = find_instances(class_ids, target_date)
+	schedules = get_schedules([i.name for i in instances])
+	by_class = {}
+	for inst in instances:
+		compiled = schedules.get(inst.name)
+		if compiled is not None:
+			by_class.setdefault(inst.class_id, []).extend(compiled.rows_on(target_date))
+	return by_class
+
+
+def invalidate(instance_id=None):
+	"""Bỏ bản biên dịch (một instance hoặc tất cả) ở tiến trình hiện tại."""
+	checked = frappe.flags.get(_CHECKED_FLAG)
+	if instance_id is None:
+		_compiled.clear()
+		if checked:
+			checked.clear()
+		return
+	_compiled.pop(instance_id, None)
+	if checked:
+		checked.discard(instance_id)
+
+
+def on_instance_row_change(doc, method=None):
+	"""Doc hook SIS Timetable Instance Row / SIS Timetable Instance.
+
+	Tiến trình khác tự thấy thay đổi qua chữ ký ở request kế tiếp; hook chỉ cần
+	để chính request vừa ghi không dùng bản đã kiểm từ trước đó.
+	"""
+	try:
+		invalidate(doc.parent if doc.doctype == "SIS Timetable Instance Row" else doc.name)
+	except Exception as e:
+		frappe.logger().warning(f"schedule_engine invalidate failed for {doc.name}: {e}")
@@ -3,7 +3,9 @@
 from __future__ import annotations
 
 import frappe
-from frappe.utils import cint, now_datetime
+from frappe.utils import add_days, cint, now_datetime
+
+from erp.api.mdm import presence
 
 DOCTYPE = "MDM Alert"
 DEVICE_DOCTYPE = "MDM Device"
@@ -89,7 +91,15 @@ def check_offline_devices():
 
     Đây là lớp bù cho việc phần mềm không chống được admin/boot ngoài: gỡ được
     agent thì gỡ, nhưng không giấu được việc máy ngừng báo cáo.
+
+    Heartbeat nằm ở Redis tới lần flush kế tiếp: flush trước khi quét, rồi vẫn
+    lọc ứng viên theo presence Redis phòng khi flush lỗi giữa chừng.
     """
+    try:
+        presence.flush()
+    except Exception as e:
+        frappe.logger().warning(f"mdm offline check: presence flush failed: {e}")
+
     stale = frappe.db.sql(
         """SELECT name, device_name, serial_number, last_heartbeat
            FROM `tabMDM Device`
@@ -99,6 +109,12 @@ def check_offline_devices():
         (OFFLINE_ALERT_DAYS,),
         as_dict=True,
     )
+    cutoff = add_days(now_datetime(), -OFFLINE_ALERT_DAYS)
+    seen = presence.last_seen_map(d.name for d in stale)
+    stale = [
+        d for d in stale
+        if not (seen.get(d.name) and seen[d.name]["last_heartbeat"] >= cutoff)
+    ]
 
     for device in stale:
         raise_alert(
@@ -3,19 +3,37 @@
 Không dùng API key của Frappe User: mỗi máy học sinh là một `MDM Device`, tạo
 User cho từng máy là sai mô hình. Agent gửi `Authorization: token <key>:<secret>`,
 ở đây đối chiếu trực tiếp với bản ghi thiết bị.
+
+Cache danh tính
+---------------
+Heartbeat / poll lệnh gọi vài trăm lần mỗi 2 phút — không đọc `tabMDM Device` mỗi
+lần. `authenticate_device` tra token_key -> {name, hash, status} qua hai tầng:
+dict trong process (sống `LOCAL_TTL_SEC`) rồi hash Redis `AUTH_CACHE_KEY`, trượt
+cả hai mới hỏi DB. Sửa / xoá `MDM Device` (duyệt lại token, đổi trạng thái) gọi
+`invalidate_device_auth` xoá mục Redis của token cũ lẫn mới; worker khác còn giữ
+bản trong process tối đa `LOCAL_TTL_SEC` giây — đó là độ trễ thu hồi chấp nhận.
 """
 
 from __future__ import annotations
 
 import hashlib
 import hmac
+import json
 import secrets
+import time
 
 import frappe
 
 TOKEN_KEY_BYTES = 16
 TOKEN_SECRET_BYTES = 32
 
+AUTH_CACHE_KEY = "mdm_device_auth"
+AUTH_CACHE_TTL_SEC = 6 * 3600
+LOCAL_TTL_SEC = 15
+
+# token_key -> (hết hạn theo time.monotonic(), identity)
+_local_identities: dict[str, tuple[float, dict]] = {}
+
 
 def hash_secret(secret: str) -> str:
     """Token là chuỗi ngẫu nhiên 32 byte nên SHA-256 là đủ (không phải mật khẩu người dùng)."""
@@ -40,9 +58,10 @@ def parse_authorization_header() -> tuple[str, str] | None:
     return key, secret
 
 
-def get_authenticated_device() -> "frappe.Document":
-    """Trả về `MDM Device` tương ứng token, hoặc ném 401/403.
+def authenticate_device() -> "frappe._dict":
+    """Xác thực token, trả `_dict(name, status)` — không đọc bản ghi thiết bị.
 
+    Dùng cho đường nóng (heartbeat, poll/ack lệnh, telemetry) chỉ cần tên máy.
     Thiết bị `Disabled`/`Retired` bị từ chối — đây là cách thu hồi một máy mà
     không cần chạm vào WireGuard.
     """
@@ -51,19 +70,88 @@ def get_authenticated_device() -> "frappe.Document":
         _throw_unauthorized("Thiếu hoặc sai định dạng header Authorization")
     key, secret = parsed
 
-    name = frappe.db.get_value("MDM Device", {"token_key": key}, "name")
-    if not name:
+    identity = _get_identity(key)
+    if not identity:
         _throw_unauthorized("Token không hợp lệ")
 
-    device = frappe.get_doc("MDM Device", name)
-    if not hmac.compare_digest(device.token_secret_hash or "", hash_secret(secret)):
+    if not hmac.compare_digest(identity["hash"] or "", hash_secret(secret)):
         _throw_unauthorized("Token không hợp lệ")
 
-    if device.status != "Active":
+    if identity["status"] != "Active":
         frappe.local.response["http_status_code"] = 403
-        frappe.throw(f"Thiết bị đang ở trạng thái {device.status}", frappe.PermissionError)
+        frappe.throw(f"Thiết bị đang ở trạng thái {identity['status']}", frappe.PermissionError)
+
+    return frappe._dict(name=identity["name"], status=identity["status"])
+
+
+def get_authenticated_device() -> "frappe.Document":
+    """Như `authenticate_device` nhưng trả về bản ghi `MDM Device` đầy đủ, hoặc ném 401/403."""
+    return frappe.get_doc("MDM Device", authenticate_device().name)
+
+
+def _get_identity(key: str) -> dict | None:
+    now = time.monotonic()
+    hit = _local_identities.get(key)
+    if hit and hit[0] > now:
+        return hit[1]
+
+    identity = _read_cached_identity(key)
+    if identity is None:
+        row = frappe.db.get_value(
+            "MDM Device", {"token_key": key}, ["name", "token_secret_hash", "status"], as_dict=True
+        )
+        if not row:
+            # Không cache token sai: tránh bị dội token rác làm phình cache
+            return None
+        identity = {"name": row.name, "hash": row.token_secret_hash, "status": row.status}
+        _write_cached_identity(key, identity)
+
+    _local_identities[key] = (now + LOCAL_TTL_SEC, identity)
+    return identity
+
+
+def _read_cached_identity(key: str) -> dict | None:
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        pipe.hget(cache.make_key(AUTH_CACHE_KEY), key)
+        (raw,) = pipe.execute()
+        return json.loads(raw) if raw else None
+    except Exception:
+        return None
+
 
-    return device
+def _write_cached_identity(key: str, identity: dict):
+    try:
+        cache = frappe.cache()
+        redis_key = cache.make_key(AUTH_CACHE_KEY)
+        pipe = cache.pipeline()
+        pipe.hset(redis_key, key, json.dumps(identity))
+        pipe.expire(redis_key, AUTH_CACHE_TTL_SEC)
+        pipe.execute()
+    except Exception as e:
+        frappe.logger().warning(f"mdm auth cache write failed: {e}")
+
+
+def invalidate_device_auth(doc, method=None):
+    """doc_events MDM Device (on_update/on_trash): xoá danh tính cache của token cũ và mới."""
+    keys = {doc.get("token_key")}
+    before = doc.get_doc_before_save()
+    if before:
+        keys.add(before.get("token_key"))
+    keys.discard(None)
+    keys.discard("")
+    if not keys:
+        return
+    for key in keys:
+        _local_identities.pop(key, None)
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        pipe.hdel(cache.make_key(AUTH_CACHE_KEY), *keys)
+        pipe.execute()
+    except Exception as e:
+        frappe.logger().warning(f"mdm auth cache invalidate failed {doc.name}: {e}")
 
 
 def client_ip() -> str | None:
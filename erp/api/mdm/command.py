@@ -9,7 +9,8 @@ from __future__ import annotations
 import frappe
 from frappe.utils import cint, now_datetime
 
-from erp.api.mdm.auth import get_authenticated_device
+from erp.api.mdm import presence
+from erp.api.mdm.auth import authenticate_device
 
 DOCTYPE = "MDM Command"
 DEVICE_DOCTYPE = "MDM Device"
@@ -27,7 +28,7 @@ MAX_ATTEMPTS = 5
 @frappe.whitelist(allow_guest=True, methods=["GET", "POST"])
 def pull_commands():
     """Agent kéo lệnh đang chờ. Pending → Sent."""
-    device = get_authenticated_device()
+    device = authenticate_device()
 
     rows = frappe.get_all(
         DOCTYPE,
@@ -63,13 +64,15 @@ def pull_commands():
         )
 
     frappe.db.commit()
+    if not commands:
+        presence.clear_pending_if_idle(device.name)
     return {"commands": commands}
 
 
 @frappe.whitelist(allow_guest=True, methods=["POST"])
 def ack_command(command_id=None, status=None, result=None):
     """Agent báo kết quả thực thi."""
-    device = get_authenticated_device()
+    device = authenticate_device()
 
     if not command_id:
         frappe.throw("Thiếu command_id")
@@ -88,6 +91,7 @@ def ack_command(command_id=None, status=None, result=None):
         update_modified=False,
     )
     frappe.db.commit()
+    presence.clear_pending_if_idle(device.name)
     return {"ok": True}
 
 
@@ -130,6 +134,7 @@ def send_command(device=None, room=None, command_type=None, params=None):
         created.append(doc.name)
 
     frappe.db.commit()
+    presence.mark_pending(targets)
     return {"ok": True, "created": created, "count": len(created)}
 
 
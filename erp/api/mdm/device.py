@@ -8,6 +8,8 @@ from __future__ import annotations
 import frappe
 from frappe.utils import cint, get_datetime, now_datetime
 
+from erp.api.mdm import presence
+
 DOCTYPE = "MDM Device"
 
 # Quá ngưỡng này mà không heartbeat thì coi là offline. Nới rộng hơn chu kỳ
@@ -59,6 +61,9 @@ def list_devices(status=None, search=None, limit=100):
         limit_page_length=cint(limit) or 100,
     )
 
+    # DB chỉ được flush mỗi 5 phút — lấy nhịp mới nhất từ presence Redis
+    presence.overlay(devices)
+
     now = now_datetime()
     for d in devices:
         d["online"] = bool(
@@ -82,6 +87,16 @@ def get_device(name=None):
         frappe.throw("Thiếu name")
 
     doc = frappe.get_doc(DOCTYPE, name)
+    seen = presence.merge_seen(
+        {
+            "last_heartbeat": doc.last_heartbeat,
+            "last_ip": doc.last_ip,
+            "agent_version": doc.agent_version,
+            "os_version": doc.os_version,
+            "os_build": doc.os_build,
+        },
+        presence.last_seen_map([doc.name]).get(doc.name),
+    )
     now = now_datetime()
     return {
         "name": doc.name,
@@ -92,17 +107,17 @@ def get_device(name=None):
         "room": doc.room,
         "campus_id": doc.campus_id,
         "status": doc.status,
-        "agent_version": doc.agent_version,
-        "os_version": doc.os_version,
-        "os_build": doc.os_build,
-        "last_heartbeat": doc.last_heartbeat,
-        "last_ip": doc.last_ip,
+        "agent_version": seen["agent_version"],
+        "os_version": seen["os_version"],
+        "os_build": seen["os_build"],
+        "last_heartbeat": seen["last_heartbeat"],
+        "last_ip": seen["last_ip"],
         "wg_ip": doc.wg_ip,
         "enrolled_on": doc.enrolled_on,
         "hardware_snapshot": doc.hardware_snapshot,
         "online": bool(
-            doc.last_heartbeat
-            and (now - get_datetime(doc.last_heartbeat)).total_seconds()
+            seen["last_heartbeat"]
+            and (now - get_datetime(seen["last_heartbeat"])).total_seconds()
             < OFFLINE_AFTER_MINUTES * 60
         ),
     }
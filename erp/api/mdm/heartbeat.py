@@ -5,8 +5,8 @@ from __future__ import annotations
 import frappe
 from frappe.utils import cint, now_datetime
 
-from erp.api.mdm.auth import client_ip, get_authenticated_device
-from erp.api.mdm.command import has_pending_commands
+from erp.api.mdm import presence
+from erp.api.mdm.auth import authenticate_device, client_ip
 
 DEFAULT_HEARTBEAT_INTERVAL_SEC = 120
 
@@ -20,28 +20,21 @@ def heartbeat_interval_sec() -> int:
 
 @frappe.whitelist(allow_guest=True, methods=["POST"])
 def heartbeat(agent_version=None, os_version=None, os_build=None):
-    device = get_authenticated_device()
+    device = authenticate_device()
 
-    updates = {
-        "last_heartbeat": now_datetime(),
-        "last_ip": client_ip(),
-    }
-    if agent_version:
-        updates["agent_version"] = agent_version
-    if os_version:
-        updates["os_version"] = os_version
-    if os_build:
-        updates["os_build"] = os_build
-
-    # db_set thay vì save(): heartbeat chạy mỗi 2 phút trên hàng trăm máy,
-    # không cần chạy validate/hooks mỗi lần.
-    frappe.db.set_value("MDM Device", device.name, updates, update_modified=False)
-    frappe.db.commit()
+    # Không chạm MariaDB: presence ghi Redis, job presence.flush ghi DB theo lô
+    presence.record_heartbeat(
+        device.name,
+        client_ip(),
+        agent_version=agent_version,
+        os_version=os_version,
+        os_build=os_build,
+    )
 
     return {
         "ok": True,
         "device_id": device.name,
         "server_time": now_datetime().isoformat(),
         "heartbeat_interval_sec": heartbeat_interval_sec(),
-        "has_pending_commands": has_pending_commands(device.name),
+        "has_pending_commands": presence.has_pending(device.name),
     }
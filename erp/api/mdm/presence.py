@@ -0,0 +1,242 @@
+"""Presence MDM: heartbeat ghi vào Redis, flush xuống DB theo lô.
+
+Vì sao
+------
+Trước đây mỗi heartbeat (vài trăm máy × 2 phút) là một SELECT token + get_doc +
+UPDATE `tabMDM Device` + COMMIT + SELECT lệnh chờ. Giờ đường nóng không chạm MariaDB:
+
+- danh tính token lấy từ cache (`auth.authenticate_device`);
+- `record_heartbeat` ghi {ts, ip, phiên bản} vào hash Redis `PRESENCE_KEY` và đưa
+  máy vào set bẩn `DIRTY_KEY`;
+- cờ "có lệnh chờ" là set Redis `PENDING_KEY`, do `command.py` bật / tắt.
+
+Job `flush` (5 phút) lấy các máy bẩn, ghi `last_heartbeat` / `last_ip` / phiên bản
+bằng một UPDATE ... JOIN cho cả lô, rồi dựng lại set lệnh chờ từ DB. Dashboard và
+cảnh báo offline đọc qua `overlay` / `flush` nên không bị trễ theo chu kỳ flush.
+
+Mất Redis: presence chưa flush (tối đa một chu kỳ) mất theo, máy gửi heartbeat
+kế tiếp là có lại; `has_pending` quay về hỏi DB cho tới khi `flush` dựng lại cờ.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+
+import frappe
+from frappe.utils import get_datetime, now_datetime
+
+DEVICE_TABLE = "tabMDM Device"
+COMMAND_TABLE = "tabMDM Command"
+
+PRESENCE_KEY = "mdm_presence"
+DIRTY_KEY = "mdm_presence_dirty"
+PENDING_KEY = "mdm_pending_commands"
+# Có khoá này nghĩa là PENDING_KEY đã dựng từ DB và còn tin được; sống lâu hơn
+# chu kỳ flush để không rơi về DB giữa hai lần dựng lại
+PENDING_BUILT_KEY = "mdm_pending_commands_built"
+PENDING_BUILT_TTL_SEC = 15 * 60
+
+FLUSH_BATCH = 500
+VERSION_FIELDS = ("agent_version", "os_version", "os_build")
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def record_heartbeat(device, ip=None, **versions):
+    """Ghi nhận máy còn sống. Lỗi Redis thì ghi thẳng DB như cũ — không để mất nhịp."""
+    entry = {"ts": str(now_datetime()), "ip": ip}
+    entry.update({f: versions[f] for f in VERSION_FIELDS if versions.get(f)})
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        pipe.hset(cache.make_key(PRESENCE_KEY), device, json.dumps(entry))
+        pipe.sadd(cache.make_key(DIRTY_KEY), device)
+        pipe.execute()
+    except Exception as e:
+        frappe.logger().warning(f"mdm presence write failed {device}: {e}")
+        _write_rows([(device, entry)])
+        frappe.db.commit()
+
+
+def last_seen_map(devices) -> dict:
+    """{device: {"last_heartbeat": datetime, "last_ip", ...}} cho các máy có presence trong Redis."""
+    devices = list(devices)
+    if not devices:
+        return {}
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        pipe.hmget(cache.make_key(PRESENCE_KEY), devices)
+        (raw,) = pipe.execute()
+    except Exception:
+        return {}
+    return {device: parse_entry(value) for device, value in zip(devices, raw) if value}
+
+
+def parse_entry(value) -> dict:
+    entry = json.loads(_decode(value))
+    seen = {"last_heartbeat": get_datetime(entry["ts"])}
+    if entry.get("ip"):
+        seen["last_ip"] = entry["ip"]
+    seen.update({f: entry[f] for f in VERSION_FIELDS if entry.get(f)})
+    return seen
+
+
+def merge_seen(row, seen):
+    """Đè các trường presence lên một dòng DB nếu presence mới hơn `last_heartbeat` của dòng."""
+    if not seen:
+        return row
+    current = row.get("last_heartbeat")
+    if current and get_datetime(current) >= seen["last_heartbeat"]:
+        return row
+    for field, value in seen.items():
+        if field in row:
+            row[field] = value
+    return row
+
+
+def overlay(rows):
+    """Áp presence Redis lên danh sách dòng `MDM Device` (mỗi dòng có `name`)."""
+    seen = last_seen_map(r["name"] for r in rows)
+    for row in rows:
+        merge_seen(row, seen.get(row["name"]))
+    return rows
+
+
+def _write_rows(rows):
+    """rows: [(device, entry)] -> một UPDATE ... JOIN cho cả lô.
+
+    GREATEST giữ last_heartbeat không lùi nếu DB đã có giá trị mới hơn (ví dụ flush
+    chạy chồng); COALESCE giữ giá trị cũ khi nhịp không gửi phiên bản.
+    """
+    if not rows:
+        return
+    selects, params = [], []
+    for device, entry in rows:
+        selects.append("SELECT %s AS name, %s AS hb, %s AS ip, %s AS av, %s AS ov, %s AS ob")
+        params.extend(
+            [device, get_datetime(entry["ts"]), entry.get("ip")]
+            + [entry.get(f) for f in VERSION_FIELDS]
+        )
+    frappe.db.sql(
+        f"""
+        UPDATE `{DEVICE_TABLE}` d
+        JOIN ({' UNION ALL '.join(selects)}) p ON p.name = d.name
+        SET d.last_heartbeat = GREATEST(COALESCE(d.last_heartbeat, p.hb), p.hb),
+            d.last_ip = COALESCE(p.ip, d.last_ip),
+            d.agent_version = COALESCE(p.av, d.agent_version),
+            d.os_version = COALESCE(p.ov, d.os_version),
+            d.os_build = COALESCE(p.ob, d.os_build)
+        """,
+        tuple(params),
+    )
+
+
+def flush():
+    """Scheduled (5 phút): ghi presence của các máy bẩn xuống DB theo lô, dựng lại cờ lệnh chờ."""
+    cache = frappe.cache()
+    presence_key = cache.make_key(PRESENCE_KEY)
+    dirty_key = cache.make_key(DIRTY_KEY)
+    t0 = time.perf_counter()
+    flushed = 0
+    while True:
+        # SPOP lấy-và-xoá nguyên tử: nhịp đến sau SPOP đưa máy vào lại set bẩn.
+        # Đi qua pipeline: RedisWrapper.spop/sadd tự thêm tiền tố lần nữa
+        pipe = cache.pipeline()
+        pipe.spop(dirty_key, FLUSH_BATCH)
+        (popped,) = pipe.execute()
+        devices = [_decode(d) for d in (popped or [])]
+        if not devices:
+            break
+        pipe = cache.pipeline()
+        pipe.hmget(presence_key, devices)
+        (raw,) = pipe.execute()
+        rows = [(device, json.loads(_decode(value))) for device, value in zip(devices, raw) if value]
+        try:
+            _write_rows(rows)
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            pipe = cache.pipeline()
+            pipe.sadd(dirty_key, *devices)
+            pipe.execute()
+            raise
+        flushed += len(rows)
+        if len(devices) < FLUSH_BATCH:
+            break
+
+    rebuild_pending_flags()
+    if flushed:
+        frappe.logger().info(
+            f"mdm presence flush: {flushed} máy trong {time.perf_counter() - t0:.2f}s"
+        )
+    return flushed
+
+
+def mark_pending(devices):
+    """Bật cờ lệnh chờ — gọi SAU commit lệnh để agent không poll trước khi lệnh hiện ra."""
+    devices = [d for d in devices if d]
+    if not devices:
+        return
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        pipe.sadd(cache.make_key(PENDING_KEY), *devices)
+        pipe.execute()
+    except Exception as e:
+        frappe.logger().warning(f"mdm pending flag set failed: {e}")
+
+
+def clear_pending_if_idle(device):
+    """Tắt cờ khi DB không còn lệnh Pending/Sent (sau pull/ack đã commit).
+
+    Lệnh gửi chen giữa lúc kiểm và lúc SREM có thể mất cờ — `flush` dựng lại từ DB
+    nên chậm nhất một chu kỳ là agent thấy.
+    """
+    from erp.api.mdm.command import has_pending_commands
+
+    if has_pending_commands(device):
+        return
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        pipe.srem(cache.make_key(PENDING_KEY), device)
+        pipe.execute()
+    except Exception as e:
+        frappe.logger().warning(f"mdm pending flag clear failed {device}: {e}")
+
+
+def has_pending(device) -> bool:
+    """Đọc cờ lệnh chờ từ Redis; cờ chưa dựng (Redis mới khởi động) thì hỏi DB."""
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        pipe.exists(cache.make_key(PENDING_BUILT_KEY))
+        pipe.sismember(cache.make_key(PENDING_KEY), device)
+        built, member = pipe.execute()
+        if built:
+            return bool(member)
+    except Exception:
+        pass
+    from erp.api.mdm.command import has_pending_commands
+
+    return has_pending_commands(device)
+
+
+def rebuild_pending_flags():
+    """Dựng lại set cờ lệnh chờ từ `tabMDM Command` (một SELECT DISTINCT)."""
+    devices = frappe.db.sql_list(
+        f"SELECT DISTINCT device FROM `{COMMAND_TABLE}` WHERE status IN ('Pending', 'Sent')"
+    )
+    cache = frappe.cache()
+    key = cache.make_key(PENDING_KEY)
+    pipe = cache.pipeline()
+    pipe.delete(key)
+    if devices:
+        pipe.sadd(key, *devices)
+    pipe.set(cache.make_key(PENDING_BUILT_KEY), 1, ex=PENDING_BUILT_TTL_SEC)
+    pipe.execute()
+    return len(devices)
@@ -3,21 +3,39 @@
 Hai thứ khác nhau về nhịp và về ý nghĩa:
 - **Inventory** đổi rất hiếm (thay RAM, thay ổ) → so sánh với ảnh chụp cũ và
   cảnh báo khi lệch. Đây chính là giá trị quản lý tài sản nhà trường cần nhất.
-- **Telemetry** đổi liên tục → nhận theo lô, có TTL để không phình DB.
+- **Telemetry** đổi liên tục → nhận theo lô, ghi một INSERT nhiều dòng vào bảng
+  chỉ-thêm, tổng hợp 5 phút / 1 giờ và dọn theo lô ở `telemetry_rollup`.
 """
 
 from __future__ import annotations
 
 import json
+from datetime import timedelta
 
 import frappe
-from frappe.utils import cint, flt, now_datetime
+from frappe.utils import cint, flt, get_datetime, now_datetime
 
+from erp.api.mdm import presence, telemetry_rollup
 from erp.api.mdm.alert import raise_alert
-from erp.api.mdm.auth import client_ip, get_authenticated_device
+from erp.api.mdm.auth import authenticate_device, client_ip, get_authenticated_device
 
 TELEMETRY_DOCTYPE = "MDM Telemetry"
-TELEMETRY_TTL_DAYS = 30
+TELEMETRY_TTL_DAYS = telemetry_rollup.RAW_TTL_DAYS
+MAX_SAMPLES = 500
+
+# Khoảng xem tới ngần này thì đọc mẫu thô / khung 5 phút; dài hơn đọc khung giờ
+RAW_MAX_RANGE = timedelta(hours=6)
+FIVE_MIN_MAX_RANGE = timedelta(days=7)
+
+_SAMPLE_COLUMNS = (
+    "device", "captured_at", "cpu_pct", "ram_pct", "disk_free_gb", "disk_total_gb",
+    "disk_health", "battery_pct", "charging", "uptime_sec", "cpu_temp",
+)
+_DISK_HEALTH_IDX = _SAMPLE_COLUMNS.index("disk_health")
+_SERIES_FIELDS = [
+    "captured_at", "cpu_pct", "ram_pct", "disk_free_gb", "disk_total_gb",
+    "battery_pct", "charging", "uptime_sec", "cpu_temp", "disk_health",
+]
 
 
 @frappe.whitelist(allow_guest=True, methods=["POST"])
@@ -64,7 +82,7 @@ def ingest_inventory(inventory=None):
 @frappe.whitelist(allow_guest=True, methods=["POST"])
 def ingest_telemetry(samples=None):
     """Nhận lô mẫu telemetry. Agent gom 1–5 phút mới gửi một lần."""
-    device = get_authenticated_device()
+    device = authenticate_device()
 
     if isinstance(samples, str):
         samples = frappe.parse_json(samples)
@@ -74,33 +92,23 @@ def ingest_telemetry(samples=None):
         frappe.local.response["http_status_code"] = 400
         frappe.throw("samples phải là mảng", frappe.ValidationError)
 
-    accepted = 0
+    rows = []
     worst_disk = None
-    for sample in samples[:500]:
+    for sample in samples[:MAX_SAMPLES]:
         try:
-            doc = frappe.get_doc(
-                {
-                    "doctype": TELEMETRY_DOCTYPE,
-                    "device": device.name,
-                    "captured_at": sample.get("captured_at") or now_datetime(),
-                    "cpu_pct": flt(sample.get("cpu_pct")),
-                    "ram_pct": flt(sample.get("ram_pct")),
-                    "disk_free_gb": flt(sample.get("disk_free_gb")),
-                    "disk_total_gb": flt(sample.get("disk_total_gb")),
-                    "disk_health": sample.get("disk_health"),
-                    "battery_pct": cint(sample.get("battery_pct")),
-                    "charging": cint(sample.get("charging")),
-                    "uptime_sec": cint(sample.get("uptime_sec")),
-                    "cpu_temp": flt(sample.get("cpu_temp")) or None,
-                }
-            )
-            doc.insert(ignore_permissions=True)
-            accepted += 1
-            if sample.get("disk_health") in ("warning", "critical"):
-                worst_disk = sample.get("disk_health")
+            row = _sample_row(device.name, sample)
         except Exception:
             # Một mẫu hỏng không được làm mất cả lô
             frappe.log_error(title="MDM ingest telemetry", message=frappe.get_traceback())
+            continue
+        rows.append(row)
+        health = row[_DISK_HEALTH_IDX]
+        if health in ("warning", "critical") and worst_disk != "critical":
+            worst_disk = health
+
+    _insert_samples(rows)
+    telemetry_rollup.mark_dirty(device.name, [row[1] for row in rows])
+    accepted = len(rows)
 
     if worst_disk:
         raise_alert(
@@ -112,28 +120,127 @@ def ingest_telemetry(samples=None):
             dedup_key=f"disk:{device.name}:{worst_disk}",
         )
 
-    frappe.db.set_value(
-        "MDM Device", device.name, "last_heartbeat", now_datetime(), update_modified=False
-    )
     frappe.db.commit()
+    presence.record_heartbeat(device.name, client_ip())
     return {"ok": True, "accepted": accepted}
 
 
+def _sample_row(device, sample) -> tuple:
+    """Một mẫu -> tuple theo `_SAMPLE_COLUMNS` (đúng kiểu như khi còn insert bằng doc)."""
+    disk_health = sample.get("disk_health") or None
+    if disk_health not in (None, "ok", "warning", "critical", "unknown"):
+        disk_health = "unknown"
+    return (
+        device,
+        get_datetime(sample.get("captured_at") or now_datetime()),
+        flt(sample.get("cpu_pct")),
+        flt(sample.get("ram_pct")),
+        flt(sample.get("disk_free_gb")),
+        flt(sample.get("disk_total_gb")),
+        disk_health,
+        cint(sample.get("battery_pct")),
+        cint(sample.get("charging")),
+        cint(sample.get("uptime_sec")),
+        flt(sample.get("cpu_temp")) or None,
+    )
+
+
+def _insert_samples(rows):
+    """Một INSERT nhiều dòng cho cả lô — bảng chỉ thêm, không doc hook / validate."""
+    if not rows:
+        return
+    now = now_datetime()
+    user = frappe.session.user
+    placeholders = "(" + ", ".join(["%s"] * (len(_SAMPLE_COLUMNS) + 6)) + ")"
+    values = []
+    for row in rows:
+        values.extend((frappe.generate_hash(length=10), *row, now, now, user, user, 0))
+    frappe.db.sql(
+        f"""
+        INSERT INTO `tab{TELEMETRY_DOCTYPE}`
+            (name, {', '.join(_SAMPLE_COLUMNS)}, creation, modified, owner, modified_by, docstatus)
+        VALUES {', '.join([placeholders] * len(rows))}
+        """,
+        values,
+    )
+
+
+def pick_resolution(range_start, range_end) -> str:
+    """Mẫu thô cho khoảng ngắn (và còn trong TTL), 5 phút cho ≤ 7 ngày, còn lại theo giờ."""
+    span = range_end - range_start
+    raw_floor = now_datetime() - timedelta(days=telemetry_rollup.RAW_TTL_DAYS)
+    if span <= RAW_MAX_RANGE and range_start >= raw_floor:
+        return "raw"
+    if span <= FIVE_MIN_MAX_RANGE:
+        return telemetry_rollup.FIVE_MIN
+    return telemetry_rollup.HOURLY
+
+
+def _rollup_series(device, resolution, range_start, range_end):
+    """Dòng rollup cùng hình dạng với mẫu thô (giá trị = avg) kèm *_min / *_max."""
+    metric_fields = []
+    for m in telemetry_rollup.METRICS:
+        metric_fields += [f"{m}_avg as {m}", f"{m}_min", f"{m}_max"]
+    rows = frappe.get_all(
+        telemetry_rollup.ROLLUP_DOCTYPE,
+        filters=[
+            ["device", "=", device],
+            ["resolution", "=", resolution],
+            ["bucket_start", ">=", range_start],
+            ["bucket_start", "<", range_end],
+        ],
+        fields=[
+            "bucket_start as captured_at", "sample_count", "disk_total_gb", "disk_health",
+            "uptime_sec", *metric_fields,
+        ],
+        order_by="bucket_start asc",
+        limit_page_length=0,
+    )
+    for row in rows:
+        row["resolution"] = resolution
+    return rows
+
+
 @frappe.whitelist()
-def device_telemetry(device=None, limit=200):
-    """Chuỗi telemetry gần nhất cho biểu đồ ở trang chi tiết máy."""
+def device_telemetry(device=None, limit=200, range_start=None, range_end=None, resolution=None):
+    """Chuỗi telemetry cho biểu đồ ở trang chi tiết máy.
+
+    Không truyền khoảng: `limit` mẫu thô gần nhất như trước. Có khoảng: tự chọn độ
+    phân giải theo độ dài khoảng (`pick_resolution`) trừ khi truyền `resolution`
+    ("raw" / "5m" / "1h").
+    """
     if not frappe.has_permission("MDM Device", "read"):
         frappe.throw("Không có quyền xem telemetry", frappe.PermissionError)
     if not device:
         frappe.throw("Thiếu device")
 
+    if range_start or range_end:
+        end = get_datetime(range_end) if range_end else now_datetime()
+        start = get_datetime(range_start) if range_start else end - RAW_MAX_RANGE
+        if end <= start:
+            frappe.throw("Khoảng thời gian không hợp lệ")
+        resolution = resolution or pick_resolution(start, end)
+        if resolution in (telemetry_rollup.FIVE_MIN, telemetry_rollup.HOURLY):
+            return _rollup_series(device, resolution, start, end)
+        rows = frappe.get_all(
+            TELEMETRY_DOCTYPE,
+            filters=[
+                ["device", "=", device],
+                ["captured_at", ">=", start],
+                ["captured_at", "<", end],
+            ],
+            fields=_SERIES_FIELDS,
+            order_by="captured_at asc",
+            limit_page_length=0,
+        )
+        for row in rows:
+            row["resolution"] = "raw"
+        return rows
+
     rows = frappe.get_all(
         TELEMETRY_DOCTYPE,
         filters={"device": device},
-        fields=[
-            "captured_at", "cpu_pct", "ram_pct", "disk_free_gb", "disk_total_gb",
-            "battery_pct", "charging", "uptime_sec", "cpu_temp", "disk_health",
-        ],
+        fields=_SERIES_FIELDS,
         order_by="captured_at desc",
         limit_page_length=cint(limit) or 200,
     )
@@ -142,13 +249,10 @@ def device_telemetry(device=None, limit=200):
 
 
 def cleanup_old_telemetry():
-    """Scheduled: xóa telemetry quá hạn. Đặt TTL từ đầu, không đợi DB phình rồi mới lo."""
-    frappe.db.sql(
-        """DELETE FROM `tabMDM Telemetry`
-           WHERE captured_at < DATE_SUB(NOW(), INTERVAL %s DAY)""",
-        (TELEMETRY_TTL_DAYS,),
-    )
-    frappe.db.commit()
+    """Scheduled: xóa telemetry quá hạn theo lô (mẫu thô + hai mức rollup)."""
+    summary = telemetry_rollup.purge_expired()
+    frappe.logger().info(f"mdm telemetry purge: {summary}")
+    return summary
 
 
 def _load_snapshot(raw) -> dict | None:
@@ -0,0 +1,220 @@
+"""Tổng hợp telemetry theo khung 5 phút / 1 giờ và dọn dữ liệu cũ theo lô.
+
+Vì sao
+------
+Vài trăm laptop học sinh gửi mẫu vài phút một lần → `tabMDM Telemetry` là bảng lớn
+nhanh nhất. Biểu đồ 1 tuần / 1 tháng không cần từng mẫu: đọc `MDM Telemetry
+Rollup` (min/avg/max mỗi khung) nhẹ hơn hàng trăm lần và cho phép giữ mẫu thô ngắn.
+
+Khung bẩn
+---------
+`ingest_telemetry` ghi mẫu xong thì `mark_dirty` đưa (máy, khung 5 phút) vào một
+sorted set Redis (score = đầu khung). Job 5 phút `rollup_dirty_buckets` lấy các
+khung đã "lắng" (`SETTLE_SEC`), tính lại bằng INSERT ... SELECT ... GROUP BY
+(ON DUPLICATE KEY UPDATE — chạy lại bao nhiêu lần cũng đúng), rồi tính lại khung
+giờ chứa chúng từ các dòng 5 phút. Mẫu đến muộn (agent offline gom lại) chỉ làm
+khung cũ bẩn lại — không cần cửa sổ quét cố định. Mất Redis thì chạy
+`rebuild(start, end)`.
+
+Dọn
+---
+Mỗi mức giữ một TTL riêng; xoá theo lô `PURGE_BATCH` dòng trên index thời gian,
+commit từng lô để không giữ khoá / phình undo log như một DELETE khổng lồ.
+"""
+
+from __future__ import annotations
+
+import time
+from datetime import timedelta
+
+import frappe
+from frappe.utils import get_datetime, now_datetime
+
+RAW_TABLE = "tabMDM Telemetry"
+ROLLUP_DOCTYPE = "MDM Telemetry Rollup"
+ROLLUP_TABLE = f"tab{ROLLUP_DOCTYPE}"
+
+FIVE_MIN = "5m"
+HOURLY = "1h"
+BUCKET_SEC = {FIVE_MIN: 300, HOURLY: 3600}
+
+RAW_TTL_DAYS = 7
+ROLLUP_TTL_DAYS = {FIVE_MIN: 45, HOURLY: 400}
+
+DIRTY_KEY = "mdm_telemetry_dirty"
+SETTLE_SEC = 60
+DIRTY_BATCH = 2000
+PURGE_BATCH = 5000
+MAX_PURGE_BATCHES = 500
+
+METRICS = ("cpu_pct", "ram_pct", "disk_free_gb", "battery_pct", "cpu_temp")
+_HEALTH_LEVEL = "CASE {col} WHEN 'critical' THEN 3 WHEN 'warning' THEN 2 WHEN 'ok' THEN 1 WHEN 'unknown' THEN 0 END"
+_HEALTH_NAME = "ELT(1 + {level}, 'unknown', 'ok', 'warning', 'critical')"
+
+_COLUMNS = (
+    ["sample_count"]
+    + [f"{m}_{agg}" for m in METRICS for agg in ("min", "avg", "max")]
+    + ["disk_total_gb", "disk_health", "uptime_sec"]
+)
+
+
+def bucket_start(ts, resolution=FIVE_MIN):
+    ts = get_datetime(ts)
+    step = BUCKET_SEC[resolution]
+    seconds = ts.hour * 3600 + ts.minute * 60 + ts.second
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(seconds=seconds - seconds % step)
+
+
+def mark_dirty(device, captured_ats):
+    """Đánh dấu các khung 5 phút của một lô mẫu — gọi từ ingest, lỗi Redis thì bỏ qua."""
+    try:
+        members = {}
+        for ts in captured_ats:
+            start = bucket_start(ts)
+            members[f"{device}|{start:%Y-%m-%d %H:%M:%S}"] = start.timestamp()
+        if members:
+            cache = frappe.cache()
+            cache.zadd(cache.make_key(DIRTY_KEY), members)
+    except Exception as e:
+        frappe.logger().warning(f"mdm telemetry mark_dirty failed {device}: {e}")
+
+
+def _upsert_sql(source_sql):
+    updates = ", ".join(f"`{c}` = VALUES(`{c}`)" for c in _COLUMNS + ["modified"])
+    return f"""
+        INSERT INTO `{ROLLUP_TABLE}`
+            (name, device, resolution, bucket_start, {', '.join(f'`{c}`' for c in _COLUMNS)},
+             creation, modified, owner, modified_by, docstatus)
+        {source_sql}
+        ON DUPLICATE KEY UPDATE {updates}
+    """
+
+
+def _rollup_five_minute(device, lo, hi):
+    """Tính lại mọi khung 5 phút của máy có mẫu trong [lo, hi)."""
+    bucket = "FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(captured_at) / 300) * 300)"
+    aggs = ", ".join(f"MIN({m}), AVG({m}), MAX({m})" for m in METRICS)
+    level = _HEALTH_LEVEL.format(col="disk_health")
+    frappe.db.sql(
+        _upsert_sql(f"""
+        SELECT SUBSTRING(MD5(CONCAT_WS('|', device, '{FIVE_MIN}', {bucket})), 1, 20),
+               device, '{FIVE_MIN}', {bucket},
+               COUNT(*), {aggs},
+               MAX(disk_total_gb), {_HEALTH_NAME.format(level=f'MAX({level})')}, MAX(uptime_sec),
+               NOW(), NOW(), 'Administrator', 'Administrator', 0
+        FROM `{RAW_TABLE}`
+        WHERE device = %(device)s AND captured_at >= %(lo)s AND captured_at < %(hi)s
+        GROUP BY device, {bucket}
+        """),
+        {"device": device, "lo": lo, "hi": hi},
+    )
+
+
+def _rollup_hourly(device, lo, hi):
+    """Tính lại khung giờ trong [lo, hi) từ các dòng 5 phút (avg có trọng số số mẫu)."""
+    hour = "DATE_FORMAT(bucket_start, '%%Y-%%m-%%d %%H:00:00')"
+    aggs = ", ".join(
+        f"MIN({m}_min), SUM({m}_avg * sample_count) / NULLIF(SUM(IF({m}_avg IS NULL, 0, sample_count)), 0), MAX({m}_max)"
+        for m in METRICS
+    )
+    level = _HEALTH_LEVEL.format(col="disk_health")
+    frappe.db.sql(
+        _upsert_sql(f"""
+        SELECT SUBSTRING(MD5(CONCAT_WS('|', device, '{HOURLY}', {hour})), 1, 20),
+               device, '{HOURLY}', {hour},
+               SUM(sample_count), {aggs},
+               MAX(disk_total_gb), {_HEALTH_NAME.format(level=f'MAX({level})')}, MAX(uptime_sec),
+               NOW(), NOW(), 'Administrator', 'Administrator', 0
+        FROM `{ROLLUP_TABLE}`
+        WHERE device = %(device)s AND resolution = '{FIVE_MIN}'
+          AND bucket_start >= %(lo)s AND bucket_start < %(hi)s
+        GROUP BY device, {hour}
+        """),
+        {"device": device, "lo": lo, "hi": hi},
+    )
+
+
+def _rollup_device_spans(spans):
+    """spans: {device: [đầu khung 5 phút]} -> tính lại 5 phút rồi giờ cho từng máy."""
+    for device, starts in spans.items():
+        starts = sorted(set(starts))
+        _rollup_five_minute(device, starts[0], starts[-1] + timedelta(seconds=BUCKET_SEC[FIVE_MIN]))
+        hours = sorted({bucket_start(s, HOURLY) for s in starts})
+        _rollup_hourly(device, hours[0], hours[-1] + timedelta(seconds=BUCKET_SEC[HOURLY]))
+
+
+def rollup_dirty_buckets():
+    """Scheduled (5 phút): tổng hợp các khung bẩn đã lắng."""
+    if not frappe.db.table_exists(ROLLUP_DOCTYPE):
+        return
+    cache = frappe.cache()
+    key = cache.make_key(DIRTY_KEY)
+    cutoff = now_datetime().timestamp() - BUCKET_SEC[FIVE_MIN] - SETTLE_SEC
+    t0 = time.perf_counter()
+    processed = 0
+    while True:
+        members = cache.zrangebyscore(key, "-inf", cutoff, start=0, num=DIRTY_BATCH)
+        if not members:
+            break
+        spans = {}
+        for raw in members:
+            device, _, start = (raw.decode() if isinstance(raw, bytes) else raw).rpartition("|")
+            if device and start:
+                spans.setdefault(device, []).append(get_datetime(start))
+        _rollup_device_spans(spans)
+        frappe.db.commit()
+        # Xoá SAU commit: lỗi giữa chừng thì khung vẫn bẩn, lần sau tính lại
+        cache.zrem(key, *members)
+        processed += len(members)
+        if len(members) < DIRTY_BATCH:
+            break
+    if processed:
+        frappe.logger().info(
+            f"mdm telemetry rollup: {processed} khung trong {time.perf_counter() - t0:.2f}s"
+        )
+
+
+def rebuild(start=None, end=None):
+    """Dựng lại rollup cho mọi máy trong [start, end) từ mẫu thô (patch / sau khi mất Redis)."""
+    end = get_datetime(end) if end else now_datetime()
+    start = get_datetime(start) if start else end - timedelta(days=RAW_TTL_DAYS)
+    lo = bucket_start(start, HOURLY)
+    devices = frappe.db.sql_list(
+        f"SELECT DISTINCT device FROM `{RAW_TABLE}` WHERE captured_at >= %s AND captured_at < %s",
+        (lo, end),
+    )
+    for device in devices:
+        _rollup_five_minute(device, lo, end)
+        _rollup_hourly(device, lo, end)
+        frappe.db.commit()
+    return {"devices": len(devices), "start": str(lo), "end": str(end)}
+
+
+def _purge(table, time_column, cutoff, extra_where="", params=None):
+    """Cùng pattern với erp/common/log_purge.py: lô nhỏ + commit từng lô."""
+    deleted = 0
+    params = dict(params or {}, cutoff=cutoff, batch=PURGE_BATCH)
+    for _ in range(MAX_PURGE_BATCHES):
+        frappe.db.sql(
+            f"DELETE FROM `{table}` WHERE {time_column} < %(cutoff)s {extra_where} LIMIT %(batch)s",
+            params,
+        )
+        affected = frappe.db.sql("SELECT ROW_COUNT()")[0][0] or 0
+        frappe.db.commit()
+        deleted += affected
+        if affected < PURGE_BATCH:
+            break
+    return deleted
+
+
+def purge_expired():
+    """Xoá mẫu thô / rollup quá TTL theo lô. Trả số dòng đã xoá theo mức."""
+    now = now_datetime()
+    summary = {"raw": _purge(RAW_TABLE, "captured_at", now - timedelta(days=RAW_TTL_DAYS))}
+    if frappe.db.table_exists(ROLLUP_DOCTYPE):
+        for resolution, days in ROLLUP_TTL_DAYS.items():
+            summary[resolution] = _purge(
+                ROLLUP_TABLE, "bucket_start", now - timedelta(days=days),
+                "AND resolution = %(resolution)s", {"resolution": resolution},
+            )
+    return summary
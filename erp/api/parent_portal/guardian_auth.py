@@ -158,6 +158,9 @@ def force_logout_guardian(guardian_id=None, guardian_name=None):
         guardian.force_logout_at = frappe.utils.now_datetime()
         guardian.save(ignore_permissions=True)
         frappe.db.commit()
+        # Hook on_update đã ghi bộ đếm; gọi lại ở đây cho chắc khi hook bị tắt
+        from erp.utils.jwt_auth import set_guardian_token_version
+        set_guardian_token_version(guardian_name, current_version + 1)
         
         frappe.logger().info(
             f"Force logout guardian {guardian_name}: version {current_version} -> {current_version + 1}"
@@ -196,6 +199,9 @@ def force_logout_all_guardians():
                 force_logout_at = NOW()
         """)
         frappe.db.commit()
+        # UPDATE thẳng không qua hook → xoá bộ đếm Redis, request sau đọc lại từ DB
+        from erp.utils.jwt_auth import clear_guardian_token_versions
+        clear_guardian_token_versions()
         
         count = frappe.db.count("CRM Guardian")
         
@@ -121,7 +121,8 @@ def _guardian_from_request():
     Lấy từ email do `get_parent_portal_user_from_request()` trả về — đường này đi
     qua `verify_guardian_jwt_token` (CÓ kiểm chữ ký). Cố ý KHÔNG dùng
     `frappe.session.user` / `get_current_guardian()`: đường đó rơi vào middleware
-    JWT toàn cục hiện chưa kiểm chữ ký (`erp/utils/jwt_auth.py`).
+    JWT toàn cục, có thể tắt kiểm chữ ký qua `jwt_auth_verify_signature`
+    (`erp/utils/jwt_auth.py`).
     """
     user_email = get_parent_portal_user_from_request()
     if not user_email or user_email == "Guest":
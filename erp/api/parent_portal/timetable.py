@@ -9,6 +9,7 @@ from frappe.utils import getdate
 from datetime import datetime, timedelta
 import json
 from erp.utils.api_response import validation_error_response, list_response, error_response
+from erp.api.erp_sis.timetable import schedule_engine
 
 
 def _timetable_row_applies_to_target_date(row_dict, instance_start, instance_end, target_date_str):
@@ -548,25 +549,17 @@ def _get_class_timetable_for_date(class_id, target_date, enrich_cache=None, clas
 
             logs.append(f"📋 Class: {class_id}, Grade: {education_grade_id}, Stage: {education_stage_id}, Campus: {campus_id}")
             
-            # Get columns actually used in this instance for this day (study periods)
-            study_columns_sql = """
-                SELECT DISTINCT
-                    tir.timetable_column_id
-                FROM `tabSIS Timetable Instance Row` tir
-                INNER JOIN `tabSIS Timetable Instance` ti ON ti.name = tir.parent
-                WHERE tir.parent IN %(instance_ids)s
-                AND tir.day_of_week = %(day_of_week)s
-                AND %(target_date)s >= IFNULL(tir.valid_from, ti.start_date)
-                AND %(target_date)s <= IFNULL(tir.valid_to, ti.end_date)
-            """
+            # Dòng TKB hiệu lực trong ngày qua schedule_engine (chỉ mục đã biên dịch theo
+            # instance): pattern có valid_from mới nhất thắng, override theo ngày thay pattern
+            schedules = schedule_engine.get_schedules(instance_ids)
+            day_rows = [
+                row
+                for instance_id in instance_ids
+                if instance_id in schedules
+                for row in schedules[instance_id].rows_on(target_date)
+            ]
             
-            study_columns = frappe.db.sql(study_columns_sql, {
-                "instance_ids": tuple(instance_ids),
-                "day_of_week": day_of_week,
-                "target_date": target_date_str,
-            }, as_dict=True)
-            
-            study_column_ids = {row['timetable_column_id'] for row in study_columns}
+            study_column_ids = {row.timetable_column_id for row in day_rows if row.timetable_column_id}
             logs.append(f"✅ Found {len(study_column_ids)} study columns for {day_of_week}")
             
             # ⚡ FIX: Lấy non-study columns theo schedule active cho ngày target
@@ -789,29 +782,10 @@ def _get_class_timetable_for_date(class_id, target_date, enrich_cache=None, clas
             logs.append(f"✅ Total {len(all_day_columns)} columns for {day_of_week} (study + non-study)")
             
             # Get existing rows with subject data for this specific day
-            existing_rows_sql = """
-                SELECT DISTINCT
-                    tir.timetable_column_id,
-                    tir.subject_id,
-                    tir.teacher_1_id,
-                    tir.teacher_2_id,
-                    tir.room_id,
-                    tir.day_of_week
-                FROM `tabSIS Timetable Instance Row` tir
-                INNER JOIN `tabSIS Timetable Instance` ti ON ti.name = tir.parent
-                WHERE tir.parent IN %(instance_ids)s
-                AND tir.day_of_week = %(day_of_week)s
-                AND tir.subject_id IS NOT NULL
-                AND %(target_date)s >= IFNULL(tir.valid_from, ti.start_date)
-                AND %(target_date)s <= IFNULL(tir.valid_to, ti.end_date)
-                ORDER BY tir.timetable_column_id
-            """
-
-            existing_rows = frappe.db.sql(existing_rows_sql, {
-                "instance_ids": tuple(instance_ids),
-                "day_of_week": day_of_week,
-                "target_date": target_date_str,
-            }, as_dict=True)
+            existing_rows = sorted(
+                (row for row in day_rows if row.subject_id),
+                key=lambda row: row.timetable_column_id or ""
+            )
 
             logs.append(f"✅ Found {len(existing_rows)} study period rows for {day_of_week}")
 
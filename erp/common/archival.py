@@ -0,0 +1,289 @@
+"""
+Dọn / lưu trữ bảng log lớn theo lô có giới hạn — dùng chung cho log_purge và
+notification_purge.
+
+Vì sao
+------
+`DELETE ... WHERE creation < X LIMIT 10000` quét index thời gian rồi khoá cả dải
+khoá nó đi qua; trên bảng đang được worker ghi liên tục (ERP Notification ~10–20k
+dòng/ngày trong giờ điểm danh) mỗi lô giữ lock đủ lâu để chặn INSERT, và 300 lô
+liền nhau không nghỉ làm undo log / replica đuổi không kịp.
+
+Cách chạy
+---------
+Mỗi bảng khai một policy (xem `policy`): doctype, cột thời gian, số ngày giữ, có lưu
+trữ hay không. `run_policy`:
+
+1. lấy `batch_size` khoá chính cũ nhất (`SELECT name ... ORDER BY <cột thời gian>`),
+2. nếu `archive`: `INSERT IGNORE ... SELECT` các dòng đó sang bảng lưu trữ theo
+   tháng `_archive_<bảng>_<YYYYMM>` (ROW_FORMAT=COMPRESSED — xoá cả tháng chỉ là
+   DROP TABLE), liệt kê cột tường minh; cột mới của bảng nguồn (migrate thêm field)
+   được thêm vào bảng lưu trữ trước,
+3. `DELETE ... WHERE name IN (...)` — xoá đúng các khoá vừa lấy, lock ngắn,
+4. commit, nghỉ `sleep_sec`; replica trễ quá `MAX_LAG_SEC` thì nghỉ thêm, trễ mãi
+   thì dừng lượt chạy,
+5. dừng khi hết dòng cũ, hết `max_rows` hoặc hết thời gian; phần còn lại để lượt sau.
+
+Thời gian là MỘT ngân sách cho cả lượt `run` (`DEFAULT_MAX_SECONDS`), các policy chạy
+sau dùng phần còn lại — log_purge chạy hai policy trong cùng một job daily_long
+(timeout 1500 giây). `max_seconds` của policy chỉ siết thêm cho riêng doctype đó.
+
+Mỗi lượt trả / ghi log: số dòng lưu trữ + xoá, số lô, thời gian, độ trễ replica lớn nhất.
+"""
+
+import time
+from datetime import date
+
+import frappe
+from frappe.utils import add_days, add_months, now_datetime
+
+ARCHIVE_PREFIX = "_archive_"
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_SLEEP_SEC = 0.2
+DEFAULT_MAX_ROWS = 1_000_000
+# Ngân sách thời gian cho cả lượt `run` — dưới timeout 1500 giây của job daily_long
+DEFAULT_MAX_SECONDS = 20 * 60
+DEFAULT_ARCHIVE_KEEP_MONTHS = 12
+
+MAX_LAG_SEC = 30
+LAG_BACKOFF_SEC = 5
+MAX_LAG_WAITS = 12
+
+
+def policy(doctype, retention_days, date_column="creation", archive=False, **overrides):
+	"""Khai báo dọn cho một doctype. overrides: batch_size, sleep_sec, max_rows,
+	max_seconds, archive_keep_months."""
+	return frappe._dict(
+		doctype=doctype,
+		retention_days=retention_days,
+		date_column=date_column,
+		archive=archive,
+		batch_size=overrides.get("batch_size", DEFAULT_BATCH_SIZE),
+		sleep_sec=overrides.get("sleep_sec", DEFAULT_SLEEP_SEC),
+		max_rows=overrides.get("max_rows", DEFAULT_MAX_ROWS),
+		max_seconds=overrides.get("max_seconds"),
+		archive_keep_months=overrides.get("archive_keep_months", DEFAULT_ARCHIVE_KEEP_MONTHS),
+	)
+
+
+def archive_table_name(doctype, month):
+	"""`_archive_erp_notification_202608` — month: date/datetime bất kỳ trong tháng."""
+	slug = "".join(ch if ch.isalnum() else "_" for ch in doctype.lower())
+	return f"{ARCHIVE_PREFIX}{slug}_{month:%Y%m}"
+
+
+def group_by_month(rows):
+	"""rows [(name, ts)] -> {(năm, tháng): [name]} giữ thứ tự."""
+	out = {}
+	for name, ts in rows:
+		out.setdefault((ts.year, ts.month), []).append(name)
+	return out
+
+
+# ---------------------------------------------------------------------------
+# Độ trễ replica
+# ---------------------------------------------------------------------------
+
+
+def _replica_connection():
+	"""Kết nối tới replica khai trong site_config (`replica_host`), hoặc None."""
+	conf = frappe.conf
+	if not conf.get("replica_host"):
+		return None
+	try:
+		from frappe.database import get_db
+
+		user, password = conf.db_name, conf.db_password
+		if conf.get("different_credentials_for_replica"):
+			user, password = conf.replica_db_name, conf.replica_db_password
+		return get_db(
+			host=conf.replica_host,
+			port=conf.get("replica_db_port"),
+			user=user,
+			password=password,
+			cur_db_name=conf.db_name,
+		)
+	except Exception:
+		frappe.logger("archival").warning("không kết nối được replica để đo độ trễ")
+		return None
+
+
+def _replication_lag(replica):
+	"""Giây replica trễ (Seconds_Behind_Master), None nếu không đo được."""
+	if replica is None:
+		return None
+	try:
+		rows = replica.sql("SHOW SLAVE STATUS", as_dict=True)
+	except Exception:
+		return None
+	if not rows:
+		return None
+	lag = rows[0].get("Seconds_Behind_Master")
+	return int(lag) if lag is not None else None
+
+
+# ---------------------------------------------------------------------------
+# Lưu trữ
+# ---------------------------------------------------------------------------
+
+
+def _ensure_archive_table(source, target):
+	if frappe.db.sql("SHOW TABLES LIKE %s", (target,)):
+		return
+	frappe.db.sql_ddl(f"CREATE TABLE IF NOT EXISTS `{target}` LIKE `{source}`")
+	try:
+		frappe.db.sql_ddl(f"ALTER TABLE `{target}` ROW_FORMAT=COMPRESSED")
+	except Exception:
+		# innodb_file_per_table tắt: vẫn lưu trữ được, chỉ không nén
+		frappe.logger("archival").warning(f"{target}: không bật được ROW_FORMAT=COMPRESSED")
+
+
+def _table_columns(table):
+	"""[(cột, kiểu cột)] theo thứ tự trong bảng."""
+	return frappe.db.sql(
+		"""
+		SELECT COLUMN_NAME, COLUMN_TYPE FROM information_schema.COLUMNS
+		WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+		ORDER BY ORDINAL_POSITION
+		""",
+		(table,),
+	)
+
+
+def _sync_archive_columns(source, target):
+	"""Thêm sang bảng lưu trữ các cột nguồn nó chưa có; trả danh sách cột chung để chép.
+	Bảng lưu trữ tạo bằng LIKE từ tháng trước nên lệch schema khi doctype đổi field —
+	`SELECT *` khi đó lỗi số cột hoặc đổ nhầm cột."""
+	existing = {name for name, _ in _table_columns(target)}
+	columns = []
+	for name, column_type in _table_columns(source):
+		if name not in existing:
+			try:
+				frappe.db.sql_ddl(f"ALTER TABLE `{target}` ADD COLUMN `{name}` {column_type} NULL")
+			except Exception:
+				frappe.logger("archival").warning(f"{target}: không thêm được cột {name}, bỏ qua cột này")
+				continue
+		columns.append(name)
+	return columns
+
+
+def _archive_rows(pol, table, rows):
+	for (year, month), names in group_by_month(rows).items():
+		target = archive_table_name(pol.doctype, date(year, month, 1))
+		_ensure_archive_table(table, target)
+		column_list = ", ".join(f"`{c}`" for c in _sync_archive_columns(table, target))
+		frappe.db.sql(
+			f"INSERT IGNORE INTO `{target}` ({column_list}) SELECT {column_list} FROM `{table}` WHERE name IN %s",
+			(tuple(names),),
+		)
+
+
+def drop_expired_archives(pol):
+	"""DROP các bảng lưu trữ tháng cũ hơn `archive_keep_months`. Trả danh sách bảng đã xoá."""
+	oldest = archive_table_name(pol.doctype, add_months(now_datetime(), -pol.archive_keep_months))
+	prefix = oldest[: -len("YYYYMM")]
+	dropped = []
+	for (name,) in frappe.db.sql("SHOW TABLES LIKE %s", (prefix.replace("_", "\\_") + "%",)):
+		# Cùng độ dài + đuôi 6 số: không nhầm sang bảng của doctype có tên bắt đầu giống
+		if len(name) == len(oldest) and name[-6:].isdigit() and name < oldest:
+			frappe.db.sql_ddl(f"DROP TABLE IF EXISTS `{name}`")
+			dropped.append(name)
+	return dropped
+
+
+# ---------------------------------------------------------------------------
+# Chạy
+# ---------------------------------------------------------------------------
+
+
+def run_policy(pol, replica=None, deadline=None):
+	"""Dọn một doctype theo policy. `deadline`: mốc time.monotonic() phải dừng
+	(mặc định DEFAULT_MAX_SECONDS kể từ lúc gọi). Trả báo cáo lượt chạy."""
+	table = f"tab{pol.doctype}"
+	cutoff = add_days(now_datetime(), -pol.retention_days)
+	report = frappe._dict(
+		doctype=pol.doctype, cutoff=str(cutoff), archived=0, deleted=0, batches=0,
+		seconds=0.0, max_lag=None, stopped="done",
+	)
+	if not frappe.db.table_exists(pol.doctype):
+		report.stopped = "missing_table"
+		return report
+
+	t0 = time.monotonic()
+	if deadline is None:
+		deadline = t0 + DEFAULT_MAX_SECONDS
+	if pol.max_seconds:
+		deadline = min(deadline, t0 + pol.max_seconds)
+	while True:
+		if report.deleted >= pol.max_rows:
+			report.stopped = "row_budget"
+			break
+		if time.monotonic() >= deadline:
+			report.stopped = "time_budget"
+			break
+
+		limit = min(pol.batch_size, pol.max_rows - report.deleted)
+		rows = frappe.db.sql(
+			f"""
+			SELECT name, `{pol.date_column}` FROM `{table}`
+			WHERE `{pol.date_column}` < %s
+			ORDER BY `{pol.date_column}`
+			LIMIT %s
+			""",
+			(cutoff, limit),
+		)
+		if not rows:
+			break
+		names = tuple(r[0] for r in rows)
+		if pol.archive:
+			_archive_rows(pol, table, rows)
+			report.archived += len(names)
+		frappe.db.sql(f"DELETE FROM `{table}` WHERE name IN %s", (names,))
+		frappe.db.commit()
+		report.deleted += len(names)
+		report.batches += 1
+		if len(names) < limit:
+			break
+
+		time.sleep(pol.sleep_sec)
+		if not _wait_for_replica(replica, report):
+			report.stopped = "replica_lag"
+			break
+
+	if pol.archive:
+		report.dropped_archives = drop_expired_archives(pol)
+	report.seconds = round(time.monotonic() - t0, 2)
+	return report
+
+
+def _wait_for_replica(replica, report):
+	"""Nghỉ khi replica trễ quá MAX_LAG_SEC. False = trễ mãi, nên dừng lượt chạy."""
+	for _ in range(MAX_LAG_WAITS):
+		lag = _replication_lag(replica)
+		if lag is not None:
+			report.max_lag = max(report.max_lag or 0, lag)
+		if lag is None or lag <= MAX_LAG_SEC:
+			return True
+		time.sleep(LAG_BACKOFF_SEC)
+	return False
+
+
+def run(policies, logger_name="archival", max_seconds=DEFAULT_MAX_SECONDS):
+	"""Chạy lần lượt các policy trong chung một ngân sách `max_seconds`, ghi log một
+	dòng báo cáo cho mỗi doctype."""
+	deadline = time.monotonic() + max_seconds
+	replica = _replica_connection()
+	reports = []
+	try:
+		for pol in policies:
+			report = run_policy(pol, replica, deadline)
+			frappe.logger(logger_name).info(
+				f"{report.doctype}: archived={report.archived} deleted={report.deleted} "
+				f"batches={report.batches} seconds={report.seconds} max_lag={report.max_lag} "
+				f"stopped={report.stopped} cutoff={report.cutoff}"
+			)
+			reports.append(report)
+	finally:
+		if replica is not None:
+			replica.close()
+	return reports
@@ -101,6 +101,14 @@ def _expiry(conf):
     return math.ceil(time.time() / window) * window + lifetime
 
 
+def default_expiry():
+    """Mốc hết hạn của cửa sổ mặc định — cái `sign_path` tự dùng khi không truyền.
+
+    Tách ra để bộ nhớ chữ ký (`cdn_sign_cache`) biết trước `e` mà không phải ký.
+    """
+    return _expiry(load_conf() or {})
+
+
 def expiry_for(window_key, lifetime_key):
     """Moc het han cho mot nhom co cua so ky rieng.
 
@@ -259,11 +267,19 @@ def _media_urls_re():
     return _media_text_re
 
 
-def media_urls_to_files(text):
+def _breaks_json_string(key):
+    """Khoá đã giải mã có ký tự làm vỡ chuỗi JSON (`"`, `\\`, ký tự điều khiển)."""
+    return any(ch in ('"', "\\") or ch < " " for ch in key)
+
+
+def media_urls_to_files(text, json_safe=False):
     """Thay mọi URL media (đã ký) trong chuỗi bằng `/files/<khoá>`.
 
     Dùng cho HTML tin tức và bước chuẩn hoá trước `files_cdn.sign_text` để URL
     hết hạn trong response cũ vẫn được ký lại.
+
+    `json_safe=True` khi `text` là body JSON: khoá giải mã ra `%22`/`%5C`/xuống
+    dòng thì giữ nguyên URL cũ, để bước ký khỏi phải `json.loads` lại cả body.
     """
     if not text or not isinstance(text, str) or "://" not in text:
         return text
@@ -272,6 +288,8 @@ def media_urls_to_files(text):
         key = unquote(m.group(2))
         if not key or ".." in key:
             return m.group(0)
+        if json_safe and _breaks_json_string(key):
+            return m.group(0)
         return f"/files/{key}"
 
     return _media_urls_re().sub(repl, text)
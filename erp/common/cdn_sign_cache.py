@@ -0,0 +1,110 @@
+"""Bo nho TIEN TRINH cho duong ky URL o `after_request` — xem files_cdn.py.
+
+Vi sao can
+----------
+`files_cdn.sign_response` chay tren MOI response JSON. Truoc day moi lan chay:
+
+    - moi domain `frappe.cache().get_value(...)` -> unpickle tap khoa tu Redis
+      (anh hoc sinh ~3.300 ten, noi dung SIS ~2.800 duong dan)
+    - moi match mot lan md5 + base64 trong `cdn_sign.sign_path`
+
+Danh sach 2.198 bia sach tra ve la 2.198 lan md5 cho nhung chuoi GIONG HET
+response truoc do vai giay. Ca hai thu deu doi rat cham nen giu o bo nho tien
+trinh la du.
+
+Tap khoa: dong dau phien ban
+----------------------------
+Moi tien trinh giu ban sao tap khoa kem SO PHIEN BAN doc tu Redis
+(`VERSION_KEY`, mot so nguyen nho). Moi response chi doc so do — `get_value`
+con duoc `frappe.local.cache` giu lai trong request nen la dung MOT lenh GET.
+Chi khi so phien ban doi (domain goi `clear_cache()` -> `bump_version()`) hoac
+ban sao qua `LOCAL_TTL` moi nap lai tap khoa that. TTL bang dung TTL cache
+Redis cua domain nen do tre toi da khong doi so voi truoc.
+
+Chu ky: nho theo (duong dan, moc het han)
+-----------------------------------------
+`cdn_sign.expiry_for` lam tron `e` len moc cua so co dinh, nen trong ca cua so
+cung mot duong dan luon ra CUNG mot URL — nho lai la dung tuyet doi. Chi giu
+`MEMO_WINDOWS` moc gan nhat; qua cua so moi thi moc cu tu rot ra.
+"""
+
+import time
+
+import frappe
+
+from erp.common import cdn_sign
+
+VERSION_KEY = "erp:cdn_keys:version"
+LOCAL_TTL = 300
+
+# Moi moc het han toi da bao nhieu URL. Vuot thi xoa ca moc — tran bo nho la
+# thu duy nhat can chan, chi phi ky lai vai nghin URL khong dang ke.
+MEMO_MAX = 50000
+MEMO_WINDOWS = 2
+
+# ten tap khoa -> (phien ban, luc nap (monotonic), frozenset khoa)
+_keysets = {}
+# moc het han -> {duong dan tho: URL da ky}
+_memo = {}
+
+
+def current_version():
+    """So phien ban tap khoa trong Redis. Loi Redis -> 0 (van phuc vu ban dang giu)."""
+    try:
+        value = frappe.cache().get_value(VERSION_KEY)
+        return int(value) if value is not None else 0
+    except Exception:
+        return 0
+
+
+def bump_version():
+    """Bao moi tien trinh nap lai tap khoa o response ke tiep.
+
+    get + set giong `cache_utils.bump_lesson_status_version`: giu dung site-prefix
+    va cach serialize cua `frappe.cache()`. Hai lenh bump dam nhau thi van TANG,
+    chi co the mat mot buoc — van khac so cu nen khong sao.
+    """
+    try:
+        cache = frappe.cache()
+        cur = cache.get_value(VERSION_KEY)
+        cache.set_value(VERSION_KEY, (int(cur) if cur is not None else 0) + 1)
+    except Exception as e:
+        frappe.logger().warning(f"cdn_sign_cache.bump_version failed: {e}")
+
+
+def local_keys(name, loader):
+    """Tap khoa `name` o bo nho tien trinh; chi goi `loader()` khi het han/doi phien ban."""
+    version = current_version()
+    now = time.monotonic()
+    entry = _keysets.get(name)
+    if entry and entry[0] == version and now - entry[1] < LOCAL_TTL:
+        return entry[2]
+    keys = frozenset(loader() or ())
+    _keysets[name] = (version, now, keys)
+    return keys
+
+
+def sign_path(object_path, expires=None):
+    """Nhu `cdn_sign.sign_path` nhung nho ket qua theo (duong dan, moc het han)."""
+    if expires is None:
+        expires = cdn_sign.default_expiry()
+    bucket = _memo.get(expires)
+    if bucket is None:
+        bucket = _memo[expires] = {}
+        for old in sorted(_memo)[:-MEMO_WINDOWS]:
+            _memo.pop(old, None)
+    signed = bucket.get(object_path)
+    if signed is not None:
+        return signed
+    signed = cdn_sign.sign_path(object_path, expires=expires)
+    if signed:
+        if len(bucket) >= MEMO_MAX:
+            bucket.clear()
+        bucket[object_path] = signed
+    return signed
+
+
+def clear_local():
+    """Xoa sach bo nho tien trinh — cho test va benchmark."""
+    _keysets.clear()
+    _memo.clear()
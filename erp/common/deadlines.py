@@ -0,0 +1,232 @@
+"""
+Hàng đợi hạn (deadline) trên một sorted set Redis — thay các cron quét bảng tìm việc tới hạn.
+
+Vì sao
+------
+SLA CRM, hạn duyệt, visit y tế quá 10 phút, mốc đợt CLB, nhắc sự kiện CSVC trước
+đây là các cron 2–15 phút quét bảng: hầu hết lượt chạy không có gì để làm mà vẫn
+tốn một lượt SELECT, và việc tới hạn phải đợi hết chu kỳ cron mới được xử lý.
+
+Cách chạy
+---------
+- Doc hook của bảng nguồn gọi `schedule(kind, ref, due)` / `cancel(kind, ref)`.
+  Ghi Redis SAU commit (gom theo giao dịch như attendance/day_cache.py): rollback
+  thì không để lại hạn ma, và dispatcher không bắn trước khi dữ liệu hiện ra.
+- `dispatch` (cron mỗi phút) chỉ đọc Redis: không có hạn nào trong
+  `LOOKAHEAD_SEC` tới thì trả về ngay; có thì ngủ tới đúng hạn rồi gọi handler —
+  độ trễ còn vài giây thay vì cả chu kỳ cron.
+- Handler nhận `ref`, TỰ KIỂM LẠI điều kiện trên DB (hạn trong Redis chỉ là gợi
+  ý "nên xem lúc này") rồi trả về datetime hạn kế tiếp (nhắc lại hằng ngày, thử
+  lại khi chưa có người nhận) hoặc None.
+- ZREM là bước "giành" việc: hai dispatcher chạy chồng không xử lý trùng.
+- `rebuild` dựng lại toàn bộ set từ DB (mất Redis, deploy lần đầu, ghi DB không qua
+  doc hook); chạy hằng đêm làm lưới an toàn:
+
+    bench --site <site> execute erp.common.deadlines.rebuild
+"""
+
+import time
+from datetime import datetime, timedelta
+
+import frappe
+from frappe.utils import get_datetime, getdate, now_datetime
+
+ZSET_KEY = "deadlines"
+ATTEMPTS_KEY = "deadlines_attempts"
+_PENDING_FLAG = "deadline_ops"
+
+LOOKAHEAD_SEC = 55
+CLAIM_BATCH = 200
+RETRY_SEC = 120
+MAX_ATTEMPTS = 3
+
+CRM_ISSUE_SLA = "crm_issue_sla"
+APPROVAL_STEP = "approval_step_deadline"
+HEALTH_VISIT_STALE = "health_visit_stale"
+CLUB_PERIOD = "club_period_reminder"
+EVENT_FACILITY = "event_facility_reminder"
+
+#: kind -> handler(ref) -> datetime | None, pending() -> iterable[(ref, due)]
+KINDS = {
+    CRM_ISSUE_SLA: {
+        "handler": "erp.api.crm.sla_scheduler.process_issue_sla",
+        "pending": "erp.api.crm.sla_scheduler.pending_sla_deadlines",
+    },
+    APPROVAL_STEP: {
+        "handler": "erp.api.erp_sis.approval.sla.process_step_deadline",
+        "pending": "erp.api.erp_sis.approval.sla.pending_step_deadlines",
+    },
+    HEALTH_VISIT_STALE: {
+        "handler": "erp.api.erp_sis.daily_health_notification.escalate_stale_visit",
+        "pending": "erp.api.erp_sis.daily_health_notification.pending_stale_visits",
+    },
+    CLUB_PERIOD: {
+        "handler": "erp.sis.tasks.club_reminders.fire_period_reminder",
+        "pending": "erp.sis.tasks.club_reminders.pending_period_reminders",
+    },
+    EVENT_FACILITY: {
+        "handler": "erp.api.erp_administrative.administrative_ticket.fire_event_facility_reminder",
+        "pending": "erp.api.erp_administrative.administrative_ticket.pending_event_facility_reminders",
+    },
+}
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def member(kind, ref):
+    return f"{kind}|{ref}"
+
+
+def parse_member(raw):
+    kind, _, ref = _decode(raw).partition("|")
+    return kind, ref
+
+
+def _now_ts():
+    # Điểm số lấy từ datetime giờ site (naive) -> so với "bây giờ" cùng hệ, không dùng time.time()
+    return now_datetime().timestamp()
+
+
+def start_of_next_day(now=None):
+    """00:00 ngày mai — mốc nhắc lại của các việc "mỗi ngày một lần"."""
+    return datetime.combine(getdate(now or now_datetime()) + timedelta(days=1), datetime.min.time())
+
+
+# ---------------------------------------------------------------------------
+# Đăng ký / huỷ hạn
+# ---------------------------------------------------------------------------
+
+
+def schedule(kind, ref, due):
+    """Đặt (hoặc dời) hạn của `ref`. `due` None = huỷ.
+
+    `ref` có thể là callable: dòng con mới (bước duyệt) chưa có `name` lúc kích
+    hoạt, tới lúc commit mới có — gọi ref() khi ghi Redis.
+    """
+    try:
+        ops = frappe.flags.get(_PENDING_FLAG)
+        if ops is None:
+            ops = frappe.flags[_PENDING_FLAG] = []
+            frappe.db.after_commit.add(_flush_pending)
+            frappe.db.after_rollback.add(lambda: frappe.flags.pop(_PENDING_FLAG, None))
+        ops.append((kind, ref, due))
+    except Exception:
+        frappe.log_error(frappe.get_traceback(), f"deadlines.schedule {kind}")
+
+
+def cancel(kind, ref):
+    schedule(kind, ref, None)
+
+
+def _flush_pending():
+    apply(frappe.flags.pop(_PENDING_FLAG, None) or [])
+
+
+def apply(ops):
+    """Ghi ngay một loạt (kind, ref, due) vào Redis bằng một pipeline — op sau đè op trước."""
+    if not ops:
+        return
+    try:
+        cache = frappe.cache()
+        key = cache.make_key(ZSET_KEY)
+        pipe = cache.pipeline()
+        for kind, ref, due in ops:
+            ref = ref() if callable(ref) else ref
+            if not ref:
+                continue
+            m = member(kind, ref)
+            if due:
+                pipe.zadd(key, {m: get_datetime(due).timestamp()})
+            else:
+                pipe.zrem(key, m)
+        pipe.execute()
+    except Exception:
+        # Mất Redis: hạn sẽ được rebuild hằng đêm dựng lại
+        frappe.log_error(frappe.get_traceback(), "deadlines.apply")
+
+
+# ---------------------------------------------------------------------------
+# Dispatcher
+# ---------------------------------------------------------------------------
+
+
+def dispatch():
+    """Scheduled (mỗi phút): xử lý các hạn tới trong `LOOKAHEAD_SEC` giây tới."""
+    cache = frappe.cache()
+    key = cache.make_key(ZSET_KEY)
+    stop_at = _now_ts() + LOOKAHEAD_SEC
+    handled = 0
+    while True:
+        head = cache.zrange(key, 0, 0, withscores=True)
+        if not head or head[0][1] > stop_at:
+            break
+        wait = head[0][1] - _now_ts()
+        if wait > 0:
+            time.sleep(wait)
+        for raw in cache.zrangebyscore(key, "-inf", _now_ts(), start=0, num=CLAIM_BATCH):
+            # ZREM trả 1 cho đúng một dispatcher -> người đó giữ việc
+            if cache.zrem(key, raw):
+                _run(cache, raw)
+                handled += 1
+    if handled:
+        frappe.logger().info(f"deadlines.dispatch: {handled} hạn")
+    return handled
+
+
+def _run(cache, raw):
+    kind, ref = parse_member(raw)
+    cfg = KINDS.get(kind)
+    if not cfg:
+        return
+    # hincrby / hdel qua pipeline: RedisWrapper.hdel tự thêm tiền tố lần nữa
+    attempts_key = cache.make_key(ATTEMPTS_KEY)
+    field = _decode(raw)
+    try:
+        next_due = frappe.get_attr(cfg["handler"])(ref)
+        frappe.db.commit()
+        cache.pipeline().hdel(attempts_key, field).execute()
+        if next_due:
+            apply([(kind, ref, next_due)])
+    except Exception:
+        frappe.db.rollback()
+        (attempts,) = cache.pipeline().hincrby(attempts_key, field, 1).execute()
+        frappe.log_error(frappe.get_traceback(), f"deadlines.{kind} {ref} (lần {attempts})")
+        if attempts < MAX_ATTEMPTS:
+            apply([(kind, ref, now_datetime() + timedelta(seconds=RETRY_SEC))])
+        else:
+            cache.pipeline().hdel(attempts_key, field).execute()
+
+
+# ---------------------------------------------------------------------------
+# Dựng lại từ DB
+# ---------------------------------------------------------------------------
+
+
+def rebuild(kinds=None):
+    """Dựng lại set hạn từ DB cho `kinds` (mặc định: tất cả). Trả số hạn theo loại."""
+    kinds = [kinds] if isinstance(kinds, str) else (kinds or list(KINDS))
+    cache = frappe.cache()
+    key = cache.make_key(ZSET_KEY)
+    summary = {}
+    for kind in kinds:
+        entries = {
+            member(kind, ref): get_datetime(due).timestamp()
+            for ref, due in frappe.get_attr(KINDS[kind]["pending"])()
+            if ref and due
+        }
+        # Chỉ bỏ hạn không còn nguồn trên DB; hạn còn nguồn thì ZADD đè điểm
+        stale = [
+            m for m in cache.zrangebyscore(key, "-inf", "+inf")
+            if parse_member(m)[0] == kind and _decode(m) not in entries
+        ]
+        pipe = cache.pipeline()
+        if stale:
+            pipe.zrem(key, *stale)
+        if entries:
+            pipe.zadd(key, entries)
+        pipe.execute()
+        summary[kind] = len(entries)
+    frappe.logger().info(f"deadlines.rebuild: {summary}")
+    return summary
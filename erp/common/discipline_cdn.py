@@ -44,7 +44,7 @@ import urllib.parse
 
 import frappe
 
-from erp.common import cdn_sign
+from erp.common import cdn_sign, cdn_sign_cache
 
 CACHE_KEY = "erp:discipline:migrated_names"
 CACHE_TTL = 300
@@ -90,6 +90,7 @@ def clear_cache():
         frappe.cache().delete_value(CACHE_KEY)
     except Exception:
         pass
+    cdn_sign_cache.bump_version()
 
 
 def key_from_url(raw):
@@ -118,7 +119,7 @@ def get_domain():
     return {
         "name": "discipline",
         "prefix": PREFIX,
-        "keys": _migrated_names(),
+        "keys": cdn_sign_cache.local_keys(PREFIX, _migrated_names),
         "key_from_url": key_from_url,
         # 1h/2h nhu ho so hoc bong: ten file chua ten va lop hoc sinh nen link
         # ro ri phai chet som. KHONG dung 6h/24h cua noi dung SIS.
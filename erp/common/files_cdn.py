@@ -28,12 +28,11 @@ Rang buoc tren KHONG cuu duoc truong hop hai nhom trung ten khi CA HAI cung nam
 o goc `files/`. Phai do trung ten tren du lieu that truoc khi bat nhom thu vien.
 """
 
-import json
 import re
 
 import frappe
 
-from erp.common import cdn_sign
+from erp.common import cdn_sign, cdn_sign_cache
 
 # Bat ca hai dang URL anh xuat hien trong response:
 #
@@ -89,20 +88,23 @@ def get_domains():
 def sign_text(text, domains, signer=None):
     """Thay moi `/files/<khoa da migrate>` bang URL da ky.
 
-    `signer` chi de test bom vao; mac dinh dung `cdn_sign.sign_path`.
+    `signer` chi de test bom vao; mac dinh dung `cdn_sign_cache.sign_path` (nho
+    chu ky theo moc het han, xem cdn_sign_cache.py).
     """
-    sign = signer or cdn_sign.sign_path
+    sign = signer or cdn_sign_cache.sign_path
+    # Moc het han tinh MOT lan cho ca body: trong mot response moc khong doi,
+    # goi `expiry()` theo tung match chi ton `load_conf` + `time()` vo ich.
+    expiries = [domain["expiry"]() if domain.get("expiry") else None for domain in domains]
 
     def repl(m):
         raw = m.group(2)
-        for domain in domains:
+        for domain, expires in zip(domains, expiries):
             try:
                 key = domain["key_from_url"](raw)
             except Exception:  # noqa: BLE001
                 continue
             if not key or key not in domain["keys"]:
                 continue
-            expires = domain["expiry"]() if domain.get("expiry") else None
             signed = sign(f"/{domain['prefix']}/{key}", expires=expires)
             if not signed:
                 continue
@@ -114,6 +116,17 @@ def sign_text(text, domains, signer=None):
     return FILES_RE.sub(repl, text)
 
 
+def same_json_shape(before, after):
+    """Kiem tra re thay cho `json.loads` ca body sau khi ky.
+
+    FILES_RE khong bao gio bat `"` hay `\\`, nen moi match nam tron trong MOT chuoi
+    JSON; URL ky ra da percent-encode nen khong chua hai ky tu do. Cu phap chi
+    co the vo neu so `"` hoac `\\` doi — dem hai ky tu la du, chay o toc do C
+    thay vi dung lai ca cay object cua 2.198 bia sach.
+    """
+    return before.count('"') == after.count('"') and before.count("\\") == after.count("\\")
+
+
 def sign_response(**kwargs):
     """Hook `after_request` duy nhat. Nuot moi loi — khong duoc lam hong response."""
     try:
@@ -138,8 +151,9 @@ def sign_response(**kwargs):
         if not has_files and not has_media:
             return
 
+        original = raw
         if has_media:
-            raw = cdn_sign.media_urls_to_files(raw)
+            raw = cdn_sign.media_urls_to_files(raw, json_safe=True)
 
         domains = get_domains()
         if not domains:
@@ -149,7 +163,8 @@ def sign_response(**kwargs):
         if signed != raw:
             # Xac nhan van la JSON hop le truoc khi ghi de. Neu regex lam hong
             # cu phap thi tha khong ky con hon tra ve response vo.
-            json.loads(signed)
+            if not same_json_shape(original, signed):
+                raise ValueError("body sau khi ky doi so dau nhay/gach cheo")
             response.set_data(signed)
     except Exception as e:  # noqa: BLE001
         frappe.log_error(f"Ky URL file that bai: {e}", "Files CDN")
@@ -5,46 +5,29 @@ Bối cảnh 2026-08-07 (khảo sát DB): tabVersion 3.07GB / 2.2M dòng sau 12
 tabDeleted Document 125MB / 89k dòng — cả hai không nằm trong Log Settings.
 Version còn KHÔNG thêm vào Log Settings được vì bản Frappe này chưa có
 clear_old_logs cho doctype đó, nên dọn ở đây, cùng pattern với
-[[notification_purge]]: batch nhỏ + commit từng batch, không lock dài.
+[[notification_purge]]: lô nhỏ theo khoá chính, nghỉ giữa các lô, có trần số dòng
+mỗi lượt — xem erp/common/archival.py.
 
 Retention 90 ngày theo quyết định của Linh (đủ truy vết lịch sử sửa hồ sơ).
+Xuất phòng theo mốc thời gian KHÔNG còn tái dựng từ Version (xem
+erp/api/erp_administrative/room_history.py) nên không bị retention này cắt.
+
+Deleted Document là nguồn khôi phục bản ghi lỡ xoá -> chép sang bảng lưu trữ theo
+tháng (nén) trước khi xoá. Error Log / Notification Log đã có Log Settings lo.
 """
 
-import frappe
+from erp.common import archival
 
 RETENTION_DAYS = 90
-BATCH_SIZE = 10000
-MAX_BATCHES = 300
 
-# (tên bảng, cột thời gian) — thêm bảng mới vào đây khi cần
-PURGE_TABLES = (
-	("tabVersion", "creation"),
-	("tabDeleted Document", "creation"),
+# Thêm doctype mới vào đây khi cần
+POLICIES = (
+	archival.policy("Version", RETENTION_DAYS),
+	archival.policy("Deleted Document", RETENTION_DAYS, archive=True),
 )
 
 
-def _purge_table(table, date_column, cutoff):
-	total = 0
-	for _ in range(MAX_BATCHES):
-		frappe.db.sql(
-			f"DELETE FROM `{table}` WHERE `{date_column}` < %s LIMIT %s",
-			(cutoff, BATCH_SIZE),
-		)
-		affected = frappe.db.sql("SELECT ROW_COUNT()")[0][0] or 0
-		frappe.db.commit()
-		total += affected
-		if affected < BATCH_SIZE:
-			break
-	return total
-
-
 def purge_old_logs():
-	"""Hook daily: dọn Version + Deleted Document cũ hơn RETENTION_DAYS ngày."""
-	cutoff = frappe.utils.add_days(frappe.utils.now_datetime(), -RETENTION_DAYS)
-	result = {}
-	for table, date_column in PURGE_TABLES:
-		result[table] = _purge_table(table, date_column, cutoff)
-
-	frappe.logger("log_purge").info(f"purged (cutoff {cutoff}): {result}")
-	result["cutoff"] = str(cutoff)
-	return result
+	"""Hook daily_long: dọn Version + Deleted Document cũ hơn RETENTION_DAYS ngày."""
+	reports = archival.run(POLICIES, logger_name="log_purge")
+	return {r.doctype: r for r in reports}
@@ -11,7 +11,7 @@ from typing import Any, Dict, List, Optional, Union
 
 import frappe
 
-from erp.common.redis_events import publish
+from erp.common.redis_events import publish, publish_many
 from erp.utils.bilingual_notification import coerce_title_body
 
 TitleBody = Union[str, Dict[str, str]]
@@ -21,24 +21,21 @@ def _notification_channel(default: str = "frappe_notifications") -> str:
     return str(frappe.conf.get("NOTIFICATION_STREAM_CHANNEL") or default)
 
 
-def emit_notify(
-    channel: str,
+def _notify_envelope(
     recipients: List[str],
     title: TitleBody,
     body: TitleBody,
-    data: Optional[Dict[str, Any]] = None,
-    notification_type: str = "general",
-) -> bool:
-    """Gửi envelope chuẩn `notify.send` lên Redis (dual-write theo EVENT_BUS_MODE)."""
+    data: Optional[Dict[str, Any]],
+    notification_type: str,
+) -> Optional[Dict[str, Any]]:
     emails = [
         str(e).strip().lower()
         for e in (recipients or [])
         if e and isinstance(e, str) and "@" in e
     ]
     if not emails:
-        return False
-
-    envelope: Dict[str, Any] = {
+        return None
+    return {
         "service": "erp",
         "event": notification_type,
         "type": notification_type,
@@ -51,6 +48,20 @@ def emit_notify(
         "data": data if isinstance(data, dict) else {},
         "channel": "push",
     }
+
+
+def emit_notify(
+    channel: str,
+    recipients: List[str],
+    title: TitleBody,
+    body: TitleBody,
+    data: Optional[Dict[str, Any]] = None,
+    notification_type: str = "general",
+) -> bool:
+    """Gửi envelope chuẩn `notify.send` lên Redis (dual-write theo EVENT_BUS_MODE)."""
+    envelope = _notify_envelope(recipients, title, body, data, notification_type)
+    if envelope is None:
+        return False
     try:
         return bool(publish(channel, envelope))
     except Exception:
@@ -67,7 +78,8 @@ def emit_notify_bulk(
 ) -> Dict[str, Any]:
     """
     targets: [{"email": str, "data": {...}}, ...] như `send_mobile_notifications_bulk`.
-    Mỗi user một publish để không trộn `data` deep link giữa người nhận.
+    Mỗi user một envelope để không trộn `data` deep link giữa người nhận; cả lô gửi
+    bằng một `publish_many` (pipeline) thay vì một round-trip mỗi người.
     """
     if not targets:
         return {
@@ -78,19 +90,20 @@ def emit_notify_bulk(
             "message": "No targets",
         }
 
-    ok = 0
-    fail = 0
+    events = []
     for t in targets:
         em = (t or {}).get("email")
         d = (t or {}).get("data") or {}
-        if not em:
-            fail += 1
-            continue
         ntype = str((d.get("type") if isinstance(d, dict) else None) or notification_type)
-        if emit_notify(channel, [em], title, body, data=d, notification_type=ntype):
-            ok += 1
-        else:
-            fail += 1
+        envelope = _notify_envelope([em], title, body, d, ntype) if em else None
+        if envelope is not None:
+            events.append((channel, envelope))
+    try:
+        ok = publish_many(events)
+    except Exception:
+        frappe.logger().error("notification_emit.emit_notify_bulk failed", exc_info=True)
+        ok = 0
+    fail = len(targets) - ok
 
     total = ok + fail
     return {
@@ -111,12 +124,71 @@ def push_delivered_by_notification_service() -> bool:
     return bool(frappe.utils.cint(frappe.conf.get("MOBILE_NOTIFY_VIA_REDIS_STREAM_ONLY") or 0))
 
 
+def _unique_emails(emails: List[str]) -> List[str]:
+    """Email hạ chữ, bỏ trùng / không hợp lệ, giữ thứ tự."""
+    seen = set()
+    out = []
+    for raw in emails or []:
+        em = str(raw or "").strip().lower()
+        if not em or "@" not in em or em in seen:
+            continue
+        seen.add(em)
+        out.append(em)
+    return out
+
+
+def _publish_envelopes(events: List[Any], caller: str) -> int:
+    """Một `publish_many` cho cả lô envelope; không raise."""
+    try:
+        return publish_many(events)
+    except Exception:
+        frappe.logger().error(f"notification_emit.{caller} failed", exc_info=True)
+        return 0
+
+
 def _inbox_mirror_enabled() -> bool:
     """Kill-switch `NOTIFICATION_INBOX_MIRROR` (mặc định BẬT) — tắt gấp không cần deploy."""
     value = frappe.conf.get("NOTIFICATION_INBOX_MIRROR")
     return True if value is None else bool(frappe.utils.cint(value))
 
 
+def _inbox_envelopes(
+    emails: List[str],
+    title: TitleBody,
+    body: TitleBody,
+    event_type: str,
+    data: Optional[Dict[str, Any]],
+    reference_doctype: Optional[str],
+    reference_name: Optional[str],
+    channels: Optional[List[str]],
+) -> List[Dict[str, Any]]:
+    chans = [str(c).strip().lower() for c in (channels or ["push"]) if str(c or "").strip()]
+    if not chans:
+        chans = ["push"]
+    out = []
+    for em in _unique_emails(emails):
+        envelope: Dict[str, Any] = {
+            "service": "erp",
+            "event": event_type,
+            "type": event_type,
+            "kind": "notify.send",
+            "deliver": False,
+            "deliverFromStream": False,
+            "recipients": [em],
+            "title": coerce_title_body(title),
+            "body": coerce_title_body(body),
+            "channel": chans[0],
+            "channels": chans,
+            "data": {**(data or {}), "type": event_type},
+        }
+        if reference_doctype:
+            envelope["reference_doctype"] = reference_doctype
+        if reference_name:
+            envelope["reference_name"] = reference_name
+        out.append(envelope)
+    return out
+
+
 def emit_inbox_mirror(
     emails: List[str],
     title: TitleBody,
@@ -147,42 +219,10 @@ def emit_inbox_mirror(
         return 0
 
     ch = channel or _notification_channel()
-    chans = [str(c).strip().lower() for c in (channels or ["push"]) if str(c or "").strip()]
-    if not chans:
-        chans = ["push"]
-    seen = set()
-    ok = 0
-    for raw in emails or []:
-        em = str(raw or "").strip().lower()
-        if not em or "@" not in em or em in seen:
-            continue
-        seen.add(em)
-        envelope: Dict[str, Any] = {
-            "service": "erp",
-            "event": event_type,
-            "type": event_type,
-            "kind": "notify.send",
-            "deliver": False,
-            "deliverFromStream": False,
-            "recipients": [em],
-            "title": coerce_title_body(title),
-            "body": coerce_title_body(body),
-            "channel": chans[0],
-            "channels": chans,
-            "data": {**(data or {}), "type": event_type},
-        }
-        if reference_doctype:
-            envelope["reference_doctype"] = reference_doctype
-        if reference_name:
-            envelope["reference_name"] = reference_name
-        try:
-            if publish(ch, envelope):
-                ok += 1
-        except Exception:
-            frappe.logger().error(
-                f"notification_emit.emit_inbox_mirror failed for {em}", exc_info=True
-            )
-    return ok
+    envelopes = _inbox_envelopes(
+        emails, title, body, event_type, data, reference_doctype, reference_name, channels
+    )
+    return _publish_envelopes([(ch, e) for e in envelopes], "emit_inbox_mirror")
 
 
 def emit_inbox_mirror_bulk(
@@ -196,20 +236,24 @@ def emit_inbox_mirror_bulk(
 ) -> int:
     """targets: [{"email": str, "data": {...}}, ...] như `emit_notify_bulk`.
 
-    Mỗi người nhận một envelope để `data` deep link không lẫn nhau.
+    Mỗi người nhận một envelope để `data` deep link không lẫn nhau; cả lô một `publish_many`.
     `channels` xem cảnh báo push trùng ở `emit_inbox_mirror`.
     """
-    ok = 0
+    if not _inbox_mirror_enabled():
+        return 0
+
+    ch = channel or _notification_channel()
+    events = []
     for t in targets or []:
         em = (t or {}).get("email")
         d = (t or {}).get("data") or {}
         if not em:
             continue
         ntype = str((d.get("type") if isinstance(d, dict) else None) or notification_type)
-        ok += emit_inbox_mirror(
-            [em], title, body, ntype, data=d, channel=channel, channels=channels
+        events.extend(
+            (ch, e) for e in _inbox_envelopes([em], title, body, ntype, d, None, None, channels)
         )
-    return ok
+    return _publish_envelopes(events, "emit_inbox_mirror_bulk")
 
 
 def emit_standard_parent_notification(
@@ -247,13 +291,8 @@ def emit_staff_notify(
     """
     ch = channel or _notification_channel()
     chans = ["push", "email"] if include_email else ["push"]
-    seen = set()
-    ok = 0
-    for raw in emails or []:
-        em = str(raw or "").strip().lower()
-        if not em or "@" not in em or em in seen:
-            continue
-        seen.add(em)
+    events = []
+    for em in _unique_emails(emails):
         envelope: Dict[str, Any] = {
             "service": "erp",
             "event": event_type,
@@ -272,14 +311,8 @@ def emit_staff_notify(
             envelope["reference_doctype"] = reference_doctype
         if reference_name:
             envelope["reference_name"] = reference_name
-        try:
-            if publish(ch, envelope):
-                ok += 1
-        except Exception:
-            frappe.logger().error(
-                f"notification_emit.emit_staff_notify failed for {em}", exc_info=True
-            )
-    return ok
+        events.append((ch, envelope))
+    return _publish_envelopes(events, "emit_staff_notify")
 
 
 def emit_notify_hc_email(
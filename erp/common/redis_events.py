@@ -1,7 +1,8 @@
 import json
 import os
+import threading
 import uuid as _uuid
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import frappe
 
@@ -39,12 +40,18 @@ def _parse_redis_url(url: str) -> Tuple[str, int, Optional[str], Optional[int]]:
         return "localhost", 6379, None, None
 
 
-def _get_redis_client():
-    try:
-        import redis
-    except Exception:
-        return None
+# Một pool kết nối cho cả process (mọi event bus dùng chung), khoá theo thông số kết nối.
+# Trước đây mỗi lần publish tạo client mới + PING: 2 round-trip + 1 kết nối TCP mỗi event.
+_POOLS: Dict[Tuple, Any] = {}
+_POOLS_LOCK = threading.Lock()
+POOL_MAX_CONNECTIONS = 50
+POOL_HEALTH_CHECK_SEC = 30
+
+# Số event mỗi lần execute pipeline (mỗi event 1–2 lệnh PUBLISH / XADD)
+PIPELINE_CHUNK = 500
 
+
+def _connection_params() -> Tuple[str, int, Optional[str], Optional[int]]:
     # Preferred: explicit host/port/password
     host = _get_conf("REDIS_HOST")
     port = _get_conf("REDIS_PORT")
@@ -65,16 +72,58 @@ def _get_redis_client():
             password = password or p_password
             db = p_db
 
-    host = host or "localhost"
-    port = int(port or 6379)
+    return host or "localhost", int(port or 6379), password, db
+
 
+def _shared_pool(key: Tuple, make):
+    pool = _POOLS.get(key)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(key)
+            if pool is None:
+                pool = _POOLS[key] = make()
+    return pool
+
+
+def _get_redis_client():
     try:
-        client = redis.Redis(host=host, port=port, password=password, db=db, decode_responses=True)
-        client.ping()
-        return client
+        import redis
     except Exception:
         return None
 
+    host, port, password, db = _connection_params()
+    pool = _shared_pool(
+        ("params", host, port, password, db),
+        lambda: redis.ConnectionPool(
+            host=host,
+            port=port,
+            password=password,
+            db=db or 0,
+            decode_responses=True,
+            max_connections=POOL_MAX_CONNECTIONS,
+            health_check_interval=POOL_HEALTH_CHECK_SEC,
+        ),
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+def get_client_for_url(url: str):
+    """Client trên pool dùng chung cho một Redis URL (vd redis_socketio của room_events)."""
+    try:
+        import redis
+    except Exception:
+        return None
+    pool = _shared_pool(
+        ("url", url),
+        lambda: redis.ConnectionPool.from_url(
+            url,
+            decode_responses=True,
+            max_connections=POOL_MAX_CONNECTIONS,
+            health_check_interval=POOL_HEALTH_CHECK_SEC,
+        ),
+    )
+    return redis.Redis(connection_pool=pool)
+
 
 def is_production_server() -> bool:
     """
@@ -95,47 +144,116 @@ def is_user_events_enabled() -> bool:
     return _bool(flag, default=True)  # Mặc định enable cho hệ thống nội bộ
 
 
-def publish(channel: str, message: Dict[str, Any]) -> bool:
-    client = _get_redis_client()
+def _encode(message: Any) -> str:
+    if isinstance(message, dict) and not message.get("eventId"):
+        message = {**message, "eventId": str(_uuid.uuid4())}
+    return json.dumps(message, default=str)
+
+
+def _stream_settings() -> Tuple[str, int]:
+    prefix = ((_get_conf("EVENT_BUS_STREAM_PREFIX") or "events").strip(":") or "events")
+    try:
+        stream_maxlen = int(_get_conf("EVENT_BUS_STREAM_MAXLEN") or 100000)
+    except Exception:
+        stream_maxlen = 100000
+    return prefix, stream_maxlen
+
+
+def _xadd(pipe, stream_key: str, body: str, stream_maxlen: int) -> None:
+    try:
+        pipe.xadd(stream_key, {"payload": body}, maxlen=stream_maxlen, approximate=True)
+    except TypeError:
+        pipe.xadd(stream_key, {"payload": body}, maxlen=stream_maxlen)
+
+
+def count_ok(commands_per_event: List[int], results: List[Any]) -> int:
+    """Số event mà mọi lệnh của nó trong pipeline đều không lỗi.
+
+    `results` là kết quả `execute(raise_on_error=False)` — lệnh lỗi trả về Exception.
+    """
+    ok = 0
+    pos = 0
+    for n in commands_per_event:
+        if not any(isinstance(r, Exception) for r in results[pos:pos + n]):
+            ok += 1
+        pos += n
+    return ok
+
+
+def publish_many(
+    events: Iterable[Tuple[str, Any]],
+    client=None,
+    mode: Optional[str] = None,
+    event_id: bool = True,
+) -> int:
+    """PUBLISH (+ XADD theo EVENT_BUS_MODE) cho nhiều (channel, message) qua pipeline.
+
+    Mỗi PIPELINE_CHUNK event là MỘT round-trip thay vì 2 round-trip / event.
+    `client`: mặc định client event bus; `mode` ghi đè EVENT_BUS_MODE (room_events chỉ
+    pub/sub); `event_id=False` giữ nguyên message (không chèn eventId).
+    Trả về số event ghi thành công.
+    """
+    events = list(events)
+    if not events:
+        return 0
+    client = client or _get_redis_client()
     if client is None:
         try:
             frappe.log_error("Redis client not available for user_events publish", "redis_events.publish")
         except Exception:
             pass
-        return False
-    try:
-        if isinstance(message, dict) and not message.get("eventId"):
-            message = {**message, "eventId": str(_uuid.uuid4())}
-
-        mode = (_get_conf("EVENT_BUS_MODE") or "both").strip().lower()
-        body = json.dumps(message, default=str)
+        return 0
 
-        prefix = ((_get_conf("EVENT_BUS_STREAM_PREFIX") or "events").strip(":") or "events")
-        stream_key = f"{prefix}:{channel}"
+    mode = (mode or _get_conf("EVENT_BUS_MODE") or "both").strip().lower()
+    prefix, stream_maxlen = _stream_settings()
+    ok = 0
+    for start in range(0, len(events), PIPELINE_CHUNK):
+        chunk = events[start:start + PIPELINE_CHUNK]
         try:
-            stream_maxlen = int(_get_conf("EVENT_BUS_STREAM_MAXLEN") or 100000)
+            pipe = client.pipeline(transaction=False)
+            commands_per_event = []
+            for channel, message in chunk:
+                body = _encode(message) if event_id else json.dumps(message, default=str)
+                n = 0
+                if mode in ("pubsub", "both"):
+                    pipe.publish(channel, body)
+                    n += 1
+                if mode in ("streams", "both"):
+                    _xadd(pipe, f"{prefix}:{channel}", body, stream_maxlen)
+                    n += 1
+                commands_per_event.append(n)
+            ok += count_ok(commands_per_event, pipe.execute(raise_on_error=False))
         except Exception:
-            stream_maxlen = 100000
-
-        if mode in ("pubsub", "both"):
-            client.publish(channel, body)
-        if mode in ("streams", "both"):
             try:
-                client.xadd(
-                    stream_key,
-                    {"payload": body},
-                    maxlen=stream_maxlen,
-                    approximate=True,
-                )
-            except TypeError:
-                client.xadd(stream_key, {"payload": body}, maxlen=stream_maxlen)
-        return True
-    except Exception:
-        try:
-            frappe.log_error(f"Failed to publish to {channel}", "redis_events.publish")
-        except Exception:
-            pass
-        return False
+                channels = sorted({channel for channel, _ in chunk})
+                frappe.log_error(f"Failed to publish to {', '.join(channels)}", "redis_events.publish")
+            except Exception:
+                pass
+    return ok
+
+
+def publish(channel: str, message: Dict[str, Any]) -> bool:
+    return publish_many([(channel, message)]) == 1
+
+
+_PENDING_FLAG = "redis_events_pending"
+
+
+def publish_after_commit(channel: str, message: Dict[str, Any]) -> None:
+    """Hoãn publish tới khi giao dịch commit — rollback thì event không bao giờ được phát.
+
+    Mọi event hoãn trong một giao dịch được gửi chung một `publish_many` sau commit.
+    """
+    pending = frappe.flags.get(_PENDING_FLAG)
+    if pending is None:
+        pending = frappe.flags[_PENDING_FLAG] = []
+        frappe.db.after_commit.add(_flush_pending)
+        frappe.db.after_rollback.add(lambda: frappe.flags.pop(_PENDING_FLAG, None))
+    pending.append((channel, message))
+
+
+def _flush_pending() -> None:
+    publish_many(frappe.flags.pop(_PENDING_FLAG, None) or [])
 
 
 def build_user_payload(user_email: str) -> Optional[Dict[str, Any]]:
@@ -194,21 +312,26 @@ def build_user_payload(user_email: str) -> Optional[Dict[str, Any]]:
         return None
 
 
-def publish_user_event(event_type: str, user_email: str) -> None:
-    if not is_user_events_enabled():
-        return
-
-    channel = _get_conf("REDIS_USER_CHANNEL", "user_events")
-    payload = build_user_payload(user_email)
-
-    message = {
+def _user_message(event_type: str, user_email: str) -> Dict[str, Any]:
+    return {
         "type": event_type,
-        "user": payload or {"email": user_email},
+        "user": build_user_payload(user_email) or {"email": user_email},
         "source": "frappe",
         "timestamp": frappe.utils.now_datetime().isoformat() if hasattr(frappe, "utils") else None,
     }
 
-    publish(channel, message)
+
+def publish_user_event(event_type: str, user_email: str, defer: bool = True) -> None:
+    """Phát user event. Mặc định hoãn tới commit (`defer=False`: phát ngay)."""
+    if not is_user_events_enabled():
+        return
+
+    channel = _get_conf("REDIS_USER_CHANNEL", "user_events")
+    message = _user_message(event_type, user_email)
+    if defer:
+        publish_after_commit(channel, message)
+    else:
+        publish(channel, message)
 
 
 # Simple ping to verify wiring end-to-end
@@ -222,7 +345,7 @@ def ping_user_events(channel: Optional[str] = None) -> Dict[str, Any]:
 def publish_all_users(batch_size: int = 500, only_active: bool = True, event_type: str = "user_updated") -> Dict[str, Any]:
     """
     Gửi sự kiện user cho toàn bộ người dùng hiện có để microservices đồng bộ lần đầu.
-    - Chạy theo lô để tránh tốn bộ nhớ.
+    - Chạy theo lô để tránh tốn bộ nhớ; mỗi lô publish bằng một `publish_many`.
     - Bỏ qua Guest/Administrator.
     - Mặc định dùng event_type = 'user_updated' để đảm bảo idempotent.
     """
@@ -252,13 +375,14 @@ def publish_all_users(batch_size: int = 500, only_active: bool = True, event_typ
         )
         if not users:
             break
+        events = []
         for u in users:
             email = (u.get("email") or "").strip()
             if not email or email in ("Guest", "Administrator"):
                 skipped += 1
                 continue
-            publish_user_event(event_type, email)
-            published += 1
+            events.append((ch, _user_message(event_type, email)))
+        published += publish_many(events)
         page += 1
 
     return {"channel": ch, "total": total, "published": published, "skipped": skipped}
@@ -4,9 +4,10 @@ Redis publish for room changes to sync microservices in real-time
 
 from __future__ import annotations
 
-import json
 import frappe
 
+from erp.common.redis_events import get_client_for_url, publish_many
+
 
 def is_production_server() -> bool:
     """
@@ -27,25 +28,28 @@ def _room_events_enabled() -> bool:
     return bool(frappe.conf.get("FRAPPE_ROOM_EVENTS_ENABLED", True))
 
 
+ROOM_PAYLOAD_FIELDS = (
+    "name",
+    "title_vn",
+    "title_en",
+    "short_title",
+    "room_name",
+    "room_number",
+    "building_id",
+    "building",
+    "floor",
+    "block",
+    "campus_id",
+    "capacity",
+    "room_type",
+    "status",
+    "disabled",
+)
+
+
 def _build_room_payload_from_doc(doc) -> dict:
-    """Snapshot room payload từ doc hiện có để worker nền dùng lại."""
-    return {
-        "name": doc.name,
-        "title_vn": getattr(doc, "title_vn", None),
-        "title_en": getattr(doc, "title_en", None),
-        "short_title": getattr(doc, "short_title", None),
-        "room_name": getattr(doc, "room_name", None),
-        "room_number": getattr(doc, "room_number", None),
-        "building_id": getattr(doc, "building_id", None),
-        "building": getattr(doc, "building", None),
-        "floor": getattr(doc, "floor", None),
-        "block": getattr(doc, "block", None),
-        "campus_id": getattr(doc, "campus_id", None),
-        "capacity": getattr(doc, "capacity", None),
-        "room_type": getattr(doc, "room_type", None),
-        "status": getattr(doc, "status", None),
-        "disabled": getattr(doc, "disabled", None),
-    }
+    """Snapshot room payload từ doc (hoặc dòng get_all) để worker nền dùng lại."""
+    return {field: getattr(doc, field, None) for field in ROOM_PAYLOAD_FIELDS}
 
 
 def _enqueue_room_event_message(message: dict) -> None:
@@ -61,32 +65,32 @@ def _enqueue_room_event_message(message: dict) -> None:
     )
 
 
-def _publish_room(payload: dict) -> None:
-    try:
-        # Prefer socketio redis; fallback to cache/queue via frappe.cache
-        uri = frappe.conf.get("redis_socketio") or frappe.conf.get("redis_cache")
-        if uri:
-            from frappe.utils.redis_wrapper import RedisWrapper
-
-            client = RedisWrapper.from_url(uri)
-            client.publish(_get_room_channel(), json.dumps(payload, default=str))
-            return
-    except Exception as e:
-        # Log the exception instead of silent fail
-        try:
-            frappe.log_error(f"Failed to publish room event via RedisWrapper: {str(e)}", "erp.common.room_events")
-        except Exception:
-            pass
+def _room_client():
+    """Client Redis cho room events — pool dùng chung với các event bus khác (redis_events)."""
+    # Prefer socketio redis; fallback to cache via frappe.cache
+    uri = frappe.conf.get("redis_socketio") or frappe.conf.get("redis_cache")
+    if uri:
+        client = get_client_for_url(uri)
+        if client is not None:
+            return client
+    return frappe.cache()
+
 
-    # Fallback to default cache client
+def _publish_rooms(payloads: list) -> int:
+    """PUBLISH nhiều room event trong một pipeline (chỉ pub/sub, giữ nguyên payload)."""
     try:
-        client = frappe.cache()._redis
-        client.publish(_get_room_channel(), json.dumps(payload, default=str))
+        channel = _get_room_channel()
+        return publish_many([(channel, p) for p in payloads], client=_room_client(), mode="pubsub", event_id=False)
     except Exception as e:
         try:
-            frappe.log_error(f"Failed to publish room event via cache: {str(e)}", "erp.common.room_events")
+            frappe.log_error(f"Failed to publish room event: {str(e)}", "erp.common.room_events")
         except Exception:
             pass
+        return 0
+
+
+def _publish_room(payload: dict) -> bool:
+    return _publish_rooms([payload]) == 1
 
 
 def publish_room_event(event_type: str, room_name: str) -> None:
@@ -181,6 +185,9 @@ def publish_all_rooms(batch_size: int = 500, only_active: bool = True, event_typ
     """
     Send room events for all existing rooms to trigger initial sync in microservices
     Chỉ chạy trên production server (is_production = true trong site_config.json)
+
+    Mỗi lô đọc payload bằng một get_all và publish bằng một pipeline — không còn
+    một job nền + một get_doc cho từng phòng.
     """
     # Chỉ publish events trên production server
     if not is_production_server():
@@ -191,20 +198,27 @@ def publish_all_rooms(batch_size: int = 500, only_active: bool = True, event_typ
 
     ch = _get_room_channel()
 
-    # Build filters
+    meta = frappe.get_meta("ERP Administrative Room")
+    fields = ["name"] + [f for f in ROOM_PAYLOAD_FIELDS if f != "name" and meta.has_field(f)]
+
+    # Build filters — DocType dùng is_active; "disabled" chỉ có nếu site thêm custom field
     filters = {}
     if only_active:
-        filters["disabled"] = 0
+        if meta.has_field("disabled"):
+            filters["disabled"] = 0
+        elif meta.has_field("is_active"):
+            filters["is_active"] = 1
 
     total = frappe.db.count("ERP Administrative Room", filters)
     published = 0
     skipped = 0
+    timestamp = frappe.utils.now_datetime().isoformat()
 
     page = 0
     while True:
         rooms = frappe.get_all(
             "ERP Administrative Room",
-            fields=["name"],
+            fields=fields,
             filters=filters,
             limit=batch_size,
             start=page * batch_size,
@@ -213,14 +227,18 @@ def publish_all_rooms(batch_size: int = 500, only_active: bool = True, event_typ
         if not rooms:
             break
 
+        messages = []
         for r in rooms:
-            name = (r.get("name") or "").strip()
-            if not name:
+            if not (r.get("name") or "").strip():
                 skipped += 1
                 continue
-
-            publish_room_event(event_type, name)
-            published += 1
+            messages.append({
+                "type": event_type,
+                "room": _build_room_payload_from_doc(r),
+                "source": "frappe",
+                "timestamp": timestamp,
+            })
+        published += _publish_rooms(messages)
 
         page += 1
 
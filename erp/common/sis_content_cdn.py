@@ -19,7 +19,7 @@ import urllib.parse
 
 import frappe
 
-from erp.common import cdn_sign
+from erp.common import cdn_sign, cdn_sign_cache
 
 PREFIX = "sis-content"
 CACHE_KEY_PREFIX = "erp:sis_content:urls"
@@ -112,14 +112,20 @@ def clear_cache():
             frappe.cache().delete_value(_cache_key(group))
     except Exception:
         pass
+    cdn_sign_cache.bump_version()
 
 
 def get_domain():
     """Domain cho bo ky chung — xem erp/common/files_cdn.py."""
+    groups = enabled_groups()
     return {
         "name": "sis-content",
         "prefix": PREFIX,
-        "keys": migrated_keys(),
+        # Ten ban sao gom ca to hop nhom dang bat: doi CDN_SIS_CONTENT_GROUPS
+        # thi ten doi theo, khong phuc vu nham tap khoa cu.
+        "keys": cdn_sign_cache.local_keys(
+            f"{PREFIX}:{','.join(groups)}", lambda: migrated_keys(groups)
+        ),
         "key_from_url": key_from_url,
         # Cua so 6h/24h thay vi 1h/2h cua hoc bong: nhom nay khong nhay cam, cua
         # so dai thi chuoi URL on dinh lau hon nen trinh duyet con cache duoc.
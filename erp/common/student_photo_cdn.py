@@ -35,7 +35,7 @@ import urllib.parse
 
 import frappe
 
-from erp.common import cdn_sign
+from erp.common import cdn_sign, cdn_sign_cache
 
 CACHE_KEY = "erp:student_photo:migrated_names"
 CACHE_TTL = 300
@@ -62,6 +62,7 @@ def clear_cache():
         frappe.cache().delete_value(CACHE_KEY)
     except Exception:
         pass
+    cdn_sign_cache.bump_version()
 
 
 def object_exists(name):
@@ -146,7 +147,9 @@ def get_domain():
     return {
         "name": "student-photos",
         "prefix": PREFIX,
-        "keys": _migrated_names(),
+        # Ban sao o bo nho tien trinh, chi nap lai khi phien ban doi — xem
+        # cdn_sign_cache.py
+        "keys": cdn_sign_cache.local_keys(PREFIX, _migrated_names),
         "key_from_url": key_from_url,
         # None = dung cua so mac dinh nhu truoc, khong doi hanh vi
         "expiry": None,
@@ -0,0 +1,10 @@
+import frappe
+from frappe.model.document import Document
+
+
+class CRMMatchKey(Document):
+	"""
+	Khoá so trùng của CRM Lead / CRM Guardian.
+	Chỉ ghi bởi erp.api.crm.match_keys — không sửa tay.
+	"""
+	pass
@@ -151,6 +151,7 @@ permission_query_conditions = {
 	"SIS Class Log Score": "erp.sis.utils.permission_query.sis_class_log_score_query",
 	"SIS Class Log Subject": "erp.sis.utils.permission_query.sis_class_log_subject_query",
 	"SIS Class Log Student": "erp.sis.utils.permission_query.sis_class_log_student_query",
+	"SIS Class Log Compliance": "erp.sis.utils.permission_query.sis_class_log_compliance_query",
 	"SIS Homeroom Score Record": "erp.sis.utils.permission_query.sis_homeroom_score_record_query",
 	# Bus, Finance, Report Card, Marcom, ... (Phase 1 bổ sung)
 	"SIS Announcement": "erp.sis.utils.permission_query.sis_announcement_query",
@@ -352,6 +353,7 @@ has_permission = {
 	"SIS Class Log Score": "erp.sis.utils.campus_permissions.has_campus_permission",
 	"SIS Class Log Subject": "erp.sis.utils.campus_permissions.has_campus_permission",
 	"SIS Class Log Student": "erp.sis.utils.campus_permissions.has_campus_permission",
+	"SIS Class Log Compliance": "erp.sis.utils.campus_permissions.has_campus_permission",
 	"SIS Homeroom Score Record": "erp.sis.utils.campus_permissions.has_campus_permission",
 	# Bus, Finance, Report Card, Marcom, ... (Phase 1 bổ sung)
 	"SIS Announcement": "erp.sis.utils.campus_permissions.has_campus_permission",
@@ -561,11 +563,14 @@ doc_events = {
 		],
 		"on_update": [
 			"erp.common.room_events.on_room_on_update",
-			"erp.common.user_hooks.trigger_room_webhooks"
+			"erp.common.user_hooks.trigger_room_webhooks",
+			# Lịch sử theo thời gian (xuất danh sách phòng theo mốc)
+			"erp.api.erp_administrative.room_history.on_doc_update"
 		],
 		"on_trash": [
 			"erp.common.room_events.on_room_on_trash",
-			"erp.common.user_hooks.trigger_room_webhooks"
+			"erp.common.user_hooks.trigger_room_webhooks",
+			"erp.api.erp_administrative.room_history.on_doc_trash"
 		]
 	},
 	# Push notification when ERP Notification is created
@@ -615,9 +620,22 @@ doc_events = {
 		]
 	},
 	"SIS Timetable Instance Row": {
-		"after_insert": "erp.api.erp_sis.utils.assignment_cache.on_timetable_instance_row_change",
-		"on_update": "erp.api.erp_sis.utils.assignment_cache.on_timetable_instance_row_change",
-		"after_delete": "erp.api.erp_sis.utils.assignment_cache.on_timetable_instance_row_change"
+		"after_insert": [
+			"erp.api.erp_sis.utils.assignment_cache.on_timetable_instance_row_change",
+			"erp.api.erp_sis.timetable.schedule_engine.on_instance_row_change"
+		],
+		"on_update": [
+			"erp.api.erp_sis.utils.assignment_cache.on_timetable_instance_row_change",
+			"erp.api.erp_sis.timetable.schedule_engine.on_instance_row_change"
+		],
+		"after_delete": [
+			"erp.api.erp_sis.utils.assignment_cache.on_timetable_instance_row_change",
+			"erp.api.erp_sis.timetable.schedule_engine.on_instance_row_change"
+		]
+	},
+	"SIS Timetable Instance": {
+		"on_update": "erp.api.erp_sis.timetable.schedule_engine.on_instance_row_change",
+		"on_trash": "erp.api.erp_sis.timetable.schedule_engine.on_instance_row_change"
 	},
 	# Logging hooks for audit trail
 	"File": {
@@ -664,17 +682,21 @@ doc_events = {
 			"erp.observability.audit.log_create",
 			"erp.api.erp_sis.chat_membership_hooks.on_class_student_change",
 			# Xếp lớp / chuyển lớp → cập nhật Trường trên FaceID Person
-			"erp.api.faceid.person_hooks.on_class_student_changed"
+			"erp.api.faceid.person_hooks.on_class_student_changed",
+			# Roster lớp → học sinh của người nhận thông báo (erp/utils/notification_recipients.py)
+			"erp.utils.notification_recipients.on_class_student_change"
 		],
 		"on_update": [
 			"erp.observability.audit.log_update",
 			"erp.api.erp_sis.chat_membership_hooks.on_class_student_change",
-			"erp.api.faceid.person_hooks.on_class_student_changed"
+			"erp.api.faceid.person_hooks.on_class_student_changed",
+			"erp.utils.notification_recipients.on_class_student_change"
 		],
 		"on_trash": [
 			"erp.observability.audit.log_delete",
 			"erp.api.erp_sis.chat_membership_hooks.on_class_student_change",
-			"erp.api.faceid.person_hooks.on_class_student_changed"
+			"erp.api.faceid.person_hooks.on_class_student_changed",
+			"erp.utils.notification_recipients.on_class_student_change"
 		]
 	},
 	"SIS Class Attendance": {
@@ -708,10 +730,12 @@ doc_events = {
 			"erp.api.erp_administrative.room.sync_class_room_assignment",
 			"erp.api.erp_administrative.room.sync_class_homeroom_teachers_to_room_pic",
 			"erp.observability.audit.log_update",
-			"erp.api.erp_sis.chat_membership_hooks.on_sis_class_change"
+			"erp.api.erp_sis.chat_membership_hooks.on_sis_class_change",
+			"erp.utils.notification_recipients.on_class_change"
 		],
 		"on_trash": [
-			"erp.observability.audit.log_delete"
+			"erp.observability.audit.log_delete",
+			"erp.utils.notification_recipients.on_class_change"
 		]
 	},
 	"SIS Teacher": {
@@ -976,15 +1000,24 @@ doc_events = {
 	},
 	"CRM Issue": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
+		# Hạn SLA (Warning / Breached / nhắc hằng ngày) -> erp/common/deadlines.py
+		"on_update": "erp.api.crm.sla_scheduler.on_issue_update",
+		"on_trash": "erp.api.crm.sla_scheduler.on_issue_update",
 	},
 	"ERP IT Support Ticket": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
+		# Bộ đếm ticket đang xử lý theo người (auto-assign) -> erp/api/erp_it_support/workload.py
+		"on_update": "erp.api.erp_it_support.workload.on_ticket_change",
+		"on_trash": "erp.api.erp_it_support.workload.on_ticket_change",
 	},
 	"SIS Health Examination": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
 	},
 	"SIS Daily Health Visit": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
+		# Hẹn escalation HEALTH_STALE_MINUTES sau khi HS rời lớp
+		"after_insert": "erp.api.erp_sis.daily_health_notification.schedule_stale_check",
+		"on_update": "erp.api.erp_sis.daily_health_notification.schedule_stale_check",
 	},
 	"SIS Health Report": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
@@ -1015,6 +1048,9 @@ doc_events = {
 	},
 	"SIS Club Registration Period": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
+		# Ba mốc nhắc của đợt (mở / sắp đóng / đã đóng) -> erp/common/deadlines.py
+		"on_update": "erp.sis.tasks.club_reminders.schedule_period_reminders",
+		"on_trash": "erp.sis.tasks.club_reminders.schedule_period_reminders",
 	},
 	"SIS Club Offering": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
@@ -1036,8 +1072,15 @@ doc_events = {
 	"SIS Finance Order Student": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
 	},
+	"SIS Finance Student": {
+		"on_update": "erp.api.erp_sis.finance.ledger.on_finance_student_change",
+		"on_trash": "erp.api.erp_sis.finance.ledger.on_finance_student_change",
+	},
 	"SIS Finance Order Item": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
+		# Bộ đếm năm (dashboard tài chính) cộng delta — erp/api/erp_sis/finance/ledger.py
+		"on_update": "erp.api.erp_sis.finance.ledger.on_order_item_change",
+		"on_trash": "erp.api.erp_sis.finance.ledger.on_order_item_change",
 	},
 	"SIS Finance Send Batch": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
@@ -1056,6 +1099,13 @@ doc_events = {
 	},
 	"SIS Library Transaction": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
+		# Bảng tổng hợp báo cáo thư viện theo ngày (delta trước/sau) — erp/api/erp_sis/library/rollup.py
+		"on_update": "erp.api.erp_sis.library.rollup.on_transaction_change",
+		"on_trash": "erp.api.erp_sis.library.rollup.on_transaction_change",
+	},
+	"SIS Library Fine": {
+		"on_update": "erp.api.erp_sis.library.rollup.on_fine_change",
+		"on_trash": "erp.api.erp_sis.library.rollup.on_fine_change",
 	},
 	"SIS Library Title": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
@@ -1086,11 +1136,32 @@ doc_events = {
 		"on_update": [
 			"erp.api.erp_sis.chat_membership_hooks.on_guardian_change",
 			"erp.api.faceid.person_hooks.on_guardian_changed",
+			# Bộ đếm token_version trong Redis cho cache xác thực JWT (force logout)
+			"erp.utils.jwt_auth.on_guardian_token_change",
+			# Khoá so trùng (SĐT / email / danh tính) — xem erp/api/crm/match_keys.py
+			"erp.api.crm.match_keys.on_guardian_change",
+			# Cache học sinh → phụ huynh của thông báo (guardian_id đổi)
+			"erp.utils.notification_recipients.on_guardian_change",
+		],
+		"on_trash": [
+			"erp.utils.jwt_auth.on_guardian_token_change",
+			"erp.api.crm.match_keys.on_guardian_change",
+			"erp.utils.notification_recipients.on_guardian_change",
 		],
 	},
 	"CRM Family": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
-		"on_update": "erp.api.erp_sis.chat_membership_hooks.on_family_change",
+		"on_update": [
+			"erp.api.erp_sis.chat_membership_hooks.on_family_change",
+			# Cache học sinh → phụ huynh của thông báo (erp/utils/notification_recipients.py)
+			"erp.utils.notification_recipients.on_family_change",
+		],
+		"on_trash": "erp.utils.notification_recipients.on_family_change",
+	},
+	"ERP Time Attendance": {
+		# Ghi xuyên cache điểm danh theo ngày SAU commit — xem erp/api/attendance/day_cache.py
+		"on_update": "erp.api.attendance.day_cache.on_attendance_change",
+		"on_trash": "erp.api.attendance.day_cache.on_attendance_change",
 	},
 	"CRM Student": {
 		# APPEND vào list này, đừng tạo entry "CRM Student" thứ hai (key trùng bị đè)
@@ -1102,8 +1173,13 @@ doc_events = {
 		],
 	},
 	"CRM Lead": {
-		# Lead rời Enrolled (chuyển trường / tốt nghiệp / bảo lưu) → gỡ HS FaceID ngay
-		"on_update": "erp.api.faceid.person_hooks.on_lead_step_changed",
+		"on_update": [
+			# Lead rời Enrolled (chuyển trường / tốt nghiệp / bảo lưu) → gỡ HS FaceID ngay
+			"erp.api.faceid.person_hooks.on_lead_step_changed",
+			# Khoá so trùng (SĐT / email / khối tên) cho kiểm tra trùng — erp/api/crm/match_keys.py
+			"erp.api.crm.match_keys.on_lead_change",
+		],
+		"on_trash": "erp.api.crm.match_keys.on_lead_change",
 	},
 	# Mô hình nhóm quyền vào FaceID — đổi nhóm/thành viên thì tính lại desired state
 	"FaceID Access Group": {
@@ -1191,16 +1267,33 @@ doc_events = {
 	},
 	"ERP Administrative Room Yearly Assignment": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
+		"on_update": "erp.api.erp_administrative.room_history.on_doc_update",
+		"on_trash": "erp.api.erp_administrative.room_history.on_doc_trash",
 	},
 	"ERP Administrative Ticket": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
+		"on_update": [
+			"erp.api.erp_administrative.room_availability.on_ticket_change",
+			"erp.api.erp_administrative.administrative_ticket.schedule_event_facility_reminder",
+		],
+		"on_trash": [
+			"erp.api.erp_administrative.room_availability.on_ticket_change",
+			"erp.api.erp_administrative.administrative_ticket.schedule_event_facility_reminder",
+		],
 	},
 	"ERP Room Booking": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
+		"on_update": "erp.api.erp_administrative.room_availability.on_booking_change",
+		"on_trash": "erp.api.erp_administrative.room_availability.on_booking_change",
 	},
 	"ERP Room Booking Config": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
 	},
+	# MDM: đổi token / trạng thái máy thì bỏ danh tính đang cache (auth.authenticate_device)
+	"MDM Device": {
+		"on_update": "erp.api.mdm.auth.invalidate_device_auth",
+		"on_trash": "erp.api.mdm.auth.invalidate_device_auth",
+	},
 	"ERP Administrative Facility Handover": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
 	},
@@ -1253,8 +1346,15 @@ doc_events = {
 	"SIS Discipline Record": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
 		"after_insert": "erp.common.discipline_store.on_record_insert",
-		"on_update": "erp.common.discipline_store.on_record_update",
-		"on_trash": "erp.common.discipline_store.on_record_trash",
+		# Bộ đếm tháng (HS/lớp × vi phạm) — cộng chênh lệch trong cùng giao dịch
+		"on_update": [
+			"erp.common.discipline_store.on_record_update",
+			"erp.api.erp_sis.discipline_counters.on_record_change",
+		],
+		"on_trash": [
+			"erp.common.discipline_store.on_record_trash",
+			"erp.api.erp_sis.discipline_counters.on_record_change",
+		],
 	},
 	"SIS Discipline Classification": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
@@ -1299,6 +1399,13 @@ doc_events = {
 	# Xem cảnh báo đầy đủ trong erp/utils/campus_document.py.
 	"SIS Class Log Subject": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
+		# Rollup tuân thủ sổ đầu bài theo (lớp, ngày) — tính lại sau commit
+		"on_update": "erp.api.erp_sis.class_log_compliance.on_class_log_subject_change",
+		"on_trash": "erp.api.erp_sis.class_log_compliance.on_class_log_subject_change",
+	},
+	"SIS Class Log Student": {
+		"on_update": "erp.api.erp_sis.class_log_compliance.on_class_log_student_change",
+		"on_trash": "erp.api.erp_sis.class_log_compliance.on_class_log_student_change",
 	},
 	"SIS Class Log Score": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
@@ -1311,6 +1418,10 @@ doc_events = {
 	},
 	"ERP Organization Unit": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
+		# Đổi tem tập principal người duyệt (lãnh đạo / thành viên / liên kết / chức danh)
+		"on_update": "erp.api.erp_sis.approval.principal_cache.invalidate",
+		"on_trash": "erp.api.erp_sis.approval.principal_cache.invalidate",
+		"after_rename": "erp.api.erp_sis.approval.principal_cache.invalidate",
 	},
 	"PM Project": {
 		"before_insert": "erp.utils.campus_document.inject_campus_id",
@@ -1539,14 +1650,21 @@ scheduler_events = {
         "erp.api.faceid.sync_worker.process_pending_device_sync_jobs",
     ],
     "cron": {
-        # FaceID reconcile pickup + CRM Issue SLA + LMS enrollment (mỗi 15 phút)
+        # FaceID reconcile pickup + LMS enrollment (mỗi 15 phút)
         "*/15 * * * *": [
             "erp.api.faceid.sync_worker.reconcile_pickup_auth_to_controller",
             # Thành viên nhóm "PH cổng đón" dẫn xuất từ ủy quyền đón còn hiệu lực
             "erp.api.faceid.access_group_api.sync_pickup_guardian_members",
-            "erp.api.crm.sla_scheduler.check_crm_issue_sla",
-            "erp.api.erp_sis.approval.sla.check_workflow_deadlines",
             "erp.lms.sync.enrollment_sync.sync_all_sections",
+            # IT Support: ghi đè bộ đếm ticket đang xử lý (Redis) bằng số DB
+            "erp.api.erp_it_support.workload.reconcile",
+        ],
+        # Hạn SLA CRM / hạn duyệt / visit y tế quá 10' / mốc đợt CLB / nhắc sự kiện CSVC:
+        # đọc sorted set Redis, chỉ chạm DB khi có việc tới hạn (erp/common/deadlines.py)
+        "* * * * *": [
+            "erp.common.deadlines.dispatch",
+            # CLB: đối chiếu bộ đếm giữ chỗ Redis của các đợt đang Open với DB
+            "erp.sis.utils.club_slots.reconcile",
         ],
         "*/30 * * * *": [
             "erp.api.erp_common_user.microsoft_auth.ensure_users_subscription"
@@ -1556,7 +1674,7 @@ scheduler_events = {
         "0 * * * *": [
             "erp.api.mdm.alert.check_offline_devices",
         ],
-        # MDM: TTL telemetry — đặt từ đầu, không đợi DB phình rồi mới lo
+        # MDM: TTL telemetry (mẫu thô + rollup) — xoá theo lô, không đợi DB phình rồi mới lo
         "30 2 * * *": [
             "erp.api.mdm.telemetry.cleanup_old_telemetry",
         ],
@@ -1578,10 +1696,22 @@ scheduler_events = {
             "erp.api.erp_sis.attendance.remind_homeroom_attendance",
             "erp.api.erp_sis.attendance.daily_homeroom_attendance_report"
         ],
+        # Kỷ luật: dựng lại bộ đếm tháng hiện tại (bắt kịp chuyển lớp giữa tháng)
+        "45 0 * * *": [
+            "erp.api.erp_sis.discipline_counters.rebuild_current_month"
+        ],
         # Báo cáo kỷ luật THCS/THPT lúc 17:00 hàng ngày
         "0 17 * * *": [
             "erp.api.erp_sis.discipline_report.daily_discipline_email_report"
         ],
+        # Sổ đầu bài: tổng hợp lại rollup tuân thủ 7 ngày gần nhất (bắt kịp TKB ghi SQL thô)
+        "15 0 * * *": [
+            "erp.api.erp_sis.class_log_compliance.backfill_recent",
+            # Lưới an toàn cho hàng đợi hạn: dựng lại từ DB (ghi không qua doc hook, mất Redis)
+            "erp.common.deadlines.rebuild",
+            # Khoá so trùng CRM của bản ghi sửa gần đây (ghi không qua doc hook)
+            "erp.api.crm.match_keys.refresh_recent",
+        ],
         # Aggregate Parent Portal Analytics lúc 23:00 hàng ngày
         "0 23 * * *": [
             "erp.api.analytics.portal_analytics.aggregate_portal_analytics"
@@ -1598,18 +1728,13 @@ scheduler_events = {
         "0 1 * * *": [
             "erp.sis.tasks.library_overdue.sync_library_overdue_job"
         ],
-        # Health Visit Escalation - Kiểm tra visit quá 10 phút chưa chuyển trạng thái (mỗi 2 phút, 7h-17h)
-        "*/2 7-17 * * 1-6": [
-            "erp.api.erp_sis.daily_health_notification.check_stale_health_visits"
-        ],
-        # Nhắc PIC (task + công việc con) ~1 tiếng trước giờ bắt đầu sự kiện CSVC (mỗi 5 phút)
-        # + Ba mốc vòng đời đợt CLB: ~15' trước khi mở, ~1h trước khi đóng,
-        #   và ngay sau khi đóng cổng
         "*/5 * * * *": [
-            "erp.api.erp_administrative.administrative_ticket.send_event_facility_reminders",
-            "erp.sis.tasks.club_reminders.send_club_open_reminders",
-            "erp.sis.tasks.club_reminders.send_club_close_reminders",
-            "erp.sis.tasks.club_reminders.send_club_closed_notices",
+            # MDM: tổng hợp telemetry 5 phút / 1 giờ cho các khung vừa nhận mẫu
+            "erp.api.mdm.telemetry_rollup.rollup_dirty_buckets",
+            # MDM: ghi heartbeat đang nằm ở Redis xuống tabMDM Device theo lô
+            "erp.api.mdm.presence.flush",
+            # Expo: hỏi receipt của ticket đã gửi ~15 phút trước, tắt token DeviceNotRegistered
+            "erp.api.erp_sis.expo_push.poll_receipts",
         ],
         # Renew subscription mỗi 30 phút
         "0 2 * * *": [
@@ -1626,6 +1751,12 @@ scheduler_events = {
         "erp.api.parent_portal.push_notification.cleanup_stale_push_subscriptions",
         # Mobile Device Token (Expo) - deactivate token last_seen quá 90 ngày, xóa inactive quá 30 ngày
         "erp.api.erp_sis.mobile_push_notification.cleanup_stale_mobile_device_tokens",
+    ],
+    # Dọn theo lô có nghỉ + trần số dòng (erp/common/archival.py) — một lượt có thể
+    # chạy vài phút, nên đặt ở hàng đợi long
+    "daily_long": [
+        # Tài chính: đối soát tổng học sinh + bộ đếm năm (delta) với số tính lại toàn bộ
+        "erp.api.erp_sis.finance.ledger.reconcile",
         # ERP Notification giữ 45 ngày (2026-08-07, bảng từng đạt 751k rows/750MB)
         "erp.common.notification_purge.purge_old_notifications",
         # Version + Deleted Document giữ 90 ngày (tabVersion từng đạt 3GB/2.2M rows)
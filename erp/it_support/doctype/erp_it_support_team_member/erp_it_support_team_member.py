@@ -29,6 +29,17 @@ class ERPITSupportTeamMember(Document):
 			frappe.throw(_("Role không hợp lệ: {0}").format(", ".join(invalid)))
 		self.roles_json = json.dumps(roles, separators=(",", ":"))
 
+	def on_update(self):
+		# Chỉ mục role → thành viên dùng cho auto-assign ticket
+		from erp.api.erp_it_support.workload import invalidate_role_index
+
+		invalidate_role_index()
+
+	def on_trash(self):
+		from erp.api.erp_it_support.workload import invalidate_role_index
+
+		invalidate_role_index()
+
 
 def _normalize_roles_json(raw):
 	if raw is None:
@@ -46,6 +46,37 @@ def http_request_duration_histogram() -> Histogram:
 	)
 
 
+@lru_cache(maxsize=1)
+def jwt_auth_counter() -> Counter:
+	return Counter(
+		"erp_jwt_auth_total",
+		"Số lần middleware JWT xác thực, theo kết quả cache (hit/miss/invalid/revoked/error)",
+		["outcome"],
+		registry=_registry(),
+	)
+
+
+@lru_cache(maxsize=1)
+def jwt_auth_duration_histogram() -> Histogram:
+	return Histogram(
+		"erp_jwt_auth_duration_seconds",
+		"Thời gian middleware JWT resolve principal (giây)",
+		["outcome"],
+		buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+		registry=_registry(),
+	)
+
+
+@lru_cache(maxsize=1)
+def attendance_day_cache_counter() -> Counter:
+	return Counter(
+		"erp_attendance_day_cache_total",
+		"Số mã học sinh tra cache điểm danh theo ngày (hit/miss)",
+		["result"],
+		registry=_registry(),
+	)
+
+
 def normalize_path(path: str) -> str:
 	"""Thu gọn path (giảm cardinality)."""
 	if not path:
@@ -74,6 +105,20 @@ def observe_http_request(method: str, path: str, status_code: int, duration_seco
 	)
 
 
+def observe_jwt_auth(outcome: str, duration_seconds: float) -> None:
+	"""Ghi nhận một lần xác thực JWT — hit rate = hit / (hit + miss)."""
+	jwt_auth_counter().labels(outcome=outcome).inc()
+	jwt_auth_duration_histogram().labels(outcome=outcome).observe(max(0.0, float(duration_seconds)))
+
+
+def observe_attendance_day_cache(hits: int, misses: int) -> None:
+	"""Ghi nhận một lượt `get_students_day_map` — đếm theo MÃ, không theo request."""
+	if hits:
+		attendance_day_cache_counter().labels(result="hit").inc(hits)
+	if misses:
+		attendance_day_cache_counter().labels(result="miss").inc(misses)
+
+
 def generate_metrics_bytes() -> bytes:
 	"""Nội dung text exposition cho Prometheus."""
 	from prometheus_client import generate_latest
@@ -0,0 +1,39 @@
+"""
+Index cho hàng chờ duyệt (engine.pending_parent_names) và tập principal (principal_cache).
+
+    idx_approval_step_inbox (status, is_active, parenttype) trên tabERP Approval Step
+        -> lọc bước Pending đang mở theo loại phiếu trước khi khớp principal
+    idx_approval_step_scope (scope_unit, assignee_principal_type)
+    idx_approval_step_user (approver_user)
+    idx_org_unit_<bảng>_user (user, parenttype) trên ba bảng con Leader / Member / Associate
+        -> principal_cache._load: một UNION theo user
+"""
+
+import frappe
+
+STEP = "ERP Approval Step"
+ORG_CHILDREN = (
+	("ERP Organization Unit Leader", "idx_org_unit_leader_user"),
+	("ERP Organization Unit Member", "idx_org_unit_member_user"),
+	("ERP Organization Unit Associate", "idx_org_unit_associate_user"),
+)
+
+
+def _create_index_if_missing(table, index_name, columns_sql, unique=False):
+	existing = frappe.db.sql(f"SHOW INDEX FROM `{table}` WHERE Key_name = %s", (index_name,))
+	if existing:
+		return
+	frappe.db.sql(f"CREATE {'UNIQUE ' if unique else ''}INDEX `{index_name}` ON `{table}` ({columns_sql})")
+	frappe.db.commit()
+
+
+def execute():
+	# table_exists() tự thêm tiền tố `tab` — truyền DOCTYPE, không truyền tên bảng
+	if frappe.db.table_exists(STEP):
+		_create_index_if_missing(f"tab{STEP}", "idx_approval_step_inbox", "`status`, `is_active`, `parenttype`")
+		_create_index_if_missing(f"tab{STEP}", "idx_approval_step_scope", "`scope_unit`, `assignee_principal_type`")
+		_create_index_if_missing(f"tab{STEP}", "idx_approval_step_user", "`approver_user`")
+
+	for doctype, index_name in ORG_CHILDREN:
+		if frappe.db.table_exists(doctype):
+			_create_index_if_missing(f"tab{doctype}", index_name, "`user`, `parenttype`")
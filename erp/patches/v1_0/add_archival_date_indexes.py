@@ -0,0 +1,33 @@
+"""
+Index cột thời gian cho các bảng dọn theo lô (erp/common/archival.py).
+
+Mỗi lô `SELECT name ... WHERE <cột> < cutoff ORDER BY <cột> LIMIT n` cần index bắt đầu
+bằng cột thời gian, nếu không mỗi lô là một lần quét toàn bảng. Bảng đã có index như
+vậy (Frappe tự tạo trên `creation` ở một số bản) thì bỏ qua.
+"""
+
+import frappe
+
+
+def _has_leading_index(table, column):
+	return bool(
+		frappe.db.sql(
+			f"SHOW INDEX FROM `{table}` WHERE Seq_in_index = 1 AND Column_name = %s",
+			(column,),
+		)
+	)
+
+
+def execute():
+	from erp.common.log_purge import POLICIES
+	from erp.common.notification_purge import POLICY
+
+	for pol in (*POLICIES, POLICY):
+		# table_exists() tự thêm tiền tố `tab` — truyền DOCTYPE, không truyền tên bảng
+		if not frappe.db.table_exists(pol.doctype):
+			continue
+		table = f"tab{pol.doctype}"
+		if _has_leading_index(table, pol.date_column):
+			continue
+		frappe.db.sql(f"CREATE INDEX `idx_archival_{pol.date_column}` ON `{table}` (`{pol.date_column}`)")
+		frappe.db.commit()
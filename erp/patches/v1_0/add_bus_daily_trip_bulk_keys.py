@@ -0,0 +1,95 @@
+"""
+Khoá / index cho sinh và lưu trữ chuyến xe theo lô (erp/api/erp_sis/bus_daily_trip_bulk.py).
+
+    uq_bus_daily_trip_key (route_id, trip_date, trip_type) trên tabSIS Bus Daily Trip
+        -> INSERT IGNORE của generate_trips idempotent kể cả khi hai job chạy chồng
+    idx_bus_daily_trip_archive_scan (trip_status, trip_date)
+        -> archive_trips quét chuyến Completed cũ theo lô
+    tabSIS Bus Daily Trip Archive -> ROW_FORMAT=COMPRESSED (students_data là JSON dài)
+
+Bộ trùng khoá có sẵn: chỉ xoá chuyến "chưa đụng tới" (Not Started, mọi học sinh Not
+Boarded), giữ bản tạo sớm nhất. Còn trùng sau đó (hai chuyến cùng khoá đều đã chạy —
+gộp tự động sẽ mất điểm danh) thì patch DỪNG migrate, liệt kê các bộ trùng để xử lý
+tay rồi chạy lại `bench migrate`. Không có unique key thì generate_trips từ chối chạy.
+"""
+
+import frappe
+
+TRIP = "SIS Bus Daily Trip"
+ARCHIVE = "SIS Bus Daily Trip Archive"
+
+
+def _create_index_if_missing(table, index_name, columns_sql, unique=False):
+	existing = frappe.db.sql(f"SHOW INDEX FROM `{table}` WHERE Key_name = %s", (index_name,))
+	if existing:
+		return
+	frappe.db.sql(f"CREATE {'UNIQUE ' if unique else ''}INDEX `{index_name}` ON `{table}` ({columns_sql})")
+	frappe.db.commit()
+
+
+def _duplicate_groups():
+	return frappe.db.sql(
+		f"""
+		SELECT route_id, trip_date, trip_type FROM `tab{TRIP}`
+		GROUP BY route_id, trip_date, trip_type
+		HAVING COUNT(*) > 1
+		""",
+		as_dict=True,
+	)
+
+
+def _drop_untouched_duplicates():
+	for g in _duplicate_groups():
+		trips = frappe.db.sql(
+			f"""
+			SELECT dt.name, dt.trip_status,
+				SUM(IF(IFNULL(s.student_status, 'Not Boarded') != 'Not Boarded', 1, 0)) AS touched
+			FROM `tab{TRIP}` dt
+			LEFT JOIN `tabSIS Bus Daily Trip Student` s ON s.daily_trip_id = dt.name
+			WHERE dt.route_id = %s AND dt.trip_date = %s AND dt.trip_type = %s
+			GROUP BY dt.name
+			ORDER BY dt.creation, dt.name
+			""",
+			(g.route_id, g.trip_date, g.trip_type),
+			as_dict=True,
+		)
+		keep = next((t for t in trips if t.trip_status != "Not Started" or t.touched), trips[0])
+		drop = [
+			t.name for t in trips
+			if t.name != keep.name and t.trip_status == "Not Started" and not t.touched
+		]
+		if drop:
+			frappe.db.sql(
+				"DELETE FROM `tabSIS Bus Daily Trip Student` WHERE daily_trip_id IN %(names)s", {"names": drop}
+			)
+			frappe.db.sql(f"DELETE FROM `tab{TRIP}` WHERE name IN %(names)s", {"names": drop})
+	frappe.db.commit()
+
+
+def execute():
+	# table_exists() tự thêm tiền tố `tab` — truyền DOCTYPE, không truyền tên bảng
+	if frappe.db.table_exists(TRIP):
+		_drop_untouched_duplicates()
+		remaining = _duplicate_groups()
+		if remaining:
+			sample = ", ".join(f"({g.route_id}, {g.trip_date}, {g.trip_type})" for g in remaining[:20])
+			frappe.throw(
+				f"{len(remaining)} bộ (route_id, trip_date, trip_type) trùng mà các chuyến đều đã "
+				f"chạy — không tạo được uq_bus_daily_trip_key. Xoá / gộp tay rồi chạy lại migrate: {sample}"
+			)
+		_create_index_if_missing(
+			f"tab{TRIP}", "uq_bus_daily_trip_key", "`route_id`, `trip_date`, `trip_type`", unique=True
+		)
+		_create_index_if_missing(f"tab{TRIP}", "idx_bus_daily_trip_archive_scan", "`trip_status`, `trip_date`")
+
+	if frappe.db.table_exists(ARCHIVE):
+		row_format = frappe.db.sql(
+			"SELECT ROW_FORMAT FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+			(f"tab{ARCHIVE}",),
+		)
+		if row_format and (row_format[0][0] or "").lower() != "compressed":
+			try:
+				frappe.db.sql_ddl(f"ALTER TABLE `tab{ARCHIVE}` ROW_FORMAT=COMPRESSED")
+			except Exception:
+				# Máy chủ tắt innodb_file_per_table / page nén — bảng vẫn dùng được, chỉ không nén
+				frappe.log_error(frappe.get_traceback(), "add_bus_daily_trip_bulk_keys.compress_archive")
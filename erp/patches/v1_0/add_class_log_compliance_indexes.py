@@ -0,0 +1,41 @@
+"""
+Index cho tabSIS Class Log Compliance (rollup sổ đầu bài — xem
+erp/api/erp_sis/class_log_compliance.py).
+
+    uq_cl_compliance_slot (log_date, class_id, period_number, teacher_id)
+        -> khoá của rollup; ghi bằng INSERT ... ON DUPLICATE KEY UPDATE nên hai lần
+           tổng hợp cùng lúc một (lớp, ngày) không sinh dòng trùng
+    idx_cl_compliance_class_date (class_id, log_date, schedule_signature)
+        -> kiểm độ tươi theo lớp × khoảng ngày mà không đọc bảng
+
+teacher_id luôn là '' chứ không NULL khi không có GV: MariaDB bỏ qua dòng có NULL
+trong UNIQUE index.
+"""
+
+import frappe
+
+DOCTYPE = "SIS Class Log Compliance"
+TABLE = f"tab{DOCTYPE}"
+
+
+def _create_index_if_missing(index_name, columns_sql, unique=False):
+	existing = frappe.db.sql(f"SHOW INDEX FROM `{TABLE}` WHERE Key_name = %s", (index_name,))
+	if existing:
+		return
+	frappe.db.sql(f"CREATE {'UNIQUE ' if unique else ''}INDEX `{index_name}` ON `{TABLE}` ({columns_sql})")
+	frappe.db.commit()
+
+
+def execute():
+	# table_exists() tự thêm tiền tố `tab` — truyền DOCTYPE, không truyền TABLE
+	if not frappe.db.table_exists(DOCTYPE):
+		return
+	_create_index_if_missing(
+		"uq_cl_compliance_slot",
+		"`log_date`, `class_id`, `period_number`, `teacher_id`",
+		unique=True,
+	)
+	_create_index_if_missing(
+		"idx_cl_compliance_class_date",
+		"`class_id`, `log_date`, `schedule_signature`",
+	)
@@ -0,0 +1,34 @@
+"""
+Index + dựng lần đầu cho tabCRM Match Key (khoá so trùng CRM — xem
+erp/api/crm/match_keys.py).
+
+    idx_crm_match_key (key_type, match_key, entity_type)
+        -> kiểm tra trùng: tra lead theo SĐT / khối tên; script gộp nhà: ai giữ khoá nào
+    idx_crm_match_entity (entity_type, entity_id)
+        -> doc hook xoá khoá cũ của một lead / guardian trước khi ghi lại
+"""
+
+import frappe
+
+DOCTYPE = "CRM Match Key"
+TABLE = f"tab{DOCTYPE}"
+
+
+def _create_index_if_missing(index_name, columns_sql, unique=False):
+	existing = frappe.db.sql(f"SHOW INDEX FROM `{TABLE}` WHERE Key_name = %s", (index_name,))
+	if existing:
+		return
+	frappe.db.sql(f"CREATE {'UNIQUE ' if unique else ''}INDEX `{index_name}` ON `{TABLE}` ({columns_sql})")
+	frappe.db.commit()
+
+
+def execute():
+	# table_exists() tự thêm tiền tố `tab` — truyền DOCTYPE, không truyền TABLE
+	if not frappe.db.table_exists(DOCTYPE):
+		return
+	_create_index_if_missing("idx_crm_match_key", "`key_type`, `match_key`, `entity_type`")
+	_create_index_if_missing("idx_crm_match_entity", "`entity_type`, `entity_id`")
+
+	from erp.api.crm.match_keys import rebuild
+
+	rebuild()
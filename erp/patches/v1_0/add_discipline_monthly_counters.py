@@ -0,0 +1,44 @@
+"""
+Index + dựng lần đầu cho tabSIS Discipline Monthly Counter (bộ đếm kỷ luật theo
+tháng — xem erp/api/erp_sis/discipline_counters.py).
+
+    uq_discipline_counter_key (entity_type, entity_id, violation, month_start)
+        -> khoá của bộ đếm; hook cộng delta bằng INSERT ... ON DUPLICATE KEY UPDATE
+    idx_discipline_counter_month (month_start, entity_type)
+        -> rebuild_month xoá theo tháng + tra dòng đánh dấu tháng
+
+entity_id / violation luôn là '' chứ không NULL: MariaDB bỏ qua dòng có NULL trong
+UNIQUE index.
+"""
+
+import frappe
+
+DOCTYPE = "SIS Discipline Monthly Counter"
+TABLE = f"tab{DOCTYPE}"
+
+
+def _create_index_if_missing(index_name, columns_sql, unique=False):
+	existing = frappe.db.sql(f"SHOW INDEX FROM `{TABLE}` WHERE Key_name = %s", (index_name,))
+	if existing:
+		return
+	frappe.db.sql(f"CREATE {'UNIQUE ' if unique else ''}INDEX `{index_name}` ON `{TABLE}` ({columns_sql})")
+	frappe.db.commit()
+
+
+def execute():
+	# table_exists() tự thêm tiền tố `tab` — truyền DOCTYPE, không truyền TABLE
+	if not frappe.db.table_exists(DOCTYPE):
+		return
+	_create_index_if_missing(
+		"uq_discipline_counter_key",
+		"`entity_type`, `entity_id`, `violation`, `month_start`",
+		unique=True,
+	)
+	_create_index_if_missing(
+		"idx_discipline_counter_month",
+		"`month_start`, `entity_type`",
+	)
+
+	from erp.api.erp_sis.discipline_counters import rebuild
+
+	rebuild()
@@ -0,0 +1,43 @@
+"""
+Index cho telemetry MDM + dựng rollup lần đầu (xem erp/api/mdm/telemetry_rollup.py).
+
+    idx_mdm_telemetry_device_time (device, captured_at) trên tabMDM Telemetry
+        -> biểu đồ theo khoảng + tính lại khung 5 phút của một máy
+    idx_mdm_telemetry_captured (captured_at)
+        -> dọn theo lô `DELETE ... WHERE captured_at < ? LIMIT n`
+    uq_mdm_telemetry_rollup_key (device, resolution, bucket_start)
+        -> khoá của rollup; job tính lại bằng INSERT ... ON DUPLICATE KEY UPDATE
+    idx_mdm_telemetry_rollup_purge (resolution, bucket_start)
+"""
+
+import frappe
+
+RAW = "MDM Telemetry"
+ROLLUP = "MDM Telemetry Rollup"
+
+
+def _create_index_if_missing(table, index_name, columns_sql, unique=False):
+	existing = frappe.db.sql(f"SHOW INDEX FROM `{table}` WHERE Key_name = %s", (index_name,))
+	if existing:
+		return
+	frappe.db.sql(f"CREATE {'UNIQUE ' if unique else ''}INDEX `{index_name}` ON `{table}` ({columns_sql})")
+	frappe.db.commit()
+
+
+def execute():
+	# table_exists() tự thêm tiền tố `tab` — truyền DOCTYPE, không truyền tên bảng
+	if frappe.db.table_exists(RAW):
+		_create_index_if_missing(f"tab{RAW}", "idx_mdm_telemetry_device_time", "`device`, `captured_at`")
+		_create_index_if_missing(f"tab{RAW}", "idx_mdm_telemetry_captured", "`captured_at`")
+	if not frappe.db.table_exists(ROLLUP):
+		return
+	_create_index_if_missing(
+		f"tab{ROLLUP}", "uq_mdm_telemetry_rollup_key", "`device`, `resolution`, `bucket_start`", unique=True
+	)
+	_create_index_if_missing(f"tab{ROLLUP}", "idx_mdm_telemetry_rollup_purge", "`resolution`, `bucket_start`")
+
+	if frappe.db.table_exists(RAW):
+		from erp.api.mdm.telemetry_rollup import rebuild
+
+		# Mẫu thô đang giữ tới 30 ngày (TTL cũ) — dựng hết trước khi TTL mới cắt còn 7 ngày
+		rebuild(start=frappe.utils.add_days(frappe.utils.now_datetime(), -30))
@@ -0,0 +1,38 @@
+"""
+Index + dựng lần đầu cho tabERP Administrative Room History (xem
+erp/api/erp_administrative/room_history.py).
+
+    idx_room_history_asof (ref_doctype, valid_from, valid_to)
+        -> "mọi phòng tại mốc T" là một lần quét khoảng
+    idx_room_history_doc (ref_doctype, docname, valid_to)
+        -> hook tìm phiên bản đang mở của một bản ghi
+
+Dựng từ Version còn lại: Version đã bị log_purge xoá (>90 ngày) thì phiên bản cũ nhất
+dựng được kéo dài về tận lúc tạo — cùng giới hạn với cách tái dựng cũ, nhưng từ nay
+lịch sử không mất thêm.
+"""
+
+import frappe
+
+DOCTYPE = "ERP Administrative Room History"
+TABLE = f"tab{DOCTYPE}"
+
+
+def _create_index_if_missing(index_name, columns_sql):
+	existing = frappe.db.sql(f"SHOW INDEX FROM `{TABLE}` WHERE Key_name = %s", (index_name,))
+	if existing:
+		return
+	frappe.db.sql(f"CREATE INDEX `{index_name}` ON `{TABLE}` ({columns_sql})")
+	frappe.db.commit()
+
+
+def execute():
+	# table_exists() tự thêm tiền tố `tab` — truyền DOCTYPE, không truyền TABLE
+	if not frappe.db.table_exists(DOCTYPE):
+		return
+	_create_index_if_missing("idx_room_history_asof", "`ref_doctype`, `valid_from`, `valid_to`")
+	_create_index_if_missing("idx_room_history_doc", "`ref_doctype`, `docname`, `valid_to`")
+
+	from erp.api.erp_administrative.room_history import backfill
+
+	backfill()
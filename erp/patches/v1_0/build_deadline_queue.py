@@ -0,0 +1,18 @@
+"""
+Dựng hàng đợi hạn lần đầu (erp/common/deadlines.py) từ DB.
+
+Các cron quét SLA CRM / hạn duyệt / visit y tế / mốc CLB / nhắc sự kiện CSVC đã gỡ khỏi
+hooks.py; không dựng ngay thì các hạn đang chờ lúc deploy phải đợi rebuild 00:15.
+"""
+
+import frappe
+
+
+def execute():
+	from erp.common import deadlines
+
+	try:
+		deadlines.rebuild()
+	except Exception:
+		# Redis chưa sẵn lúc migrate — rebuild hằng đêm sẽ làm lại
+		frappe.log_error(frappe.get_traceback(), "build_deadline_queue")
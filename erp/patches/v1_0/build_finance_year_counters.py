@@ -0,0 +1,18 @@
+"""
+Dựng lần đầu tabSIS Finance Year Counter (bộ đếm dashboard tài chính — xem
+erp/api/erp_sis/finance/ledger.py) cho mọi năm tài chính đang có.
+"""
+
+import frappe
+
+
+def execute():
+	# table_exists() tự thêm tiền tố `tab` — truyền DocType
+	if not frappe.db.table_exists("SIS Finance Year Counter"):
+		return
+
+	from erp.api.erp_sis.finance.ledger import rebuild_year
+
+	for year in frappe.db.sql_list("SELECT name FROM `tabSIS Finance Year`"):
+		rebuild_year(year)
+		frappe.db.commit()
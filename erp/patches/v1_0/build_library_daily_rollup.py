@@ -0,0 +1,16 @@
+"""
+Dựng lần đầu bảng tổng hợp báo cáo thư viện (SIS Library Daily Stat / Title Daily Stat —
+xem erp/api/erp_sis/library/rollup.py) từ toàn bộ phiếu mượn và phiếu phạt.
+"""
+
+import frappe
+
+
+def execute():
+	# table_exists() tự thêm tiền tố `tab` — truyền DocType
+	if not frappe.db.table_exists("SIS Library Daily Stat") or not frappe.db.table_exists("SIS Library Title Daily Stat"):
+		return
+
+	from erp.api.erp_sis.library.rollup import rebuild
+
+	rebuild()
@@ -0,0 +1,116 @@
+# Copyright (c) 2026, Wellspring International School
+"""
+Đo độ trễ mà `files_cdn.sign_response` cộng thêm vào một response JSON, theo kích thước body.
+
+    bench --site <site> execute erp.scripts.benchmark_files_cdn.run
+
+    # Tuỳ chỉnh kích thước (số phần tử có URL ảnh) và số vòng lặp:
+    bench --site <site> execute erp.scripts.benchmark_files_cdn.run \
+        --kwargs "{'sizes': [100, 2198, 10000], 'rounds': 20}"
+
+So ba đường trên CÙNG một body giả lập (mỗi phần tử một bìa sách `/files/...`):
+
+    cu        ký thẳng `cdn_sign.sign_path` từng match + `json.loads` cả body
+    moi_lanh  bộ nhớ chữ ký rỗng (request đầu tiên của cửa sổ ký) + kiểm tra đếm dấu
+    moi_nong  bộ nhớ đã đầy (mọi request sau trong cửa sổ)
+
+Không đụng Redis hay DB: tập khoá dựng sẵn trong bộ nhớ, conf CDN là conf giả đặt tạm
+vào `cdn_sign._conf_cache` rồi trả lại — chạy được cả trên site chưa cấu hình CDN.
+"""
+
+import json
+import time
+
+from erp.common import cdn_sign, cdn_sign_cache, files_cdn, sis_content_cdn
+
+_FAKE_CONF = {
+	"CDN_LINK_SECRET": "benchmark-secret",
+	"CDN_PUBLIC_URL": "https://media.wellspring.edu.vn",
+}
+
+
+def _body(size):
+	items = [
+		{
+			"name": f"TITLE-{i:05d}",
+			"title": f"Sách số {i}",
+			"cover_image": f"/files/Library/cover_{i:05d}.webp",
+		}
+		for i in range(size)
+	]
+	return json.dumps({"message": {"data": items}}, ensure_ascii=False)
+
+
+def _domain(size):
+	return {
+		"name": "sis-content",
+		"prefix": sis_content_cdn.PREFIX,
+		"keys": frozenset(f"Library/cover_{i:05d}.webp" for i in range(size)),
+		"key_from_url": sis_content_cdn.key_from_url,
+		"expiry": lambda: cdn_sign.expiry_for(
+			"CDN_SIGN_WINDOW_SIS_CONTENT_SEC", "CDN_SIGN_LIFETIME_SIS_CONTENT_SEC"
+		),
+	}
+
+
+def _old_path(body, domains):
+	signed = files_cdn.sign_text(body, domains, signer=cdn_sign.sign_path)
+	json.loads(signed)
+	return signed
+
+
+def _new_path(body, domains):
+	signed = files_cdn.sign_text(body, domains)
+	if not files_cdn.same_json_shape(body, signed):
+		raise ValueError("shape mismatch")
+	return signed
+
+
+def _time_ms(fn, rounds):
+	samples = []
+	for _ in range(rounds):
+		started = time.perf_counter()
+		fn()
+		samples.append((time.perf_counter() - started) * 1000)
+	samples.sort()
+	return round(samples[len(samples) // 2], 3)
+
+
+def run(sizes=None, rounds=10):
+	sizes = sizes or [10, 100, 1000, 2198, 5000]
+	saved_conf = cdn_sign._conf_cache
+	cdn_sign._conf_cache = _FAKE_CONF
+	results = []
+	try:
+		for size in sizes:
+			body = _body(size)
+			domains = [_domain(size)]
+			# Hai đường phải ra CÙNG body — benchmark mà khác kết quả thì vô nghĩa.
+			cdn_sign_cache.clear_local()
+			if _old_path(body, domains) != _new_path(body, domains):
+				raise AssertionError(f"size={size}: đường mới ký khác đường cũ")
+
+			def cold():
+				cdn_sign_cache.clear_local()
+				_new_path(body, domains)
+
+			old_ms = _time_ms(lambda: _old_path(body, domains), rounds)
+			cold_ms = _time_ms(cold, rounds)
+			_new_path(body, domains)
+			warm_ms = _time_ms(lambda: _new_path(body, domains), rounds)
+			row = {
+				"items": size,
+				"body_kb": round(len(body.encode("utf-8")) / 1024, 1),
+				"cu_ms": old_ms,
+				"moi_lanh_ms": cold_ms,
+				"moi_nong_ms": warm_ms,
+			}
+			results.append(row)
+			print(
+				f"{size:>6} items {row['body_kb']:>8} KB | cu {old_ms:>8} ms"
+				f" | moi_lanh {cold_ms:>8} ms | moi_nong {warm_ms:>8} ms"
+			)
+	finally:
+		cdn_sign._conf_cache = saved_conf
+		cdn_sign_cache.clear_local()
+	return results
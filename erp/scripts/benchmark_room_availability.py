@@ -0,0 +1,102 @@
+# Copyright (c) 2026, Wellspring International School
+"""
+Đo thời gian tìm phòng trống cả campus trong một tuần.
+
+    bench --site <site> execute erp.scripts.benchmark_room_availability.run \
+        --kwargs "{'campus_id': 'campus-1'}"
+
+    # Tuần khác / số vòng lặp:
+    ... --kwargs "{'campus_id': 'campus-1', 'start_date': '2026-10-19', 'days': 7, 'rounds': 10}"
+
+So ba đường trên CÙNG tập phòng đang mở đặt của campus:
+
+    cu        như FE cũ: mỗi phòng một lượt `get_room_bookings` + `get_room_event_bookings`
+              (2 truy vấn / phòng, chưa tính thời khoá biểu)
+    moi_lanh  `room_availability.search` sau khi xoá chỉ mục campus (dựng lại từ DB)
+    moi_nong  `room_availability.search` khi chỉ mục đã có trong Redis
+
+Chỉ đọc — không ghi DB; chỉ mục Redis của campus bị xoá rồi dựng lại trong lúc đo.
+"""
+
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import frappe
+from frappe.utils import getdate, nowdate
+
+from erp.api.erp_administrative import room_availability as ra
+
+
+def _timed(fn, rounds):
+    samples = []
+    result = None
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), result
+
+
+def _old_path(room_names, start_dt, end_dt):
+    busy = {}
+    for room in room_names:
+        busy[room] = frappe.get_all(
+            ra.BOOKING_DOCTYPE,
+            filters=[
+                ["room_id", "=", room],
+                ["status", "!=", "Cancelled"],
+                ["start_time", "<", end_dt],
+                ["end_time", ">", start_dt],
+            ],
+            fields=["name", "start_time", "end_time"],
+        ) + frappe.get_all(
+            ra.TICKET_DOCTYPE,
+            filters=[
+                ["is_event_facility", "=", 1],
+                ["event_room_id", "=", room],
+                ["status", "!=", "Cancelled"],
+                ["event_start_time", "<", end_dt],
+                ["event_end_time", ">", start_dt],
+            ],
+            fields=["name", "event_start_time", "event_end_time"],
+        )
+    return busy
+
+
+def run(campus_id=None, start_date=None, days=7, rounds=5, duration_minutes=60):
+    if not campus_id:
+        print("Thiếu campus_id")
+        return {}
+    days, rounds = int(days), int(rounds)
+    start_dt = datetime.combine(getdate(start_date or nowdate()), datetime.min.time())
+    end_dt = start_dt + timedelta(days=days)
+
+    rooms, _hours = ra._candidate_rooms(campus_id)
+    room_names = [r.name for r in rooms]
+    print(f"Campus {campus_id}: {len(room_names)} phòng mở đặt, {start_dt.date()} -> {end_dt.date()}")
+
+    cu_ms, _busy = _timed(lambda: _old_path(room_names, start_dt, end_dt), rounds)
+
+    def _cold():
+        ra.invalidate_campus(campus_id)
+        return ra.search(campus_id, start_dt, end_dt, duration_minutes=duration_minutes)
+
+    lanh_ms, _ = _timed(_cold, rounds)
+    nong_ms, found = _timed(
+        lambda: ra.search(campus_id, start_dt, end_dt, duration_minutes=duration_minutes), rounds
+    )
+
+    summary = {
+        "rooms": len(room_names),
+        "days": days,
+        "rooms_with_free_slot": len(found or []),
+        "cu_ms": round(cu_ms, 2),
+        "moi_lanh_ms": round(lanh_ms, 2),
+        "moi_nong_ms": round(nong_ms, 2),
+    }
+    print(
+        f"cu={summary['cu_ms']}ms | moi_lanh={summary['moi_lanh_ms']}ms | "
+        f"moi_nong={summary['moi_nong_ms']}ms (median {rounds} vòng)"
+    )
+    return summary
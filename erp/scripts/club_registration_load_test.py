@@ -0,0 +1,228 @@
+# Copyright (c) 2026, Wellspring International School
+"""
+Giả lập lúc mở cổng đăng ký CLB — nhiều phụ huynh bấm cùng lúc vào vài môn hot.
+
+Hai bài đo:
+
+    # 1. Chỉ cửa nhanh Redis (không chạm DB): N client tranh `capacity` chỗ của
+    #    một offering giả; kiểm số chỗ cấp ra đúng bằng capacity.
+    bench --site <site> execute erp.scripts.club_registration_load_test.burst_slots \
+        --kwargs "{'capacity': 20, 'clients': 2000, 'threads': 64}"
+
+    # 2. Đường đăng ký thật (cửa nhanh + khoá DB) trên site staging: mỗi tiến trình
+    #    con là một "gunicorn worker" có kết nối DB riêng.
+    bench --site <site> execute erp.scripts.club_registration_load_test.burst_register \
+        --kwargs "{'period_id': 'CLUB-PERIOD-0001', 'offering_ids': ['...', '...'], \
+                   'students': 2000, 'processes': 16}"
+
+Bài 2 GHI đăng ký thật rồi xoá đúng các đăng ký vừa tạo khi xong (cleanup=1),
+đếm lại `registered_count` và bộ đếm Redis. Không chạy trên site có
+`is_production` trong site_config.
+
+Báo cáo: số request theo kết quả (saved / CLUB_FULL / SYSTEM_BUSY / ...), độ trễ
+p50 / p95 / p99 / max, và số đăng ký active từng môn so với capacity (vượt là lỗi).
+"""
+
+import random
+import statistics
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import frappe
+
+from erp.sis.utils import club_registration, club_slots
+
+
+def _percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 1)
+
+    return {
+        "p50_ms": round(statistics.median(ordered), 1),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1], 1),
+    }
+
+
+def _refuse_production():
+    if frappe.conf.get("is_production"):
+        frappe.throw("Không chạy load test trên site production")
+
+
+def burst_slots(capacity=20, clients=2000, threads=64):
+    """Bắn `clients` lượt reserve song song vào một offering giả có `capacity` chỗ."""
+    cache = frappe.cache()
+    offering_id = f"LOADTEST-{uuid.uuid4().hex[:8]}"
+    # Tính key + nạp script ở luồng chính — luồng phụ không có frappe.local
+    keys = list(club_slots._keys(cache, offering_id))
+    reserve = cache.register_script(club_slots._RESERVE_LUA)
+    cache.set(keys[0], int(capacity), ex=600)
+
+    def one(i):
+        t0 = time.perf_counter()
+        result = reserve(keys=keys, args=[f"student-{i}", int(time.time())])
+        return (time.perf_counter() - t0) * 1000, int(result[0])
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=int(threads)) as pool:
+        outcomes = list(pool.map(one, range(int(clients))))
+    seconds = time.perf_counter() - t0
+
+    granted = sum(1 for _, r in outcomes if r == club_slots.GRANTED)
+    report = {
+        "offering": offering_id,
+        "capacity": int(capacity),
+        "clients": int(clients),
+        "granted": granted,
+        "rejected": len(outcomes) - granted,
+        "remaining": int(cache.get(keys[0]) or 0),
+        "oversubscribed": granted > int(capacity),
+        "seconds": round(seconds, 2),
+        "reserves_per_sec": round(len(outcomes) / seconds, 1) if seconds else None,
+        **_percentiles([ms for ms, _ in outcomes]),
+    }
+    cache.delete(*keys)
+    print(report)
+    return report
+
+
+def _eligible_students(period, offering_ids, limit):
+    """Học sinh có lớp chính quy thuộc khối của các môn, chưa đăng ký gì trong đợt."""
+    return frappe.db.sql_list(
+        """
+        SELECT DISTINCT cs.student_id
+        FROM `tabSIS Class Student` cs
+        INNER JOIN `tabSIS Class` c ON c.name = cs.class_id
+        INNER JOIN `tabSIS Club Offering Grade` g
+            ON g.education_grade_id = c.education_grade AND g.parent IN %(offerings)s
+        WHERE c.school_year_id = %(school_year_id)s
+          AND (c.class_type = 'regular' OR c.class_type IS NULL OR c.class_type = '')
+          AND cs.student_id NOT IN (
+              SELECT student_id FROM `tabSIS Club Registration`
+              WHERE period_id = %(period_id)s AND status = 'active'
+          )
+        LIMIT %(limit)s
+        """,
+        {
+            "offerings": tuple(offering_ids),
+            "school_year_id": period.school_year_id,
+            "period_id": period.name,
+            "limit": int(limit),
+        },
+    )
+
+
+def _init_worker(site, sites_path):
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+    frappe.set_user("Administrator")
+
+
+def _register_one(period_id, student_id, offering_ids):
+    """Một "phụ huynh": chọn ngẫu nhiên một môn trong danh sách hot rồi đăng ký."""
+    offering_id = random.choice(offering_ids)
+    t0 = time.perf_counter()
+    try:
+        period = frappe.get_doc(club_registration.DT_PERIOD, period_id)
+        result = club_registration.register_student_to_clubs(
+            period,
+            student_id,
+            [offering_id],
+            source="staff",
+            enforce_window=False,
+        )
+        if result["saved"]:
+            outcome = "saved"
+        elif result["failed"]:
+            outcome = result["failed"][0]["code"]
+        else:
+            outcome = "skipped"
+        saved = [s["registration_id"] for s in result["saved"]]
+    except club_registration.ClubRegError as e:
+        frappe.db.rollback()
+        outcome, saved = e.code, []
+    except Exception as e:
+        frappe.db.rollback()
+        outcome, saved = type(e).__name__, []
+    return (time.perf_counter() - t0) * 1000, outcome, saved
+
+
+def burst_register(period_id, offering_ids, students=2000, processes=16, cleanup=1):
+    """Đăng ký `students` học sinh song song trên `processes` tiến trình vào các môn hot."""
+    _refuse_production()
+    if isinstance(offering_ids, str):
+        offering_ids = [offering_ids]
+
+    period = frappe.get_doc(club_registration.DT_PERIOD, period_id)
+    student_ids = _eligible_students(period, offering_ids, students)
+    if not student_ids:
+        frappe.throw("Không tìm được học sinh hợp lệ cho các môn đã chọn")
+
+    # Bộ đếm Redis tươi trước khi mở "cổng"
+    club_slots.refresh(offering_ids)
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=int(processes),
+        initializer=_init_worker,
+        initargs=(frappe.local.site, frappe.local.sites_path),
+    ) as pool:
+        futures = [
+            pool.submit(_register_one, period_id, sid, list(offering_ids)) for sid in student_ids
+        ]
+        outcomes = [f.result() for f in futures]
+    seconds = time.perf_counter() - t0
+
+    active = dict(
+        frappe.db.sql(
+            """
+            SELECT offering_id, COUNT(*) FROM `tabSIS Club Registration`
+            WHERE offering_id IN %(offerings)s AND status = 'active'
+            GROUP BY offering_id
+            """,
+            {"offerings": tuple(offering_ids)},
+        )
+    )
+    capacity = dict(
+        frappe.db.sql(
+            "SELECT name, capacity FROM `tabSIS Club Offering` WHERE name IN %(offerings)s",
+            {"offerings": tuple(offering_ids)},
+        )
+    )
+    created = [name for _, _, saved in outcomes for name in saved]
+
+    report = {
+        "requests": len(outcomes),
+        "processes": int(processes),
+        "seconds": round(seconds, 2),
+        "requests_per_sec": round(len(outcomes) / seconds, 1) if seconds else None,
+        "outcomes": dict(Counter(outcome for _, outcome, _ in outcomes)),
+        **_percentiles([ms for ms, _, _ in outcomes]),
+        "offerings": {
+            oid: {"capacity": int(capacity.get(oid) or 0), "active": int(active.get(oid) or 0)}
+            for oid in offering_ids
+        },
+        "oversubscribed": [
+            oid for oid in offering_ids if int(active.get(oid) or 0) > int(capacity.get(oid) or 0)
+        ],
+    }
+
+    if int(cleanup) and created:
+        frappe.db.sql(
+            "DELETE FROM `tabSIS Club Registration` WHERE name IN %(names)s",
+            {"names": tuple(created)},
+        )
+        frappe.db.commit()
+        club_registration.recalculate_registered_counts(offering_ids=offering_ids)
+        club_slots.refresh(offering_ids)
+        report["cleaned_up"] = len(created)
+
+    print(report)
+    return report
@@ -0,0 +1,156 @@
+# Copyright (c) 2026, Wellspring International School
+"""
+Expo Push giả chạy local — đo thông lượng `_post_expo_batch` mà không gửi push thật.
+
+Chạy server (terminal riêng, không cần bench):
+
+    python -m erp.scripts.fake_expo_server --port 8765 --latency-ms 300 \
+        --rate-429 0.05 --unregistered 0.02
+
+rồi trỏ site sang nó (site_config): "EXPO_PUSH_URL": "http://127.0.0.1:8765/--/api/v2/push/send"
+và đo:
+
+    bench --site <site> execute erp.scripts.fake_expo_server.benchmark \
+        --kwargs "{'messages': 3000}"
+
+Server phục vụ:
+
+    POST /--/api/v2/push/send         ticket "ok" (id ngẫu nhiên) cho từng message; tỉ lệ
+                                      `--unregistered` trả lỗi DeviceNotRegistered; tỉ lệ
+                                      `--rate-429` trả cả request 429 + Retry-After
+    POST /--/api/v2/push/getReceipts  receipt "ok" cho mọi id
+
+`benchmark` chỉ gửi tới token giả "ExponentPushToken[bench-…]" — UPDATE deactivate không
+chạm token thật; ticket giả vẫn vào hàng chờ receipt và được poll_receipts bỏ qua an toàn.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.messages = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+def make_handler(latency_ms=300, rate_429=0.0, unregistered=0.0, stats=None):
+    stats = stats or _Stats()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive như Expo thật
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, body, extra_headers=None):
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            for k, v in (extra_headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"null")
+            with stats.lock:
+                stats.requests += 1
+                stats.in_flight += 1
+                stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+            try:
+                time.sleep(latency_ms / 1000.0)
+                if self.path.endswith("/getReceipts"):
+                    ids = (payload or {}).get("ids") or []
+                    self._reply(200, {"data": {i: {"status": "ok"} for i in ids}})
+                    return
+                if random.random() < rate_429:
+                    with stats.lock:
+                        stats.throttled += 1
+                    self._reply(429, {"errors": [{"code": "TOO_MANY_REQUESTS"}]}, {"Retry-After": "1"})
+                    return
+                messages = payload if isinstance(payload, list) else [payload]
+                tickets = []
+                for _ in messages:
+                    if random.random() < unregistered:
+                        tickets.append({
+                            "status": "error",
+                            "message": "not a registered push notification recipient",
+                            "details": {"error": "DeviceNotRegistered"},
+                        })
+                    else:
+                        tickets.append({"status": "ok", "id": str(uuid.uuid4())})
+                with stats.lock:
+                    stats.messages += len(messages)
+                self._reply(200, {"data": tickets})
+            finally:
+                with stats.lock:
+                    stats.in_flight -= 1
+
+    Handler.stats = stats
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8765, latency_ms=300, rate_429=0.0, unregistered=0.0):
+    handler = make_handler(latency_ms, rate_429, unregistered)
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Fake Expo tại http://{host}:{port}/--/api/v2/push/send (latency {latency_ms}ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        s = handler.stats
+        print(f"requests={s.requests} messages={s.messages} 429={s.throttled} max_in_flight={s.max_in_flight}")
+    finally:
+        server.server_close()
+
+
+def benchmark(messages=3000):
+    """Gửi `messages` message tới EXPO_PUSH_URL (phải là Expo giả) và in thời gian / thông lượng."""
+    import frappe
+
+    from erp.api.erp_sis import expo_push
+    from erp.api.erp_sis.mobile_push_notification import _post_expo_batch
+
+    url = expo_push.push_url()
+    if url == expo_push.DEFAULT_PUSH_URL:
+        frappe.throw("Đặt site_config EXPO_PUSH_URL trỏ tới Expo giả trước khi chạy benchmark")
+
+    batch = [
+        {"to": f"ExponentPushToken[bench-{i}]", "title": "bench", "body": "bench", "data": {}}
+        for i in range(int(messages))
+    ]
+    t0 = time.perf_counter()
+    result = _post_expo_batch(batch)
+    seconds = time.perf_counter() - t0
+    report = {
+        "url": url,
+        "messages": len(batch),
+        "seconds": round(seconds, 2),
+        "messages_per_sec": round(len(batch) / seconds, 1) if seconds else None,
+        "success_count": result["success_count"],
+        "failed_count": result["failed_count"],
+    }
+    print(report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=int, default=300)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--unregistered", type=float, default=0.0)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.latency_ms, args.rate_429, args.unregistered)
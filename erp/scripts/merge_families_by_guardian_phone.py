@@ -72,13 +72,23 @@ thứ tự này không ổn định, nên dồn quan hệ về một bản ghi c
 vào bản ghi kia và MẤT TRẮNG danh sách con. Gộp thật hai bản ghi guardian là việc riêng,
 nặng hơn (13 doctype tham chiếu + id guardian còn nằm ở notification-service ngoài Frappe).
 Các bản ghi trùng được liệt kê ở mục `duplicate_guardian_records` của báo cáo.
+
+-----------------------------------------------------------------------------------------
+KHOÁ SO TRÙNG
+-----------------------------------------------------------------------------------------
+Chuẩn hoá SĐT / tên dùng chung với `tabCRM Match Key` (erp/api/crm/match_keys.py) — cùng
+cách kiểm tra trùng lead. Khoá danh tính dùng để GỘP luôn được tính lại từ bản ghi
+guardian lúc chạy; index chỉ còn cấp SĐT bảng con cho phần báo cáo. Nghi index lệch
+(vừa import SQL thẳng) thì dựng lại trước khi chạy:
+
+    bench --site <site> execute erp.api.crm.match_keys.rebuild
 """
 
 from collections import Counter, defaultdict
 
 import frappe
 
-from erp.api.crm.utils import normalize_phone_number
+from erp.api.crm import match_keys
 from erp.utils.family_relationship import (
     _has_can_pickup,
     canonical_relationship_rows,
@@ -125,9 +135,9 @@ def _int(value):
 
 
 def _e164(phone):
-    """+84xxxxxxxxx, hoặc '' nếu không dùng được."""
-    norm = normalize_phone_number(phone or "")
-    return norm if norm and norm != "+84" else ""
+    """+84xxxxxxxxx, hoặc '' nếu không dùng được. Cùng chuẩn hoá với CRM Match Key."""
+    digits = match_keys.phone_key(phone)
+    return f"+{digits}" if digits else ""
 
 
 def _is_placeholder_phone(e164):
@@ -195,13 +205,8 @@ def _load_guardians():
 
 def _name_key(guardian_row):
     """Tên đã bỏ dấu / hạ chữ / gộp khoảng trắng — dùng để nhận ra CÙNG MỘT NGƯỜI."""
-    from erp.utils.search import strip_accents
-
-    name = (guardian_row.get("guardian_name") or "").strip()
-    if not name:
-        return ""
-    # split() gộp luôn cả \n: dữ liệu prod có bản ghi tên hai dòng dính nhau.
-    return " ".join(strip_accents(name).casefold().split())
+    # fold_name: split() gộp luôn cả \n — dữ liệu prod có bản ghi tên hai dòng dính nhau.
+    return match_keys.fold_name(guardian_row.get("guardian_name"))
 
 
 def _identity_of(guardian_row):
@@ -273,21 +278,13 @@ def _load_canonical_rows():
 
 
 def _child_phone_identities():
-    """{guardian: {e164,...}} từ bảng con — CHỈ để báo cáo, không dùng để gộp."""
-    rows = frappe.db.sql(
-        """
-        SELECT parent AS guardian, phone_number
-        FROM `tabCRM Guardian Phone`
-        WHERE parenttype = 'CRM Guardian'
-          AND IFNULL(TRIM(phone_number), '') <> ''
-        """,
-        as_dict=True,
-    )
+    """{guardian: {e164,...}} từ bảng con (khoá `alt_phone`) — CHỈ để báo cáo, không dùng để gộp."""
     out = defaultdict(set)
-    for r in rows:
-        e164 = _e164(r.get("phone_number"))
-        if e164 and not _is_placeholder_phone(e164):
-            out[r["guardian"]].add(e164)
+    for guardian, keys in match_keys.keys_by_entity(match_keys.GUARDIAN, match_keys.ALT_PHONE).items():
+        for digits in keys:
+            e164 = f"+{digits}"
+            if not _is_placeholder_phone(e164):
+                out[guardian].add(e164)
     return out
 
 
@@ -725,6 +722,9 @@ def run(
     else:
         excluded = {str(f).strip() for f in (exclude_families or []) if str(f).strip()}
 
+    if not frappe.db.table_exists(match_keys.DOCTYPE):
+        frappe.throw("Chưa có CRM Match Key — chạy bench migrate (patch add_crm_match_keys) trước.")
+
     has_pickup = _has_can_pickup()
     guardians = _load_guardians()
     rows = _load_canonical_rows()
@@ -733,12 +733,14 @@ def run(
 
     rows_by_family = defaultdict(list)
     family_campus, family_code, family_creation = {}, {}, {}
-    identity_holders = defaultdict(set)
     for r in rows:
         rows_by_family[r["family"]].append(r)
         family_campus[r["family"]] = r.get("campus_id")
         family_code[r["family"]] = r.get("family_code")
         family_creation[r["family"]] = r.get("family_creation")
+    # Ai giữ khoá danh tính nào: gom từ bản ghi guardian vừa đọc, KHÔNG đọc index
+    # `identity` — index lệch (import SQL thẳng) sẽ làm gate "SĐT dùng chung" sai.
+    identity_holders = defaultdict(set)
     for g in guardians.values():
         identity_holders[_identity_of(g)].add(g["name"])
 
@@ -0,0 +1,97 @@
+# Copyright (c) 2026, Wellspring International School
+"""
+Dựng lại / rà soát bộ đếm kỷ luật theo tháng (`SIS Discipline Monthly Counter`).
+
+    # 1. Rà soát (KHÔNG ghi gì) — so bộ đếm đang lưu với phép tính trực tiếp:
+    bench --site <site> execute erp.scripts.rebuild_discipline_counters.run
+
+    # 2. Dựng lại mọi tháng có bản ghi:
+    bench --site <site> execute erp.scripts.rebuild_discipline_counters.run \
+        --kwargs "{'dry_run': 0}"
+
+    # Chỉ một khoảng:
+    ... --kwargs "{'dry_run': 0, 'start_date': '2026-09-01', 'end_date': '2026-10-31'}"
+
+Khi nào cần: sau import/sửa dữ liệu kỷ luật bằng SQL thô (không qua doc hook), hoặc
+sau đợt chuyển lớp lớn — đóng góp qua Class Entry tính theo danh sách lớp lúc ghi.
+Job đêm chỉ dựng lại tháng hiện tại.
+"""
+
+import frappe
+
+from erp.api.erp_sis import discipline_counters as dc
+
+
+def _stored_month(first):
+    rows = frappe.db.sql(
+        f"""
+        SELECT entity_type, entity_id, violation, record_count, instance_count,
+               level1_count, deduction_points
+        FROM `{dc.TABLE}`
+        WHERE month_start = %s AND entity_type != %s
+        """,
+        (first, dc.MONTH_MARKER),
+        as_dict=True,
+    )
+    return {
+        (r.entity_type, r.entity_id, r.violation or ""): tuple(int(r[m] or 0) for m in dc._METRICS)
+        for r in rows
+    }
+
+
+def _diff_month(first, samples, limit):
+    live = {
+        key[:3]: tuple(int(v[m] or 0) for m in dc._METRICS)
+        for key, v in dc._compute_month(first).items()
+    }
+    stored = _stored_month(first)
+    zero = (0,) * len(dc._METRICS)
+    mismatched = 0
+    for key in set(live) | set(stored):
+        expected = live.get(key, zero)
+        actual = stored.get(key, zero)
+        if expected == actual:
+            continue
+        mismatched += 1
+        if len(samples) < limit:
+            samples.append({
+                "month": str(first),
+                "key": list(key),
+                "expected": dict(zip(dc._METRICS, expected)),
+                "stored": dict(zip(dc._METRICS, actual)),
+            })
+    return mismatched
+
+
+def run(dry_run=1, start_date=None, end_date=None, limit=30):
+    dry_run = int(dry_run)
+    if not dry_run:
+        summary = dc.rebuild(start_date, end_date)
+        print(f"Đã dựng lại: {summary}")
+        return summary
+
+    if not start_date or not end_date:
+        lo, hi = frappe.db.sql("SELECT MIN(date), MAX(date) FROM `tabSIS Discipline Record`")[0]
+        start_date, end_date = start_date or lo, end_date or hi
+    if not start_date or not end_date:
+        print("Không có bản ghi kỷ luật.")
+        return {"months": 0, "mismatched": 0}
+
+    months = dc._months_between(frappe.utils.getdate(start_date), frappe.utils.getdate(end_date))
+    built = dc._built_months(months)
+    samples = []
+    mismatched = 0
+    for first in months:
+        mismatched += _diff_month(first, samples, int(limit))
+
+    print(f"Tháng: {len(months)} | đã dựng: {len(built)} | khoá lệch: {mismatched}")
+    for s in samples:
+        print(f"  {s['month']} {s['key']}: lưu={s['stored']} đúng={s['expected']}")
+    if mismatched or len(built) < len(months):
+        print("-> chạy lại với dry_run=0 để dựng lại.")
+    return {
+        "months": len(months),
+        "built": len(built),
+        "mismatched": mismatched,
+        "samples": samples,
+    }
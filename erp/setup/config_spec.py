@@ -83,6 +83,9 @@ SITE_CONFIG_SPEC: list[ConfKey] = [
 	        note="Handshake service ↔ erp. Đang là chuỗi yếu — xoay ở GĐ0"),
 	ConfKey("jwt_secret", secret=True, required=True, tenant_scope=PER_TENANT,
 	        note="Ký JWT cho app mobile + parent portal. Tenant mới PHẢI sinh chuỗi riêng"),
+	ConfKey("jwt_auth_verify_signature",
+	        note="Mặc định 1: middleware JWT toàn cục kiểm chữ ký HS256 (một lần/token nhờ cache). "
+	             "Đặt 0 chỉ khi khẩn cấp có nguồn token ký bằng khoá khác"),
 
 	ConfKey("email_service_url", tenant_scope=WELLSPRING_ONLY),
 	ConfKey("email_service_token", secret=True, tenant_scope=WELLSPRING_ONLY),
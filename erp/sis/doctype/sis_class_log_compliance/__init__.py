@@ -0,0 +1 @@
+# Package init for SIS Class Log Compliance
@@ -0,0 +1,10 @@
+import frappe
+from frappe.model.document import Document
+
+
+class SISClassLogCompliance(Document):
+    """
+    Bảng tổng hợp sổ đầu bài theo (ngày, lớp, tiết, giáo viên).
+    Chỉ ghi bởi erp.api.erp_sis.class_log_compliance — không sửa tay.
+    """
+    pass
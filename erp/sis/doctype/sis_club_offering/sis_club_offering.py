@@ -5,6 +5,7 @@ import frappe
 from frappe.model.document import Document
 from frappe.utils import now_datetime
 
+from erp.sis.utils import club_slots
 from erp.sis.utils.club_days import DAY_LABELS_VN, format_days_vn
 
 
@@ -37,6 +38,11 @@ class SISClubOffering(Document):
         self.validate_day_allowed()
         self.validate_unique_subject_day()
 
+    def on_update(self):
+        # Đổi sức chứa / trạng thái thì bộ đếm giữ chỗ Redis phải tính lại
+        if self.has_value_changed("capacity") or self.has_value_changed("status"):
+            club_slots.refresh_after_commit([self.name])
+
     def validate_day_allowed(self):
         """
         Thứ của buổi phải nằm trong «ngày sinh hoạt» của đợt.
@@ -0,0 +1,10 @@
+import frappe
+from frappe.model.document import Document
+
+
+class SISDisciplineMonthlyCounter(Document):
+    """
+    Bộ đếm vi phạm theo (học sinh | lớp, vi phạm, tháng).
+    Chỉ ghi bởi erp.api.erp_sis.discipline_counters — không sửa tay.
+    """
+    pass
@@ -41,6 +41,7 @@ class SISFinanceStudent(Document):
         """, (self.name,), as_dict=True)
         
         old_payment_status = self.payment_status
+        before_state = (self.payment_status, self.total_amount, self.paid_amount, self.outstanding_amount)
         
         if summary:
             self.total_amount = summary[0].get('total_amount', 0)
@@ -57,6 +58,10 @@ class SISFinanceStudent(Document):
         
         self.db_update()
         
+        # db_update không chạy on_update -> tự cộng delta vào bộ đếm năm
+        from erp.api.erp_sis.finance.ledger import record_student_totals
+        record_student_totals(self, before_state)
+        
         # Nếu payment_status thay đổi, sync lên Re-enrollment (nếu có)
         if old_payment_status != self.payment_status:
             self.sync_payment_to_reenrollment()
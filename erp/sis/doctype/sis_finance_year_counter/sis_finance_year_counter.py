@@ -0,0 +1,13 @@
+# Copyright (c) 2026, Wellspring and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class SISFinanceYearCounter(Document):
+    """
+    Bộ đếm (năm tài chính, phạm vi, trạng thái) cho dashboard tài chính.
+    Chỉ ghi bởi erp.api.erp_sis.finance.ledger — không sửa tay.
+    """
+    pass
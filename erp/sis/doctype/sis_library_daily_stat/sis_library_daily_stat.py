@@ -0,0 +1,13 @@
+# Copyright (c) 2026, Wellspring and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class SISLibraryDailyStat(Document):
+    """
+    Một dòng / ngày cho dashboard thư viện (phiếu mượn, mất/hỏng, tiền phạt).
+    Chỉ ghi bởi erp.api.erp_sis.library.rollup — không sửa tay.
+    """
+    pass
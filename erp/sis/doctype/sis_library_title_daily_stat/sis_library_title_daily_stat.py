@@ -0,0 +1,13 @@
+# Copyright (c) 2026, Wellspring and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class SISLibraryTitleDailyStat(Document):
+    """
+    Lượt mượn theo (ngày mượn, tên sách chuẩn hoá) cho top sách thư viện.
+    Chỉ ghi bởi erp.api.erp_sis.library.rollup — không sửa tay.
+    """
+    pass
@@ -10,8 +10,9 @@ Ba mốc, cùng một lõi gửi, khác nhau ở cửa sổ thời gian và cờ
   closing — ~1 tiếng TRƯỚC giờ đóng đăng ký
   closed  — ngay SAU khi đóng đăng ký
 
-Chạy theo cron mỗi 5 phút. Mỗi đợt × mỗi mốc chỉ gửi một lần nhờ cờ riêng trên
-chính đợt đó.
+Mỗi đợt × mỗi mốc có một hạn trong erp/common/deadlines.py (doc hook đặt lúc lưu
+đợt); dispatcher gọi `fire_period_reminder` đúng đầu cửa sổ thay vì cron quét mỗi
+5 phút. Mỗi đợt × mỗi mốc chỉ gửi một lần nhờ cờ riêng trên chính đợt đó.
 
 Người nhận = phụ huynh của học sinh THỰC SỰ đăng ký được: khối của em phải nằm
 trong ít nhất một buổi đang mở của đợt. Gửi cho toàn trường thì phần lớn phụ
@@ -25,6 +26,7 @@ from erp.api.parent_portal.club_beta_access import (
     allowed_parent_emails,
     filter_students_for_beta,
 )
+from erp.common import deadlines
 
 DT_PERIOD = "SIS Club Registration Period"
 DT_OFFERING = "SIS Club Offering"
@@ -32,6 +34,10 @@ DT_OFFERING = "SIS Club Offering"
 #: Nhắc trước bao nhiêu phút (giữ tên cũ cho tương thích lời gọi sẵn có).
 DEFAULT_MINUTES_BEFORE = 15
 
+#: Chưa đốt được cờ (chưa tới khoảng hiển thị, cổng chạy thử…) thì thử lại sau
+#: ngần này phút — đúng nhịp của cron quét cũ.
+RETRY_MINUTES = 5
+
 #: Cấu hình từng mốc.
 #:   field   — cột mốc thời gian trên đợt
 #:   flag    — cờ chống gửi trùng
@@ -66,8 +72,8 @@ def _eligible_student_ids(period):
     """
     Học sinh đăng ký được: đang học ở một lớp thuộc khối mà đợt có mở buổi.
 
-    Đi thẳng từ khối -> lớp -> học sinh bằng một query thay vì gọi
-    `_get_students_by_grade` cho từng khối: một đợt có thể phủ cả chục khối.
+    Đi thẳng từ khối -> lớp -> học sinh bằng một query thay vì giải từng khối
+    qua notification_handler: một đợt có thể phủ cả chục khối.
 
     BẮT BUỘC lọc theo năm học của đợt: khối "Khối 1" tồn tại ở mọi năm, không lọc
     thì lớp của các năm cũ cũng khớp và ta nhắc cả học sinh đã lên lớp hoặc đã ra
@@ -195,7 +201,7 @@ def _reminder_text(period, kind, now):
     )
 
 
-def _scan(kind, now=None):
+def _scan(kind, now=None, period_name=None):
     """Quét các đợt tới hạn của MỘT mốc và gửi."""
     cfg = KINDS[kind]
     now = now or now_datetime()
@@ -207,16 +213,14 @@ def _scan(kind, now=None):
         # Mốc sắp tới: [now, now + window]
         lo, hi = now, add_to_date(now, minutes=cfg["window"])
 
-    return frappe.get_all(
-        DT_PERIOD,
-        filters={
-            "status": "Open",
-            cfg["flag"]: 0,
-            cfg["field"]: ["between", [lo, hi]],
-        },
-        fields=["name"],
-        ignore_permissions=True,
-    )
+    filters = {
+        "status": "Open",
+        cfg["flag"]: 0,
+        cfg["field"]: ["between", [lo, hi]],
+    }
+    if period_name:
+        filters["name"] = period_name
+    return frappe.get_all(DT_PERIOD, filters=filters, fields=["name"], ignore_permissions=True)
 
 
 def _run(kind, now=None):
@@ -231,18 +235,70 @@ def _run(kind, now=None):
         frappe.log_error(frappe.get_traceback(), f"club_reminders.{kind}")
 
 
+def reminder_due(period, kind):
+    """Đầu cửa sổ của một mốc: mốc sắp tới thì lùi `window` phút, mốc đã qua thì đúng mốc."""
+    cfg = KINDS[kind]
+    at = period.get(cfg["field"])
+    if not at:
+        return None
+    return get_datetime(at) if cfg["after"] else add_to_date(get_datetime(at), minutes=-cfg["window"])
+
+
+def schedule_period_reminders(doc, method=None):
+    """Doc hook SIS Club Registration Period (on_update / on_trash): đặt / huỷ hạn ba mốc."""
+    for kind, cfg in KINDS.items():
+        due = None
+        if method != "on_trash" and doc.get("status") == "Open" and not cint(doc.get(cfg["flag"])):
+            due = reminder_due(doc, kind)
+        deadlines.schedule(deadlines.CLUB_PERIOD, f"{kind}:{doc.name}", due)
+
+
+def fire_period_reminder(ref):
+    """Handler deadlines: ref = "<mốc>:<đợt>". Còn trong cửa sổ thì gửi; chưa đốt cờ thì hẹn thử lại."""
+    kind, _, period_name = ref.partition(":")
+    if kind not in KINDS:
+        return None
+    now = now_datetime()
+    if not _scan(kind, now, period_name):
+        return None
+    _send_for_period(period_name, kind, now)
+    if cint(frappe.db.get_value(DT_PERIOD, period_name, KINDS[kind]["flag"])):
+        return None
+    # Rớt khỏi cửa sổ thì lần sau _scan trả rỗng và hạn tự hết
+    return add_to_date(now, minutes=RETRY_MINUTES)
+
+
+def pending_period_reminders():
+    """Nguồn cho deadlines.rebuild: các mốc chưa gửi của đợt đang mở, cửa sổ chưa đóng."""
+    now = now_datetime()
+    periods = frappe.get_all(
+        DT_PERIOD,
+        filters={"status": "Open"},
+        fields=["name"] + sorted({c["field"] for c in KINDS.values()} | {c["flag"] for c in KINDS.values()}),
+        ignore_permissions=True,
+    )
+    for period in periods:
+        for kind, cfg in KINDS.items():
+            due = reminder_due(period, kind)
+            if cint(period.get(cfg["flag"])) or not due:
+                continue
+            if add_to_date(due, minutes=cfg["window"]) < now:
+                continue
+            yield f"{kind}:{period.name}", due
+
+
 def send_club_open_reminders(minutes_before=DEFAULT_MINUTES_BEFORE):
-    """Scheduler: nhắc ~15 phút TRƯỚC giờ mở đăng ký."""
+    """Quét tay: nhắc ~15 phút TRƯỚC giờ mở đăng ký (lịch thường do fire_period_reminder)."""
     _run("open")
 
 
 def send_club_close_reminders():
-    """Scheduler: nhắc ~1 tiếng TRƯỚC giờ đóng đăng ký."""
+    """Quét tay: nhắc ~1 tiếng TRƯỚC giờ đóng đăng ký (lịch thường do fire_period_reminder)."""
     _run("closing")
 
 
 def send_club_closed_notices():
-    """Scheduler: báo đã đóng cổng, ngay SAU giờ đóng đăng ký."""
+    """Quét tay: báo đã đóng cổng, ngay SAU giờ đóng đăng ký (lịch thường do fire_period_reminder)."""
     _run("closed")
 
 
@@ -34,6 +34,13 @@ của request (thường sớm hơn nhiều so với lúc ta lấy khoá). Đế
 CŨ và cho vượt slot, dù đã khoá dòng offering thành công. Vì đã giữ khoá trên
 chính offering đó nên gap lock của câu COUNT chỉ đụng phạm vi của offering này —
 vốn đã bị serialize sẵn, không làm tăng nguy cơ deadlock.
+
+CỬA NHANH TRƯỚC KHOÁ
+--------------------
+`register_student_to_clubs` giữ chỗ trên Redis (erp/sis/utils/club_slots.py)
+TRƯỚC khi lấy khoá: môn đã hết chỗ bị từ chối ngay thay vì xếp hàng khoá lúc mở
+cổng. Kiểm slot ở trên vẫn là nguồn sự thật; mọi đường đổi số đăng ký mà không
+qua cửa nhanh (huỷ, chuyển, sửa lô) phải gọi `club_slots.refresh_after_commit`.
 """
 
 import time
@@ -41,7 +48,7 @@ import time
 import frappe
 from frappe.utils import now_datetime
 
-from erp.sis.utils import club_days
+from erp.sis.utils import club_days, club_slots
 
 DT_PERIOD = "SIS Club Registration Period"
 DT_OFFERING = "SIS Club Offering"
@@ -571,52 +578,74 @@ def register_student_to_clubs(
     if not pending_ids:
         return {"saved": [], "skipped": skipped, "failed": failed}
 
-    _set_short_lock_timeout()
+    # Cửa nhanh: môn đã hết chỗ bị từ chối trên Redis, không xếp hàng khoá DB.
+    # Chỉ môn giữ được chỗ (hoặc không gác được) mới vào lock — xem club_slots.py.
+    reservation = club_slots.reserve(pending_ids, student_id)
+    full = [
+        ClubRegError("CLUB_FULL", f"Môn {offerings[oid].title_vn} đã đủ số lượng", oid)
+        for oid in reservation.full
+    ]
+    if full and atomic:
+        reservation.settle()
+        raise full[0]
+    failed = failed + [e.as_dict() for e in full]
+    pending_ids = [oid for oid in pending_ids if oid in set(reservation.admitted)]
+    if not pending_ids:
+        reservation.settle()
+        return {"saved": [], "skipped": skipped, "failed": failed}
 
-    for attempt in range(MAX_LOCK_ATTEMPTS):
-        outer_sp = f"club_reg_outer_{attempt}"
-        frappe.db.savepoint(outer_sp)
-        try:
-            locked = _lock_offerings(pending_ids)
-            saved, lock_failed = _insert_locked(
-                locked,
-                period=period,
-                student_id=student_id,
-                student_ctx=student_ctx,
-                source=source,
-                actor_user=actor_user,
-                guardian=guardian,
-                atomic=atomic,
-            )
+    saved_ids = []
+    try:
+        _set_short_lock_timeout()
+
+        for attempt in range(MAX_LOCK_ATTEMPTS):
+            outer_sp = f"club_reg_outer_{attempt}"
+            frappe.db.savepoint(outer_sp)
+            try:
+                locked = _lock_offerings(pending_ids)
+                saved, lock_failed = _insert_locked(
+                    locked,
+                    period=period,
+                    student_id=student_id,
+                    student_ctx=student_ctx,
+                    source=source,
+                    actor_user=actor_user,
+                    guardian=guardian,
+                    atomic=atomic,
+                )
 
-            frappe.db.commit()
-            return {"saved": saved, "skipped": skipped, "failed": failed + lock_failed}
+                frappe.db.commit()
+                saved_ids = [s["offering_id"] for s in saved]
+                return {"saved": saved, "skipped": skipped, "failed": failed + lock_failed}
 
-        except ClubRegError:
-            _rollback_to(outer_sp)
-            raise
-        except Exception as e:
-            if _is_deadlock(e):
-                # Deadlock (1213) khiến MySQL rollback TOÀN BỘ transaction — savepoint
-                # không còn tồn tại nữa, `rollback to savepoint` sẽ lỗi tiếp. Phải
-                # rollback full. (Lock wait timeout 1205 thì chỉ rollback một câu lệnh,
-                # nhưng rollback full ở đây vẫn an toàn vì ta sắp thử lại từ đầu.)
-                frappe.db.rollback()
-                if attempt < MAX_LOCK_ATTEMPTS - 1:
-                    time.sleep(0.05 * (attempt + 1))
-                    continue
-                raise ClubRegError(
-                    "SYSTEM_BUSY",
-                    "Hệ thống đang bận do có nhiều người đăng ký cùng lúc. "
-                    "Vui lòng thử lại sau giây lát.",
-                )
-            _rollback_to(outer_sp)
-            raise
+            except ClubRegError:
+                _rollback_to(outer_sp)
+                raise
+            except Exception as e:
+                if _is_deadlock(e):
+                    # Deadlock (1213) khiến MySQL rollback TOÀN BỘ transaction — savepoint
+                    # không còn tồn tại nữa, `rollback to savepoint` sẽ lỗi tiếp. Phải
+                    # rollback full. (Lock wait timeout 1205 thì chỉ rollback một câu lệnh,
+                    # nhưng rollback full ở đây vẫn an toàn vì ta sắp thử lại từ đầu.)
+                    frappe.db.rollback()
+                    if attempt < MAX_LOCK_ATTEMPTS - 1:
+                        time.sleep(0.05 * (attempt + 1))
+                        continue
+                    raise ClubRegError(
+                        "SYSTEM_BUSY",
+                        "Hệ thống đang bận do có nhiều người đăng ký cùng lúc. "
+                        "Vui lòng thử lại sau giây lát.",
+                    )
+                _rollback_to(outer_sp)
+                raise
 
-    raise ClubRegError(
-        "SYSTEM_BUSY",
-        "Hệ thống đang bận do có nhiều người đăng ký cùng lúc. Vui lòng thử lại sau giây lát.",
-    )
+        raise ClubRegError(
+            "SYSTEM_BUSY",
+            "Hệ thống đang bận do có nhiều người đăng ký cùng lúc. Vui lòng thử lại sau giây lát.",
+        )
+    finally:
+        # Môn đã commit giữ chỗ thành đăng ký; môn hỏng / rollback trả lại chỗ.
+        reservation.settle(saved_ids)
 
 
 def update_student_registrations(
@@ -727,6 +756,8 @@ def update_student_registrations(
                 atomic=True,
             )
 
+            # Huỷ trả chỗ, thêm môn không qua cửa nhanh — đếm lại bộ đếm Redis sau commit
+            club_slots.refresh_after_commit([off.name for off in locked])
             frappe.db.commit()
             return {
                 "cancelled": cancelled,
@@ -789,6 +820,7 @@ def cancel_registration(registration_id, reason=None, actor_user=None):
         doc.save()
 
         _sync_count_locked(reg.offering_id)
+        club_slots.refresh_after_commit([reg.offering_id])
         frappe.db.commit()
     except Exception:
         frappe.db.rollback()
@@ -887,6 +919,7 @@ def move_registration(registration_id, target_offering_id, reason=None, actor_us
 
         _sync_count_locked(source_offering_id)
         _sync_count_locked(target_offering_id)
+        club_slots.refresh_after_commit([source_offering_id, target_offering_id])
         frappe.db.commit()
 
     except ClubRegError:
@@ -0,0 +1,346 @@
+# Copyright (c) 2026, Wellspring and contributors
+# For license information, please see license.txt
+"""
+CỬA NHANH GIỮ CHỖ CÂU LẠC BỘ TRÊN REDIS — chặn môn đã đầy TRƯỚC khi lấy khoá DB.
+
+VÌ SAO CẦN
+----------
+Lúc mở cổng, ~2.000 phụ huynh bấm cùng lúc vào vài môn hot. Mỗi request đều xếp
+hàng ở `_lock_offerings` (`SELECT ... FOR UPDATE`) dù môn đã đầy từ lâu: hàng
+khoá dài ra, request chờ tới `LOCK_WAIT_TIMEOUT_SECONDS`, retry
+`MAX_LOCK_ATTEMPTS` lần, và giữ chết gunicorn worker suốt thời gian đó.
+
+Ở đây mỗi offering có một bộ đếm "còn trống" trên Redis. Một Lua script trừ
+nguyên tử: môn hết chỗ bị từ chối ngay, không chạm DB; chỉ request GIỮ ĐƯỢC chỗ
+mới đi tiếp vào đường ghi có khoá trong `club_registration.py`. Số request vào
+hàng khoá của một môn vì thế không vượt quá số chỗ còn lại.
+
+    ⚠️ Redis chỉ là CỬA VÀO, không phải nguồn sự thật. Kiểm slot thật vẫn là
+    `COUNT(*) ... FOR UPDATE` trong lock — bộ đếm Redis lệch (cao hơn) chỉ làm
+    cửa rộng hơn một chút, không bao giờ làm vượt slot. Redis lỗi / chưa chạy
+    thì mọi môn coi như "không gác" và đi đường DB như trước.
+
+BỐ CỤC KEY (đã qua `cache.make_key`, nên tách theo site)
+----------------------------------------------------------
+    club_slots:remaining:<offering>   số chỗ còn trống cho người MỚI
+    club_slots:holders:<offering>     hash {student_id: thời điểm giữ (epoch giây)}
+
+    remaining = capacity - đăng ký active trong DB - số giữ chỗ còn sống
+                (không tính holder đã có đăng ký active: chỗ đó DB đã trừ)
+
+Vòng đời một giữ chỗ
+--------------------
+    reserve  — trừ remaining, ghi holder. Cùng học sinh giữ lại (bấm hai lần)
+               không trừ thêm.
+    settle   — sau khi ghi DB: môn ghi được chỉ xoá holder (chỗ đã thành đăng
+               ký); môn hỏng / rollback thì xoá holder VÀ trả lại remaining.
+    refresh  — tính lại remaining từ DB + holder còn sống, bỏ holder quá
+               `HOLD_TTL_SECONDS` (worker chết giữa chừng). Holder đã commit đăng
+               ký nhưng chưa settle không bị trừ hai lần. Cron chạy mỗi phút
+               cho các đợt đang Open; luồng huỷ / chuyển / đổi sức chứa gọi ngay
+               sau commit.
+"""
+
+import time
+
+import frappe
+
+DT_PERIOD = "SIS Club Registration Period"
+DT_OFFERING = "SIS Club Offering"
+DT_REGISTRATION = "SIS Club Registration"
+
+KEY_REMAINING = "club_slots:remaining"
+KEY_HOLDERS = "club_slots:holders"
+
+# Giữ chỗ quá hạn này coi như request đã chết (3 lần chờ khoá 10 giây còn dư)
+HOLD_TTL_SECONDS = 120
+# Key tự hết hạn nếu đợt không còn Open (cron không làm mới nữa)
+KEY_TTL_SECONDS = 86400
+
+# Kết quả reserve từng offering
+GRANTED = 1
+FULL = 0
+UNSEEDED = -1
+
+# KEYS: cặp (remaining, holders) cho từng offering. ARGV: holder, now.
+_RESERVE_LUA = """
+local out = {}
+for i = 1, #KEYS, 2 do
+    local remaining = redis.call('GET', KEYS[i])
+    if not remaining then
+        out[#out + 1] = -1
+    elseif redis.call('HEXISTS', KEYS[i + 1], ARGV[1]) == 1 then
+        redis.call('HSET', KEYS[i + 1], ARGV[1], ARGV[2])
+        out[#out + 1] = 1
+    elseif tonumber(remaining) <= 0 then
+        out[#out + 1] = 0
+    else
+        redis.call('DECR', KEYS[i])
+        redis.call('HSET', KEYS[i + 1], ARGV[1], ARGV[2])
+        out[#out + 1] = 1
+    end
+end
+return out
+"""
+
+# KEYS: cặp (remaining, holders). ARGV[1] = holder, ARGV[1 + k] = '1' trả chỗ / '0' chỉ bỏ holder.
+# Holder đã bị refresh dọn thì không trả thêm — tránh cộng hai lần.
+_SETTLE_LUA = """
+local k = 1
+for i = 1, #KEYS, 2 do
+    k = k + 1
+    if redis.call('HDEL', KEYS[i + 1], ARGV[1]) == 1 and ARGV[k] == '1' then
+        if redis.call('EXISTS', KEYS[i]) == 1 then
+            redis.call('INCR', KEYS[i])
+        end
+    end
+end
+return 1
+"""
+
+# KEYS[1] remaining, KEYS[2] holders. ARGV: free theo DB, now, hold ttl, key ttl, only_missing,
+# rồi các holder ĐÃ có đăng ký active ở môn này (DB đã trừ chỗ — không trừ lần nữa).
+_REFRESH_LUA = """
+if ARGV[5] == '1' and redis.call('EXISTS', KEYS[1]) == 1 then
+    return tonumber(redis.call('GET', KEYS[1]))
+end
+local registered = {}
+for i = 6, #ARGV do
+    registered[ARGV[i]] = true
+end
+local live = 0
+local entries = redis.call('HGETALL', KEYS[2])
+for i = 1, #entries, 2 do
+    if tonumber(ARGV[2]) - tonumber(entries[i + 1]) > tonumber(ARGV[3]) then
+        redis.call('HDEL', KEYS[2], entries[i])
+    elseif not registered[entries[i]] then
+        live = live + 1
+    end
+end
+local remaining = tonumber(ARGV[1]) - live
+if remaining < 0 then
+    remaining = 0
+end
+redis.call('SET', KEYS[1], remaining, 'EX', ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return remaining
+"""
+
+
+def _logger():
+    return frappe.logger("club_slots")
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _keys(cache, offering_id):
+    return (
+        cache.make_key(f"{KEY_REMAINING}:{offering_id}"),
+        cache.make_key(f"{KEY_HOLDERS}:{offering_id}"),
+    )
+
+
+def _pair_keys(cache, offering_ids):
+    keys = []
+    for oid in offering_ids:
+        keys.extend(_keys(cache, oid))
+    return keys
+
+
+def split_results(offering_ids, results):
+    """Chia kết quả script thành (granted, full, ungated) theo thứ tự offering_ids."""
+    granted, full, ungated = [], [], []
+    for oid, res in zip(offering_ids, results, strict=True):
+        res = int(res)
+        if res == GRANTED:
+            granted.append(oid)
+        elif res == FULL:
+            full.append(oid)
+        else:
+            ungated.append(oid)
+    return granted, full, ungated
+
+
+def settle_flags(granted, saved_ids):
+    """'0' cho môn đã ghi DB (chỗ đã thành đăng ký), '1' cho môn phải trả chỗ."""
+    saved = set(saved_ids or [])
+    return ["0" if oid in saved else "1" for oid in granted]
+
+
+class Reservation:
+    """
+    Kết quả giữ chỗ của một request.
+
+    `admitted` = môn được đi tiếp vào đường ghi có khoá (giữ được chỗ + không
+    gác được vì Redis lỗi / chưa seed). `full` = môn bị cửa nhanh từ chối.
+    Người gọi PHẢI gọi `settle` đúng một lần, kể cả khi lỗi.
+    """
+
+    def __init__(self, holder, granted=(), full=(), ungated=()):
+        self.holder = holder
+        self.granted = list(granted)
+        self.full = list(full)
+        self.ungated = list(ungated)
+        self._settled = False
+
+    @property
+    def admitted(self):
+        return self.granted + self.ungated
+
+    def settle(self, saved_ids=()):
+        if self._settled or not self.granted:
+            self._settled = True
+            return
+        self._settled = True
+        try:
+            cache = frappe.cache()
+            script = cache.register_script(_SETTLE_LUA)
+            script(
+                keys=_pair_keys(cache, self.granted),
+                args=[self.holder, *settle_flags(self.granted, saved_ids)],
+            )
+        except Exception as e:
+            # Không trả được chỗ thì refresh (cron mỗi phút) sẽ dọn holder quá hạn
+            _logger().warning(f"club slots settle failed holder={self.holder}: {e}")
+
+
+def reserve(offering_ids, holder):
+    """
+    Giữ chỗ cho `holder` (student_id) ở từng offering — một lần EVALSHA cho cả giỏ.
+
+    Offering chưa có bộ đếm thì seed từ DB (chỉ khi key còn thiếu) rồi thử lại
+    đúng các môn đó. Redis lỗi thì trả Reservation "không gác" toàn bộ.
+    """
+    ids = list(dict.fromkeys(o for o in offering_ids if o))
+    if not ids:
+        return Reservation(holder)
+
+    try:
+        cache = frappe.cache()
+        script = cache.register_script(_RESERVE_LUA)
+        now = int(time.time())
+        results = dict(zip(ids, script(keys=_pair_keys(cache, ids), args=[holder, now]), strict=True))
+
+        unseeded = [oid for oid in ids if int(results[oid]) == UNSEEDED]
+        if unseeded:
+            refresh(unseeded, only_missing=True)
+            retry = script(keys=_pair_keys(cache, unseeded), args=[holder, now])
+            results.update(zip(unseeded, retry, strict=True))
+    except Exception as e:
+        _logger().warning(f"club slots reserve failed holder={holder}: {e}")
+        return Reservation(holder, ungated=ids)
+
+    granted, full, ungated = split_results(ids, [results[oid] for oid in ids])
+    return Reservation(holder, granted=granted, full=full, ungated=ungated)
+
+
+def _free_rows(offering_ids=None):
+    """(offering, capacity - đăng ký active) theo DB — một câu GROUP BY."""
+    if offering_ids is not None:
+        if not offering_ids:
+            return []
+        where = "o.name IN %(offering_ids)s"
+        values = {"offering_ids": tuple(offering_ids)}
+    else:
+        where = "p.status = 'Open' AND o.status = 'active'"
+        values = {}
+
+    return frappe.db.sql(
+        f"""
+        SELECT o.name, GREATEST(IFNULL(o.capacity, 0) - COUNT(r.name), 0) AS free
+        FROM `tab{DT_OFFERING}` o
+        INNER JOIN `tab{DT_PERIOD}` p ON p.name = o.period_id
+        LEFT JOIN `tab{DT_REGISTRATION}` r
+            ON r.offering_id = o.name AND r.status = 'active'
+        WHERE {where}
+        GROUP BY o.name, o.capacity
+        """,
+        values,
+        as_dict=True,
+    )
+
+
+def _registered_holders(holders):
+    """
+    {offering: {student}} — holder ĐÃ có đăng ký active ở đúng môn đó (commit xong,
+    chưa settle). Chỉ tra các học sinh đang giữ chỗ nên câu truy vấn nhỏ.
+    """
+    students = {h for hs in holders.values() for h in hs}
+    if not students:
+        return {}
+    out = {}
+    for offering_id, student_id in frappe.db.sql(
+        f"""
+        SELECT offering_id, student_id FROM `tab{DT_REGISTRATION}`
+        WHERE status = 'active' AND offering_id IN %(offering_ids)s AND student_id IN %(students)s
+        """,
+        {"offering_ids": tuple(holders), "students": tuple(students)},
+    ):
+        if student_id in holders.get(offering_id, ()):
+            out.setdefault(offering_id, set()).add(student_id)
+    return out
+
+
+def refresh(offering_ids=None, only_missing=False):
+    """
+    Tính lại bộ đếm từ DB (mặc định: mọi môn active của các đợt đang Open).
+
+    Gọi SAU commit — đọc DB trước khi commit thì đếm thiếu chính thay đổi vừa ghi.
+    Không bao giờ ném lỗi: refresh hỏng chỉ làm cửa nhanh kém chính xác tới lần sau.
+
+    Thứ tự đọc giữ sai số về phía CAO: số trống theo DB đọc trước, holder và đăng
+    ký của holder đọc sau — đăng ký commit xen giữa chỉ bị tính là còn trống.
+    """
+    try:
+        rows = _free_rows(offering_ids)
+        if not rows:
+            return 0
+        cache = frappe.cache()
+        pipe = cache.pipeline(transaction=False)
+        for row in rows:
+            pipe.hkeys(_keys(cache, row.name)[1])
+        holders = {
+            row.name: {_decode(h) for h in keys}
+            for row, keys in zip(rows, pipe.execute(), strict=True)
+            if keys
+        }
+        registered = _registered_holders(holders)
+
+        script = cache.register_script(_REFRESH_LUA)
+        now = int(time.time())
+        pipe = cache.pipeline(transaction=False)
+        for row in rows:
+            script(
+                keys=list(_keys(cache, row.name)),
+                args=[
+                    int(row.free),
+                    now,
+                    HOLD_TTL_SECONDS,
+                    KEY_TTL_SECONDS,
+                    "1" if only_missing else "0",
+                    *sorted(registered.get(row.name, ())),
+                ],
+                client=pipe,
+            )
+        pipe.execute()
+        return len(rows)
+    except Exception as e:
+        _logger().warning(f"club slots refresh failed offerings={offering_ids}: {e}")
+        return 0
+
+
+def refresh_after_commit(offering_ids):
+    """Xếp `refresh` chạy sau commit của giao dịch hiện tại."""
+    ids = [o for o in dict.fromkeys(offering_ids or []) if o]
+    if ids:
+        frappe.db.after_commit.add(lambda: refresh(ids))
+
+
+def reconcile():
+    """Cron mỗi phút: đối chiếu bộ đếm của các đợt đang Open với DB, dọn giữ chỗ mồ côi."""
+    count = refresh()
+    if count:
+        _logger().info(f"club slots reconciled {count} offerings")
+    return count
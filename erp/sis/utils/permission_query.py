@@ -224,6 +224,11 @@ def sis_class_log_student_query(user):
     return get_campus_permission_query("SIS Class Log Student", user)
 
 
+def sis_class_log_compliance_query(user):
+    """Permission query for SIS Class Log Compliance"""
+    return get_campus_permission_query("SIS Class Log Compliance", user)
+
+
 def sis_homeroom_score_record_query(user):
     """Permission query for SIS Homeroom Score Record"""
     return get_campus_permission_query("SIS Homeroom Score Record", user)
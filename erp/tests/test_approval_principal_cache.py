@@ -0,0 +1,42 @@
+"""Tập principal người duyệt: dựng từ dòng bảng con và tem phiên bản của cache.
+
+Chỉ kiểm phần thuần — không cần site hay Redis.
+"""
+
+import unittest
+
+from erp.api.erp_sis.approval import principal_cache as pc
+
+
+def _rows():
+	return [
+		{"kind": "leads", "parent": "ORG-1", "position": "Trưởng phòng"},
+		{"kind": "members", "parent": "ORG-2", "position": None},
+		{"kind": "members", "parent": "ORG-3", "position": "Kế toán"},
+		{"kind": "associates", "parent": "ORG-4", "position": None},
+		{"kind": "members", "parent": None, "position": "Bỏ"},
+	]
+
+
+class TestFromRows(unittest.TestCase):
+	def test_chia_theo_loai_va_cap_chuc_danh(self):
+		pset = pc.from_rows(_rows())
+		self.assertEqual(pset.leads, {"ORG-1"})
+		self.assertEqual(pset.members, {"ORG-2", "ORG-3"})
+		self.assertEqual(pset.associates, {"ORG-4"})
+		self.assertEqual(pset.positions, {("ORG-1", "Trưởng phòng"), ("ORG-3", "Kế toán")})
+
+
+class TestVersionStamp(unittest.TestCase):
+	def test_cung_tem_thi_doc_lai_du(self):
+		pset = pc.from_rows(_rows())
+		self.assertEqual(pc._parse(pc._dump(pset, 7), 7), pset)
+
+	def test_tem_cu_bi_bo(self):
+		raw = pc._dump(pc.from_rows(_rows()), 7)
+		self.assertIsNone(pc._parse(raw, 8))
+		self.assertIsNone(pc._parse(None, 8))
+
+
+if __name__ == "__main__":
+	unittest.main()
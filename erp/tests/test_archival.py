@@ -0,0 +1,73 @@
+"""Dọn theo lô: khai báo policy, tên bảng lưu trữ theo tháng, chia lô theo tháng.
+
+Chỉ kiểm phần thuần — không cần site.
+"""
+
+import unittest
+from datetime import date, datetime
+from unittest import mock
+
+from erp.common import archival
+
+
+class TestPolicy(unittest.TestCase):
+	def test_mac_dinh_va_ghi_de(self):
+		pol = archival.policy("Version", 90)
+		self.assertEqual((pol.date_column, pol.archive), ("creation", False))
+		self.assertEqual(pol.batch_size, archival.DEFAULT_BATCH_SIZE)
+		pol = archival.policy("Deleted Document", 90, archive=True, batch_size=500)
+		self.assertTrue(pol.archive)
+		self.assertEqual(pol.batch_size, 500)
+
+
+class TestArchiveTables(unittest.TestCase):
+	def test_ten_bang_theo_thang(self):
+		self.assertEqual(
+			archival.archive_table_name("Deleted Document", date(2026, 8, 1)),
+			"_archive_deleted_document_202608",
+		)
+		self.assertEqual(
+			archival.archive_table_name("ERP Notification", datetime(2026, 1, 31, 23, 59)),
+			"_archive_erp_notification_202601",
+		)
+
+	def test_chia_lo_theo_thang_giu_thu_tu(self):
+		rows = [
+			("A", datetime(2026, 7, 30)),
+			("B", datetime(2026, 7, 31)),
+			("C", datetime(2026, 8, 1)),
+		]
+		self.assertEqual(archival.group_by_month(rows), {(2026, 7): ["A", "B"], (2026, 8): ["C"]})
+
+
+class TestArchiveColumns(unittest.TestCase):
+	def test_them_cot_moi_va_liet_ke_cot_chung(self):
+		source = (("name", "varchar(140)"), ("data", "longtext"), ("restored", "int(1)"))
+		target = (("name", "varchar(140)"), ("data", "longtext"))
+		with mock.patch.object(archival, "_table_columns", side_effect=[target, source]), mock.patch.object(
+			archival.frappe.db, "sql_ddl", create=True
+		) as ddl:
+			columns = archival._sync_archive_columns("tabDeleted Document", "_archive_deleted_document_202608")
+		self.assertEqual(columns, ["name", "data", "restored"])
+		ddl.assert_called_once_with(
+			"ALTER TABLE `_archive_deleted_document_202608` ADD COLUMN `restored` int(1) NULL"
+		)
+
+
+class TestRunBudget(unittest.TestCase):
+	def test_cac_policy_dung_chung_mot_han(self):
+		policies = [archival.policy("Version", 90), archival.policy("Deleted Document", 90, archive=True)]
+		report = archival.frappe._dict(
+			doctype="X", archived=0, deleted=0, batches=0, seconds=0, max_lag=None, stopped="done", cutoff="",
+		)
+		with mock.patch.object(archival, "_replica_connection", return_value=None), mock.patch.object(
+			archival.time, "monotonic", return_value=100.0
+		), mock.patch.object(archival, "run_policy", return_value=report) as run_policy, mock.patch.object(
+			archival.frappe, "logger", create=True
+		):
+			archival.run(policies, max_seconds=600)
+		self.assertEqual([c.args[2] for c in run_policy.call_args_list], [700.0, 700.0])
+
+
+if __name__ == "__main__":
+	unittest.main()
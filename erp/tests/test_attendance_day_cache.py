@@ -0,0 +1,56 @@
+"""Cache diem danh theo (ngay, ma): giai ma HMGET va dung payload.
+
+Phan Redis duoc gia lap bang mock — chi kiem logic, khong can site.
+"""
+
+import json
+import unittest
+from datetime import date, datetime
+from unittest import mock
+
+from erp.api.attendance import day_cache
+
+
+class TestBuildPayload(unittest.TestCase):
+	def test_mot_lan_quet_khong_hien_gio_ra(self):
+		t = datetime(2026, 9, 1, 7, 15)
+		payload = day_cache.build_payload(t, t, 1, "A", date(2026, 9, 1))
+		self.assertEqual(payload["checkInTime"], "2026-09-01T07:15:00")
+		self.assertIsNone(payload["checkOutTime"])
+
+	def test_chuoi_va_datetime_so_sanh_nhu_nhau(self):
+		# Doc vua save giu chuoi, hang DB la datetime — khong duoc coi la khac nhau
+		payload = day_cache.build_payload(
+			"2026-09-01 07:15:00", datetime(2026, 9, 1, 7, 15), 1, "A", date(2026, 9, 1)
+		)
+		self.assertIsNone(payload["checkOutTime"])
+
+
+class TestGetMany(unittest.TestCase):
+	def _cache(self, values):
+		cache = mock.Mock()
+		cache.make_key.side_effect = lambda k: f"site|{k}"
+		cache.hmget.return_value = values
+		return cache
+
+	def test_phan_biet_hit_vang_va_miss(self):
+		hit = json.dumps({"checkInTime": "x", "checkOutTime": None, "totalCheckIns": 1, "employeeName": "A"})
+		cache = self._cache([hit.encode(), b"", None])
+		with mock.patch.object(day_cache.frappe, "cache", return_value=cache):
+			found, missing = day_cache.get_many("2026-09-01", ["ws1", "ws2", "ws3"])
+		self.assertEqual(found["ws1"]["checkInTime"], "x")
+		self.assertIsNone(found["ws2"])
+		self.assertEqual(missing, ["ws3"])
+		cache.hmget.assert_called_once_with("site|attendance:day:2026-09-01", ["ws1", "ws2", "ws3"])
+
+	def test_redis_loi_thi_tat_ca_la_miss(self):
+		cache = mock.Mock()
+		cache.make_key.side_effect = RuntimeError("down")
+		with mock.patch.object(day_cache.frappe, "cache", return_value=cache):
+			found, missing = day_cache.get_many("2026-09-01", ["ws1"])
+		self.assertEqual(found, {})
+		self.assertEqual(missing, ["ws1"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,65 @@
+"""Sinh chuyến xe theo lô: lập kế hoạch chuyến (idempotent + trùng tài nguyên).
+
+Chỉ kiểm `plan_trips` thuần — không cần site.
+"""
+
+import unittest
+from datetime import date
+
+from frappe import _dict
+
+from erp.api.erp_sis import bus_daily_trip_bulk as bulk
+
+MONDAY = date(2026, 10, 19)
+
+
+def _route(name, **kw):
+	row = _dict(name=name, vehicle_id=None, driver_id=None, monitor1_id=f"M-{name}", monitor2_id=None,
+		campus_id="campus-1", school_year_id="SY")
+	row.update(kw)
+	return row
+
+
+def _student(route_id, trip_type, student_id):
+	return _dict(route_id=route_id, weekday="Thứ 2", trip_type=trip_type, student_id=student_id)
+
+
+class TestPlanTrips(unittest.TestCase):
+	def test_tuyen_khong_hoc_sinh_tao_ca_don_va_tra(self):
+		planned, skipped, errors = bulk.plan_trips([_route("R1")], {}, [], [MONDAY])
+		self.assertEqual(sorted(p["trip_type"] for p in planned), sorted(bulk.DEFAULT_TRIP_TYPES))
+		self.assertEqual((skipped, errors), (0, []))
+		self.assertEqual(planned[0]["weekday"], "Thứ 2")
+
+	def test_chi_loai_chuyen_co_hoc_sinh_va_chia_dung_hoc_sinh(self):
+		students = {("R1", "Thứ 2"): [_student("R1", "Đón", "S1"), _student("R1", "Đón", "S2")]}
+		planned, _, _ = bulk.plan_trips([_route("R1")], students, [], [MONDAY])
+		self.assertEqual([p["trip_type"] for p in planned], ["Đón"])
+		self.assertEqual([s.student_id for s in planned[0]["students"]], ["S1", "S2"])
+
+	def test_chuyen_da_co_thi_bo_qua(self):
+		existing = [_dict(route_id="R1", trip_date=MONDAY, trip_type="Đón", route_active=1)]
+		planned, skipped, _ = bulk.plan_trips([_route("R1")], {}, existing, [MONDAY])
+		self.assertEqual([p["trip_type"] for p in planned], ["Trả"])
+		self.assertEqual(skipped, 1)
+
+	def test_trung_tai_xe_voi_tuyen_khac_bi_loai(self):
+		routes = [_route("R1", driver_id="D1"), _route("R2", driver_id="D1")]
+		planned, _, errors = bulk.plan_trips(routes, {}, [], [MONDAY])
+		self.assertEqual({p["route"]["name"] for p in planned}, {"R1"})
+		self.assertEqual(len(errors), 2)
+
+	def test_tai_nguyen_cua_tuyen_inactive_khong_tinh(self):
+		existing = [_dict(route_id="R0", trip_date=MONDAY, trip_type="Đón", driver_id="D1", route_active=0)]
+		planned, _, errors = bulk.plan_trips([_route("R1", driver_id="D1")], {}, existing, [MONDAY])
+		self.assertEqual(len(planned), 2)
+		self.assertEqual(errors, [])
+
+	def test_hai_monitor_giong_nhau_bi_loai_nhu_validate(self):
+		planned, _, errors = bulk.plan_trips([_route("R1", monitor1_id=None)], {}, [], [MONDAY])
+		self.assertEqual(planned, [])
+		self.assertEqual(len(errors), 2)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,117 @@
+"""Rollup sổ đầu bài: khớp sổ có nội dung vào tiết theo lịch.
+
+Tra DB và TKB được giả lập bằng mock — chỉ kiểm logic tổng hợp, không cần site.
+"""
+
+import unittest
+from datetime import date, datetime
+from unittest import mock
+
+from frappe import _dict
+
+from erp.api.erp_sis import class_log_compliance
+
+DAY = date(2026, 9, 7)
+KEY = ("CLS-1", DAY)
+LABELS = {
+	"R1": {"period_name": "Tiết 1", "teacher_id": "T1", "subject_id": "S1"},
+	"R2": {"period_name": "Tiết 2", "teacher_id": "T2", "subject_id": "S2"},
+}
+
+
+def _compiled(rows):
+	compiled = mock.Mock(instance_id="INST-1")
+	compiled.rows_on.return_value = rows
+	return compiled
+
+
+def _log(name, period, comment="ok", modified=None):
+	created = datetime(2026, 9, 7, 8, 0)
+	return _dict(
+		name=name, class_id="CLS-1", log_date=DAY, period=period, general_comment=comment,
+		creation=created, modified=modified or created, student_log_count=0,
+	)
+
+
+class TestCompute(unittest.TestCase):
+	def _run(self, rows, labels, logs):
+		with mock.patch.object(
+			class_log_compliance, "_day_signatures", return_value=({KEY: "sig"}, {KEY: [_compiled(rows)]})
+		), mock.patch.object(
+			class_log_compliance, "_period_number", side_effect=lambda p: int(p.split()[-1])
+		), mock.patch(
+			"erp.api.erp_sis.class_log_report._study_period_labels", return_value=labels
+		), mock.patch.object(
+			class_log_compliance.frappe, "get_all", return_value=[("CLS-1", "CAMPUS-1")]
+		), mock.patch.object(class_log_compliance.frappe.db, "sql", return_value=logs):
+			return class_log_compliance.compute(["CLS-1"], [DAY])[KEY]
+
+	def test_so_co_noi_dung_danh_dau_tiet_theo_lich(self):
+		rows = [_dict(name="R1"), _dict(name="R2")]
+		labels = {
+			"R1": {"period_name": "Tiết 1", "teacher_id": "T1", "subject_id": "S1"},
+			"R2": {"period_name": "Tiết 2", "teacher_id": "T2", "subject_id": "S2"},
+		}
+		out = self._run(rows, labels, [_log("L1", "Tiết 2", modified=datetime(2026, 9, 7, 9, 0))])
+		by_period = {r["period_number"]: r for r in out}
+		self.assertEqual(by_period[1]["is_entered"], 0)
+		self.assertEqual(by_period[2]["is_entered"], 1)
+		self.assertEqual(by_period[2]["is_updated"], 1)
+		self.assertEqual(by_period[2]["class_log_subject"], "L1")
+
+	def test_so_ngoai_lich_thanh_dong_khong_lich(self):
+		out = self._run([], {}, [_log("L1", "Tiết 5")])
+		self.assertEqual(len(out), 1)
+		self.assertEqual((out[0]["period_number"], out[0]["is_scheduled"], out[0]["is_entered"]), (5, 0, 1))
+
+	def test_ngay_trong_co_dong_danh_dau(self):
+		out = self._run([], {}, [_log("L1", "Tiết 1", comment=None)])
+		self.assertEqual(len(out), 1)
+		self.assertEqual(out[0]["period_number"], class_log_compliance.MARKER_PERIOD)
+
+
+class TestReadRows(unittest.TestCase):
+	def _run(self, stored, rollup, logs):
+		"""`stored`: chữ ký đang lưu; `rollup`: dòng bảng rollup; `logs`: sổ đầu bài nguồn."""
+		with mock.patch.object(
+			class_log_compliance, "_day_signatures",
+			return_value=({KEY: "sig"}, {KEY: [_compiled([_dict(name="R1"), _dict(name="R2")])]}),
+		), mock.patch.object(
+			class_log_compliance, "_period_number", side_effect=lambda p: int(p.split()[-1])
+		), mock.patch(
+			"erp.api.erp_sis.class_log_report._study_period_labels", return_value=LABELS
+		), mock.patch.object(
+			class_log_compliance.frappe, "get_all", return_value=[("CLS-1", "CAMPUS-1")]
+		), mock.patch.object(
+			class_log_compliance.frappe.db, "sql", side_effect=[stored, rollup, logs]
+		), mock.patch.object(class_log_compliance, "_queue_pairs") as queue:
+			return class_log_compliance.read_rows(["CLS-1"], [DAY]), queue
+
+	def test_rollup_trong_thi_tinh_truc_tiep_va_xep_job(self):
+		out, queue = self._run([], [], [_log("L1", "Tiết 2")])
+		self.assertEqual(
+			[(r["period_number"], r["is_scheduled"], r["is_entered"]) for r in out],
+			[(1, 1, 0), (2, 1, 1)],
+		)
+		queue.assert_called_once_with({KEY})
+
+	def test_rollup_tuoi_thi_doc_tu_bang(self):
+		row = _dict(
+			log_date=DAY, class_id="CLS-1", period_number=1, is_scheduled=1, is_entered=1,
+			teacher_id="T1", schedule_signature="sig",
+		)
+		stored = [_dict(class_id="CLS-1", log_date=DAY, schedule_signature="sig")]
+		out, queue = self._run(stored, [row], [])
+		self.assertEqual(out, [row])
+		queue.assert_called_once_with(set())
+
+
+class TestStalePair(unittest.TestCase):
+	def test_ma_hoa_cap_lop_ngay(self):
+		raw = class_log_compliance._encode_pair("CLS-1", DAY)
+		self.assertEqual(raw, "CLS-1|2026-09-07")
+		self.assertEqual(class_log_compliance._decode_pair(raw.encode()), KEY)
+
+
+if __name__ == "__main__":
+	unittest.main()
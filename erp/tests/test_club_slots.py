@@ -0,0 +1,116 @@
+"""Cửa nhanh giữ chỗ CLB: chia kết quả script, cờ trả chỗ, settle đúng một lần, Redis lỗi thì không gác.
+
+Không cần Redis — cache giả ghi lại lời gọi script.
+"""
+
+import unittest
+from unittest import mock
+
+from erp.sis.utils import club_slots
+
+
+class _Script:
+	def __init__(self, cache, source):
+		self.cache = cache
+		self.source = source
+
+	def __call__(self, keys=None, args=None, client=None):
+		self.cache.calls.append((self.source, list(keys), list(args)))
+		return self.cache.replies.pop(0) if self.cache.replies else 1
+
+
+class _Cache:
+	def __init__(self, replies=None, fail=False):
+		self.calls = []
+		self.replies = list(replies or [])
+		self.fail = fail
+
+	def make_key(self, key):
+		return f"site|{key}"
+
+	def register_script(self, source):
+		if self.fail:
+			raise ConnectionError("redis down")
+		return _Script(self, source)
+
+
+class TestSplitResults(unittest.TestCase):
+	def test_chia_theo_ma_ket_qua(self):
+		self.assertEqual(
+			club_slots.split_results(["A", "B", "C", "D"], [1, 0, -1, b"1"]),
+			(["A", "D"], ["B"], ["C"]),
+		)
+
+
+class TestSettleFlags(unittest.TestCase):
+	def test_mon_da_ghi_khong_tra_cho(self):
+		self.assertEqual(club_slots.settle_flags(["A", "B", "C"], ["B"]), ["1", "0", "1"])
+		self.assertEqual(club_slots.settle_flags(["A"], None), ["1"])
+
+
+class TestReserve(unittest.TestCase):
+	def test_mot_lan_script_cho_ca_gio(self):
+		cache = _Cache(replies=[[1, 0]])
+		with mock.patch.object(club_slots.frappe, "cache", return_value=cache):
+			reservation = club_slots.reserve(["OFF-1", "OFF-2", "OFF-1"], "STU-1")
+		self.assertEqual(len(cache.calls), 1)
+		self.assertEqual(
+			cache.calls[0][1],
+			[
+				"site|club_slots:remaining:OFF-1",
+				"site|club_slots:holders:OFF-1",
+				"site|club_slots:remaining:OFF-2",
+				"site|club_slots:holders:OFF-2",
+			],
+		)
+		self.assertEqual(cache.calls[0][2][0], "STU-1")
+		self.assertEqual((reservation.granted, reservation.full), (["OFF-1"], ["OFF-2"]))
+		self.assertEqual(reservation.admitted, ["OFF-1"])
+
+	def test_redis_loi_thi_khong_gac(self):
+		with mock.patch.object(club_slots.frappe, "cache", return_value=_Cache(fail=True)):
+			reservation = club_slots.reserve(["OFF-1"], "STU-1")
+		self.assertEqual(reservation.ungated, ["OFF-1"])
+		self.assertEqual(reservation.admitted, ["OFF-1"])
+
+	def test_chua_seed_thi_seed_roi_thu_lai(self):
+		cache = _Cache(replies=[[1, -1], [1]])
+		with mock.patch.object(club_slots.frappe, "cache", return_value=cache), mock.patch.object(
+			club_slots, "refresh"
+		) as refresh:
+			reservation = club_slots.reserve(["OFF-1", "OFF-2"], "STU-1")
+		refresh.assert_called_once_with(["OFF-2"], only_missing=True)
+		self.assertEqual(cache.calls[1][1], ["site|club_slots:remaining:OFF-2", "site|club_slots:holders:OFF-2"])
+		self.assertEqual(reservation.granted, ["OFF-1", "OFF-2"])
+
+
+class TestSettle(unittest.TestCase):
+	def test_settle_mot_lan(self):
+		cache = _Cache()
+		reservation = club_slots.Reservation("STU-1", granted=["OFF-1", "OFF-2"])
+		with mock.patch.object(club_slots.frappe, "cache", return_value=cache):
+			reservation.settle(["OFF-2"])
+			reservation.settle()
+		self.assertEqual(len(cache.calls), 1)
+		self.assertEqual(cache.calls[0][2], ["STU-1", "1", "0"])
+
+	def test_khong_giu_cho_thi_khong_goi_redis(self):
+		cache = _Cache()
+		with mock.patch.object(club_slots.frappe, "cache", return_value=cache):
+			club_slots.Reservation("STU-1", ungated=["OFF-1"]).settle()
+		self.assertEqual(cache.calls, [])
+
+
+class TestRegisteredHolders(unittest.TestCase):
+	def test_chi_giu_holder_da_dang_ky_dung_mon(self):
+		db = mock.Mock()
+		db.sql.return_value = [("OFF-1", "STU-1"), ("OFF-2", "STU-1"), ("OFF-2", "STU-2")]
+		with mock.patch.object(club_slots.frappe, "db", db, create=True):
+			out = club_slots._registered_holders({"OFF-1": {"STU-1", "STU-3"}, "OFF-2": {"STU-2"}})
+		self.assertEqual(out, {"OFF-1": {"STU-1"}, "OFF-2": {"STU-2"}})
+
+	def test_khong_holder_thi_khong_tra_db(self):
+		db = mock.Mock()
+		with mock.patch.object(club_slots.frappe, "db", db, create=True):
+			self.assertEqual(club_slots._registered_holders({}), {})
+		db.sql.assert_not_called()
@@ -0,0 +1,34 @@
+"""So trùng CRM theo cặp tên HS + tên PH.
+
+Tra index được giả lập bằng mock — không cần site.
+"""
+
+import unittest
+from unittest import mock
+
+from frappe import _dict
+
+from erp.api.crm import duplicate
+
+
+class TestMatchByNames(unittest.TestCase):
+	def _run(self, student_name, guardian_name, candidates):
+		with mock.patch.object(duplicate.match_keys, "find_leads", return_value=candidates):
+			return duplicate._find_matching_leads_by_names(student_name, guardian_name)
+
+	def test_ten_co_dau_khop_ten_khong_dau(self):
+		lead = _dict(name="LEAD-1", student_name="Nguyen Van An", guardian_name="TRAN  THI BINH")
+		rows = self._run("Nguyễn Văn An", "Trần Thị Bình", [lead])
+		self.assertEqual([r.name for r in rows], ["LEAD-1"])
+		self.assertEqual(rows[0]["matched_fields"], ["student_name", "guardian_name"])
+
+	def test_khac_ten_dem_khong_khop(self):
+		lead = _dict(name="LEAD-1", student_name="Nguyễn Thị An", guardian_name="Trần Thị Bình")
+		self.assertEqual(self._run("Nguyễn Văn An", "Trần Thị Bình", [lead]), [])
+
+	def test_thieu_mot_ten_thi_bo_qua(self):
+		self.assertEqual(self._run("Nguyễn Văn An", "  ", []), [])
+
+
+if __name__ == "__main__":
+	unittest.main()
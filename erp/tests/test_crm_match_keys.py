@@ -0,0 +1,64 @@
+"""Khoá so trùng CRM: chuẩn hoá SĐT / email / tên và bộ khoá của lead, guardian.
+
+Chỉ kiểm phần thuần — không cần site.
+"""
+
+import unittest
+
+from frappe import _dict
+
+from erp.api.crm import match_keys as mk
+
+
+class TestNormalize(unittest.TestCase):
+	def test_sdt_chi_con_chu_so(self):
+		self.assertEqual(mk.phone_key("0912 345-678"), "84912345678")
+		self.assertEqual(mk.phone_key("+84912345678"), "84912345678")
+		self.assertEqual(mk.phone_key(""), "")
+		self.assertEqual(mk.phone_key("0"), "")
+
+	def test_email(self):
+		self.assertEqual(mk.email_key("  An@Example.COM "), "an@example.com")
+		self.assertEqual(mk.email_key("khong-phai-email"), "")
+
+	def test_khoi_ten_bo_dau_bo_ten_dem(self):
+		self.assertEqual(mk.name_block("Nguyễn  Văn\nAn"), "nguyen an")
+		self.assertEqual(mk.name_block("Nguyen An"), mk.name_block("nguyễn thị an"))
+		self.assertEqual(mk.name_block("  "), "")
+
+	def test_khoa_danh_tinh_gom_so_va_ten(self):
+		self.assertEqual(mk.identity_key("0912345678", "Dương Thị Thủy"), "+84912345678|duong thi thuy")
+		self.assertEqual(mk.identity_key("", "Dương Thị Thủy"), "")
+
+
+class TestEntityKeys(unittest.TestCase):
+	def test_khoa_cua_lead(self):
+		lead = _dict(
+			student_name="Lê Minh An", guardian_name="Trần Thị Bình", guardian_email="Binh@x.vn",
+			phone_numbers=[_dict(phone_number="0912345678"), _dict(phone_number="")],
+			emails=[_dict(email_address="binh@x.vn")],
+		)
+		self.assertEqual(mk.lead_keys(lead), {
+			(mk.PHONE, "84912345678"),
+			(mk.EMAIL, "binh@x.vn"),
+			(mk.NAME_BLOCK, "le an|tran binh"),
+		})
+
+	def test_lead_thieu_ten_phu_huynh_khong_co_khoi_ten(self):
+		keys = mk.lead_keys(_dict(student_name="Lê Minh An"))
+		self.assertEqual(keys, set())
+
+	def test_khoa_cua_guardian_tach_sdt_phang_va_so_phu(self):
+		guardian = _dict(
+			guardian_name="Trần Thị Bình", phone_number="0912345678",
+			phone_numbers=[_dict(phone_number="0987000111")], emails=[],
+		)
+		self.assertEqual(mk.guardian_keys(guardian), {
+			(mk.PHONE, "84912345678"),
+			(mk.IDENTITY, "+84912345678|tran thi binh"),
+			(mk.ALT_PHONE, "84987000111"),
+		})
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,71 @@
+"""Hàng đợi hạn: mã hoá member, ghi pipeline, dời hạn theo kết quả handler.
+
+Redis được giả lập bằng mock — không cần site.
+"""
+
+import unittest
+from datetime import date, datetime
+from unittest import mock
+
+from erp.common import deadlines
+
+
+def _cache():
+	cache = mock.Mock()
+	cache.make_key.side_effect = lambda k: f"site|{k}"
+	return cache
+
+
+class TestMember(unittest.TestCase):
+	def test_ref_co_dau_gach_van_tach_dung(self):
+		raw = deadlines.member(deadlines.CLUB_PERIOD, "open:CLB|2026").encode()
+		self.assertEqual(deadlines.parse_member(raw), (deadlines.CLUB_PERIOD, "open:CLB|2026"))
+
+	def test_dau_ngay_mai(self):
+		self.assertEqual(deadlines.start_of_next_day(date(2026, 12, 31)), datetime(2027, 1, 1))
+
+
+class TestApply(unittest.TestCase):
+	def test_dat_huy_va_ref_callable(self):
+		cache = _cache()
+		due = datetime(2026, 10, 19, 8)
+		with mock.patch.object(deadlines.frappe, "cache", return_value=cache):
+			deadlines.apply([
+				(deadlines.CRM_ISSUE_SLA, "ISS-1", due),
+				(deadlines.APPROVAL_STEP, lambda: "step-1", due),
+				(deadlines.APPROVAL_STEP, lambda: None, due),
+				(deadlines.HEALTH_VISIT_STALE, "V-1", None),
+			])
+		pipe = cache.pipeline.return_value
+		self.assertEqual(
+			pipe.zadd.call_args_list,
+			[
+				mock.call("site|deadlines", {"crm_issue_sla|ISS-1": due.timestamp()}),
+				mock.call("site|deadlines", {"approval_step_deadline|step-1": due.timestamp()}),
+			],
+		)
+		pipe.zrem.assert_called_once_with("site|deadlines", "health_visit_stale|V-1")
+		pipe.execute.assert_called_once()
+
+
+class TestRun(unittest.TestCase):
+	def test_handler_tra_han_moi_thi_dat_lai(self):
+		cache = _cache()
+		nxt = datetime(2026, 10, 20)
+		handler = mock.Mock(return_value=nxt)
+		get_attr = mock.Mock(return_value=handler)
+		with mock.patch.object(deadlines.frappe, "get_attr", get_attr, create=True), \
+				mock.patch.object(deadlines, "apply") as apply:
+			deadlines._run(cache, b"crm_issue_sla|ISS-1")
+		get_attr.assert_called_once_with("erp.api.crm.sla_scheduler.process_issue_sla")
+		handler.assert_called_once_with("ISS-1")
+		apply.assert_called_once_with([("crm_issue_sla", "ISS-1", nxt)])
+
+	def test_loai_la_bi_bo_qua(self):
+		with mock.patch.object(deadlines, "apply") as apply:
+			deadlines._run(_cache(), b"khong_ton_tai|X")
+		apply.assert_not_called()
+
+
+if __name__ == "__main__":
+	unittest.main()
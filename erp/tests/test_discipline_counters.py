@@ -0,0 +1,75 @@
+"""Bộ đếm kỷ luật theo tháng: đóng góp của một bản ghi khớp luật của query thống kê.
+
+Danh sách lớp (SIS Class Student) được giả lập bằng mock — không cần site.
+"""
+
+import unittest
+from datetime import date
+from unittest import mock
+
+from frappe import _dict
+
+from erp.api.erp_sis import discipline_counters as dc
+
+MONTH = date(2026, 9, 1)
+
+
+def _get_all(doctype, filters=None, fields=None, ignore_permissions=False):
+	rows = [
+		_dict(class_id="C1", student_id="S1", class_type="regular"),
+		_dict(class_id="C1", student_id="S2", class_type="regular"),
+		_dict(class_id="CLB", student_id="S1", class_type="club"),
+	]
+	if "class_id" in filters:
+		return [r for r in rows if r.class_id in filters["class_id"][1]]
+	return [
+		r for r in rows
+		if r.student_id in filters["student_id"][1] and r.class_type == filters["class_type"]
+	]
+
+
+def _record(**kw):
+	doc = _dict(date="2026-09-15", violation="V1", target_student=None, target_students=[], target_classes=[])
+	doc.update(kw)
+	return doc
+
+
+class TestContributions(unittest.TestCase):
+	def _run(self, doc):
+		with mock.patch.object(dc.frappe, "get_all", side_effect=_get_all):
+			return dc._contributions(doc)
+
+	def test_mixed_khong_cong_diem_trung(self):
+		doc = _record(
+			target_students=[_dict(student_id="S1", deduction_points="5", applied_level="1")],
+			target_classes=[_dict(class_id="C1", deduction_points="1")],
+		)
+		out = self._run(doc)
+		# S1 có Student Entry riêng: chỉ lấy điểm dòng HS; S2 nhận điểm theo lớp
+		self.assertEqual(out[("Student", "S1", "V1", MONTH)], [1, 1, 1, 5])
+		self.assertEqual(out[("Student", "S2", "V1", MONTH)], [1, 0, 0, 1])
+		# C1 có Class Entry riêng: điểm HS trong lớp không cộng thêm
+		self.assertEqual(out[("Class", "C1", "V1", MONTH)], [1, 0, 0, 1])
+		self.assertNotIn(("Class", "CLB", "V1", MONTH), out)
+
+	def test_ban_ghi_cu_chi_co_target_student(self):
+		out = self._run(_record(target_student="S2", violation=None))
+		self.assertEqual(out[("Student", "S2", "", MONTH)], [1, 1, 0, 0])
+		self.assertEqual(out[("Class", "C1", "", MONTH)], [1, 0, 0, 0])
+
+	def test_diem_rong_giong_cast_sql(self):
+		self.assertEqual(dc._dp(None), 10)
+		self.assertEqual(dc._dp(""), 0)
+		self.assertEqual(dc._dp("15"), 15)
+
+
+class TestMonths(unittest.TestCase):
+	def test_khoang_qua_cuoi_nam(self):
+		self.assertEqual(
+			dc._months_between(date(2026, 11, 1), date(2027, 1, 10)),
+			[date(2026, 11, 1), date(2026, 12, 1), date(2027, 1, 1)],
+		)
+
+
+if __name__ == "__main__":
+	unittest.main()
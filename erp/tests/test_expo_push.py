@@ -0,0 +1,77 @@
+"""Gửi Expo song song: gom kết quả theo lô, lùi retry, receipt DeviceNotRegistered.
+
+Chỉ kiểm phần thuần — không cần site / mạng.
+"""
+
+import unittest
+
+from erp.api.erp_sis import expo_push
+
+NOT_REGISTERED = {"status": "error", "details": {"error": "DeviceNotRegistered"}}
+
+
+def _msgs(*tokens):
+	return [{"to": t} for t in tokens]
+
+
+class TestSummarize(unittest.TestCase):
+	def test_ticket_ok_loi_va_thieu_ticket(self):
+		chunks = [_msgs("a", "b", "c")]
+		outcomes = [(200, {"data": [{"status": "ok", "id": "t1"}, NOT_REGISTERED]}, None)]
+		out = expo_push.summarize(chunks, outcomes)
+		self.assertEqual((out.success_count, out.failed_count), (1, 2))
+		self.assertEqual([r["status"] for r in out.results], ["success", "failed", "failed"])
+		self.assertEqual(out.results[2]["error"], "No ticket returned")
+		self.assertEqual(out.unregistered, ["b"])
+		self.assertEqual(out.tickets, [("t1", "a")])
+
+	def test_http_loi_va_loi_mang_danh_dau_ca_lo(self):
+		chunks = [_msgs("a"), _msgs("b", "c")]
+		outcomes = [(429, None, None), (None, None, "timeout")]
+		out = expo_push.summarize(chunks, outcomes)
+		self.assertEqual((out.success_count, out.failed_count), (0, 3))
+		self.assertEqual(out.results[0], {"token": "a", "status": "failed", "http_code": 429})
+		self.assertEqual(out.results[1], {"token": "b", "status": "error", "error": "timeout"})
+
+	def test_giu_thu_tu_message_qua_nhieu_lo(self):
+		chunks = [_msgs("a"), _msgs("b")]
+		outcomes = [(200, {"data": [{"status": "ok", "id": "1"}]}, None)] * 2
+		out = expo_push.summarize(chunks, outcomes)
+		self.assertEqual([r["token"] for r in out.results], ["a", "b"])
+
+
+class TestBackoff(unittest.TestCase):
+	def test_tang_cap_so_nhan_co_tran(self):
+		for attempt in range(6):
+			base = min(expo_push.BACKOFF_BASE_SEC * 2 ** attempt, expo_push.BACKOFF_MAX_SEC)
+			delay = expo_push.backoff_delay(attempt)
+			self.assertGreaterEqual(delay, base)
+			self.assertLessEqual(delay, base * 1.1)
+
+	def test_uu_tien_retry_after(self):
+		self.assertEqual(expo_push.backoff_delay(0, "3"), 3.0)
+		self.assertEqual(expo_push.backoff_delay(0, "600"), expo_push.BACKOFF_MAX_SEC)
+		self.assertGreaterEqual(expo_push.backoff_delay(1, "không phải số"), 1.0)
+
+
+class TestReceipts(unittest.TestCase):
+	def test_member_hai_chieu(self):
+		raw = expo_push.receipt_member("tid", "ExponentPushToken[x|y]").encode()
+		self.assertEqual(expo_push.parse_receipt_member(raw), ("tid", "ExponentPushToken[x|y]"))
+
+	def test_token_hong_tu_receipt(self):
+		members = [("t1", "a"), ("t2", "b"), ("t3", "c")]
+		receipts = {"data": {"t1": {"status": "ok"}, "t2": NOT_REGISTERED}}
+		self.assertEqual(expo_push.unregistered_from_receipts(members, receipts), ["b"])
+
+	def test_chi_tach_id_da_co_receipt(self):
+		raw = [b"t1|a", b"t2|b", b"t3|c"]
+		receipts = {"data": {"t1": {"status": "ok"}, "t3": NOT_REGISTERED}}
+		self.assertEqual(expo_push.split_answered(raw, receipts), ([b"t1|a", b"t3|c"], [b"t2|b"]))
+		self.assertEqual(expo_push.split_answered(raw, {"data": {}}), ([], raw))
+
+	def test_url_receipts_cung_host(self):
+		self.assertEqual(
+			expo_push.receipts_url("http://127.0.0.1:8765/--/api/v2/push/send"),
+			"http://127.0.0.1:8765/--/api/v2/push/getReceipts",
+		)
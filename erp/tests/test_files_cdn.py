@@ -6,7 +6,7 @@ Ba rang buoc cua regex tung lam vo production nen moi rang buoc co mot test rien
 import unittest
 from unittest import mock
 
-from erp.common import cdn_sign, files_cdn, student_photo_cdn
+from erp.common import cdn_sign, cdn_sign_cache, files_cdn, student_photo_cdn
 
 
 def _domain(keys, prefix="student-photos", key_from_url=None):
@@ -209,6 +209,69 @@ class TestToFilesUrl(unittest.TestCase):
         self.assertIn("https://cdn/sis-content/0582.webp?e=9&s=new", out)
 
 
+class TestSameJsonShape(unittest.TestCase):
+    """Thay `json.loads` ca body: chi dem `"` va `\\` truoc/sau khi ky."""
+
+    def test_ky_binh_thuong_giu_nguyen_hinh(self):
+        text = '{"a":"/files/WS1.jpg","b":"Lop 1A1"}'
+        out = files_cdn.sign_text(
+            text, [_domain(["WS1.jpg"])], signer=lambda p, expires=None: f"https://cdn{p}?e=1&s=x"
+        )
+        self.assertNotEqual(out, text)
+        self.assertTrue(files_cdn.same_json_shape(text, out))
+
+    def test_url_ky_co_dau_nhay_bi_chan(self):
+        text = '{"a":"/files/WS1.jpg"}'
+        out = files_cdn.sign_text(
+            text, [_domain(["WS1.jpg"])], signer=lambda p, expires=None: 'https://cdn"x'
+        )
+        self.assertFalse(files_cdn.same_json_shape(text, out))
+
+    def test_media_khoa_giai_ma_ra_dau_nhay_giu_nguyen(self):
+        raw = '{"a":"https://media.wellspring.edu.vn/sis-content/a%22b.webp?e=1&s=x"}'
+        with mock.patch.object(cdn_sign, "load_conf", return_value=None):
+            cdn_sign._media_text_re = None
+            self.assertEqual(cdn_sign.media_urls_to_files(raw, json_safe=True), raw)
+
+
+class TestSignCache(unittest.TestCase):
+    def setUp(self):
+        cdn_sign_cache.clear_local()
+
+    def test_nho_chu_ky_theo_moc_het_han(self):
+        with mock.patch.object(
+            cdn_sign, "sign_path", side_effect=lambda p, expires=None: f"{p}?e={expires}"
+        ) as sign:
+            a = cdn_sign_cache.sign_path("/student-photos/WS1.jpg", expires=100)
+            b = cdn_sign_cache.sign_path("/student-photos/WS1.jpg", expires=100)
+            c = cdn_sign_cache.sign_path("/student-photos/WS1.jpg", expires=200)
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+        self.assertEqual(sign.call_count, 2)
+
+    def test_chi_giu_vai_moc_gan_nhat(self):
+        with mock.patch.object(cdn_sign, "sign_path", return_value="u"):
+            for exp in range(1, 6):
+                cdn_sign_cache.sign_path("/p", expires=exp)
+        self.assertEqual(sorted(cdn_sign_cache._memo), [4, 5])
+
+    def test_tap_khoa_nap_lai_khi_doi_phien_ban(self):
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return {"WS1.jpg"}
+
+        with mock.patch.object(cdn_sign_cache, "current_version", return_value=1):
+            cdn_sign_cache.local_keys("student-photos", loader)
+            keys = cdn_sign_cache.local_keys("student-photos", loader)
+        self.assertEqual(len(loads), 1)
+        self.assertIn("WS1.jpg", keys)
+        with mock.patch.object(cdn_sign_cache, "current_version", return_value=2):
+            cdn_sign_cache.local_keys("student-photos", loader)
+        self.assertEqual(len(loads), 2)
+
+
 class TestSanitizeDoc(unittest.TestCase):
     def test_library_title_cover(self):
         doc = mock.Mock()
@@ -0,0 +1,75 @@
+"""Sổ cái tài chính: trạng thái theo tổng, phần đóng góp Order Student, delta bộ đếm, đối soát.
+
+Chỉ kiểm phần thuần — không cần site.
+"""
+
+import unittest
+
+from erp.api.erp_sis.finance import ledger
+
+ACTIVE = {"is_active": 1, "is_superseded": 0}
+
+
+class TestSummarize(unittest.TestCase):
+	def test_trang_thai_theo_tong(self):
+		self.assertEqual(ledger.summarize_totals(0, 0), (0, "unpaid"))
+		self.assertEqual(ledger.summarize_totals(100, 0), (100, "unpaid"))
+		self.assertEqual(ledger.summarize_totals(100, 40), (60, "partial"))
+		self.assertEqual(ledger.summarize_totals(100, 100), (0, "paid"))
+
+
+class TestContribution(unittest.TestCase):
+	def test_chi_tinh_order_active_chua_thay_the(self):
+		self.assertEqual(ledger.contribution(100, 40, 0, ACTIVE), (100, 40))
+		self.assertEqual(ledger.contribution(100, 40, 1, ACTIVE), (0, 0))
+		self.assertEqual(ledger.contribution(100, 40, 0, {"is_active": 0}), (0, 0))
+		self.assertEqual(ledger.contribution(100, 40, 0, {"is_active": 1, "is_superseded": 1}), (0, 0))
+		self.assertEqual(ledger.contribution(100, 40, 0, None), (0, 0))
+
+
+class TestCounterDeltas(unittest.TestCase):
+	def test_doi_trang_thai(self):
+		deltas = ledger.counter_deltas(("partial", 100, 40, 60), ("paid", 100, 100, 0))
+		self.assertEqual(deltas, {"partial": [-1, -100, -40, -60], "paid": [1, 100, 100, 0]})
+
+	def test_cung_trang_thai_chi_doi_tien(self):
+		deltas = ledger.counter_deltas(("partial", 100, 40, 60), ("partial", 100, 70, 30))
+		self.assertEqual(deltas, {"partial": [0, 0, 30, -30]})
+
+	def test_khong_doi_gi(self):
+		self.assertEqual(ledger.counter_deltas(("paid", 1, 1, 0), ("paid", 1, 1, 0)), {})
+
+	def test_them_va_xoa(self):
+		self.assertEqual(ledger.counter_deltas(None, (None, 0, 0, 0)), {"": [1, 0, 0, 0]})
+		self.assertEqual(ledger.counter_deltas(("unpaid", 5, 0, 5), None), {"unpaid": [-1, -5, 0, -5]})
+
+
+class TestStatistics(unittest.TestCase):
+	def test_khoi_dashboard(self):
+		rows = [
+			{"scope": "student", "payment_status": "paid", "row_count": 3, "total_amount": 0, "paid_amount": 0, "outstanding_amount": 0},
+			{"scope": "student", "payment_status": "", "row_count": 1, "total_amount": 0, "paid_amount": 0, "outstanding_amount": 0},
+			{"scope": "order_item", "payment_status": "partial", "row_count": 2, "total_amount": 200, "paid_amount": 50, "outstanding_amount": 150},
+		]
+		stats = ledger.statistics_from_counters(rows)
+		self.assertEqual(stats["students"], {"total": 4, "paid": 3, "partial": 0, "unpaid": 0})
+		self.assertEqual(stats["payments"]["total_outstanding"], 150)
+		self.assertEqual(stats["payments"]["collection_rate"], 25.0)
+
+	def test_tinh_thang_khi_chua_co_bo_dem(self):
+		computed = {("student", "paid"): (2, 0.0, 0.0, 0.0), ("order_item", "unpaid"): (1, 100.0, 0.0, 100.0)}
+		stats = ledger.statistics_from_counters(ledger.counter_rows(computed))
+		self.assertEqual(stats["students"]["paid"], 2)
+		self.assertEqual(stats["payments"]["total_outstanding"], 100)
+
+
+class TestReconcile(unittest.TestCase):
+	def test_student_drift(self):
+		stored = {"A": (100, 40, "partial"), "B": (100, 40, "partial"), "C": (50, 0, "unpaid")}
+		expected = {"A": (100, 40), "B": (100, 100), "X": (1, 1)}
+		self.assertEqual(ledger.student_drift(stored, expected), [("B", 100, 100)])
+
+	def test_counters_differ(self):
+		stored = {("student", "paid"): (3, 0.0, 0.0, 0.0), ("student", "unpaid"): (0, 0.0, 0.0, 0.0)}
+		computed = {("student", "paid"): (2, 0.0, 0.0, 0.0), ("order_item", "paid"): (1, 10.0, 10.0, 0.0)}
+		self.assertEqual(ledger.counters_differ(stored, computed), [("order_item", "paid"), ("student", "paid")])
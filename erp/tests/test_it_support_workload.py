@@ -0,0 +1,62 @@
+"""Tải việc đội IT: chỉ mục role, phần đóng góp ticket, delta, giữ chỗ, chọn người ít việc nhất.
+
+Chỉ kiểm phần thuần — không cần site.
+"""
+
+import unittest
+
+from erp.api.erp_it_support import workload
+
+
+class TestRoleIndex(unittest.TestCase):
+	def test_gom_theo_role_giu_thu_tu(self):
+		members = [
+			{"user": "a@x", "roles_json": '["Overall","Software"]'},
+			{"user": "b@x", "roles_json": ["Software"]},
+			{"user": "a@x", "roles_json": '["Software"]'},
+			{"user": "", "roles_json": '["Overall"]'},
+			{"user": "c@x", "roles_json": "hỏng"},
+		]
+		self.assertEqual(
+			workload.build_role_index(members),
+			{"Overall": ["a@x"], "Software": ["a@x", "b@x"]},
+		)
+
+
+class TestTicketLoad(unittest.TestCase):
+	def test_chi_tinh_ticket_dang_xu_ly_co_nguoi(self):
+		self.assertEqual(workload.ticket_load({"assigned_to": "a@x", "status": "Assigned"}), {"a@x": 1})
+		self.assertEqual(workload.ticket_load({"assigned_to": "a@x", "status": "Processing"}), {"a@x": 1})
+		self.assertEqual(workload.ticket_load({"assigned_to": "a@x", "status": "Done"}), {})
+		self.assertEqual(workload.ticket_load({"assigned_to": None, "status": "Assigned"}), {})
+		self.assertEqual(workload.ticket_load(None), {})
+
+
+class TestLoadDelta(unittest.TestCase):
+	def test_chuyen_nguoi(self):
+		self.assertEqual(workload.load_delta({"a@x": 1}, {"b@x": 1}), {"a@x": -1, "b@x": 1})
+
+	def test_dong_ticket_va_khong_doi(self):
+		self.assertEqual(workload.load_delta({"a@x": 1}, {}), {"a@x": -1})
+		self.assertEqual(workload.load_delta({"a@x": 1}, {"a@x": 1}), {})
+
+
+class TestConsumeReserved(unittest.TestCase):
+	def test_tieu_giu_cho_cua_pick(self):
+		delta, reserved = workload.consume_reserved({"a@x": 1, "b@x": -1}, {"a@x": 2})
+		self.assertEqual(delta, {"b@x": -1})
+		self.assertEqual(reserved, {"a@x": 1})
+
+	def test_khong_giu_cho_thi_giu_nguyen(self):
+		src = {"a@x": 1}
+		delta, reserved = workload.consume_reserved(src, {})
+		self.assertEqual(delta, {"a@x": 1})
+		self.assertEqual(reserved, {})
+		self.assertIsNot(delta, src)
+
+
+class TestLeastLoaded(unittest.TestCase):
+	def test_it_nhat_hoa_thi_nguoi_dau(self):
+		self.assertEqual(workload.least_loaded(["a@x", "b@x", "c@x"], {"a@x": 3, "b@x": 1, "c@x": 1}), "b@x")
+		self.assertEqual(workload.least_loaded(["a@x", "b@x"], {"b@x": 2}), "a@x")
+		self.assertIsNone(workload.least_loaded([], {}))
@@ -0,0 +1,120 @@
+"""Xác thực JWT: cache principal theo token, thu hồi theo token_version của guardian.
+
+Redis và DB được giả lập bằng mock — không cần site.
+"""
+
+import time
+import unittest
+from unittest import mock
+
+import jwt
+from frappe import _dict
+
+from erp.utils import jwt_auth
+
+SECRET = "test-secret-for-hs256-unit-tests-only"
+GUARDIAN = "CRM-GUARDIAN-0001"
+PARENT = f"0912345678{jwt_auth.PARENT_EMAIL_MARKER}"
+
+
+class _FakeCache:
+	def __init__(self):
+		self.store = {}
+
+	def get_value(self, key):
+		return self.store.get(key)
+
+	def set_value(self, key, value, expires_in_sec=None):
+		self.store[key] = value
+
+	def delete_keys(self, prefix):
+		for key in [k for k in self.store if k.startswith(prefix)]:
+			del self.store[key]
+
+
+def _token(email=PARENT, token_version=1, **claims):
+	payload = {"email": email, "guardian": GUARDIAN, "token_version": token_version, "exp": int(time.time()) + 3600}
+	payload.update(claims)
+	return jwt.encode(payload, SECRET, algorithm="HS256")
+
+
+class TestPrincipalCacheKey(unittest.TestCase):
+	def test_khoa_theo_hash_token(self):
+		key = jwt_auth._principal_cache_key("abc")
+		self.assertEqual(key, jwt_auth._principal_cache_key("abc"))
+		self.assertNotEqual(key, jwt_auth._principal_cache_key("abd"))
+		self.assertTrue(key.startswith(jwt_auth.AUTH_CACHE_PREFIX + ":"))
+		self.assertNotIn("abc", key[len(jwt_auth.AUTH_CACHE_PREFIX) :])
+
+
+class TestAuthenticate(unittest.TestCase):
+	def setUp(self):
+		self.cache = _FakeCache()
+		self.header = None
+		self.guardian_row = _dict(jwt_token_version=1)
+		self.user_exists = True
+		self.exists = mock.Mock(side_effect=lambda doctype, name: self.user_exists)
+		self.get_value = mock.Mock(side_effect=lambda *a, **k: self.guardian_row)
+		patches = [
+			mock.patch.object(jwt_auth.frappe, "cache", return_value=self.cache),
+			mock.patch.object(jwt_auth, "_jwt_secret", return_value=SECRET),
+			mock.patch.object(jwt_auth, "_verify_signature_enabled", return_value=True),
+			mock.patch.object(
+				jwt_auth.frappe, "get_request_header", side_effect=lambda name: self.header, create=True
+			),
+			mock.patch.object(jwt_auth.frappe.db, "exists", self.exists, create=True),
+			mock.patch.object(jwt_auth.frappe.db, "get_value", self.get_value),
+		]
+		for p in patches:
+			p.start()
+			self.addCleanup(p.stop)
+
+	def _auth(self, token):
+		self.header = f"Bearer {token}"
+		return jwt_auth.authenticate_via_jwt()
+
+	def test_miss_roi_hit_khong_tra_user_lai(self):
+		token = _token()
+		self.assertEqual(self._auth(token), PARENT)
+		self.assertIn(jwt_auth._principal_cache_key(token), self.cache.store)
+		self.assertEqual(self._auth(token), PARENT)
+		self.assertEqual(self.exists.call_count, 1)
+
+	def test_user_khong_ton_tai_thi_khong_cache(self):
+		self.user_exists = False
+		token = _token()
+		self.assertIsNone(self._auth(token))
+		self.assertNotIn(jwt_auth._principal_cache_key(token), self.cache.store)
+
+	def test_tang_token_version_thu_hoi_ca_principal_da_cache(self):
+		token = _token(token_version=1)
+		self.assertEqual(self._auth(token), PARENT)
+		jwt_auth.set_guardian_token_version(GUARDIAN, 2)
+		# Principal vẫn nằm trong cache nhưng không được sống qua lần tăng version
+		self.assertIn(jwt_auth._principal_cache_key(token), self.cache.store)
+		self.assertIsNone(self._auth(token))
+		self.assertEqual(self._auth(_token(token_version=2)), PARENT)
+
+	def test_xoa_guardian_thu_hoi_token(self):
+		token = _token()
+		self.assertEqual(self._auth(token), PARENT)
+		jwt_auth.on_guardian_token_change(_dict(name=GUARDIAN), "on_trash")
+		self.assertIsNone(self._auth(token))
+
+	def test_xoa_bo_dem_thi_doc_lai_db(self):
+		token = _token(token_version=3)
+		jwt_auth.set_guardian_token_version(GUARDIAN, 3)
+		self.assertEqual(self._auth(token), PARENT)
+		# UPDATE hàng loạt trong DB (force logout tất cả) rồi xoá bộ đếm Redis
+		self.guardian_row = _dict(jwt_token_version=4)
+		jwt_auth.clear_guardian_token_versions()
+		self.assertIsNone(self._auth(token))
+		self.assertEqual(self.cache.get_value(jwt_auth._guardian_version_key(GUARDIAN)), 4)
+
+	def test_tai_khoan_khong_phai_phu_huynh_bo_qua_version(self):
+		self.assertEqual(self._auth(_token(email="gv@wellspring.edu.vn", token_version=9)), "gv@wellspring.edu.vn")
+		self.get_value.assert_not_called()
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,41 @@
+"""Thư viện: status phiếu mượn suy từ items — quy tắc mà UPDATE gộp của sync_overdue_status lặp lại.
+
+Chỉ kiểm phần thuần — không cần site.
+"""
+
+import datetime
+import unittest
+
+from erp.api.erp_sis.library.transactions import _transaction_status
+
+TODAY = datetime.date(2026, 1, 10)
+PAST = "2026-01-05"
+FUTURE = "2026-01-20"
+
+
+def _item(status, due_date=FUTURE):
+	return {"status": status, "due_date": due_date}
+
+
+class TestTransactionStatus(unittest.TestCase):
+	def test_khong_co_item(self):
+		self.assertIsNone(_transaction_status([], TODAY))
+
+	def test_tat_ca_da_dong(self):
+		items = [_item("returned"), _item("lost", PAST), _item("damaged")]
+		self.assertEqual(_transaction_status(items, TODAY), "returned")
+
+	def test_dang_muon_va_qua_han(self):
+		self.assertEqual(_transaction_status([_item("borrowing")], TODAY), "borrowing")
+		self.assertEqual(_transaction_status([_item("borrowing"), _item("borrowing", PAST)], TODAY), "overdue")
+		self.assertEqual(_transaction_status([_item("overdue", PAST)], TODAY), "overdue")
+
+	def test_overdue_da_gia_han_quay_ve_borrowing(self):
+		self.assertEqual(_transaction_status([_item("overdue", FUTURE)], TODAY), "borrowing")
+
+	def test_tra_mot_phan(self):
+		self.assertEqual(_transaction_status([_item("returned", PAST), _item("borrowing")], TODAY), "partial_return")
+		self.assertEqual(_transaction_status([_item("returned"), _item("borrowing", PAST)], TODAY), "overdue")
+
+	def test_han_dung_hom_nay_chua_qua_han(self):
+		self.assertEqual(_transaction_status([_item("borrowing", "2026-01-10")], TODAY), "borrowing")
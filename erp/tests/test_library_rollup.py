@@ -0,0 +1,73 @@
+"""Tổng hợp báo cáo thư viện: phần đóng góp của phiếu mượn / phạt và delta trước-sau.
+
+Chỉ kiểm phần thuần — không cần site.
+"""
+
+import datetime
+import unittest
+
+from erp.api.erp_sis.library import rollup
+
+
+def _tx(status="borrowing", borrow_date="2026-01-05", items=None):
+	return {"status": status, "borrow_date": borrow_date, "items": items or []}
+
+
+class TestTxContribution(unittest.TestCase):
+	def test_dem_theo_ngay_muon_va_ngay_tra(self):
+		tx = _tx("partial_return", items=[
+			{"status": "returned", "date_returned": "2026-01-08", "book_title": "A"},
+			{"status": "lost", "date_returned": "2026-01-09", "book_title": "B"},
+			{"status": "borrowing", "book_title": "C"},
+		])
+		self.assertEqual(rollup.tx_contribution(tx), {
+			("2026-01-05", "tx_count"): 1,
+			("2026-01-05", "partial_return_count"): 1,
+			("2026-01-09", "lost_damaged_count"): 1,
+		})
+
+	def test_tra_sach_chi_doi_cot_trang_thai(self):
+		before = _tx("borrowing", items=[{"status": "borrowing"}])
+		after = _tx("returned", items=[{"status": "damaged", "date_returned": datetime.date(2026, 1, 7)}])
+		self.assertEqual(rollup.diff(rollup.tx_contribution(before), rollup.tx_contribution(after)), {
+			("2026-01-05", "borrowing_count"): -1,
+			("2026-01-05", "returned_count"): 1,
+			("2026-01-07", "lost_damaged_count"): 1,
+		})
+
+	def test_them_va_xoa(self):
+		contrib = rollup.tx_contribution(_tx())
+		self.assertEqual(rollup.diff({}, contrib), contrib)
+		self.assertEqual(rollup.diff(contrib, {}), {k: -v for k, v in contrib.items()})
+		self.assertEqual(rollup.diff(contrib, contrib), {})
+
+
+class TestFineContribution(unittest.TestCase):
+	def test_cho_thu_theo_ngay_tao_da_thu_theo_ngay_thu(self):
+		pending = {"status": "pending", "creation": "2026-01-05 09:30:00.123", "total_amount": 20000}
+		paid = dict(pending, status="paid", paid_amount=20000, payment_date="2026-01-12")
+		self.assertEqual(rollup.fine_contribution(pending), {("2026-01-05", "pending_fine_amount"): 20000.0})
+		self.assertEqual(rollup.diff(rollup.fine_contribution(pending), rollup.fine_contribution(paid)), {
+			("2026-01-05", "pending_fine_amount"): -20000.0,
+			("2026-01-12", "paid_fine_amount"): 20000.0,
+		})
+		self.assertEqual(rollup.fine_contribution(dict(pending, status="waived")), {})
+
+
+class TestTitles(unittest.TestCase):
+	def test_gom_ten_sach_chuan_hoa(self):
+		tx = _tx(items=[{"book_title": " Dế Mèn "}, {"book_title": "dế mèn"}, {"book_title": "  "}])
+		self.assertEqual(rollup.title_contribution(tx), {("2026-01-05", "dế mèn"): 2})
+
+	def test_hash_on_dinh(self):
+		self.assertEqual(rollup.title_hash("dế mèn"), rollup.title_hash(rollup.normalize_title_key(" Dế Mèn")))
+		self.assertEqual(len(rollup.title_hash("x")), 32)
+
+
+class TestRowsByDay(unittest.TestCase):
+	def test_gom_theo_ngay(self):
+		deltas = {("2026-01-05", "tx_count"): 1, ("2026-01-05", "overdue_count"): 1, ("2026-01-06", "tx_count"): 2}
+		self.assertEqual(rollup.rows_by_day(deltas), {
+			"2026-01-05": {"tx_count": 1, "overdue_count": 1},
+			"2026-01-06": {"tx_count": 2},
+		})
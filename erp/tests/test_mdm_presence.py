@@ -0,0 +1,51 @@
+"""Presence MDM: đọc mục Redis và đè lên dòng DB khi mới hơn.
+
+Chỉ kiểm phần thuần — không cần site hay Redis.
+"""
+
+import json
+import unittest
+from datetime import datetime
+
+from erp.api.mdm import presence
+
+
+def _entry(ts, **kw):
+	return json.dumps(dict(ts=ts, **kw)).encode()
+
+
+class TestParseEntry(unittest.TestCase):
+	def test_bo_truong_rong(self):
+		seen = presence.parse_entry(_entry("2026-10-19 08:00:00", ip=None, agent_version="1.2.0"))
+		self.assertEqual(seen, {"last_heartbeat": datetime(2026, 10, 19, 8), "agent_version": "1.2.0"})
+
+
+class TestMergeSeen(unittest.TestCase):
+	def setUp(self):
+		self.seen = presence.parse_entry(_entry("2026-10-19 08:05:00", ip="10.0.0.5"))
+
+	def test_presence_moi_hon_thi_de(self):
+		row = {"name": "D1", "last_heartbeat": datetime(2026, 10, 19, 8), "last_ip": "10.0.0.1", "os_version": "11"}
+		presence.merge_seen(row, self.seen)
+		self.assertEqual(row["last_heartbeat"], datetime(2026, 10, 19, 8, 5))
+		self.assertEqual(row["last_ip"], "10.0.0.5")
+		self.assertEqual(row["os_version"], "11")
+
+	def test_db_moi_hon_thi_giu(self):
+		row = {"name": "D1", "last_heartbeat": datetime(2026, 10, 19, 9), "last_ip": "10.0.0.1"}
+		presence.merge_seen(row, self.seen)
+		self.assertEqual(row["last_ip"], "10.0.0.1")
+
+	def test_may_chua_tung_heartbeat(self):
+		row = {"name": "D1", "last_heartbeat": None, "last_ip": None}
+		presence.merge_seen(row, self.seen)
+		self.assertEqual(row["last_heartbeat"], datetime(2026, 10, 19, 8, 5))
+
+	def test_khong_them_truong_la(self):
+		row = {"name": "D1", "last_heartbeat": None}
+		presence.merge_seen(row, self.seen)
+		self.assertNotIn("last_ip", row)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,63 @@
+"""Telemetry MDM: khung 5 phút / giờ, chọn độ phân giải, chuẩn hoá mẫu trước INSERT.
+
+Chỉ kiểm phần thuần — không cần site.
+"""
+
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from erp.api.mdm import telemetry, telemetry_rollup
+
+
+class TestBucketStart(unittest.TestCase):
+	def test_khung_5_phut_va_gio(self):
+		ts = datetime(2026, 10, 18, 9, 47, 31)
+		self.assertEqual(telemetry_rollup.bucket_start(ts), datetime(2026, 10, 18, 9, 45))
+		self.assertEqual(telemetry_rollup.bucket_start(ts, telemetry_rollup.HOURLY), datetime(2026, 10, 18, 9, 0))
+
+	def test_dung_bien_khung(self):
+		ts = datetime(2026, 10, 18, 10, 0, 0)
+		self.assertEqual(telemetry_rollup.bucket_start(ts), ts)
+
+
+class TestPickResolution(unittest.TestCase):
+	NOW = datetime(2026, 10, 18, 12, 0)
+
+	def _pick(self, start, end):
+		with mock.patch.object(telemetry, "now_datetime", return_value=self.NOW):
+			return telemetry.pick_resolution(start, end)
+
+	def test_khoang_ngan_gan_day_doc_mau_tho(self):
+		self.assertEqual(self._pick(self.NOW - timedelta(hours=2), self.NOW), "raw")
+
+	def test_khoang_ngan_nhung_qua_ttl_mau_tho_doc_5_phut(self):
+		start = self.NOW - timedelta(days=20)
+		self.assertEqual(self._pick(start, start + timedelta(hours=2)), telemetry_rollup.FIVE_MIN)
+
+	def test_tuan_va_thang(self):
+		self.assertEqual(self._pick(self.NOW - timedelta(days=7), self.NOW), telemetry_rollup.FIVE_MIN)
+		self.assertEqual(self._pick(self.NOW - timedelta(days=30), self.NOW), telemetry_rollup.HOURLY)
+
+
+class TestSampleRow(unittest.TestCase):
+	def test_ep_kieu_nhu_doc(self):
+		row = telemetry._sample_row("DEV-1", {
+			"captured_at": "2026-10-18 09:00:00", "cpu_pct": "12.5", "battery_pct": "80",
+			"disk_health": "warning", "cpu_temp": 0,
+		})
+		values = dict(zip(telemetry._SAMPLE_COLUMNS, row))
+		self.assertEqual(values["device"], "DEV-1")
+		self.assertEqual(values["captured_at"], datetime(2026, 10, 18, 9, 0))
+		self.assertEqual(values["cpu_pct"], 12.5)
+		self.assertEqual(values["battery_pct"], 80)
+		self.assertEqual(values["disk_health"], "warning")
+		self.assertIsNone(values["cpu_temp"])
+
+	def test_disk_health_la_thanh_unknown(self):
+		row = telemetry._sample_row("DEV-1", {"captured_at": "2026-10-18 09:00:00", "disk_health": "bad"})
+		self.assertEqual(row[telemetry._DISK_HEALTH_IDX], "unknown")
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,67 @@
+"""Giải người nhận thông báo theo tập: roster lớp, giải stage/grade/class, gom phụ huynh.
+
+Chỉ kiểm phần thuần — không cần site hay Redis.
+"""
+
+import json
+import unittest
+
+from erp.utils import notification_recipients as nr
+
+
+def _rosters():
+	return {
+		"SY-2025": nr.build_roster([
+			("C1", "G1", "ST1", "S1"),
+			("C1", "G1", "ST1", "S2"),
+			("C2", "G2", "ST1", "S3"),
+			("C3", "G3", "ST2", "S4"),
+			("C3", "G3", "ST2", None),
+		]),
+		"SY-2024": nr.build_roster([("C0", "G1", "ST1", "S9")]),
+	}
+
+
+class TestRoster(unittest.TestCase):
+	def test_gom_theo_lop_bo_trung_va_rong(self):
+		roster = nr.build_roster([("C1", "G1", "ST1", "S1"), ("C1", "G1", "ST1", "S1"), ("C2", "G2", None, None)])
+		self.assertEqual(roster, {"C1": ["G1", "ST1", ["S1"]], "C2": ["G2", None, []]})
+
+
+class TestStudentsForRecipients(unittest.TestCase):
+	def test_lop_khoi_cap_va_hoc_sinh(self):
+		students, _ = nr.students_for_recipients([{"id": "C3", "type": "class"}], _rosters())
+		self.assertEqual(students, {"S4"})
+		# Khối không lọc năm học — giữ phạm vi cũ
+		students, _ = nr.students_for_recipients([{"id": "G1", "type": "grade"}], _rosters())
+		self.assertEqual(students, {"S1", "S2", "S9"})
+		students, counts = nr.students_for_recipients(
+			[{"id": "ST1", "type": "stage"}, {"id": "S7", "type": "student"}], _rosters()
+		)
+		self.assertEqual(students, {"S1", "S2", "S3", "S9", "S7"})
+		self.assertEqual(counts[("stage", "ST1")], 4)
+
+	def test_toan_truong_va_muc_thieu_thong_tin(self):
+		students, _ = nr.students_for_recipients(
+			[{"id": "x", "type": "school"}, {"id": None, "type": "class"}], _rosters()
+		)
+		self.assertEqual(students, {"S1", "S2", "S3", "S4", "S9"})
+
+
+class TestGuardians(unittest.TestCase):
+	def test_gom_phu_huynh_theo_thu_tu_hoc_sinh(self):
+		by_student = {"S1": [["G-A", "PH01"]], "S2": [["G-A", "PH01"], ["G-B", "PH02"]], "S3": []}
+		out = nr.group_by_guardian(["S1", "S2", "S3"], by_student)
+		self.assertEqual([g["guardian_name"] for g in out], ["G-A", "G-B"])
+		self.assertEqual(out[0]["student_ids"], ["S1", "S2"])
+		self.assertEqual(out[1]["email"], "PH02@parent.wellspring.edu.vn")
+
+	def test_muc_cache_qua_han_bi_bo(self):
+		raw = json.dumps({"t": 1000.0, "g": [["G-A", "PH01"]]})
+		self.assertEqual(nr._parse_guardians(raw, 1000.0 + 60), [["G-A", "PH01"]])
+		self.assertIsNone(nr._parse_guardians(raw, 1000.0 + nr.GUARDIANS_TTL_SEC + 1))
+		self.assertIsNone(nr._parse_guardians(None, 1000.0))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,132 @@
+"""Tái ghi danh: lập kế hoạch tạo/cập nhật đơn theo tập, tên series, UPDATE CASE, map payment status.
+
+Chỉ kiểm phần thuần — không cần site.
+"""
+
+import re
+import unittest
+from unittest import mock
+
+from frappe import _dict
+
+from erp.api.erp_sis import re_enrollment as re_enroll
+
+
+def _student(student_id, code, name="HS", class_title="10A1", **extra):
+	return _dict(student_id=student_id, student_code=code, student_name=name, class_title=class_title, **extra)
+
+
+class TestSnapshotUpdates(unittest.TestCase):
+	def test_ghi_de_ban_sao_hoc_sinh(self):
+		current = {"student_code": "OLD", "student_name": "HS", "current_class": "9A1"}
+		self.assertEqual(
+			re_enroll._snapshot_updates(current, _student("S1", "NEW")),
+			{"student_code": "NEW", "current_class": "10A1"},
+		)
+
+	def test_link_chi_dien_khi_trong(self):
+		current = {"student_code": "C", "student_name": "HS", "current_class": "10A1", "guardian_id": "G0"}
+		student = _student("S1", "C", finance_student_id="FS1")
+		self.assertEqual(
+			re_enroll._snapshot_updates(current, student, ("G1", "Phụ huynh")),
+			{"finance_student_id": "FS1"},
+		)
+		current["guardian_id"] = None
+		self.assertEqual(
+			re_enroll._snapshot_updates(current, _student("S1", "C"), ("G1", "Phụ huynh")),
+			{"guardian_id": "G1", "guardian_name": "Phụ huynh"},
+		)
+
+
+class TestPlanStudentRecords(unittest.TestCase):
+	def test_chia_tao_moi_va_cap_nhat(self):
+		existing = {
+			"S1": {"name": "SIS-REENROLL-00001", "student_code": "A", "student_name": "HS", "current_class": "10A1"},
+			"S2": {"name": "SIS-REENROLL-00002", "student_code": "OLD", "student_name": "HS", "current_class": "10A1"},
+		}
+		students = [_student("S1", "A"), _student("S2", "B"), _student("S3", "C"), _student("S3", "C2")]
+		new_students, updates = re_enroll._plan_student_records(students, existing, {})
+		self.assertEqual([s.student_id for s in new_students], ["S3"])
+		self.assertEqual(new_students[0].student_code, "C")
+		self.assertEqual(updates, {"SIS-REENROLL-00002": {"student_code": "B"}})
+
+
+class TestNewRecordValues(unittest.TestCase):
+	def test_theo_thu_tu_cot(self):
+		student = _student("S1", "C", class_title=None, class_name="CLS-1", student_campus_id="CAMPUS-2")
+		values = re_enroll._new_record_values("N1", "CFG", "CAMPUS-1", student, ("G1", "PH"), "t", "u")
+		row = dict(zip(re_enroll.RE_ENROLLMENT_INSERT_COLUMNS, values, strict=True))
+		self.assertEqual(len(values), len(re_enroll.RE_ENROLLMENT_INSERT_COLUMNS))
+		self.assertEqual(row["current_class"], "CLS-1")
+		self.assertEqual(row["campus_id"], "CAMPUS-2")
+		self.assertEqual((row["guardian_id"], row["guardian_name"]), ("G1", "PH"))
+		self.assertEqual((row["payment_status"], row["docstatus"]), ("unpaid", 0))
+
+	def test_campus_roi_ve_campus_dot(self):
+		values = re_enroll._new_record_values("N1", "CFG", "CAMPUS-1", _student("S1", "C"), None, "t", "u")
+		row = dict(zip(re_enroll.RE_ENROLLMENT_INSERT_COLUMNS, values, strict=True))
+		self.assertEqual(row["campus_id"], "CAMPUS-1")
+		self.assertIsNone(row["guardian_id"])
+
+
+	def test_cau_insert_khop_thu_tu_cot(self):
+		header = re_enroll._RE_ENROLLMENT_INSERT_SQL
+		cols = tuple(re.findall(r"`(\w+)`", header[header.index("(") :]))
+		self.assertEqual(cols, re_enroll.RE_ENROLLMENT_INSERT_COLUMNS)
+
+
+class TestSeriesNames(unittest.TestCase):
+	def test_tiep_theo_so_hien_tai(self):
+		self.assertEqual(
+			re_enroll._series_names("SIS-REENROLL-", 41, 2),
+			["SIS-REENROLL-00042", "SIS-REENROLL-00043"],
+		)
+		self.assertEqual(re_enroll._series_names("P-", 0, 0), [])
+
+
+class TestCaseUpdateSql(unittest.TestCase):
+	def test_moi_cot_chi_doi_o_don_co_field(self):
+		sql, params = re_enroll._case_update_sql({
+			"R1": {"student_code": "A"},
+			"R2": {"student_code": "B", "current_class": "10A2"},
+		})
+		self.assertIn("`current_class` = CASE name WHEN %(n1)s THEN %(v1_current_class)s ELSE `current_class` END", sql)
+		self.assertIn("WHEN %(n0)s THEN %(v0_student_code)s WHEN %(n1)s THEN %(v1_student_code)s", sql)
+		self.assertTrue(sql.endswith("WHERE name IN (%(n0)s, %(n1)s)"))
+		self.assertNotIn("modified", sql)
+		self.assertEqual((params["n0"], params["v1_current_class"]), ("R1", "10A2"))
+
+
+class TestMapPaymentStatus(unittest.TestCase):
+	def test_giu_nguyen_hoac_unpaid(self):
+		for status in ("paid", "partial", "unpaid"):
+			self.assertEqual(re_enroll._map_payment_status(status), status)
+		self.assertEqual(re_enroll._map_payment_status("no_fee"), "unpaid")
+		self.assertEqual(re_enroll._map_payment_status(None), "unpaid")
+
+
+class TestEnqueueSyncJob(unittest.TestCase):
+	def _run(self, already_running):
+		with mock.patch(
+			"frappe.utils.background_jobs.is_job_enqueued", return_value=already_running
+		), mock.patch.object(re_enroll.frappe, "enqueue") as enqueue, mock.patch.object(
+			re_enroll, "_set_job_state"
+		) as set_state, mock.patch.object(re_enroll.frappe, "session", _dict(user="admin@x"), create=True):
+			job = re_enroll._enqueue_sync_job("sync_students", "CFG-1")
+		return job, enqueue, set_state
+
+	def test_job_moi_ghi_queued_roi_enqueue(self):
+		job, enqueue, set_state = self._run(False)
+		self.assertEqual((job["status"], job["already_running"]), ("queued", False))
+		self.assertEqual(job["job_id"], "re_enrollment_sync_students_CFG-1")
+		set_state.assert_called_once()
+		self.assertEqual(set_state.call_args[0][1]["status"], "queued")
+		enqueue.assert_called_once()
+		self.assertNotIn("enqueue_after_commit", enqueue.call_args.kwargs)
+		self.assertEqual(enqueue.call_args.kwargs["job_id"], job["job_id"])
+
+	def test_dang_chay_thi_khong_enqueue(self):
+		job, enqueue, set_state = self._run(True)
+		self.assertEqual((job["status"], job["already_running"]), ("running", True))
+		enqueue.assert_not_called()
+		set_state.assert_not_called()
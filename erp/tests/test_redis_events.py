@@ -0,0 +1,78 @@
+"""Event bus: publish_many gom PUBLISH + XADD vào pipeline, đếm event thành công.
+
+Không cần Redis — client giả ghi lại lệnh của pipeline.
+"""
+
+import json
+import unittest
+
+from erp.common import redis_events
+
+
+class _Pipe:
+	def __init__(self, client):
+		self.client = client
+		self.commands = []
+
+	def publish(self, channel, body):
+		self.commands.append(("publish", channel, body))
+
+	def xadd(self, key, fields, maxlen=None, approximate=False):
+		self.commands.append(("xadd", key, fields["payload"]))
+
+	def execute(self, raise_on_error=True):
+		self.client.executes += 1
+		self.client.commands.extend(self.commands)
+		return [self.client.fail.get(i, 1) for i in range(len(self.commands))]
+
+
+class _Client:
+	def __init__(self, fail=None):
+		self.commands = []
+		self.executes = 0
+		self.fail = fail or {}
+
+	def pipeline(self, transaction=True):
+		return _Pipe(self)
+
+
+class TestCountOk(unittest.TestCase):
+	def test_event_loi_khi_mot_lenh_loi(self):
+		results = [1, "1-0", ValueError("x"), "2-0", 1, "3-0"]
+		self.assertEqual(redis_events.count_ok([2, 2, 2], results), 2)
+
+	def test_mot_lenh_moi_event(self):
+		self.assertEqual(redis_events.count_ok([1, 1], [1, RuntimeError()]), 1)
+
+
+class TestPublishMany(unittest.TestCase):
+	def test_both_gom_mot_round_trip(self):
+		client = _Client()
+		events = [("user_events", {"type": "a"}), ("user_events", {"type": "b"})]
+		self.assertEqual(redis_events.publish_many(events, client=client, mode="both"), 2)
+		self.assertEqual(client.executes, 1)
+		self.assertEqual([c[0] for c in client.commands], ["publish", "xadd", "publish", "xadd"])
+		self.assertEqual(client.commands[1][1], "events:user_events")
+		body = json.loads(client.commands[0][2])
+		self.assertTrue(body["eventId"])
+		self.assertEqual(client.commands[0][2], client.commands[1][2])
+
+	def test_chia_chunk_theo_pipeline_chunk(self):
+		client = _Client()
+		n = redis_events.PIPELINE_CHUNK * 2 + 1
+		events = [("c", {"i": i}) for i in range(n)]
+		self.assertEqual(redis_events.publish_many(events, client=client, mode="pubsub"), n)
+		self.assertEqual(client.executes, 3)
+
+	def test_pubsub_khong_chen_event_id(self):
+		client = _Client()
+		redis_events.publish_many([("room_events", {"type": "room_updated"})], client=client, mode="pubsub", event_id=False)
+		self.assertEqual(json.loads(client.commands[0][2]), {"type": "room_updated"})
+
+	def test_dem_loi_tung_event(self):
+		client = _Client(fail={1: RuntimeError("stream")})
+		events = [("c", {"i": 1}), ("c", {"i": 2})]
+		self.assertEqual(redis_events.publish_many(events, client=client, mode="both"), 1)
+
+	def test_rong(self):
+		self.assertEqual(redis_events.publish_many([], client=_Client()), 0)
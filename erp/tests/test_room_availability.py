@@ -0,0 +1,46 @@
+"""Tìm phòng trống: phép trừ khoảng và cắt khoảng theo ngày.
+
+Chỉ kiểm phần thuần — không cần site hay Redis.
+"""
+
+import unittest
+from datetime import date, datetime
+
+from erp.api.erp_administrative import room_availability as ra
+
+
+class TestFreeSlots(unittest.TestCase):
+	def test_gop_khoang_chong_lan_roi_tru(self):
+		busy = [(480, 540, "booking", "B1"), (530, 600, "timetable", "C1"), (720, 780, "ticket", "T1")]
+		self.assertEqual(ra.free_slots(420, 1020, busy, 30), [(420, 480), (600, 720), (780, 1020)])
+
+	def test_khoang_ngan_hon_duration_bi_loai(self):
+		busy = [(480, 540, "booking", "B1"), (560, 600, "booking", "B2")]
+		self.assertEqual(ra.free_slots(480, 600, busy, 30), [])
+		self.assertEqual(ra.free_slots(480, 600, busy, 20), [(540, 560)])
+
+	def test_khoang_ban_ngoai_gio_mo_bo_qua(self):
+		busy = [(300, 400, "timetable", "C1"), (1100, 1200, "booking", "B1")]
+		self.assertEqual(ra.free_slots(420, 1020, busy, 60), [(420, 1020)])
+
+	def test_khoang_ban_tran_dau_gio_mo(self):
+		busy = [(400, 500, "booking", "B1")]
+		self.assertEqual(ra.free_slots(420, 600, busy, 60), [(500, 600)])
+
+
+class TestSplitByDay(unittest.TestCase):
+	def test_mot_ngay(self):
+		self.assertEqual(
+			ra._split_by_day(datetime(2026, 10, 19, 8), datetime(2026, 10, 19, 9, 30)),
+			[(date(2026, 10, 19), 480, 570)],
+		)
+
+	def test_qua_dem(self):
+		self.assertEqual(
+			ra._split_by_day(datetime(2026, 10, 19, 22), datetime(2026, 10, 21, 0)),
+			[(date(2026, 10, 19), 1320, 1440), (date(2026, 10, 20), 0, 1440)],
+		)
+
+
+if __name__ == "__main__":
+	unittest.main()
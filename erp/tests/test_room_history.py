@@ -0,0 +1,52 @@
+"""Lịch sử phòng: dựng phiên bản từ Version cho backfill.
+
+Chỉ kiểm phần tái dựng thuần — không cần site.
+"""
+
+import json
+import unittest
+from datetime import datetime
+
+from frappe import _dict
+
+from erp.api.erp_administrative import room_history
+
+
+def _version(ts, *changed):
+	return _dict(creation=ts, owner="editor@x", data=json.dumps({"changed": [list(c) for c in changed]}))
+
+
+class TestRevisionsFromVersions(unittest.TestCase):
+	def setUp(self):
+		fields = room_history.TRACKED_FIELDS[room_history.ROOM]
+		self.current = _dict({fn: None for fn in fields})
+		self.current.update(
+			name="R1", creation=datetime(2026, 1, 1, 8), owner="admin@x",
+			building_id="B2", capacity=40, is_active=1,
+		)
+
+	def test_moi_version_mot_phien_ban_lien_tiep(self):
+		versions = [
+			_version(datetime(2026, 2, 1), ("capacity", 30, 35)),
+			_version(datetime(2026, 3, 1), ("building_id", "B1", "B2"), ("capacity", 35, 40)),
+		]
+		revs = room_history._revisions_from_versions(room_history.ROOM, self.current, versions)
+		self.assertEqual([(r[0], r[1]) for r in revs], [
+			(datetime(2026, 1, 1, 8), datetime(2026, 2, 1)),
+			(datetime(2026, 2, 1), datetime(2026, 3, 1)),
+			(datetime(2026, 3, 1), None),
+		])
+		self.assertEqual((revs[0][2]["building_id"], revs[0][2]["capacity"]), ("B1", 30))
+		self.assertEqual((revs[1][2]["building_id"], revs[1][2]["capacity"]), ("B1", 35))
+		self.assertEqual(revs[2][2]["capacity"], 40)
+		self.assertEqual(revs[0][3], "admin@x")
+
+	def test_version_khong_dung_field_theo_doi_thi_bo_qua(self):
+		versions = [_version(datetime(2026, 2, 1), ("modified", "a", "b"))]
+		revs = room_history._revisions_from_versions(room_history.ROOM, self.current, versions)
+		self.assertEqual(len(revs), 1)
+		self.assertIsNone(revs[0][1])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,65 @@
+"""Schedule engine: quy tắc hiệu lực pattern/override và mở rộng khoảng ngày.
+
+Chỉ kiểm phần biên dịch trên dòng dựng sẵn — không cần site.
+"""
+
+import unittest
+from datetime import date
+
+from frappe import _dict
+
+from erp.api.erp_sis.timetable import schedule_engine
+
+
+def _row(name, day, column, valid_from=None, valid_to=None, on_date=None):
+	return _dict(
+		name=name, day_of_week=day, date=on_date, valid_from=valid_from, valid_to=valid_to,
+		timetable_column_id=column, subject_id=f"SUB-{name}", teachers=(f"T-{name}",)
+	)
+
+
+class TestCompileRows(unittest.TestCase):
+	def test_pattern_moi_nhat_thang_khi_chong_nhau(self):
+		compiled = schedule_engine.compile_rows([
+			_row("old", "mon", "C1"),
+			_row("new", "mon", "C1", valid_from=date(2026, 9, 14)),
+		])
+		self.assertEqual([r.name for r in compiled.rows_on(date(2026, 9, 7))], ["old"])
+		self.assertEqual([r.name for r in compiled.rows_on(date(2026, 9, 14))], ["new"])
+
+	def test_override_thay_pattern_chi_ngay_do(self):
+		compiled = schedule_engine.compile_rows([
+			_row("p", "tue", "C1"),
+			_row("o", "tue", "C1", on_date=date(2026, 9, 8)),
+		])
+		self.assertEqual([r.name for r in compiled.rows_on(date(2026, 9, 8))], ["o"])
+		self.assertEqual([r.name for r in compiled.rows_on(date(2026, 9, 15))], ["p"])
+
+	def test_null_chan_theo_instance(self):
+		compiled = schedule_engine.compile_rows(
+			[_row("p", "wed", "C1")], start_date="2026-09-01", end_date="2026-09-30"
+		)
+		self.assertEqual(compiled.rows_on(date(2026, 10, 7)), [])
+		self.assertEqual(len(compiled.rows_on(date(2026, 9, 30))), 1)
+
+	def test_expand_khop_tung_ngay(self):
+		rows = [
+			_row("a", "mon", "C1", valid_to=date(2026, 10, 4)),
+			_row("b", "mon", "C1", valid_from=date(2026, 10, 5)),
+			_row("c", "thứ 6", "C2", valid_from=date(2026, 9, 10), valid_to=date(2026, 11, 1)),
+			_row("o", "fri", "C2", on_date=date(2026, 9, 18)),
+		]
+		compiled = schedule_engine.compile_rows(rows, start_date="2026-09-01", end_date="2026-12-31")
+		start, end = date(2026, 8, 25), date(2026, 12, 20)
+		expected = []
+		for ordinal in range(start.toordinal(), end.toordinal() + 1):
+			day = date.fromordinal(ordinal)
+			expected.extend((day, r.name) for r in compiled.rows_on(day))
+		got = [(day, r.name) for day, r in compiled.expand(start, end)]
+		self.assertEqual(sorted(got), sorted(expected))
+		self.assertIn((date(2026, 9, 18), "o"), got)
+		self.assertNotIn((date(2026, 9, 18), "c"), got)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,119 @@
+"""Sync phân công from_date set-based: index override theo slot, diff trong bộ nhớ, gom xung đột.
+
+Chỉ kiểm phần thuần (index_override_rows / plan_override_changes) và thứ tự ghi của
+batch_sync_assignments (tra DB giả lập bằng mock) — không cần site.
+"""
+
+import datetime
+import unittest
+from unittest import mock
+
+import frappe
+
+from erp.api.erp_sis.subject_assignment import timetable_sync_v2
+from erp.api.erp_sis.subject_assignment.timetable_sync_v2 import (
+	group_conflicts_by_subject,
+	index_override_rows,
+	override_slot_key,
+	plan_override_changes,
+)
+
+D1 = datetime.date(2026, 1, 5)
+D2 = datetime.date(2026, 1, 12)
+
+
+def _pattern(name="P1", parent="INST-1", subject="SUBJ-1"):
+	return frappe._dict(
+		name=name, parent=parent, subject_id=subject, day_of_week="mon",
+		timetable_column_id="COL-1", period_name="Tiết 1",
+	)
+
+
+def _override(name, date, t1=None, t2=None, parent="INST-1", pti=None, subject="SUBJ-1"):
+	return frappe._dict(
+		name=name, parent=parent, parent_timetable_instance=pti, date=date, day_of_week="mon",
+		timetable_column_id="COL-1", subject_id=subject, teacher_1_id=t1, teacher_2_id=t2,
+	)
+
+
+class TestIndex(unittest.TestCase):
+	def test_giu_ban_moi_nhat_va_index_ca_hai_instance(self):
+		rows = [_override("NEW", D1, parent="INST-2", pti="INST-1"), _override("OLD", D1)]
+		index = index_override_rows(rows, [{"parent": "NEW", "teacher_id": "T1"}])
+		slots = index["slots"]
+		self.assertEqual(slots[override_slot_key("INST-1", D1, "mon", "COL-1", "SUBJ-1")]["name"], "NEW")
+		self.assertEqual(slots[override_slot_key("INST-2", "2026-01-05", "mon", "COL-1", "SUBJ-1")]["name"], "NEW")
+		self.assertEqual(index["teachers"], {"NEW": ["T1"]})
+
+
+class TestPlan(unittest.TestCase):
+	def test_tao_moi_copy_giao_vien_pattern(self):
+		index = index_override_rows([], [{"parent": "P1", "teacher_id": "T1"}])
+		plan = plan_override_changes("T9", [(D1, _pattern()), (D2, _pattern())], index)
+		self.assertEqual([(d, teachers) for d, _, teachers in plan["creates"]], [(D1, ["T1", "T9"]), (D2, ["T1", "T9"])])
+		self.assertEqual(plan["updates"], {})
+
+	def test_bo_qua_khi_da_co_giao_vien(self):
+		index = index_override_rows(
+			[_override("O1", D1)],
+			[{"parent": "P1", "teacher_id": "T9"}, {"parent": "O1", "teacher_id": "T9"}],
+		)
+		plan = plan_override_changes("T9", [(D1, _pattern()), (D2, _pattern())], index)
+		self.assertEqual((plan["creates"], plan["updates"]), ([], {}))
+
+	def test_them_dong_giang_vao_override_co_san(self):
+		index = index_override_rows([_override("O1", D1, t1="T1")], [{"parent": "O1", "teacher_id": "T1"}])
+		plan = plan_override_changes("T9", [(D1, _pattern())], index)
+		self.assertEqual(plan["updates"], {"O1": ["T1", "T9"]})
+
+	def test_xung_dot_va_giai_quyet_theo_mon(self):
+		index = index_override_rows([_override("O1", D1, t1="T1", t2="T2")], [])
+		plan = plan_override_changes("T9", [(D1, _pattern())], index)
+		self.assertEqual(plan["updates"], {})
+		self.assertEqual(plan["conflicts"][0]["row_id"], "O1")
+
+		resolved = plan_override_changes("T9", [(D1, _pattern())], index, resolution_by_subject={"SUBJ-1": "teacher_2"})
+		self.assertEqual((resolved["conflicts"], resolved["updates"]), ([], {"O1": ["T1", "T9"]}))
+
+		by_row = plan_override_changes("T9", [(D1, _pattern())], index, replace_teacher_map={"O1": "teacher_1"})
+		self.assertEqual(by_row["updates"], {"O1": ["T9", "T2"]})
+
+
+class TestGroupConflicts(unittest.TestCase):
+	def test_mot_xung_dot_moi_mon(self):
+		conflicts = [
+			{"row_id": "O1", "subject_id": "S1"},
+			{"row_id": "O2", "subject_id": "S1"},
+			{"row_id": "O3", "subject_id": "S2"},
+		]
+		grouped = group_conflicts_by_subject(conflicts)
+		self.assertEqual([(c["conflict_key"], c["affected_row_ids"]) for c in grouped], [("S1", ["O1", "O2"]), ("S2", ["O3"])])
+
+
+class TestBatchOrder(unittest.TestCase):
+	def test_giu_thu_tu_dau_vao_quanh_full_year(self):
+		kinds = {"A": "from_date", "B": "full_year", "C": "from_date", "D": "from_date"}
+		calls = []
+
+		def load(assignment_id):
+			return frappe._dict(name=assignment_id, application_type=kinds[assignment_id], class_id="CLS-1"), None
+
+		def apply(assignment, specs, slot_index, debug_info=None):
+			calls.append(assignment.name)
+			return {"success": True}
+
+		def full_year(assignment):
+			calls.append(assignment.name)
+			return {"success": True}
+
+		with mock.patch.object(timetable_sync_v2, "load_assignment_for_sync", side_effect=load), mock.patch.object(
+			timetable_sync_v2, "build_date_range_specs", return_value=[("spec",)]
+		), mock.patch.object(timetable_sync_v2, "load_override_index", return_value={}) as load_index, mock.patch.object(
+			timetable_sync_v2, "apply_date_range_specs", side_effect=apply
+		), mock.patch.object(timetable_sync_v2, "sync_full_year_assignment", side_effect=full_year):
+			out = timetable_sync_v2.batch_sync_assignments(["A", "B", "C", "D"])
+
+		self.assertEqual(calls, ["A", "B", "C", "D"])
+		# C, D liền nhau cùng lớp -> chung một lần đọc index; A tách riêng vì B chen giữa
+		self.assertEqual(load_index.call_count, 2)
+		self.assertEqual(out["succeeded"], 4)
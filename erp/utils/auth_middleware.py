@@ -62,7 +62,8 @@ def jwt_auth_middleware():
                     frappe.local.login_manager.user = user_email
                 except Exception:
                     pass
-                frappe.logger().info(f"🔑 Global JWT auth (token priority): Set user {user_email}")
+                # debug, không phải info: dòng này chạy ở MỌI request có Bearer
+                frappe.logger().debug(f"🔑 Global JWT auth (token priority): Set user {user_email}")
                 frappe.local.jwt_authenticated = True
                 return
             # Token sai/hết hạn: không return — cho phép dùng cookie session bên dưới
@@ -79,7 +80,7 @@ def jwt_auth_middleware():
                 frappe.local.login_manager.user = user_email
             except Exception:
                 pass
-            frappe.logger().info(f"🔑 Global JWT auth: Set user {user_email}")
+            frappe.logger().debug(f"🔑 Global JWT auth: Set user {user_email}")
             frappe.local.jwt_authenticated = True
 
     except Exception as e:
@@ -112,8 +112,15 @@ def rebuild_guardian_relationship_mirror(guardian_name):
     """
     if not guardian_name or not frappe.db.exists("CRM Guardian", guardian_name):
         return
+    from erp.utils.notification_recipients import invalidate_students
+
     rows = canonical_relationship_rows(guardian=guardian_name)
     guardian_doc = frappe.get_doc("CRM Guardian", guardian_name)
+    # Cache phụ huynh theo học sinh (thông báo): cả học sinh vừa gỡ lẫn vừa thêm
+    invalidate_students(
+        {r.get("student") for r in guardian_doc.get("student_relationships") or []}
+        | {r.get("student") for r in rows}
+    )
     guardian_doc.set("student_relationships", [])
     for r in rows:
         guardian_doc.append("student_relationships", _mirror_row(r))
@@ -125,6 +132,10 @@ def rebuild_student_relationship_mirror(student_name):
     """Dựng lại CRM Student.family_relationships từ các dòng chuẩn của học sinh."""
     if not student_name or not frappe.db.exists("CRM Student", student_name):
         return
+    from erp.utils.notification_recipients import invalidate_students
+
+    # Dòng chuẩn vừa đổi (nhiều chỗ sửa bằng SQL thô) — cache phụ huynh theo học sinh cũ
+    invalidate_students([student_name])
     rows = canonical_relationship_rows(student=student_name)
     student_doc = frappe.get_doc("CRM Student", student_name)
     student_doc.set("family_relationships", [])
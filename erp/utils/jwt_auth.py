@@ -1,26 +1,81 @@
 # Copyright (c) 2024, Wellspring International School and contributors
 # For license information, please see license.txt
 
+import hashlib
+import time
+
 import frappe
 import jwt
 from frappe import _
-import time
+
+# ===== CACHE XÁC THỰC JWT =====
+# Middleware chạy TRƯỚC MỌI request. App phụ huynh gọi nhiều API mỗi màn hình, mỗi
+# lần lại `exists('User')` + `get_value('CRM Guardian', jwt_token_version)` — hai
+# query DB chỉ để biết "ai đang gọi". Token không đổi giữa các lần gọi nên kết quả
+# giải mã + tra User được cache theo sha256(token).
+#
+# - Chữ ký chỉ kiểm MỘT lần cho mỗi token (lúc miss), sau đó tin bản cache.
+# - TTL = min(exp của token, AUTH_CACHE_MAX_TTL). Token sống 365 ngày nên không cap
+#   thì User bị xoá vẫn đăng nhập được tới khi token hết hạn; 1 giờ đủ cho hit rate
+#   gần tuyệt đối với phiên đang dùng app.
+# - Thu hồi (force logout) KHÔNG phụ thuộc TTL: bản cache lưu token_version, mỗi
+#   request so với bộ đếm phiên bản của guardian trong Redis (1 GET, miss mới đọc DB).
+AUTH_CACHE_PREFIX = "jwt_auth:principal"
+AUTH_CACHE_MAX_TTL = 3600
+GUARDIAN_VERSION_PREFIX = "jwt_auth:guardian_ver"
+GUARDIAN_VERSION_TTL = 86400
+# Guardian đã bị xoá — phiên bản thật luôn >= 1 nên 0 không bao giờ khớp token.
+_GUARDIAN_GONE = 0
+
+PARENT_EMAIL_MARKER = "@parent.wellspring.edu.vn"
+
+
+def _jwt_secret():
+    return (
+        frappe.conf.get("jwt_secret")
+        or frappe.get_site_config().get("jwt_secret")
+        or "default_jwt_secret_change_in_production"
+    )
+
+
+def _verify_signature_enabled():
+    """Tắt khẩn cấp qua site_config `jwt_auth_verify_signature: 0` nếu có nguồn token lạ."""
+    return bool(frappe.conf.get("jwt_auth_verify_signature", 1))
 
 
-def decode_jwt_token(token):
+def _strip_bearer(token):
+    token = (token or "").strip()
+    if token.startswith('Bearer '):
+        token = token[7:].strip()
+    return token
+
+
+def _principal_cache_key(token):
+    return f"{AUTH_CACHE_PREFIX}:{hashlib.sha256(token.encode('utf-8')).hexdigest()}"
+
+
+def _guardian_version_key(guardian_name):
+    return f"{GUARDIAN_VERSION_PREFIX}:{guardian_name}"
+
+
+def decode_jwt_token(token, verify_signature=None):
     """
-    Decode JWT token and return payload
-    This is for internal use only - we trust tokens issued by our own system
+    Decode JWT token and return payload.
+
+    Mặc định KIỂM chữ ký HS256 bằng `jwt_secret` — mọi nơi phát token trong app
+    (`generate_jwt_token`, `generate_guardian_jwt_token`) đều ký bằng khoá này.
+    Nhờ cache theo token nên việc kiểm chỉ xảy ra một lần cho mỗi token.
     """
     try:
-        # Remove "Bearer " prefix if present
-        if token.startswith('Bearer '):
-            token = token[7:]
-        
-        # Decode without verification for now (since we control the issuer)
-        # In production, you should verify the signature
-        payload = jwt.decode(token, options={"verify_signature": False})
-        
+        token = _strip_bearer(token)
+        if verify_signature is None:
+            verify_signature = _verify_signature_enabled()
+
+        if verify_signature:
+            payload = jwt.decode(token, _jwt_secret(), algorithms=["HS256"])
+        else:
+            payload = jwt.decode(token, options={"verify_signature": False})
+
         # Check expiration
         if payload.get('exp') and payload['exp'] < time.time():
             frappe.logger().warning("JWT token has expired")
@@ -39,13 +94,117 @@ def decode_jwt_token(token):
         return None
 
 
+def get_guardian_token_version(guardian_name):
+    """Phiên bản token hiện hành của guardian: Redis trước, DB khi miss.
+
+    Trả `_GUARDIAN_GONE` (0) nếu guardian không còn — token nào cũng lệch.
+    """
+    key = _guardian_version_key(guardian_name)
+    cache = frappe.cache()
+    try:
+        cached = cache.get_value(key)
+        if cached is not None:
+            return int(cached)
+    except Exception:
+        pass
+
+    row = frappe.db.get_value("CRM Guardian", guardian_name, "jwt_token_version", as_dict=True)
+    version = _GUARDIAN_GONE if row is None else (row.jwt_token_version or 1)
+    try:
+        cache.set_value(key, version, expires_in_sec=GUARDIAN_VERSION_TTL)
+    except Exception:
+        pass
+    return version
+
+
+def set_guardian_token_version(guardian_name, version):
+    """Ghi phiên bản mới vào Redis ngay — force logout có hiệu lực ở request kế tiếp."""
+    if not guardian_name:
+        return
+    try:
+        frappe.cache().set_value(
+            _guardian_version_key(guardian_name), int(version), expires_in_sec=GUARDIAN_VERSION_TTL
+        )
+    except Exception as e:
+        frappe.logger().warning(f"set_guardian_token_version({guardian_name}) failed: {e}")
+
+
+def clear_guardian_token_versions():
+    """Xoá mọi bộ đếm — dùng sau UPDATE hàng loạt (force logout tất cả)."""
+    try:
+        frappe.cache().delete_keys(f"{GUARDIAN_VERSION_PREFIX}:")
+    except Exception as e:
+        frappe.logger().warning(f"clear_guardian_token_versions failed: {e}")
+
+
+def on_guardian_token_change(doc, method=None):
+    """Doc hook CRM Guardian: giữ bộ đếm Redis khớp DB khi sửa tay/xoá guardian."""
+    if method == "on_trash":
+        set_guardian_token_version(doc.name, _GUARDIAN_GONE)
+        return
+    if doc.has_value_changed("jwt_token_version"):
+        set_guardian_token_version(doc.name, doc.jwt_token_version or 1)
+
+
+def _resolve_principal(token):
+    """Kiểm chữ ký + tra User. Trả dict principal để cache, hoặc None."""
+    payload = decode_jwt_token(token)
+    if not payload:
+        return None
+
+    # Extract user email from payload
+    user_email = payload.get('email') or payload.get('sub')
+    if not user_email:
+        frappe.logger().warning("No user email found in JWT payload")
+        return None
+
+    # Check if user exists
+    if not frappe.db.exists('User', user_email):
+        frappe.logger().warning(f"User {user_email} not found in database")
+        return None
+
+    return {
+        "user": user_email,
+        "guardian": payload.get('guardian'),
+        "token_version": payload.get('token_version'),
+        "exp": payload.get('exp'),
+    }
+
+
+def _is_revoked(principal):
+    """Phụ huynh: token_version phải khớp bộ đếm hiện hành (force logout)."""
+    if PARENT_EMAIL_MARKER not in principal["user"]:
+        return False
+    guardian_name = principal.get("guardian")
+    if not guardian_name:
+        return False
+
+    current_version = get_guardian_token_version(guardian_name)
+    if current_version == _GUARDIAN_GONE:
+        frappe.logger().warning(f"Guardian {guardian_name} khong con ton tai — tu choi token")
+        return True
+
+    token_version = principal.get("token_version")
+    # Nếu token_version không match, token đã bị revoke (force logout)
+    if token_version and token_version != current_version:
+        frappe.logger().warning(
+            f"Token revoked for {guardian_name}: "
+            f"token_version={token_version}, current={current_version}"
+        )
+        return True
+    return False
+
+
 def authenticate_via_jwt():
     """
     Authenticate user via JWT token from Authorization header
     Returns user_email if successful, None otherwise
     
-    Cho Parent Portal users: kiểm tra token_version để support force logout
+    Cho Parent Portal users: kiểm tra token_version để support force logout.
+    Kết quả giải mã được cache theo token — xem khối chú thích đầu file.
     """
+    started = time.perf_counter()
+    outcome = "none"
     try:
         # Check Authorization header first
         auth_header = frappe.get_request_header('Authorization')
@@ -54,46 +213,56 @@ def authenticate_via_jwt():
             auth_header = frappe.get_request_header('X-Frappe-Token')
             if not auth_header:
                 return None
-        
-        # Decode JWT token
-        payload = decode_jwt_token(auth_header)
-        if not payload:
-            return None
-        
-        # Extract user email from payload
-        user_email = payload.get('email') or payload.get('sub')
-        if not user_email:
-            frappe.logger().warning("No user email found in JWT payload")
-            return None
-        
-        # Check if user exists
-        if not frappe.db.exists('User', user_email):
-            frappe.logger().warning(f"User {user_email} not found in database")
+
+        token = _strip_bearer(auth_header)
+        if not token:
             return None
-        
+
+        cache_key = _principal_cache_key(token)
+        principal = None
+        try:
+            principal = frappe.cache().get_value(cache_key)
+        except Exception:
+            principal = None
+
+        if principal and principal.get("exp") and principal["exp"] < time.time():
+            principal = None
+
+        if principal:
+            outcome = "hit"
+        else:
+            outcome = "miss"
+            principal = _resolve_principal(token)
+            if not principal:
+                outcome = "invalid"
+                return None
+            ttl = AUTH_CACHE_MAX_TTL
+            if principal.get("exp"):
+                ttl = min(ttl, int(principal["exp"] - time.time()))
+            if ttl > 0:
+                try:
+                    frappe.cache().set_value(cache_key, principal, expires_in_sec=ttl)
+                except Exception:
+                    pass
+
         # ===== KIỂM TRA TOKEN VERSION CHO PARENT PORTAL USERS =====
-        # Nếu là Parent Portal user và token có token_version, verify với database
-        if '@parent.wellspring.edu.vn' in user_email:
-            guardian_name = payload.get('guardian')
-            token_version = payload.get('token_version')
-            
-            if guardian_name and token_version:
-                # Lấy current token_version từ database
-                current_version = frappe.db.get_value(
-                    "CRM Guardian", guardian_name, "jwt_token_version"
-                ) or 1
-                
-                # Nếu token_version không match, token đã bị revoke (force logout)
-                if token_version != current_version:
-                    frappe.logger().warning(
-                        f"Token revoked for {guardian_name}: "
-                        f"token_version={token_version}, current={current_version}"
-                    )
-                    return None
-        
+        if _is_revoked(principal):
+            outcome = "revoked"
+            return None
+
+        user_email = principal["user"]
         frappe.logger().debug(f"JWT authentication successful for user: {user_email}")
         return user_email
         
     except Exception as e:
+        outcome = "error"
         frappe.logger().error(f"Error in JWT authentication: {str(e)}")
         return None
+    finally:
+        if outcome != "none":
+            try:
+                from erp.observability.metrics import observe_jwt_auth
+
+                observe_jwt_auth(outcome, time.perf_counter() - started)
+            except Exception:
+                pass
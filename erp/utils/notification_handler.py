@@ -44,49 +44,17 @@ def resolve_recipient_students(recipients_list: List[Dict]) -> List[str]:
     Returns:
         List of unique student IDs: ["STU-001", "STU-002", ...]
     """
-    student_ids: Set[str] = set()
-    
+    from erp.utils.notification_recipients import rosters, students_for_recipients
+
     try:
         frappe.logger().info(f"🎯 Starting recipient resolution for {len(recipients_list)} recipients")
-        
-        for recipient in recipients_list:
-            recipient_id = recipient.get("id")
-            recipient_type = recipient.get("type")
-            
-            frappe.logger().info(f"  Processing recipient: id={recipient_id}, type={recipient_type}")
-            
-            if not recipient_id or not recipient_type:
-                continue
-            
-            if recipient_type == "school":
-                # School → All students in school
-                students = _get_all_students_in_school()
-                frappe.logger().info(f"  🏫 School: found {len(students)} students")
-                student_ids.update(students)
-            
-            elif recipient_type == "stage":
-                # Stage → All students in all grades/classes of this stage
-                students = _get_students_by_stage(recipient_id)
-                frappe.logger().info(f"  📚 Stage {recipient_id}: found {len(students)} students")
-                student_ids.update(students)
-            
-            elif recipient_type == "grade":
-                # Grade → All students in all classes of this grade
-                students = _get_students_by_grade(recipient_id)
-                frappe.logger().info(f"  🎓 Grade {recipient_id}: found {len(students)} students")
-                student_ids.update(students)
-            
-            elif recipient_type == "class":
-                # Class → All students in this class
-                students = _get_students_by_class(recipient_id)
-                frappe.logger().info(f"  📖 Class {recipient_id}: found {len(students)} students")
-                student_ids.update(students)
-            
-            elif recipient_type == "student":
-                # Direct student
-                student_ids.add(recipient_id)
-                frappe.logger().info(f"  👤 Student {recipient_id}: added")
-        
+
+        # Roster lớp -> học sinh theo năm học nằm trong Redis (notification_recipients):
+        # giải cả danh sách trên bộ nhớ thay vì vài query cho từng stage/grade/class
+        student_ids, counts = students_for_recipients(recipients_list, rosters())
+        for (recipient_type, recipient_id), count in counts.items():
+            frappe.logger().info(f"  {recipient_type} {recipient_id or ''}: found {count} students")
+
         frappe.logger().info(f"🎯 Resolved recipients: {len(recipients_list)} recipients → {len(student_ids)} unique students")
         return list(student_ids)
     
@@ -95,102 +63,6 @@ def resolve_recipient_students(recipients_list: List[Dict]) -> List[str]:
         raise
 
 
-def _get_all_students_in_school() -> List[str]:
-    """Get all students in the school from SIS Class Student"""
-    try:
-        # Get all unique students from SIS Class Student records
-        class_students = frappe.get_all("SIS Class Student",
-            fields=["student_id"],
-            pluck="student_id",
-            distinct=True
-        )
-        frappe.logger().info(f"📚 Found {len(class_students)} students in school")
-        return class_students
-    except Exception as e:
-        frappe.logger().warning(f"Error getting all students in school: {str(e)}")
-        return []
-
-
-def _get_students_by_stage(stage_id: str) -> List[str]:
-    """Get all students in an education stage"""
-    try:
-        # Stage → Grades → Classes → Students
-        grades = frappe.get_all("SIS Education Grade", 
-            filters={"education_stage_id": stage_id},
-            fields=["name"],
-            pluck="name"
-        )
-        
-        if not grades:
-            return []
-        
-        classes = frappe.get_all("SIS Class",
-            filters={"education_grade": ["in", grades]},
-            fields=["name"],
-            pluck="name"
-        )
-        
-        if not classes:
-            return []
-        
-        students = frappe.get_all("SIS Class Student",
-            filters={"class_id": ["in", classes]},
-            fields=["student_id"],
-            pluck="student_id"
-        )
-        
-        frappe.logger().info(f"📚 Stage {stage_id}: {len(grades)} grades → {len(classes)} classes → {len(students)} students")
-        return students
-    
-    except Exception as e:
-        frappe.logger().warning(f"Error getting students by stage {stage_id}: {str(e)}")
-        return []
-
-
-def _get_students_by_grade(grade_id: str) -> List[str]:
-    """Get all students in an education grade"""
-    try:
-        # Grade → Classes → Students
-        classes = frappe.get_all("SIS Class",
-            filters={"education_grade": grade_id},
-            fields=["name"],
-            pluck="name"
-        )
-        
-        if not classes:
-            return []
-        
-        students = frappe.get_all("SIS Class Student",
-            filters={"class_id": ["in", classes]},
-            fields=["student_id"],
-            pluck="student_id"
-        )
-        
-        frappe.logger().info(f"🎓 Grade {grade_id}: {len(classes)} classes → {len(students)} students")
-        return students
-    
-    except Exception as e:
-        frappe.logger().warning(f"Error getting students by grade {grade_id}: {str(e)}")
-        return []
-
-
-def _get_students_by_class(class_id: str) -> List[str]:
-    """Get all students in a class"""
-    try:
-        students = frappe.get_all("SIS Class Student",
-            filters={"class_id": class_id},
-            fields=["student_id"],
-            pluck="student_id"
-        )
-        
-        frappe.logger().info(f"📖 Class {class_id}: {len(students)} students")
-        return students
-    
-    except Exception as e:
-        frappe.logger().warning(f"Error getting students by class {class_id}: {str(e)}")
-        return []
-
-
 def get_guardians_for_students(student_ids: List[str]) -> List[Dict]:
     """
     Student IDs → Guardian objects (with emails)
@@ -209,85 +81,27 @@ def get_guardians_for_students(student_ids: List[str]) -> List[Dict]:
             ...
         ]
     """
-    guardians_dict: Dict[str, Dict] = {}
+    from erp.utils.notification_recipients import (
+        group_by_guardian,
+        guardians_by_student,
+        map_student_keys,
+    )
 
     try:
         if not student_ids:
             return []
 
-        # Map student_codes to student_ids if needed
-        # Parent portal may pass student_code (WS12310116) but CRM stores student_id (CRM-STUDENT-09008)
-        actual_student_ids = []
-        for student_id in student_ids:
-            if student_id.startswith('CRM-STUDENT-'):
-                # Already a CRM student ID
-                actual_student_ids.append(student_id)
-            else:
-                # FIX: Case-insensitive lookup cho student_code vì device có thể gửi khác case
-                crm_student = frappe.db.sql("""
-                    SELECT name FROM `tabCRM Student`
-                    WHERE UPPER(student_code) = UPPER(%(code)s)
-                    LIMIT 1
-                """, {"code": student_id}, as_dict=True)
-                
-                if crm_student:
-                    actual_student_ids.append(crm_student[0].name)
-                    frappe.logger().info(f"📝 Mapped student_code {student_id} to CRM student_id {crm_student[0].name}")
-                else:
-                    # Try direct lookup as student_id
-                    direct_student = frappe.get_value('CRM Student', student_id, 'name')
-                    if direct_student:
-                        actual_student_ids.append(direct_student)
-                    else:
-                        frappe.logger().warning(f"⚠️ Could not find CRM student for {student_id}")
+        # Parent portal may pass student_code (WS12310116) but CRM stores student_id (CRM-STUDENT-09008).
+        # Một query IN trên unique index student_code (collation không phân biệt hoa thường).
+        actual_student_ids = map_student_keys(student_ids)
 
         if not actual_student_ids:
             frappe.logger().warning(f"⚠️ No valid CRM student IDs found for {student_ids}")
             return []
 
-        # Get all ACTIVE relationships for these students
-        # IMPORTANT: Only get relationships that still exist in their parent Family docs
-        # This prevents deleted guardians from receiving notifications
-        relationships = frappe.db.sql("""
-            SELECT DISTINCT fr.guardian, fr.student
-            FROM `tabCRM Family Relationship` fr
-            INNER JOIN `tabCRM Family` f ON fr.parent = f.name
-            WHERE fr.student IN %(student_ids)s
-                AND fr.guardian IS NOT NULL
-                AND fr.guardian != ''
-                AND f.docstatus < 2
-                AND fr.parentfield = 'relationships'
-        """, {"student_ids": actual_student_ids}, as_dict=True)
-        
-        frappe.logger().info(f"👥 Found {len(relationships)} ACTIVE relationships for {len(student_ids)} students")
-        
-        # Group by guardian
-        for rel in relationships:
-            guardian_name = rel.get("guardian")
-            student_id = rel.get("student")
-            
-            if not guardian_name:
-                continue
-            
-            if guardian_name not in guardians_dict:
-                # Get guardian details
-                try:
-                    guardian = frappe.get_doc("CRM Guardian", guardian_name)
-                    guardians_dict[guardian_name] = {
-                        "guardian_name": guardian.name,
-                        "guardian_id": guardian.guardian_id,
-                        "email": f"{guardian.guardian_id}@parent.wellspring.edu.vn",
-                        "student_ids": []
-                    }
-                except Exception as e:
-                    frappe.logger().warning(f"Failed to get guardian {guardian_name}: {str(e)}")
-                    continue
-            
-            # Add student to guardian's list
-            if student_id not in guardians_dict[guardian_name]["student_ids"]:
-                guardians_dict[guardian_name]["student_ids"].append(student_id)
-        
-        guardians_list = list(guardians_dict.values())
+        # Only relationships that still exist in their parent Family docs (deleted guardians
+        # must not receive notifications) — cached per student, one join for the misses
+        guardians_list = group_by_guardian(actual_student_ids, guardians_by_student(actual_student_ids))
         frappe.logger().info(f"📧 Resolved to {len(guardians_list)} unique guardians")
         return guardians_list
     
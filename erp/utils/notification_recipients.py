@@ -0,0 +1,364 @@
+"""
+Giải người nhận thông báo hàng loạt theo tập — dùng cho notification_handler.
+
+Vì sao
+------
+Thông báo toàn trường trước đây: mỗi stage/grade/class một chuỗi `get_all`, rồi
+`get_guardians_for_students` chạy `UPPER(student_code) = UPPER(...)` (không dùng
+được index) + `get_value` cho TỪNG mã, rồi `get_doc` cho TỪNG phụ huynh — hàng nghìn
+round-trip trước khi gửi được push đầu tiên.
+
+Giờ:
+
+- mã học sinh -> CRM Student: MỘT query `student_code IN (...)` trên unique index
+  (collation *_ci nên không phân biệt hoa thường, khỏi cần UPPER), mã không khớp thì
+  MỘT query `name IN (...)`;
+- lớp -> học sinh: roster theo năm học trong Redis (`ROSTER_PREFIX:<năm học>` =
+  {lớp: [khối, cấp, [học sinh]]}), dựng bằng MỘT query cho cả năm;
+- học sinh -> phụ huynh: hash Redis `GUARDIANS_KEY` (học sinh -> [[guardian, mã]]),
+  thiếu thì MỘT join Relationship + Family + Guardian cho mọi học sinh thiếu.
+
+Xoá cache SAU commit:
+
+- SIS Class Student (xếp / chuyển / xoá lớp) và SIS Class (đổi khối) -> roster năm
+  học đó (`invalidate_school_year` cho đường `frappe.db.set_value` không qua hook);
+- CRM Family / CRM Guardian -> mục phụ huynh của các học sinh liên quan.
+
+Ghi DB không qua hook thì cache tự hết hạn (`ROSTER_TTL_SEC`, `GUARDIANS_TTL_SEC`).
+"""
+
+import json
+
+import frappe
+from frappe.utils import now_datetime
+
+CRM_STUDENT_PREFIX = "CRM-STUDENT-"
+
+ROSTER_PREFIX = "notif_roster"
+ROSTER_YEARS_KEY = "notif_roster_years"
+ROSTER_TTL_SEC = 6 * 3600
+GUARDIANS_KEY = "notif_student_guardians"
+GUARDIANS_TTL_SEC = 6 * 3600
+
+_PENDING_FLAG = "notification_recipient_invalidations"
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def guardian_email(guardian_id):
+    return f"{guardian_id}@parent.wellspring.edu.vn"
+
+
+# ---------------------------------------------------------------------------
+# Mã học sinh -> CRM Student
+# ---------------------------------------------------------------------------
+
+
+def map_student_keys(keys):
+    """Mã HS (WS...) hoặc CRM-STUDENT-... -> tên CRM Student, giữ thứ tự, bỏ mã không tìm thấy."""
+    keys = [str(k).strip() for k in keys if k and str(k).strip()]
+    codes = sorted({k for k in keys if not k.startswith(CRM_STUDENT_PREFIX)})
+    by_code = {}
+    if codes:
+        for name, code in frappe.db.sql(
+            "SELECT name, student_code FROM `tabCRM Student` WHERE student_code IN %(codes)s",
+            {"codes": codes},
+        ):
+            by_code[(code or "").upper()] = name
+        unmatched = [c for c in codes if c.upper() not in by_code]
+        if unmatched:
+            for name in frappe.db.sql_list(
+                "SELECT name FROM `tabCRM Student` WHERE name IN %(names)s", {"names": unmatched}
+            ):
+                by_code[name.upper()] = name
+
+    out, seen = [], set()
+    for key in keys:
+        name = key if key.startswith(CRM_STUDENT_PREFIX) else by_code.get(key.upper())
+        if not name:
+            frappe.logger().warning(f"⚠️ Could not find CRM student for {key}")
+            continue
+        if name not in seen:
+            seen.add(name)
+            out.append(name)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Roster theo năm học
+# ---------------------------------------------------------------------------
+
+
+def _roster_key(school_year_id):
+    return f"{ROSTER_PREFIX}:{school_year_id or ''}"
+
+
+def _school_years():
+    years = frappe.cache().get_value(ROSTER_YEARS_KEY)
+    if years is None:
+        years = frappe.db.sql_list(
+            "SELECT DISTINCT IFNULL(school_year_id, '') FROM `tabSIS Class Student`"
+        )
+        frappe.cache().set_value(ROSTER_YEARS_KEY, years, expires_in_sec=ROSTER_TTL_SEC)
+    return years
+
+
+def build_roster(rows):
+    """rows (class_id, grade, stage, student_id) -> {lớp: [khối, cấp, [học sinh]]}."""
+    roster = {}
+    for class_id, grade, stage, student_id in rows:
+        entry = roster.setdefault(class_id or "", [grade, stage, []])
+        if student_id and student_id not in entry[2]:
+            entry[2].append(student_id)
+    return roster
+
+
+def _load_roster(school_year_id):
+    rows = frappe.db.sql(
+        """
+        SELECT cs.class_id, c.education_grade, g.education_stage_id, cs.student_id
+        FROM `tabSIS Class Student` cs
+        LEFT JOIN `tabSIS Class` c ON c.name = cs.class_id
+        LEFT JOIN `tabSIS Education Grade` g ON g.name = c.education_grade
+        WHERE IFNULL(cs.school_year_id, '') = %s
+        """,
+        (school_year_id or "",),
+    )
+    return build_roster(rows)
+
+
+def rosters():
+    """{năm học: roster} cho mọi năm có xếp lớp (giữ phạm vi cũ: không lọc năm)."""
+    cache = frappe.cache()
+    out = {}
+    for year in _school_years():
+        roster = cache.get_value(_roster_key(year))
+        if roster is None:
+            roster = _load_roster(year)
+            cache.set_value(_roster_key(year), roster, expires_in_sec=ROSTER_TTL_SEC)
+        out[year] = roster
+    return out
+
+
+def students_for_recipients(recipients, all_rosters):
+    """Giải danh sách người nhận (school/stage/grade/class/student) trên roster — thuần.
+
+    Trả (tập học sinh, {(type, id): số học sinh}) để log.
+    """
+    wanted = {"stage": set(), "grade": set(), "class": set()}
+    school = False
+    students, counts = set(), {}
+    for r in recipients:
+        rid, rtype = r.get("id"), r.get("type")
+        if not rid or not rtype:
+            continue
+        if rtype == "school":
+            school = True
+        elif rtype in wanted:
+            wanted[rtype].add(rid)
+        elif rtype == "student":
+            students.add(rid)
+            counts[(rtype, rid)] = 1
+
+    for roster in all_rosters.values():
+        for class_id, (grade, stage, members) in roster.items():
+            hits = []
+            if school:
+                hits.append(("school", None))
+            if stage in wanted["stage"]:
+                hits.append(("stage", stage))
+            if grade in wanted["grade"]:
+                hits.append(("grade", grade))
+            if class_id in wanted["class"]:
+                hits.append(("class", class_id))
+            if not hits:
+                continue
+            students.update(members)
+            for hit in hits:
+                counts[hit] = counts.get(hit, 0) + len(members)
+    return students, counts
+
+
+# ---------------------------------------------------------------------------
+# Học sinh -> phụ huynh
+# ---------------------------------------------------------------------------
+
+
+def _load_guardians(student_ids):
+    """{học sinh: [[guardian, guardian_id]]} — chỉ quan hệ còn nằm trong Family chưa huỷ."""
+    out = {s: [] for s in student_ids}
+    if not student_ids:
+        return out
+    for student, guardian, guardian_id in frappe.db.sql(
+        """
+        SELECT DISTINCT fr.student, fr.guardian, g.guardian_id
+        FROM `tabCRM Family Relationship` fr
+        INNER JOIN `tabCRM Family` f ON fr.parent = f.name
+        INNER JOIN `tabCRM Guardian` g ON g.name = fr.guardian
+        WHERE fr.student IN %(student_ids)s
+            AND fr.guardian IS NOT NULL
+            AND fr.guardian != ''
+            AND f.docstatus < 2
+            AND fr.parentfield = 'relationships'
+        """,
+        {"student_ids": list(student_ids)},
+    ):
+        pair = [guardian, guardian_id]
+        if pair not in out[student]:
+            out[student].append(pair)
+    return out
+
+
+def _parse_guardians(raw, now_ts):
+    if not raw:
+        return None
+    data = json.loads(_decode(raw))
+    if now_ts - data.get("t", 0) > GUARDIANS_TTL_SEC:
+        return None
+    return data["g"]
+
+
+def guardians_by_student(student_ids):
+    """{học sinh: [[guardian, guardian_id]]} — Redis trước, thiếu thì một join cho cả phần thiếu."""
+    student_ids = list(dict.fromkeys(student_ids))
+    if not student_ids:
+        return {}
+    now_ts = now_datetime().timestamp()
+    found = {}
+    try:
+        cache = frappe.cache()
+        key = cache.make_key(GUARDIANS_KEY)
+        pipe = cache.pipeline()
+        pipe.hmget(key, student_ids)
+        (raw,) = pipe.execute()
+        for student, value in zip(student_ids, raw):
+            parsed = _parse_guardians(value, now_ts)
+            if parsed is not None:
+                found[student] = parsed
+    except Exception as e:
+        cache = None
+        frappe.logger().warning(f"notification recipients: guardian cache read failed: {e}")
+
+    missing = [s for s in student_ids if s not in found]
+    if missing:
+        loaded = _load_guardians(missing)
+        found.update(loaded)
+        if cache is not None:
+            try:
+                pipe = cache.pipeline()
+                pipe.hset(key, mapping={s: json.dumps({"t": now_ts, "g": g}) for s, g in loaded.items()})
+                pipe.execute()
+            except Exception as e:
+                frappe.logger().warning(f"notification recipients: guardian cache write failed: {e}")
+    return found
+
+
+def group_by_guardian(student_ids, by_student):
+    """[{guardian_name, guardian_id, email, student_ids}] theo thứ tự học sinh — thuần."""
+    guardians = {}
+    for student in student_ids:
+        for guardian, guardian_id in by_student.get(student) or []:
+            entry = guardians.get(guardian)
+            if entry is None:
+                entry = guardians[guardian] = {
+                    "guardian_name": guardian,
+                    "guardian_id": guardian_id,
+                    "email": guardian_email(guardian_id),
+                    "student_ids": [],
+                }
+            if student not in entry["student_ids"]:
+                entry["student_ids"].append(student)
+    return list(guardians.values())
+
+
+# ---------------------------------------------------------------------------
+# Xoá cache (sau commit)
+# ---------------------------------------------------------------------------
+
+
+def _queue(kind, values):
+    values = {v for v in values if v is not None}
+    if not values:
+        return
+    pending = frappe.flags.get(_PENDING_FLAG)
+    if pending is None:
+        pending = frappe.flags[_PENDING_FLAG] = {"years": set(), "students": set()}
+        frappe.db.after_commit.add(_flush_invalidations)
+        frappe.db.after_rollback.add(lambda: frappe.flags.pop(_PENDING_FLAG, None))
+    pending[kind] |= values
+
+
+def _flush_invalidations():
+    pending = frappe.flags.pop(_PENDING_FLAG, None)
+    if not pending:
+        return
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        if pending["years"]:
+            pipe.delete(cache.make_key(ROSTER_YEARS_KEY))
+            for year in pending["years"]:
+                pipe.delete(cache.make_key(_roster_key(year)))
+        if pending["students"]:
+            pipe.hdel(cache.make_key(GUARDIANS_KEY), *pending["students"])
+        pipe.execute()
+    except Exception:
+        frappe.log_error(frappe.get_traceback(), "notification_recipients.invalidate")
+
+
+def invalidate_school_year(school_year_id):
+    """Gọi sau khi đổi lớp bằng frappe.db.set_value (không qua doc hook)."""
+    _queue("years", [school_year_id or ""])
+
+
+def invalidate_students(student_ids):
+    """Gọi sau khi sửa CRM Family Relationship bằng SQL thô (không qua doc hook CRM Family)."""
+    _queue("students", student_ids or [])
+
+
+def on_class_student_change(doc, method=None):
+    """SIS Class Student after_insert / on_update / on_trash: roster của năm học (cả năm cũ nếu đổi)."""
+    years = [doc.get("school_year_id") or ""]
+    if method == "on_update":
+        prev = doc.get_doc_before_save()
+        if prev is not None:
+            years.append(prev.get("school_year_id") or "")
+    _queue("years", years)
+
+
+def on_class_change(doc, method=None):
+    """SIS Class on_update / on_trash: khối của lớp có thể đổi."""
+    _queue("years", [doc.get("school_year_id") or ""])
+
+
+def _child_students(doc, fieldname):
+    return {row.get("student") for row in (doc.get(fieldname) or []) if row.get("student")}
+
+
+def on_family_change(doc, method=None):
+    """CRM Family on_update / on_trash: học sinh trong gia đình (cả bản trước khi lưu)."""
+    students = _child_students(doc, "relationships")
+    prev = doc.get_doc_before_save() if method == "on_update" else None
+    if prev is not None:
+        students |= _child_students(prev, "relationships")
+    _queue("students", students)
+
+
+def on_guardian_change(doc, method=None):
+    """CRM Guardian on_update / on_trash: mã guardian_id đổi hoặc phụ huynh bị xoá."""
+    if method == "on_update":
+        prev = doc.get_doc_before_save()
+        if prev is not None and prev.get("guardian_id") == doc.get("guardian_id"):
+            return
+    students = set(
+        frappe.db.sql_list(
+            """
+            SELECT DISTINCT student FROM `tabCRM Family Relationship`
+            WHERE guardian = %s AND parentfield = 'relationships'
+            """,
+            (doc.name,),
+        )
+    )
+    _queue("students", students | _child_students(doc, "student_relationships"))